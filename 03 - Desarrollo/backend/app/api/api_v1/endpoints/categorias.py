@@ -6,6 +6,7 @@ from app.api.deps import get_db, get_current_active_user
 from app.models.categoria import Categoria
 from app.models.usuario import Usuario
 from app.schemas.categoria import CategoriaCreate, CategoriaUpdate, CategoriaResponse
+from app.services.embedding_worker import category_text_changed, reembed_category
 
 router = APIRouter()
 
@@ -112,6 +113,9 @@ def update_categoria(
                 detail="Ya existe una categoría con este nombre para este usuario"
             )
     
+    # El nombre forma parte del texto embebido de sus gastos e ingresos
+    reembed = category_text_changed(categoria, update_data)
+    
     # Actualizar campos
     for field, value in update_data.items():
         setattr(categoria, field, value)
@@ -119,9 +123,44 @@ def update_categoria(
     db.add(categoria)
     db.commit()
     db.refresh(categoria)
+    
+    if reembed:
+        reembed_category(db, categoria_id)
     return categoria
 
 
+@router.post("/{categoria_id}/reembed")
+def reembed_categoria(
+    categoria_id: int,
+    dry_run: bool = Query(False, description="Solo contar los registros afectados"),
+    db: Session = Depends(get_db),
+    current_user: Usuario = Depends(get_current_active_user)
+) -> dict:
+    """
+    Regenerar los embeddings de los gastos e ingresos de una categoría.
+    
+    Con dry_run solo retorna cuántos registros se re-embeberían. Solo el
+    dueño de una categoría personalizada puede hacerlo: una categoría global
+    afecta a los registros de todos los usuarios.
+    """
+    categoria = db.query(Categoria).filter(Categoria.id_categoria == categoria_id).first()
+    if categoria is None:
+        raise HTTPException(status_code=404, detail="Categoría no encontrada")
+    if categoria.id_usuario != current_user.id_usuario:
+        raise HTTPException(
+            status_code=403,
+            detail="No tienes permiso para regenerar los embeddings de esta categoría"
+        )
+    
+    afectados = reembed_category(db, categoria_id, dry_run=dry_run)
+    return {
+        "categoria_id": categoria_id,
+        "dry_run": dry_run,
+        "gastos": afectados["gasto"],
+        "ingresos": afectados["ingreso"]
+    }
+
+
 @router.delete("/{categoria_id}", response_model=CategoriaResponse)
 def delete_categoria(
     categoria_id: int,
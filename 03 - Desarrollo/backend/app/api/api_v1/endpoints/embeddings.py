@@ -5,7 +5,9 @@ Endpoints para gestión de embeddings vectoriales
 
 Funcionalidades:
 - Generar embeddings para gastos/ingresos individuales o en lote
+- Consultar el avance de los trabajos de generación en lote
 - Consultar estadísticas de cobertura de embeddings
+- Consultar métricas de uso del proveedor (latencia, tokens, costo)
 - Regenerar embeddings
 - Búsqueda vectorial de prueba
 
@@ -14,8 +16,12 @@ Fecha: 11 noviembre 2025
 """
 
 import logging
-from typing import List, Optional
+from datetime import date, datetime
+from decimal import Decimal
+from typing import List, Literal, Optional
 from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
 from sqlalchemy.orm import Session
 from pydantic import BaseModel, Field
 
@@ -24,8 +30,13 @@ from app.models.usuario import Usuario
 from app.models.gasto import Gasto
 from app.models.ingreso import Ingreso
 from app.models.embeddings import GastoEmbedding, IngresoEmbedding
-from app.services.embeddings_service import EmbeddingsService
+from app.services.embeddings_service import get_embeddings_service
+from app.services.embedding_metrics import get_embedding_metrics
+from app.services.vector_result_cache import get_vector_result_cache
 from app.services.vector_search_service import VectorSearchService
+from app.services.embedding_worker import gasto_to_dict, ingreso_to_dict
+from app.services.embedding_backfill import ENTITY_MODELS
+from app.services.embedding_jobs import create_job, get_job, run_embedding_job
 
 logger = logging.getLogger(__name__)
 
@@ -53,6 +64,41 @@ class EmbeddingSearchRequest(BaseModel):
     entity_type: str = Field(..., description="'gastos', 'ingresos' o 'combined'")
     limit: int = Field(10, ge=1, le=100, description="Número de resultados")
     similarity_threshold: float = Field(0.7, ge=0.0, le=1.0, description="Umbral de similitud")
+    preset: Optional[Literal["fast", "balanced", "accurate"]] = Field(
+        None, description="Preset de velocidad/recall del índice (default: VECTOR_SEARCH_PRESET)"
+    )
+    ef_search: Optional[int] = Field(None, ge=1, le=1000, description="hnsw.ef_search de la consulta")
+    probes: Optional[int] = Field(None, ge=1, le=1000, description="ivfflat.probes de la consulta")
+    hybrid: bool = Field(
+        False, description="Fusionar coincidencias léxicas (comercio, palabras clave) con las vectoriales"
+    )
+    categoria: Optional[str] = Field(None, description="Filtro por nombre de categoría")
+    fecha_desde: Optional[date] = Field(None, description="Filtro de fecha inicial")
+    fecha_hasta: Optional[date] = Field(None, description="Filtro de fecha final")
+    monto_min: Optional[Decimal] = Field(None, description="Filtro de monto mínimo")
+    monto_max: Optional[Decimal] = Field(None, description="Filtro de monto máximo")
+    filter_strategy: Optional[Literal["auto", "exact", "iterative"]] = Field(
+        None, description="Estrategia con filtros (default: VECTOR_FILTER_STRATEGY)"
+    )
+
+
+class EmbeddingJobResponse(BaseModel):
+    """Response con el estado de un trabajo de generación en lote."""
+    id: int
+    entity_type: str
+    status: str
+    force_regenerate: bool
+    total: Optional[int] = None
+    processed: int = 0
+    skipped: int = 0
+    errors: int = 0
+    error_message: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
 
 
 class EmbeddingStatsResponse(BaseModel):
@@ -72,142 +118,99 @@ def generate_embedding(
     """
     Genera un embedding para un gasto o ingreso específico.
     
+    Si el embedding ya existe y el texto de la entidad no cambió, responde 409
+    sin llamar al proveedor; si el texto cambió, lo regenera.
+    
     - **entity_type**: "gasto" o "ingreso"
     - **entity_id**: ID del gasto o ingreso
     """
     try:
-        embeddings_service = EmbeddingsService()
+        embeddings_service = get_embeddings_service()
         
         if request.entity_type == "gasto":
-            # Buscar el gasto
-            gasto = db.query(Gasto).filter(
+            entity = db.query(Gasto).filter(
                 Gasto.id_gasto == request.entity_id,
                 Gasto.id_usuario == current_user.id_usuario
             ).first()
-            
-            if not gasto:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail="Gasto no encontrado"
-                )
-            
-            # Verificar si ya existe embedding
-            existing = db.query(GastoEmbedding).filter(
-                GastoEmbedding.gasto_id == gasto.id_gasto
-            ).first()
-            
-            if existing:
-                raise HTTPException(
-                    status_code=status.HTTP_409_CONFLICT,
-                    detail="El embedding ya existe. Use regenerate para actualizarlo."
-                )
-            
-            # Construir texto y generar embedding
-            gasto_dict = {
-                "descripcion": gasto.descripcion,
-                "categoria": gasto.categoria.nombre if gasto.categoria else None,
-                "monto": gasto.monto,
-                "moneda": gasto.moneda,
-                "fecha": gasto.fecha,
-                "comercio": gasto.comercio
-            }
-            
-            texto = embeddings_service.build_gasto_text(gasto_dict)
-            embedding = embeddings_service.generate_embedding(texto)
-            
-            if not embedding:
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail="Error generando embedding"
-                )
-            
-            # Guardar en base de datos
-            metadata = embeddings_service.build_metadata(gasto_dict, "gasto")
-            gasto_embedding = GastoEmbedding(
-                gasto_id=gasto.id_gasto,
-                embedding=embedding,
-                texto_original=texto,
-                metadata=metadata
-            )
-            
-            db.add(gasto_embedding)
-            db.commit()
-            db.refresh(gasto_embedding)
-            
-            return {
-                "message": "Embedding generado exitosamente",
-                "entity_type": "gasto",
-                "entity_id": gasto.id_gasto,
-                "embedding_id": gasto_embedding.id
-            }
-            
+            embedding_model, id_field = GastoEmbedding, "gasto_id"
         elif request.entity_type == "ingreso":
-            # Similar para ingresos
-            ingreso = db.query(Ingreso).filter(
+            entity = db.query(Ingreso).filter(
                 Ingreso.id_ingreso == request.entity_id,
                 Ingreso.id_usuario == current_user.id_usuario
             ).first()
-            
-            if not ingreso:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail="Ingreso no encontrado"
-                )
-            
-            # Verificar si ya existe embedding
-            existing = db.query(IngresoEmbedding).filter(
-                IngresoEmbedding.ingreso_id == ingreso.id_ingreso
-            ).first()
-            
-            if existing:
-                raise HTTPException(
-                    status_code=status.HTTP_409_CONFLICT,
-                    detail="El embedding ya existe. Use regenerate para actualizarlo."
-                )
-            
-            # Construir texto y generar embedding
-            ingreso_dict = {
-                "descripcion": ingreso.descripcion,
-                "categoria": ingreso.categoria.nombre if ingreso.categoria else None,
-                "monto": ingreso.monto,
-                "moneda": ingreso.moneda,
-                "fecha": ingreso.fecha
-            }
-            
-            texto = embeddings_service.build_ingreso_text(ingreso_dict)
-            embedding = embeddings_service.generate_embedding(texto)
-            
-            if not embedding:
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail="Error generando embedding"
-                )
-            
-            # Guardar en base de datos
-            metadata = embeddings_service.build_metadata(ingreso_dict, "ingreso")
-            ingreso_embedding = IngresoEmbedding(
-                ingreso_id=ingreso.id_ingreso,
-                embedding=embedding,
-                texto_original=texto,
-                metadata=metadata
-            )
-            
-            db.add(ingreso_embedding)
-            db.commit()
-            db.refresh(ingreso_embedding)
-            
-            return {
-                "message": "Embedding generado exitosamente",
-                "entity_type": "ingreso",
-                "entity_id": ingreso.id_ingreso,
-                "embedding_id": ingreso_embedding.id
-            }
-            
+            embedding_model, id_field = IngresoEmbedding, "ingreso_id"
         else:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="entity_type debe ser 'gasto' o 'ingreso'"
             )
+        
+        if not entity:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"{request.entity_type.capitalize()} no encontrado"
+            )
+        
+        # Construir texto
+        if request.entity_type == "gasto":
+            entity_dict = gasto_to_dict(entity)
+            texto = embeddings_service.build_gasto_text(entity_dict)
+        else:
+            entity_dict = ingreso_to_dict(entity)
+            texto = embeddings_service.build_ingreso_text(entity_dict)
+        
+        # Verificar si ya existe un embedding para el mismo contenido
+        existing = db.query(embedding_model).filter(
+            getattr(embedding_model, id_field) == request.entity_id
+        ).first()
+        
+        if existing and embeddings_service.is_embedding_current(
+            existing.content_hash, existing.texto_original, texto
+        ):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="El embedding ya existe y está actualizado."
+            )
+        
+        embedding = embeddings_service.generate_embedding(texto)
+        
+        if not embedding:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Error generando embedding"
+            )
+        
+        # Guardar en base de datos
+        metadata = embeddings_service.build_metadata(entity_dict, request.entity_type)
+        content_hash = embeddings_service.content_hash(texto)
+        
+        if existing:
+            existing.embedding = embedding
+            existing.texto_original = texto
+            existing.content_hash = content_hash
+            existing.model_version = embeddings_service.model_version
+            existing.metadata_ = metadata
+            entity_embedding = existing
+        else:
+            entity_embedding = embedding_model(
+                embedding=embedding,
+                texto_original=texto,
+                content_hash=content_hash,
+                model_version=embeddings_service.model_version,
+                metadata_=metadata,
+                **{id_field: request.entity_id}
+            )
+            db.add(entity_embedding)
+        
+        db.commit()
+        db.refresh(entity_embedding)
+        
+        return {
+            "message": "Embedding generado exitosamente",
+            "entity_type": request.entity_type,
+            "entity_id": request.entity_id,
+            "embedding_id": entity_embedding.id
+        }
             
     except HTTPException:
         raise
@@ -219,7 +222,11 @@ def generate_embedding(
         )
 
 
-@router.post("/generate-batch")
+@router.post(
+    "/generate-batch",
+    status_code=status.HTTP_202_ACCEPTED,
+    response_model=EmbeddingJobResponse
+)
 def generate_embeddings_batch(
     request: EmbeddingBatchGenerateRequest,
     background_tasks: BackgroundTasks,
@@ -229,27 +236,49 @@ def generate_embeddings_batch(
     """
     Genera embeddings en lote para múltiples gastos o ingresos.
     
-    Proceso ejecutado en background para no bloquear la respuesta.
+    Registra un trabajo y lo ejecuta en background con su propia sesión,
+    por bloques. Si ya hay un trabajo en curso para la entidad se retorna
+    ese. El avance se consulta en GET /jobs/{job_id}.
     
     - **entity_type**: "gasto" o "ingreso"
     - **entity_ids**: Lista de IDs (opcional, None = todos)
     - **force_regenerate**: Regenerar embeddings existentes
     """
-    # Agregar tarea en background
-    background_tasks.add_task(
-        _generate_batch_background,
+    if request.entity_type not in ENTITY_MODELS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="entity_type debe ser 'gasto' o 'ingreso'"
+        )
+    
+    job, should_run = create_job(
         db,
         current_user.id_usuario,
         request.entity_type,
         request.entity_ids,
         request.force_regenerate
     )
+    if should_run:
+        background_tasks.add_task(run_embedding_job, job.id)
     
-    return {
-        "message": "Generación de embeddings iniciada en background",
-        "entity_type": request.entity_type,
-        "count": len(request.entity_ids) if request.entity_ids else "todos"
-    }
+    return job
+
+
+@router.get("/jobs/{job_id}", response_model=EmbeddingJobResponse)
+def get_embedding_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: Usuario = Depends(get_current_user)
+):
+    """
+    Consulta el estado y el avance de un trabajo de generación en lote.
+    """
+    job = get_job(db, job_id, current_user.id_usuario)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Trabajo no encontrado"
+        )
+    return job
 
 
 @router.get("/stats", response_model=EmbeddingStatsResponse)
@@ -279,8 +308,40 @@ def get_embedding_stats(
         )
 
 
+@router.get("/service-stats")
+def get_embedding_service_stats(
+    current_user: Usuario = Depends(get_current_user)
+):
+    """
+    Obtiene la configuración y las métricas de uso del servicio de embeddings.
+    
+    Incluye por proveedor: llamadas, tamaños de lote, latencia p50/p95/p99,
+    reintentos, fallos, tokens y costo estimado, además del estado de las cachés.
+    """
+    try:
+        return get_embeddings_service().get_stats()
+        
+    except Exception as e:
+        logger.error(f"Error obteniendo métricas de embeddings: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error interno: {str(e)}"
+        )
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_embedding_metrics_prometheus():
+    """
+    Expone las métricas del pipeline de embeddings en formato Prometheus.
+    
+    Solo contiene contadores agregados por proveedor y de la caché de
+    resultados de búsqueda, sin datos de usuarios.
+    """
+    return get_embedding_metrics().render_prometheus() + get_vector_result_cache().render_prometheus()
+
+
 @router.post("/search")
-def search_by_vector(
+async def search_by_vector(
     request: EmbeddingSearchRequest,
     db: Session = Depends(get_db),
     current_user: Usuario = Depends(get_current_user)
@@ -292,11 +353,53 @@ def search_by_vector(
     - **entity_type**: "gastos", "ingresos" o "combined"
     - **limit**: Número máximo de resultados
     - **similarity_threshold**: Umbral mínimo de similitud (0-1)
+    - **preset**: "fast", "balanced" o "accurate" (recall del índice ANN)
+    - **ef_search** / **probes**: Pisan los valores del preset
+    - **hybrid**: Búsqueda léxica + vectorial con reciprocal rank fusion; el
+      umbral solo aplica a los candidatos vectoriales. No admite filtros (422)
+    - **categoria**, **fecha_desde/hasta**, **monto_min/max**: Filtros; la
+      respuesta informa en search_plan, por entidad, si se usó el pre-filtro
+      exacto ("exact") o el índice ("iterative") y las filas estimadas,
+      aunque no haya resultados
+    - **filter_strategy**: Fuerza la estrategia con filtros
     """
+    filters = {
+        key: value
+        for key, value in {
+            "categoria": request.categoria,
+            "fecha_desde": request.fecha_desde,
+            "fecha_hasta": request.fecha_hasta,
+            "monto_min": request.monto_min,
+            "monto_max": request.monto_max
+        }.items()
+        if value is not None
+    }
+    if request.hybrid and filters:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="La búsqueda híbrida no admite filtros de categoría, fecha o monto"
+        )
+    
     try:
-        # Generar embedding de la consulta
-        embeddings_service = EmbeddingsService()
-        query_embedding = embeddings_service.generate_embedding(request.query)
+        embeddings_service = get_embeddings_service()
+        search_service = VectorSearchService(db)
+        index_params = {
+            "preset": request.preset,
+            "ef_search": request.ef_search,
+            "probes": request.probes
+        }
+        
+        # Tras un cutover de modelo, esperar al reinicio con el proveedor nuevo
+        if not await run_in_threadpool(
+            search_service.check_model_version, embeddings_service.model_version
+        ):
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="El modelo de embeddings activo cambió; la búsqueda se habilita al reiniciar"
+            )
+        
+        # Generar embedding de la consulta sin bloquear el event loop
+        query_embedding = await embeddings_service.agenerate_query_embedding(request.query)
         
         if not query_embedding:
             raise HTTPException(
@@ -304,30 +407,82 @@ def search_by_vector(
                 detail="Error generando embedding de búsqueda"
             )
         
-        # Realizar búsqueda vectorial
-        search_service = VectorSearchService(db)
+        # Búsqueda híbrida: la parte léxica usa el texto de la consulta
+        if request.hybrid and request.entity_type in ("gastos", "ingresos", "combined"):
+            gastos, ingresos = [], []
+            for entity_type, results in (("gasto", gastos), ("ingreso", ingresos)):
+                if request.entity_type in (f"{entity_type}s", "combined"):
+                    results.extend(await run_in_threadpool(
+                        search_service.search_hybrid,
+                        current_user.id_usuario,
+                        request.query,
+                        query_embedding,
+                        entity_type,
+                        limit=request.limit,
+                        similarity_threshold=request.similarity_threshold,
+                        **index_params
+                    ))
+            return {"gastos": gastos, "ingresos": ingresos}
         
+        # Búsqueda con filtros: por entidad, planificada antes de buscar
+        if filters and request.entity_type in ("gastos", "ingresos", "combined"):
+            response = {"gastos": [], "ingresos": [], "search_plan": {}}
+            for entity_type, search in (
+                ("gasto", search_service.search_gastos),
+                ("ingreso", search_service.search_ingresos)
+            ):
+                if request.entity_type in (f"{entity_type}s", "combined"):
+                    plan = await run_in_threadpool(
+                        search_service.plan_search,
+                        entity_type,
+                        current_user.id_usuario,
+                        filter_strategy=request.filter_strategy,
+                        **filters
+                    )
+                    response[f"{entity_type}s"] = await run_in_threadpool(
+                        search,
+                        current_user.id_usuario,
+                        query_embedding,
+                        limit=request.limit,
+                        similarity_threshold=request.similarity_threshold,
+                        filter_strategy=plan.get("search_strategy", request.filter_strategy),
+                        **filters,
+                        **index_params
+                    )
+                    response["search_plan"][f"{entity_type}s"] = plan
+            return response
+        
+        # Realizar búsqueda vectorial
         if request.entity_type == "gastos":
-            results = search_service.search_gastos(
+            results = await run_in_threadpool(
+                search_service.search_gastos,
+                current_user.id_usuario,
                 query_embedding,
                 limit=request.limit,
-                similarity_threshold=request.similarity_threshold
+                similarity_threshold=request.similarity_threshold,
+                **index_params
             )
             return {"gastos": results, "ingresos": []}
             
         elif request.entity_type == "ingresos":
-            results = search_service.search_ingresos(
+            results = await run_in_threadpool(
+                search_service.search_ingresos,
+                current_user.id_usuario,
                 query_embedding,
                 limit=request.limit,
-                similarity_threshold=request.similarity_threshold
+                similarity_threshold=request.similarity_threshold,
+                **index_params
             )
             return {"gastos": [], "ingresos": results}
             
         elif request.entity_type == "combined":
-            gastos, ingresos = search_service.search_combined(
+            gastos, ingresos = await run_in_threadpool(
+                search_service.search_combined,
+                current_user.id_usuario,
                 query_embedding,
                 limit=request.limit,
-                similarity_threshold=request.similarity_threshold
+                similarity_threshold=request.similarity_threshold,
+                **index_params
             )
             return {"gastos": gastos, "ingresos": ingresos}
             
@@ -345,156 +500,3 @@ def search_by_vector(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error interno: {str(e)}"
         )
-
-
-# ==================== FUNCIONES AUXILIARES ====================
-
-def _generate_batch_background(
-    db: Session,
-    user_id: int,
-    entity_type: str,
-    entity_ids: Optional[List[int]],
-    force_regenerate: bool
-):
-    """
-    Función ejecutada en background para generar embeddings en lote.
-    """
-    try:
-        embeddings_service = EmbeddingsService()
-        logger.info(
-            f"Iniciando generación batch: {entity_type}, "
-            f"user={user_id}, force={force_regenerate}"
-        )
-        
-        if entity_type == "gasto":
-            # Obtener gastos
-            query = db.query(Gasto).filter(Gasto.id_usuario == user_id)
-            if entity_ids:
-                query = query.filter(Gasto.id_gasto.in_(entity_ids))
-            gastos = query.all()
-            
-            logger.info(f"Procesando {len(gastos)} gastos")
-            
-            for gasto in gastos:
-                # Verificar si ya existe
-                if not force_regenerate:
-                    existing = db.query(GastoEmbedding).filter(
-                        GastoEmbedding.gasto_id == gasto.id_gasto
-                    ).first()
-                    if existing:
-                        continue
-                
-                # Generar embedding
-                gasto_dict = {
-                    "descripcion": gasto.descripcion,
-                    "categoria": gasto.categoria.nombre if gasto.categoria else None,
-                    "monto": gasto.monto,
-                    "moneda": gasto.moneda,
-                    "fecha": gasto.fecha,
-                    "comercio": gasto.comercio
-                }
-                
-                texto = embeddings_service.build_gasto_text(gasto_dict)
-                embedding = embeddings_service.generate_embedding(texto)
-                
-                if embedding:
-                    metadata = embeddings_service.build_metadata(gasto_dict, "gasto")
-                    
-                    if force_regenerate:
-                        # Actualizar existente
-                        existing = db.query(GastoEmbedding).filter(
-                            GastoEmbedding.gasto_id == gasto.id_gasto
-                        ).first()
-                        if existing:
-                            existing.embedding = embedding
-                            existing.texto_original = texto
-                            existing.metadata = metadata
-                        else:
-                            # Crear nuevo
-                            gasto_embedding = GastoEmbedding(
-                                gasto_id=gasto.id_gasto,
-                                embedding=embedding,
-                                texto_original=texto,
-                                metadata=metadata
-                            )
-                            db.add(gasto_embedding)
-                    else:
-                        # Crear nuevo
-                        gasto_embedding = GastoEmbedding(
-                            gasto_id=gasto.id_gasto,
-                            embedding=embedding,
-                            texto_original=texto,
-                            metadata=metadata
-                        )
-                        db.add(gasto_embedding)
-                    
-                    db.commit()
-        
-        elif entity_type == "ingreso":
-            # Similar para ingresos
-            query = db.query(Ingreso).filter(Ingreso.id_usuario == user_id)
-            if entity_ids:
-                query = query.filter(Ingreso.id_ingreso.in_(entity_ids))
-            ingresos = query.all()
-            
-            logger.info(f"Procesando {len(ingresos)} ingresos")
-            
-            for ingreso in ingresos:
-                # Verificar si ya existe
-                if not force_regenerate:
-                    existing = db.query(IngresoEmbedding).filter(
-                        IngresoEmbedding.ingreso_id == ingreso.id_ingreso
-                    ).first()
-                    if existing:
-                        continue
-                
-                # Generar embedding
-                ingreso_dict = {
-                    "descripcion": ingreso.descripcion,
-                    "categoria": ingreso.categoria.nombre if ingreso.categoria else None,
-                    "monto": ingreso.monto,
-                    "moneda": ingreso.moneda,
-                    "fecha": ingreso.fecha
-                }
-                
-                texto = embeddings_service.build_ingreso_text(ingreso_dict)
-                embedding = embeddings_service.generate_embedding(texto)
-                
-                if embedding:
-                    metadata = embeddings_service.build_metadata(ingreso_dict, "ingreso")
-                    
-                    if force_regenerate:
-                        # Actualizar existente
-                        existing = db.query(IngresoEmbedding).filter(
-                            IngresoEmbedding.ingreso_id == ingreso.id_ingreso
-                        ).first()
-                        if existing:
-                            existing.embedding = embedding
-                            existing.texto_original = texto
-                            existing.metadata = metadata
-                        else:
-                            # Crear nuevo
-                            ingreso_embedding = IngresoEmbedding(
-                                ingreso_id=ingreso.id_ingreso,
-                                embedding=embedding,
-                                texto_original=texto,
-                                metadata=metadata
-                            )
-                            db.add(ingreso_embedding)
-                    else:
-                        # Crear nuevo
-                        ingreso_embedding = IngresoEmbedding(
-                            ingreso_id=ingreso.id_ingreso,
-                            embedding=embedding,
-                            texto_original=texto,
-                            metadata=metadata
-                        )
-                        db.add(ingreso_embedding)
-                    
-                    db.commit()
-        
-        logger.info("Generación batch completada exitosamente")
-        
-    except Exception as e:
-        logger.error(f"Error en generación batch: {str(e)}")
-        db.rollback()
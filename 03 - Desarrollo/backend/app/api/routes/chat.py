@@ -44,7 +44,6 @@ from app.models.ingreso import Ingreso
 from app.models.categoria import Categoria
 from app.services.context_builder_service import ContextBuilderService
 from app.services.vector_search_service import VectorSearchService
-from app.services.embeddings_service import EmbeddingsService
 
 router = APIRouter()
 
@@ -52,10 +51,6 @@ router = APIRouter()
 # TODO: Migrar a base de datos para persistencia
 conversaciones = {}
 
-# Inicializar servicios de embeddings (sin db)
-embeddings_service = EmbeddingsService()
-
-
 async def obtener_contexto_con_embeddings(user_id: int, consulta: str, db: Session) -> str:
     """
     Genera contexto financiero usando búsqueda semántica con embeddings
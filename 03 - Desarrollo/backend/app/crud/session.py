@@ -2,6 +2,7 @@ from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
+from app.crud.vector_codec import register_vector_codec
 
 # Crear engine de PostgreSQL
 engine = create_engine(
@@ -13,6 +14,9 @@ engine = create_engine(
     max_overflow=20      # Máximo de conexiones adicionales
 )
 
+# Vectores como arrays float32 en parámetros y resultados
+register_vector_codec(engine)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
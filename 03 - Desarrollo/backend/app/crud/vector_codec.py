@@ -0,0 +1,137 @@
+"""
+Codificación de Vectores
+========================
+Envío y lectura de vectores pgvector sin pasar por listas de Python
+
+Responsabilidades:
+- Adaptar embeddings como parámetros `vector` de psycopg2 (envueltos en
+  `VectorParam`), con la representación float32 más corta (la mitad de
+  bytes que str(float))
+- Registrar en cada conexión del pool (solo en ella) el tipo `vector`,
+  para que las columnas vector se lean directamente como arrays float32
+- Proveer el tipo `Vector` de los modelos, que escribe por el mismo adaptador
+
+psycopg2 interpola los parámetros en el cliente y no tiene protocolo
+binario para ellos; el formato binario de pgvector solo se usa en las
+cargas con COPY (ver app/services/embedding_bulk_loader.py).
+
+Autor: Sistema de Analizador Financiero
+Fecha: 17 octubre 2026
+"""
+
+import logging
+from typing import Any, Optional, Sequence
+
+import numpy as np
+import psycopg2
+from psycopg2.extensions import ISQLQuote, new_type, register_type
+from pgvector.sqlalchemy import Vector as _PgVector
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+
+def to_float32(values: Sequence[float]) -> np.ndarray:
+    """Convierte un embedding en array float32 de una dimensión."""
+    array = np.asarray(values, dtype=np.float32)
+    if array.ndim != 1:
+        raise ValueError("Se esperaba un vector de una dimensión")
+    return array
+
+
+def format_vector(values: Sequence[float]) -> str:
+    """Representación de texto de pgvector ('[0.1,0.2,...]') con floats float32 cortos."""
+    return "[" + ",".join(to_float32(values).astype(str)) + "]"
+
+
+class VectorParam:
+    """
+    Parámetro psycopg2 que se envía como '[...]'::vector.
+
+    Se adapta a sí mismo (`__conform__`), así que no hace falta registrar
+    un adaptador global para ndarray: solo los valores envueltos
+    explícitamente viajan como vector.
+    """
+
+    def __init__(self, values: Sequence[float]):
+        self.array = to_float32(values)
+
+    def __len__(self) -> int:
+        return len(self.array)
+
+    def __conform__(self, protocol: Any) -> Optional["VectorParam"]:
+        if protocol is ISQLQuote:
+            return self
+        return None
+
+    def getquoted(self) -> bytes:
+        return b"'" + format_vector(self.array).encode("ascii") + b"'::vector"
+
+
+def cast_vector(value: Optional[str], cursor: Any) -> Optional[np.ndarray]:
+    """Lee el texto de una columna vector ('[0.1,0.2,...]') como array float32."""
+    if value is None:
+        return None
+    return np.array(value[1:-1].split(","), dtype=np.float32)
+
+
+def register_vector_type(dbapi_connection: Any) -> None:
+    """
+    Registra la lectura del tipo `vector` solo en esta conexión.
+
+    No usa `pgvector.psycopg2.register_vector`, que además registra el tipo
+    para todo el proceso y un adaptador global para np.ndarray (cualquier
+    array de NumPy pasaría a enviarse como vector).
+
+    Raises:
+        psycopg2.ProgrammingError: Si la extensión vector no está instalada
+    """
+    with dbapi_connection.cursor() as cursor:
+        try:
+            cursor.execute("SELECT NULL::vector")
+        except psycopg2.errors.UndefinedObject:
+            raise psycopg2.ProgrammingError("vector type not found in the database")
+        oid = cursor.description[0][1]
+
+    register_type(new_type((oid,), "VECTOR", cast_vector), dbapi_connection)
+
+
+def register_vector_codec(engine: Engine) -> None:
+    """
+    Registra el tipo `vector` en cada conexión nueva del engine.
+
+    Sin la extensión instalada las columnas vector se siguen leyendo como
+    texto. Los parámetros no dependen de este registro (ver `VectorParam`).
+    """
+    if engine.dialect.driver != "psycopg2":
+        return
+
+    @event.listens_for(engine, "connect")
+    def _register(dbapi_connection: Any, connection_record: Any) -> None:
+        try:
+            register_vector_type(dbapi_connection)
+        except psycopg2.ProgrammingError as e:
+            dbapi_connection.rollback()
+            logger.warning(f"Tipo vector no registrado: {str(e)}")
+
+
+class Vector(_PgVector):
+    """
+    Columna `vector` de pgvector que escribe con el adaptador de NumPy.
+
+    En PostgreSQL el embedding viaja como `VectorParam` (float32); en otros
+    motores (ej: SQLite en tests) como texto '[...]'.
+    """
+
+    cache_ok = True
+
+    def bind_processor(self, dialect):
+        def process(value):
+            if value is None:
+                return None
+            param = VectorParam(value)
+            if self.dim is not None and len(param) != self.dim:
+                raise ValueError(f"Se esperaban {self.dim} dimensiones, no {len(param)}")
+            return param if dialect.name == "postgresql" else format_vector(param.array)
+        return process
@@ -80,4 +80,10 @@ def root():
 
 @app.get("/health")
 def health_check():
-    return {"status": "healthy"}
\ No newline at end of file
+    return {"status": "healthy"}
+
+@app.on_event("shutdown")
+def shutdown_embedding_worker():
+    """Procesa los embeddings pendientes antes de apagar el servidor."""
+    from app.services.embedding_worker import get_embedding_worker
+    get_embedding_worker().stop()
\ No newline at end of file
@@ -0,0 +1,51 @@
+"""
+Modelo de Trabajos de Embeddings
+================================
+Modelo SQLAlchemy para la tabla embedding_jobs (database/embedding_jobs.sql)
+
+Cada trabajo genera los embeddings de los gastos o ingresos de un usuario
+por bloques y registra su avance para consultarlo desde la API.
+
+Autor: Sistema de Analizador Financiero
+Fecha: 17 octubre 2026
+"""
+
+from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.sql import func
+from app.crud.base import Base
+
+
+class EmbeddingJob(Base):
+    """Trabajo de generación de embeddings en lote."""
+    __tablename__ = "embedding_jobs"
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    ACTIVE_STATUSES = (QUEUED, RUNNING)
+
+    id = Column(Integer, primary_key=True, index=True)
+    id_usuario = Column(
+        Integer,
+        ForeignKey("usuarios.id_usuario", ondelete="CASCADE"),
+        nullable=False
+    )
+    entity_type = Column(String(20), nullable=False, comment="'gasto' o 'ingreso'")
+    entity_ids = Column(ARRAY(Integer), nullable=True, comment="IDs pedidos (NULL = todos)")
+    force_regenerate = Column(Boolean, nullable=False, default=False)
+    status = Column(String(20), nullable=False, default=QUEUED)
+    total = Column(Integer, nullable=True, comment="Entidades a procesar al iniciar")
+    processed = Column(Integer, nullable=False, default=0)
+    skipped = Column(Integer, nullable=False, default=0)
+    errors = Column(Integer, nullable=False, default=0)
+    last_id = Column(Integer, nullable=False, default=0, comment="Último ID confirmado")
+    error_message = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<EmbeddingJob(id={self.id}, usuario={self.id_usuario}, status={self.status})>"
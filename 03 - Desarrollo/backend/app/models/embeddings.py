@@ -16,8 +16,8 @@ from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Inde
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
-from pgvector.sqlalchemy import Vector
 from app.crud.base import Base
+from app.crud.vector_codec import Vector
 
 # Dimensiones del embedding según el proveedor
 # Azure: 1536, Gemini: 768
@@ -41,6 +41,11 @@ class GastoEmbedding(Base):
         unique=True,  # Un gasto solo tiene un embedding
         index=True
     )
+    id_usuario = Column(
+        Integer,
+        nullable=False,
+        comment="Dueño del gasto; lo completa un trigger (database/embedding_user_scope.sql)"
+    )
     embedding = Column(
         Vector(EMBEDDING_DIMENSIONS),  # Dinámico: 768 (Gemini) o 1536 (Azure)
         nullable=False
@@ -50,6 +55,16 @@ class GastoEmbedding(Base):
         nullable=False,
         comment="Texto usado para generar el embedding"
     )
+    content_hash = Column(
+        String(64),
+        nullable=True,
+        comment="SHA-256 de modelo + texto, para no regenerar si no cambió"
+    )
+    model_version = Column(
+        String(100),
+        nullable=True,
+        comment="proveedor:modelo:dimensiones que generó el embedding"
+    )
     metadata_ = Column(
         "metadata",  # Nombre real de la columna en la BD
         JSONB,
@@ -83,6 +98,9 @@ class GastoEmbedding(Base):
         # Índice GIN para búsqueda en metadata JSONB
         Index('idx_gastos_embeddings_metadata', 'metadata', postgresql_using='gin'),
         
+        # Índice para acotar las búsquedas a un usuario
+        Index('idx_gastos_embeddings_usuario', 'id_usuario'),
+        
         # Índice para ordenamiento por fecha
         Index('idx_gastos_embeddings_created_at', 'created_at'),
     )
@@ -108,6 +126,11 @@ class IngresoEmbedding(Base):
         unique=True,  # Un ingreso solo tiene un embedding
         index=True
     )
+    id_usuario = Column(
+        Integer,
+        nullable=False,
+        comment="Dueño del ingreso; lo completa un trigger (database/embedding_user_scope.sql)"
+    )
     embedding = Column(
         Vector(EMBEDDING_DIMENSIONS),  # Dinámico: 768 (Gemini) o 1536 (Azure)
         nullable=False
@@ -117,6 +140,16 @@ class IngresoEmbedding(Base):
         nullable=False,
         comment="Texto usado para generar el embedding"
     )
+    content_hash = Column(
+        String(64),
+        nullable=True,
+        comment="SHA-256 de modelo + texto, para no regenerar si no cambió"
+    )
+    model_version = Column(
+        String(100),
+        nullable=True,
+        comment="proveedor:modelo:dimensiones que generó el embedding"
+    )
     metadata_ = Column(
         "metadata",  # Nombre real de la columna en la BD
         JSONB,
@@ -150,6 +183,9 @@ class IngresoEmbedding(Base):
         # Índice GIN para búsqueda en metadata JSONB
         Index('idx_ingresos_embeddings_metadata', 'metadata', postgresql_using='gin'),
         
+        # Índice para acotar las búsquedas a un usuario
+        Index('idx_ingresos_embeddings_usuario', 'id_usuario'),
+        
         # Índice para ordenamiento por fecha
         Index('idx_ingresos_embeddings_created_at', 'created_at'),
     )
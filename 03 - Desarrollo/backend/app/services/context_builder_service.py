@@ -414,17 +414,15 @@ class ContextBuilderService:
             # Instanciar servicio de búsqueda vectorial
             vector_search = VectorSearchService(db)
             
-            # Buscar gastos e ingresos relevantes usando embeddings
-            gastos_resultados = await vector_search.buscar_gastos_similares(
-                user_id=user_id,
-                query_text=consulta,
-                limite=limite_gastos
-            )
-            
-            ingresos_resultados = await vector_search.buscar_ingresos_similares(
-                user_id=user_id,
-                query_text=consulta,
-                limite=limite_ingresos
+            # Buscar gastos e ingresos relevantes usando embeddings (un solo
+            # embedding de la consulta y un solo round trip)
+            gastos_resultados, ingresos_resultados = (
+                await vector_search.buscar_gastos_e_ingresos_similares(
+                    user_id=user_id,
+                    query_text=consulta,
+                    limite_gastos=limite_gastos,
+                    limite_ingresos=limite_ingresos
+                )
             )
             
             # Construir contexto desde los resultados
@@ -0,0 +1,520 @@
+"""
+Backfill de Embeddings
+======================
+Recorrido en streaming de los gastos/ingresos pendientes de embeber
+
+Responsabilidades:
+- Encontrar las entidades sin embedding con un anti-join (LEFT JOIN ... IS NULL)
+- Paginar por clave (`id > ultimo_id`) en bloques de tamaño acotado
+- Mantener la memoria constante liberando cada bloque de la sesión
+- Persistir un checkpoint por tipo de entidad para reanudar una corrida interrumpida
+- Llenar la tabla activa o la sombra de una versión de modelo nueva
+- Repartir el backfill en shards procesados por varios procesos, cada uno con
+  su propia conexión y cliente de embeddings, bajo un límite de tasa global
+- Supervisar los procesos y agregar progreso, throughput y errores
+
+Autor: Sistema de Analizador Financiero
+Fecha: 17 octubre 2026
+"""
+
+import os
+import time
+import json
+import queue
+import logging
+import tempfile
+import multiprocessing
+from typing import Dict, Any, Iterator, List, Optional, Tuple, Callable
+
+from sqlalchemy import create_engine, select, func, or_
+from sqlalchemy.orm import Session, joinedload, sessionmaker
+
+from app.models.gasto import Gasto
+from app.models.ingreso import Ingreso
+from app.core.config import settings
+from app.crud.vector_codec import register_vector_codec
+from app.services.embeddings_service import EmbeddingsService
+from app.services.embedding_worker import embed_and_store
+from app.services.embedding_bulk_loader import get_copy_writer
+from app.services.embedding_versions import embedding_table
+from app.utils.rate_limiter import RateLimiter, SharedRateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Tipo de entidad -> (modelo, columna id, columna FK en la tabla de embeddings)
+ENTITY_MODELS = {
+    "gasto": (Gasto, Gasto.id_gasto, "gasto_id"),
+    "ingreso": (Ingreso, Ingreso.id_ingreso, "ingreso_id"),
+}
+
+
+class BackfillCheckpoint:
+    """
+    Último ID procesado por tipo de entidad, persistido en un archivo JSON.
+
+    El archivo se reescribe de forma atómica (archivo temporal + rename)
+    después de cada bloque confirmado, de modo que un corte a mitad de
+    escritura nunca deja un checkpoint corrupto.
+    """
+
+    def __init__(self, path: Optional[str], params: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            path: Ruta del archivo de checkpoint (None = sin persistencia)
+            params: Parámetros de la corrida; si no coinciden con los guardados
+                    el checkpoint se descarta para no saltear registros
+        """
+        self.path = path
+        self.params = params or {}
+        self.last_ids: Dict[str, int] = {}
+        self._load()
+
+    def _load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Checkpoint ilegible en {self.path}, se ignora: {str(e)}")
+            return
+
+        if data.get("params", {}) != self.params:
+            logger.warning(
+                f"El checkpoint {self.path} corresponde a otros parámetros "
+                f"({data.get('params')}), se empieza desde el principio"
+            )
+            return
+
+        self.last_ids = {k: int(v) for k, v in data.get("last_ids", {}).items()}
+
+    def get(self, entity_type: str) -> int:
+        """Retorna el último ID procesado (0 si no hay checkpoint)."""
+        return self.last_ids.get(entity_type, 0)
+
+    def update(self, entity_type: str, last_id: int) -> None:
+        """Registra el último ID procesado y persiste el checkpoint."""
+        self.last_ids[entity_type] = last_id
+        self._save()
+
+    def reset(self) -> None:
+        """Elimina el checkpoint para empezar desde el principio."""
+        self.last_ids = {}
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".checkpoint-")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"params": self.params, "last_ids": self.last_ids}, f)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+def _pending_query(
+    entity_type: str,
+    user_id: Optional[int] = None,
+    include_existing: bool = False,
+    shard: Optional[Tuple[int, int]] = None,
+    shard_by: str = "id",
+    target: str = "active",
+    model_version: Optional[str] = None,
+    entity_ids: Optional[List[int]] = None
+):
+    """Construye el SELECT base de entidades pendientes (sin orden ni límite)."""
+    model, id_column, fk_name = ENTITY_MODELS[entity_type]
+    table = embedding_table(entity_type, target)
+
+    query = select(model)
+    if not include_existing:
+        # Anti-join: la base resuelve la exclusión con el índice único de la FK
+        query = query.outerjoin(table, table.c[fk_name] == id_column)
+        pending = [table.c.id.is_(None)]
+        if target == "shadow":
+            # También las editadas después de copiarse a la sombra: el worker
+            # sigue actualizando la tabla activa durante el backfill
+            active = embedding_table(entity_type)
+            query = query.outerjoin(active, active.c[fk_name] == id_column)
+            pending.append(active.c.updated_at > table.c.updated_at)
+        if model_version:
+            # También las que generó el proveedor de respaldo (filas sin
+            # versión, anteriores al versionado, no se consideran)
+            pending.append(table.c.model_version != model_version)
+        query = query.where(or_(*pending))
+    if user_id:
+        query = query.where(model.id_usuario == user_id)
+    if entity_ids:
+        query = query.where(id_column.in_(entity_ids))
+    if shard:
+        index, count = shard
+        # Módulo estable: el mismo registro cae siempre en el mismo shard
+        shard_column = model.id_usuario if shard_by == "usuario" else id_column
+        query = query.where(shard_column % count == index)
+
+    return query
+
+
+def count_pending(
+    db: Session,
+    entity_type: str,
+    user_id: Optional[int] = None,
+    include_existing: bool = False,
+    after_id: int = 0,
+    shard: Optional[Tuple[int, int]] = None,
+    shard_by: str = "id",
+    target: str = "active",
+    model_version: Optional[str] = None,
+    entity_ids: Optional[List[int]] = None
+) -> int:
+    """Cuenta las entidades pendientes con ID mayor a `after_id`."""
+    _, id_column, _ = ENTITY_MODELS[entity_type]
+    query = _pending_query(
+        entity_type, user_id, include_existing, shard, shard_by, target, model_version,
+        entity_ids
+    ).where(id_column > after_id)
+    return db.execute(select(func.count()).select_from(query.subquery())).scalar_one()
+
+
+def iter_pending_chunks(
+    db: Session,
+    entity_type: str,
+    chunk_size: int,
+    after_id: int = 0,
+    user_id: Optional[int] = None,
+    include_existing: bool = False,
+    shard: Optional[Tuple[int, int]] = None,
+    shard_by: str = "id",
+    target: str = "active",
+    model_version: Optional[str] = None,
+    entity_ids: Optional[List[int]] = None
+) -> Iterator[List[Any]]:
+    """
+    Recorre en bloques las entidades pendientes de embeber.
+
+    Cada bloque es una consulta `WHERE id > ultimo_id ORDER BY id LIMIT n`,
+    por lo que el costo no crece con el avance y nunca se materializa más
+    de un bloque. El bloque anterior se libera de la sesión antes de pedir
+    el siguiente.
+
+    Args:
+        db: Sesión de base de datos
+        entity_type: "gasto" o "ingreso"
+        chunk_size: Entidades por bloque
+        after_id: Último ID ya procesado (checkpoint)
+        user_id: Solo entidades de este usuario
+        include_existing: Incluye las que ya tienen embedding (regeneración)
+        shard: (índice, cantidad) para recorrer solo una partición
+        shard_by: Columna de partición: "id" o "usuario" (id_usuario)
+        target: Tabla destino: "active" o "shadow"
+        model_version: Incluye las filas guardadas con otra versión de modelo
+                       (ej: generadas por el proveedor de respaldo)
+        entity_ids: Solo estas entidades
+
+    Yields:
+        Listas de entidades ORM con la categoría cargada, ordenadas por ID
+    """
+    model, id_column, _ = ENTITY_MODELS[entity_type]
+    base_query = _pending_query(
+        entity_type, user_id, include_existing, shard, shard_by, target, model_version,
+        entity_ids
+    ).options(
+        joinedload(model.categoria)
+    )
+    last_id = after_id
+
+    while True:
+        chunk = db.execute(
+            base_query.where(id_column > last_id).order_by(id_column).limit(chunk_size)
+        ).scalars().unique().all()
+
+        if not chunk:
+            return
+
+        last_id = getattr(chunk[-1], id_column.key)
+        yield chunk
+
+        # Liberar el bloque para mantener la memoria acotada
+        db.expunge_all()
+
+
+# ==================== BACKFILL EN PARALELO ====================
+
+def shard_checkpoint_path(path: Optional[str], index: int, count: int) -> Optional[str]:
+    """Ruta del checkpoint de un shard (ej: backfill.shard2of8.json)."""
+    if not path:
+        return None
+    root, ext = os.path.splitext(path)
+    return f"{root}.shard{index}of{count}{ext or '.json'}"
+
+
+def process_shard(
+    db: Session,
+    embeddings_service: Any,
+    options: Dict[str, Any],
+    checkpoint: BackfillCheckpoint,
+    emit: Callable[[Dict[str, Any]], None]
+) -> None:
+    """
+    Procesa todos los bloques pendientes de un shard.
+
+    Después de cada bloque confirmado actualiza el checkpoint y emite un
+    evento de progreso para el supervisor.
+
+    Args:
+        db: Sesión propia del shard
+        embeddings_service: Cliente de embeddings propio del shard
+        options: Opciones del backfill (ver BackfillSupervisor)
+        checkpoint: Checkpoint del shard
+        emit: Función que publica eventos de progreso
+    """
+    shard = (options["shard_index"], options["shard_count"])
+    force = options.get("force_regenerate", False)
+    target = options.get("target", "active")
+    writer = get_copy_writer(options.get("copy_format"))
+
+    for entity_type in options["entity_types"]:
+        chunks = iter_pending_chunks(
+            db, entity_type, options["batch_size"],
+            after_id=checkpoint.get(entity_type),
+            user_id=options.get("user_id"),
+            include_existing=force,
+            shard=shard,
+            shard_by=options.get("shard_by", "id"),
+            target=target,
+            model_version=embeddings_service.model_version
+        )
+        for chunk in chunks:
+            last_id = getattr(chunk[-1], ENTITY_MODELS[entity_type][1].key)
+
+            if options.get("dry_run"):
+                saved, unchanged = len(chunk), 0
+            else:
+                try:
+                    saved, unchanged = embed_and_store(
+                        db, entity_type, chunk, embeddings_service,
+                        force=force, target=target, writer=writer
+                    )
+                    db.commit()
+                except Exception:
+                    db.rollback()
+                    raise
+                checkpoint.update(entity_type, last_id)
+
+            emit({
+                "shard": shard[0],
+                "entity_type": entity_type,
+                "processed": saved,
+                "skipped": unchanged,
+                "errors": len(chunk) - saved - unchanged,
+                "last_id": last_id
+            })
+
+
+def run_shard(
+    options: Dict[str, Any],
+    rate_limiter: Optional[RateLimiter],
+    events: Any
+) -> None:
+    """
+    Punto de entrada de cada proceso del backfill.
+
+    Crea una conexión y un cliente de embeddings propios (nada se hereda del
+    proceso padre) y usa el limitador compartido para respetar el límite global.
+    """
+    index, count = options["shard_index"], options["shard_count"]
+    engine = create_engine(
+        options.get("database_url") or settings.database_url,
+        pool_size=1,
+        max_overflow=0,
+        pool_pre_ping=True
+    )
+    register_vector_codec(engine)
+    db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+    embeddings_service = EmbeddingsService(options.get("provider"))
+    embeddings_service.rate_limiter = rate_limiter
+
+    checkpoint = BackfillCheckpoint(
+        None if options.get("dry_run") else shard_checkpoint_path(
+            options.get("checkpoint_file"), index, count
+        ),
+        params={
+            "user_id": options.get("user_id"),
+            "force_regenerate": options.get("force_regenerate", False),
+            "target": options.get("target", "active"),
+            "model_version": embeddings_service.model_version,
+            "shard": [index, count, options.get("shard_by", "id")]
+        }
+    )
+
+    try:
+        process_shard(db, embeddings_service, options, checkpoint, events.put)
+        if not options.get("dry_run"):
+            checkpoint.reset()
+        events.put({"shard": index, "done": True})
+    except Exception as e:
+        logger.exception(f"Shard {index}/{count} falló")
+        events.put({"shard": index, "error": f"{type(e).__name__}: {str(e)}"})
+        raise SystemExit(1)
+    finally:
+        db.close()
+        engine.dispose()
+
+
+class BackfillSupervisor:
+    """
+    Lanza un proceso por shard y agrega su progreso.
+
+    Cada proceso recorre su partición (`id % workers` o `id_usuario % workers`)
+    con su propio checkpoint, así que una corrida interrumpida se reanuda con
+    la misma cantidad de workers. Todos comparten un único limitador de tasa
+    en memoria compartida, por lo que `workers` no multiplica las RPM/TPM.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        options: Dict[str, Any],
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        report_interval: float = 10.0,
+        start_method: str = "spawn",
+        target: Callable[..., None] = run_shard
+    ):
+        """
+        Args:
+            workers: Cantidad de procesos (y de shards)
+            options: entity_types, batch_size, user_id, force_regenerate,
+                     dry_run, shard_by ("id" o "usuario"), checkpoint_file,
+                     target ("active" o "shadow"), provider
+            requests_per_minute: Límite global de requests (0/None = sin límite)
+            tokens_per_minute: Límite global de tokens (0/None = sin límite)
+            report_interval: Segundos entre reportes de progreso
+            start_method: Método de multiprocessing ("spawn", "fork", ...)
+            target: Función ejecutada por cada proceso
+        """
+        self.workers = workers
+        self.options = options
+        self.report_interval = report_interval
+        self.target = target
+        self.context = multiprocessing.get_context(start_method)
+        self.rate_limiter = SharedRateLimiter(
+            requests_per_minute, tokens_per_minute, context=self.context
+        )
+
+        self.shards: Dict[int, Dict[str, Any]] = {
+            index: {"status": "pending", "processed": 0, "skipped": 0, "errors": 0,
+                    "last_ids": {}, "error": None}
+            for index in range(workers)
+        }
+        self.totals: Dict[str, Dict[str, int]] = {}
+        self.started_at: Optional[float] = None
+
+    def handle_event(self, event: Dict[str, Any]) -> None:
+        """Incorpora un evento de progreso de un shard."""
+        shard = self.shards[event["shard"]]
+
+        if event.get("done"):
+            shard["status"] = "done"
+            return
+        if "error" in event:
+            shard["status"] = "failed"
+            shard["error"] = event["error"]
+            return
+
+        totals = self.totals.setdefault(
+            event["entity_type"], {"processed": 0, "skipped": 0, "errors": 0}
+        )
+        for key in ("processed", "skipped", "errors"):
+            shard[key] += event[key]
+            totals[key] += event[key]
+        shard["last_ids"][event["entity_type"]] = event["last_id"]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Retorna el progreso agregado y por shard."""
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0.0
+        resolved = sum(s["processed"] + s["skipped"] for s in self.shards.values())
+        return {
+            "workers": self.workers,
+            "elapsed_seconds": round(elapsed, 1),
+            "throughput_per_second": round(resolved / elapsed, 2) if elapsed else 0.0,
+            "totals": self.totals,
+            "shards": self.shards
+        }
+
+    def _report(self) -> None:
+        stats = self.get_stats()
+        processed = sum(t["processed"] for t in self.totals.values())
+        errors = sum(t["errors"] for t in self.totals.values())
+        running = sum(1 for s in self.shards.values() if s["status"] == "running")
+        logger.info(
+            f"Backfill: {processed} embeddings, {errors} errores, "
+            f"{stats['throughput_per_second']}/s, {running}/{self.workers} shards activos"
+        )
+
+    def run(self) -> Dict[str, Any]:
+        """
+        Ejecuta todos los shards y espera a que terminen.
+
+        Returns:
+            Estadísticas finales (ver get_stats)
+        """
+        events = self.context.Queue()
+        processes = []
+        self.started_at = time.monotonic()
+
+        for index in range(self.workers):
+            options = {**self.options, "shard_index": index, "shard_count": self.workers}
+            process = self.context.Process(
+                target=self.target,
+                args=(options, self.rate_limiter, events),
+                name=f"embedding-backfill-{index}"
+            )
+            process.start()
+            processes.append(process)
+            self.shards[index]["status"] = "running"
+
+        last_report = time.monotonic()
+        try:
+            while any(p.is_alive() for p in processes):
+                try:
+                    self.handle_event(events.get(timeout=0.5))
+                except queue.Empty:
+                    pass
+
+                if time.monotonic() - last_report >= self.report_interval:
+                    self._report()
+                    last_report = time.monotonic()
+        except KeyboardInterrupt:
+            logger.warning("Backfill interrumpido, deteniendo shards (se reanudan con el checkpoint)")
+            for process in processes:
+                process.terminate()
+            raise
+        finally:
+            for process in processes:
+                process.join()
+
+            # Eventos que quedaron en la cola al terminar los procesos
+            while True:
+                try:
+                    self.handle_event(events.get(timeout=0.1))
+                except queue.Empty:
+                    break
+
+        for index, process in enumerate(processes):
+            shard = self.shards[index]
+            if shard["status"] != "done" and process.exitcode != 0:
+                shard["status"] = "failed"
+                shard["error"] = shard["error"] or f"exit code {process.exitcode}"
+
+        self._report()
+        return self.get_stats()
@@ -0,0 +1,217 @@
+"""
+Carga Masiva de Embeddings
+==========================
+Escritura de embeddings con COPY a una tabla temporal y un único upsert
+
+Responsabilidades:
+- Serializar los embeddings en el formato COPY binario de PostgreSQL (los
+  vectores se codifican con numpy, sin pasar por su representación en texto)
+  o en el formato COPY de texto
+- Cargar el bloque en una tabla temporal con COPY FROM STDIN
+- Pasarlo a gastos_embeddings/ingresos_embeddings (o a la sombra) con un solo
+  INSERT ... SELECT ... ON CONFLICT DO UPDATE
+
+Es un reemplazo de `upsert_embeddings` para backfills y migraciones, donde
+el costo de un INSERT con miles de vectores serializados como texto pasa a
+ser el cuello de botella.
+
+Variables de entorno:
+- EMBEDDING_COPY_FORMAT: "binary" o "text" (default: binary)
+
+Autor: Sistema de Analizador Financiero
+Fecha: 17 octubre 2026
+"""
+
+import io
+import os
+import json
+import struct
+import logging
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.crud.vector_codec import format_vector
+
+logger = logging.getLogger(__name__)
+
+COPY_FORMATS = ("binary", "text")
+
+# Columnas cargadas además de la FK, en el orden de la tabla temporal
+_COLUMNS = ("embedding", "texto_original", "content_hash", "model_version", "metadata")
+
+_BINARY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+_BINARY_TRAILER = struct.pack("!h", -1)
+_NULL_FIELD = struct.pack("!i", -1)
+
+
+def _binary_field(data: Optional[bytes]) -> bytes:
+    if data is None:
+        return _NULL_FIELD
+    return struct.pack("!i", len(data)) + data
+
+
+def _binary_vector(embedding: Any) -> bytes:
+    """Formato de envío de pgvector: dimensiones (int16), reservado (int16) y float4."""
+    vector = np.asarray(embedding, dtype=">f4")
+    return struct.pack("!hh", vector.shape[0], 0) + vector.tobytes()
+
+
+def _binary_text(value: Optional[str]) -> Optional[bytes]:
+    return value.encode("utf-8") if value is not None else None
+
+
+def _binary_jsonb(value: Any) -> Optional[bytes]:
+    # jsonb binario: byte de versión (1) seguido del JSON en texto
+    if value is None:
+        return None
+    return b"\x01" + json.dumps(value, default=str).encode("utf-8")
+
+
+def encode_binary(id_column: str, rows: List[Dict[str, Any]]) -> bytes:
+    """
+    Serializa las filas en el formato COPY binario.
+
+    Args:
+        id_column: Columna FK ("gasto_id" o "ingreso_id")
+        rows: Filas con la FK y las columnas de embedding
+
+    Returns:
+        Contenido listo para COPY ... FROM STDIN WITH (FORMAT binary)
+    """
+    buffer = io.BytesIO()
+    buffer.write(_BINARY_HEADER)
+    field_count = struct.pack("!h", 1 + len(_COLUMNS))
+
+    for row in rows:
+        buffer.write(field_count)
+        buffer.write(_binary_field(struct.pack("!i", row[id_column])))
+        buffer.write(_binary_field(_binary_vector(row["embedding"])))
+        buffer.write(_binary_field(_binary_text(row["texto_original"])))
+        buffer.write(_binary_field(_binary_text(row.get("content_hash"))))
+        buffer.write(_binary_field(_binary_text(row.get("model_version"))))
+        buffer.write(_binary_field(_binary_jsonb(row.get("metadata"))))
+
+    buffer.write(_BINARY_TRAILER)
+    return buffer.getvalue()
+
+
+def _text_field(value: Optional[str]) -> str:
+    if value is None:
+        return r"\N"
+    return (
+        value.replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def encode_text(id_column: str, rows: List[Dict[str, Any]]) -> bytes:
+    """
+    Serializa las filas en el formato COPY de texto (separado por tabs).
+
+    Returns:
+        Contenido listo para COPY ... FROM STDIN WITH (FORMAT text)
+    """
+    lines = []
+    for row in rows:
+        metadata = row.get("metadata")
+        lines.append("\t".join((
+            str(row[id_column]),
+            format_vector(row["embedding"]),
+            _text_field(row["texto_original"]),
+            _text_field(row.get("content_hash")),
+            _text_field(row.get("model_version")),
+            _text_field(json.dumps(metadata, default=str) if metadata is not None else None),
+        )))
+    return ("\n".join(lines) + "\n").encode("utf-8") if lines else b""
+
+
+def copy_upsert_embeddings(
+    db: Session,
+    table: Any,
+    id_column: str,
+    values: List[Dict[str, Any]],
+    copy_format: Optional[str] = None
+) -> None:
+    """
+    Inserta o actualiza embeddings con COPY y un único INSERT ... ON CONFLICT.
+
+    Misma interfaz que `upsert_embeddings`; no hace commit. La tabla
+    temporal se crea en la transacción de la sesión y se descarta al final.
+
+    Args:
+        db: Sesión de base de datos (PostgreSQL con psycopg2)
+        table: Tabla destino (activa o sombra)
+        id_column: Columna FK con restricción única
+        values: Filas a escribir
+        copy_format: "binary" o "text" (default: EMBEDDING_COPY_FORMAT)
+
+    Raises:
+        ValueError: Si el formato no es válido
+    """
+    if not values:
+        return
+
+    copy_format = copy_format or os.getenv("EMBEDDING_COPY_FORMAT", "binary")
+    if copy_format not in COPY_FORMATS:
+        raise ValueError(f"Formato de COPY no válido: {copy_format}")
+
+    # ON CONFLICT no admite dos filas con la misma FK: gana la última
+    rows = list({row[id_column]: row for row in values}.values())
+    encode = encode_binary if copy_format == "binary" else encode_text
+    payload = encode(id_column, rows)
+
+    staging = f"{table.name}_staging"
+    columns = ", ".join(_COLUMNS)
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.execute(
+            f"CREATE TEMP TABLE {staging} ("
+            f"{id_column} integer, embedding vector, texto_original text, "
+            f"content_hash varchar(64), model_version varchar(100), metadata jsonb"
+            f") ON COMMIT DROP"
+        )
+        cursor.copy_expert(
+            f"COPY {staging} ({id_column}, {columns}) FROM STDIN WITH (FORMAT {copy_format})",
+            io.BytesIO(payload)
+        )
+        cursor.execute(
+            f"INSERT INTO {table.name} ({id_column}, {columns}) "
+            f"SELECT {id_column}, {columns} FROM {staging} "
+            f"ON CONFLICT ({id_column}) DO UPDATE SET "
+            f"embedding = EXCLUDED.embedding, "
+            f"texto_original = EXCLUDED.texto_original, "
+            f"content_hash = EXCLUDED.content_hash, "
+            f"model_version = EXCLUDED.model_version, "
+            f"metadata = EXCLUDED.metadata, "
+            f"updated_at = now()"
+        )
+        cursor.execute(f"DROP TABLE {staging}")
+    finally:
+        cursor.close()
+
+    logger.debug(f"COPY {copy_format}: {len(rows)} embeddings en {table.name}")
+
+
+def get_copy_writer(copy_format: Optional[str]) -> Optional[Callable[..., None]]:
+    """
+    Retorna la función de escritura para un formato de COPY.
+
+    Args:
+        copy_format: "binary", "text" u "off" (None = EMBEDDING_COPY_FORMAT)
+
+    Returns:
+        Función con la interfaz de `upsert_embeddings`, o None para "off"
+        (usar el INSERT ... VALUES habitual)
+    """
+    if copy_format == "off":
+        return None
+    copy_format = copy_format or os.getenv("EMBEDDING_COPY_FORMAT", "binary")
+    if copy_format not in COPY_FORMATS:
+        raise ValueError(f"Formato de COPY no válido: {copy_format}")
+
+    return partial(copy_upsert_embeddings, copy_format=copy_format)
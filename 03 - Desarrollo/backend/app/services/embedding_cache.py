@@ -0,0 +1,265 @@
+"""
+Caché Persistente de Embeddings
+===============================
+Caché en disco (SQLite) de embeddings direccionada por contenido
+
+Responsabilidades:
+- Evitar llamadas al proveedor para textos que ya fueron embebidos
+- Identificar cada entrada por hash de (modelo, dimensiones, texto preprocesado)
+- Limitar el tamaño en disco con desalojo LRU
+- Llevar contadores de aciertos y fallos
+
+Variables de entorno:
+- EMBEDDING_CACHE_ENABLED: "true" o "false" (default: true)
+- EMBEDDING_CACHE_PATH: ruta del archivo SQLite
+- EMBEDDING_CACHE_MAX_MB: tamaño máximo de los vectores almacenados (default: 512)
+
+Autor: Sistema de Analizador Financiero
+Fecha: 17 octubre 2026
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import tempfile
+import threading
+from typing import List, Optional, Dict, Any, Iterable
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """
+    Caché persistente de embeddings sobre SQLite.
+
+    Los vectores se guardan como float32 en un BLOB. Cada lectura actualiza
+    la marca de último acceso, y cuando el tamaño total supera el máximo se
+    desalojan las entradas menos usadas recientemente.
+    """
+
+    # Al desalojar se libera hasta quedar en este porcentaje del máximo
+    EVICTION_TARGET = 0.9
+
+    def __init__(self, path: str, max_bytes: int):
+        """
+        Abre (o crea) la caché en la ruta indicada.
+
+        Args:
+            path: Ruta del archivo SQLite
+            max_bytes: Tamaño máximo de los vectores almacenados en bytes
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings_cache (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_cache_last_access "
+            "ON embeddings_cache(last_access)"
+        )
+        self._conn.commit()
+
+        self._size_bytes = self._total_size()
+        logger.info(f"EmbeddingCache abierta en {path} ({self._size_bytes} bytes)")
+
+    @staticmethod
+    def make_key(namespace: str, text: str) -> str:
+        """
+        Calcula la clave de una entrada.
+
+        Args:
+            namespace: Identificador de proveedor, modelo y dimensiones
+            text: Texto ya preprocesado
+
+        Returns:
+            Hash SHA-256 en hexadecimal
+        """
+        return hashlib.sha256(f"{namespace}\x00{text}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[List[float]]:
+        """Retorna el vector de la clave o None si no está en caché."""
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, List[float]]:
+        """
+        Busca varias claves en una sola consulta.
+
+        Returns:
+            Diccionario clave -> vector con las claves encontradas
+        """
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return {}
+
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings_cache WHERE key IN ({placeholders})",
+                    chunk
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings_cache SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+
+        return found
+
+    def put(self, key: str, vector: List[float]) -> None:
+        """Guarda un vector en la caché."""
+        self.put_many({key: vector})
+
+    def put_many(self, items: Dict[str, List[float]]) -> None:
+        """
+        Guarda varios vectores en una sola transacción y desaloja si hace falta.
+
+        Args:
+            items: Diccionario clave -> vector
+        """
+        if not items:
+            return
+
+        now = time.time()
+        rows = []
+        for key, vector in items.items():
+            blob = np.asarray(vector, dtype=np.float32).tobytes()
+            rows.append((key, blob, len(blob), now))
+
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings_cache (key, vector, size, last_access) "
+                "VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+            self._size_bytes += sum(row[2] for row in rows)
+
+            if self._size_bytes > self.max_bytes:
+                # Otro proceso puede compartir el archivo: recalcular antes de desalojar
+                self._size_bytes = self._total_size()
+                if self._size_bytes > self.max_bytes:
+                    self._evict()
+
+    def _evict(self) -> None:
+        """Desaloja las entradas menos usadas hasta quedar bajo el objetivo."""
+        target = int(self.max_bytes * self.EVICTION_TARGET)
+        to_free = self._size_bytes - target
+
+        freed = 0
+        victims = []
+        cursor = self._conn.execute(
+            "SELECT key, size FROM embeddings_cache ORDER BY last_access ASC"
+        )
+        for key, size in cursor:
+            victims.append((key,))
+            freed += size
+            if freed >= to_free:
+                break
+
+        self._conn.executemany("DELETE FROM embeddings_cache WHERE key = ?", victims)
+        self._conn.commit()
+
+        self._size_bytes -= freed
+        self.evictions += len(victims)
+        logger.info(f"EmbeddingCache: {len(victims)} entradas desalojadas ({freed} bytes)")
+
+    def _total_size(self) -> int:
+        """Suma el tamaño de los vectores almacenados."""
+        row = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM embeddings_cache"
+        ).fetchone()
+        return int(row[0])
+
+    def clear(self) -> None:
+        """Elimina todas las entradas de la caché."""
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings_cache")
+            self._conn.commit()
+            self._size_bytes = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Retorna estadísticas de uso de la caché.
+
+        Returns:
+            Diccionario con aciertos, fallos, tamaño y desalojos
+        """
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings_cache").fetchone()[0]
+
+        total = self.hits + self.misses
+        return {
+            "path": self.path,
+            "entries": entries,
+            "size_bytes": self._size_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.evictions
+        }
+
+
+_embedding_cache: Optional[EmbeddingCache] = None
+_embedding_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """
+    Obtiene la caché de embeddings del proceso (singleton).
+
+    Returns:
+        La instancia compartida, o None si la caché está deshabilitada
+        o no se pudo abrir
+    """
+    global _embedding_cache
+
+    if os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() != "true":
+        return None
+
+    with _embedding_cache_lock:
+        if _embedding_cache is None:
+            path = os.getenv(
+                "EMBEDDING_CACHE_PATH",
+                os.path.join(tempfile.gettempdir(), "analizador_embeddings_cache.sqlite3")
+            )
+            max_bytes = int(float(os.getenv("EMBEDDING_CACHE_MAX_MB", "512")) * 1024 * 1024)
+            try:
+                _embedding_cache = EmbeddingCache(path, max_bytes)
+            except Exception as e:
+                logger.error(f"No se pudo abrir la caché de embeddings: {str(e)}")
+                return None
+
+        return _embedding_cache
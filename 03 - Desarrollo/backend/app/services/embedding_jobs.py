@@ -0,0 +1,214 @@
+"""
+Trabajos de Embeddings
+======================
+Generación de embeddings en lote como trabajo en segundo plano
+
+Responsabilidades:
+- Registrar los pedidos de /embeddings/generate-batch en embedding_jobs
+- Evitar trabajos duplicados por usuario y entidad (reanudando los abandonados)
+- Ejecutar cada trabajo con su propia sesión y por bloques: un anti-join para
+  encontrar las entidades pendientes, una llamada batch al proveedor y un
+  upsert por bloque
+- Confirmar el avance junto con cada bloque para consultarlo y reanudar
+
+Variables de entorno:
+- EMBEDDING_JOB_CHUNK_SIZE: entidades por bloque (default: 200)
+- EMBEDDING_JOB_STALE_SECONDS: segundos sin avance tras los cuales un trabajo
+  en curso se considera abandonado (default: 600)
+
+Autor: Sistema de Analizador Financiero
+Fecha: 17 octubre 2026
+"""
+
+import os
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.crud.session import SessionLocal
+from app.models.embedding_job import EmbeddingJob
+from app.services.embeddings_service import EmbeddingsService, get_embeddings_service
+from app.services.embedding_backfill import ENTITY_MODELS, count_pending, iter_pending_chunks
+from app.services.embedding_worker import embed_and_store
+
+logger = logging.getLogger(__name__)
+
+
+def _find_active_job(db: Session, user_id: int, entity_type: str) -> Optional[EmbeddingJob]:
+    """Retorna el trabajo en cola o en curso del usuario para la entidad."""
+    return db.query(EmbeddingJob).filter(
+        EmbeddingJob.id_usuario == user_id,
+        EmbeddingJob.entity_type == entity_type,
+        EmbeddingJob.status.in_(EmbeddingJob.ACTIVE_STATUSES)
+    ).first()
+
+
+def _is_stale(job: EmbeddingJob) -> bool:
+    """Indica si un trabajo en curso dejó de avanzar (ej: se reinició la API)."""
+    stale_after = timedelta(seconds=int(os.getenv("EMBEDDING_JOB_STALE_SECONDS", "600")))
+    return job.updated_at is not None and datetime.now(timezone.utc) - job.updated_at > stale_after
+
+
+def create_job(
+    db: Session,
+    user_id: int,
+    entity_type: str,
+    entity_ids: Optional[List[int]] = None,
+    force_regenerate: bool = False
+) -> Tuple[EmbeddingJob, bool]:
+    """
+    Registra un trabajo de generación, o retorna el que ya está en curso.
+
+    Si el usuario ya tiene un trabajo activo para la entidad se retorna ese
+    (con sus parámetros originales). Si está abandonado se vuelve a encolar
+    y continúa desde el último bloque confirmado.
+
+    Args:
+        db: Sesión de base de datos del request
+        user_id: ID del usuario
+        entity_type: "gasto" o "ingreso"
+        entity_ids: IDs específicos (None = todos los del usuario)
+        force_regenerate: Regenerar también los que ya tienen embedding
+
+    Returns:
+        Tupla (trabajo, hay que ejecutarlo)
+    """
+    active = _find_active_job(db, user_id, entity_type)
+    if active is not None:
+        if not _is_stale(active):
+            return active, False
+        logger.warning(f"Trabajo de embeddings {active.id} abandonado: se reanuda")
+        active.status = EmbeddingJob.QUEUED
+        db.commit()
+        return active, True
+
+    job = EmbeddingJob(
+        id_usuario=user_id,
+        entity_type=entity_type,
+        entity_ids=entity_ids or None,
+        force_regenerate=force_regenerate,
+        status=EmbeddingJob.QUEUED
+    )
+    db.add(job)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Otro request creó el trabajo al mismo tiempo (índice único parcial)
+        db.rollback()
+        return _find_active_job(db, user_id, entity_type), False
+
+    db.refresh(job)
+    return job, True
+
+
+def get_job(db: Session, job_id: int, user_id: int) -> Optional[EmbeddingJob]:
+    """Retorna un trabajo del usuario, o None si no existe o es de otro usuario."""
+    return db.query(EmbeddingJob).filter(
+        EmbeddingJob.id == job_id,
+        EmbeddingJob.id_usuario == user_id
+    ).first()
+
+
+def _update_job(db: Session, job_id: int, **values) -> None:
+    """Actualiza el trabajo sin depender de la instancia ORM (los bloques se liberan de la sesión)."""
+    db.query(EmbeddingJob).filter(EmbeddingJob.id == job_id).update(
+        values, synchronize_session=False
+    )
+
+
+def run_embedding_job(
+    job_id: int,
+    session_factory: Callable[[], Session] = SessionLocal,
+    embeddings_service: Optional[EmbeddingsService] = None
+) -> None:
+    """
+    Ejecuta un trabajo de generación de embeddings.
+
+    Abre su propia sesión: corre después de la respuesta, cuando la sesión
+    del request ya está cerrada. Cada bloque se embebe con una llamada batch
+    y se guarda con un upsert en la misma transacción que el avance.
+
+    Args:
+        job_id: ID del trabajo
+        session_factory: Fábrica de sesiones (para tests)
+        embeddings_service: Servicio de embeddings (default: el singleton)
+    """
+    db = session_factory()
+    try:
+        job = db.get(EmbeddingJob, job_id)
+        if job is None:
+            logger.error(f"Trabajo de embeddings {job_id} no encontrado")
+            return
+
+        service = embeddings_service or get_embeddings_service()
+        entity_type = job.entity_type
+        user_id = job.id_usuario
+        entity_ids = job.entity_ids
+        force = job.force_regenerate
+        after_id = job.last_id
+        chunk_size = int(os.getenv("EMBEDDING_JOB_CHUNK_SIZE", "200"))
+
+        # Sin force solo las entidades sin embedding (anti-join); con force todas
+        pending_filters = dict(
+            user_id=user_id,
+            include_existing=force,
+            model_version=service.model_version,
+            entity_ids=entity_ids
+        )
+        values = {"status": EmbeddingJob.RUNNING, "error_message": None}
+        if job.started_at is None:
+            values["started_at"] = datetime.now(timezone.utc)
+        if job.total is None:
+            values["total"] = count_pending(db, entity_type, **pending_filters)
+        _update_job(db, job_id, **values)
+        db.commit()
+
+        logger.info(
+            f"Trabajo de embeddings {job_id}: {entity_type}s del usuario {user_id}, "
+            f"desde el ID {after_id}, force={force}"
+        )
+
+        id_key = ENTITY_MODELS[entity_type][1].key
+        for chunk in iter_pending_chunks(db, entity_type, chunk_size, after_id, **pending_filters):
+            try:
+                saved, unchanged = embed_and_store(db, entity_type, chunk, service, force=force)
+                _update_job(
+                    db, job_id,
+                    processed=EmbeddingJob.processed + saved,
+                    skipped=EmbeddingJob.skipped + unchanged,
+                    errors=EmbeddingJob.errors + (len(chunk) - saved - unchanged),
+                    last_id=getattr(chunk[-1], id_key)
+                )
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+
+        _update_job(
+            db, job_id,
+            status=EmbeddingJob.COMPLETED,
+            finished_at=datetime.now(timezone.utc)
+        )
+        db.commit()
+        logger.info(f"Trabajo de embeddings {job_id} completado")
+
+    except Exception as e:
+        logger.error(f"Trabajo de embeddings {job_id} falló: {str(e)}")
+        db.rollback()
+        try:
+            _update_job(
+                db, job_id,
+                status=EmbeddingJob.FAILED,
+                error_message=str(e)[:1000],
+                finished_at=datetime.now(timezone.utc)
+            )
+            db.commit()
+        except Exception as update_error:
+            # Queda 'running' y se reanuda como abandonado en el próximo pedido
+            logger.error(f"No se pudo marcar el trabajo {job_id} como fallido: {str(update_error)}")
+            db.rollback()
+    finally:
+        db.close()
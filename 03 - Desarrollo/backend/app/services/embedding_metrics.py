@@ -0,0 +1,247 @@
+"""
+Métricas de Embeddings
+======================
+Contadores en memoria del pipeline de embeddings, por proveedor
+
+Responsabilidades:
+- Contar llamadas, textos, tokens, costo estimado, reintentos y fallos
+- Registrar la distribución de tamaños de lote
+- Calcular percentiles de latencia (p50/p95/p99) sobre una ventana reciente
+- Medir el tiempo de espera impuesto por el limitador de tasa
+- Contar las llamadas rechazadas por el circuit breaker y los textos
+  resueltos con el proveedor de respaldo
+- Exportar todo en JSON o en formato de texto de Prometheus
+
+Autor: Sistema de Analizador Financiero
+Fecha: 17 octubre 2026
+"""
+
+import threading
+from collections import deque
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+# Límites superiores de los buckets del histograma de tamaños de lote
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048)
+
+# Cantidad de latencias recientes usadas para los percentiles
+LATENCY_WINDOW = 2048
+
+PERCENTILES = (50, 95, 99)
+
+
+class _ProviderMetrics:
+    """Contadores de un proveedor."""
+
+    def __init__(self):
+        self.calls = 0
+        self.texts = 0
+        self.tokens = 0
+        self.cost_usd = 0.0
+        self.retries = 0
+        self.failures = 0
+        self.throttled_seconds = 0.0
+        self.rejected = 0
+        self.fallback_texts = 0
+        self.latency_sum = 0.0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.batch_sizes = [0] * (len(BATCH_SIZE_BUCKETS) + 1)
+        self.batch_size_sum = 0
+
+    def observe_batch(self, size: int) -> None:
+        self.batch_size_sum += size
+        for i, bound in enumerate(BATCH_SIZE_BUCKETS):
+            if size <= bound:
+                self.batch_sizes[i] += 1
+                return
+        self.batch_sizes[-1] += 1
+
+    def percentiles(self) -> Dict[str, Optional[float]]:
+        if not self.latencies:
+            return {f"p{p}": None for p in PERCENTILES}
+        values = np.percentile(np.fromiter(self.latencies, dtype=np.float64), PERCENTILES)
+        return {f"p{p}": round(float(v), 4) for p, v in zip(PERCENTILES, values)}
+
+
+class EmbeddingMetrics:
+    """
+    Registro de métricas del servicio de embeddings.
+
+    Es seguro entre hilos y se comparte por todo el proceso, de modo que
+    sirve tanto para la API como para el worker y los scripts.
+    """
+
+    def __init__(self):
+        self._providers: Dict[str, _ProviderMetrics] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, provider: str) -> _ProviderMetrics:
+        if provider not in self._providers:
+            self._providers[provider] = _ProviderMetrics()
+        return self._providers[provider]
+
+    def record_call(
+        self,
+        provider: str,
+        batch_size: int,
+        latency: float,
+        tokens: int,
+        cost_usd: float
+    ) -> None:
+        """Registra una llamada exitosa al proveedor."""
+        with self._lock:
+            metrics = self._get(provider)
+            metrics.calls += 1
+            metrics.texts += batch_size
+            metrics.tokens += tokens
+            metrics.cost_usd += cost_usd
+            metrics.latency_sum += latency
+            metrics.latencies.append(latency)
+            metrics.observe_batch(batch_size)
+
+    def record_failure(self, provider: str, batch_size: int) -> None:
+        """Registra una llamada fallida al proveedor."""
+        with self._lock:
+            metrics = self._get(provider)
+            metrics.failures += 1
+            metrics.observe_batch(batch_size)
+
+    def record_retry(self, provider: str) -> None:
+        """Registra un reintento después de un fallo."""
+        with self._lock:
+            self._get(provider).retries += 1
+
+    def record_throttle(self, provider: str, seconds: float) -> None:
+        """Registra el tiempo esperado por el limitador de tasa."""
+        if seconds <= 0:
+            return
+        with self._lock:
+            self._get(provider).throttled_seconds += seconds
+
+    def record_rejected(self, provider: str) -> None:
+        """Registra una llamada rechazada por el circuit breaker."""
+        with self._lock:
+            self._get(provider).rejected += 1
+
+    def record_fallback(self, provider: str, count: int) -> None:
+        """Registra textos que `provider` resolvió como respaldo de otro proveedor."""
+        with self._lock:
+            self._get(provider).fallback_texts += count
+
+    def reset(self) -> None:
+        """Reinicia todas las métricas."""
+        with self._lock:
+            self._providers.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Retorna las métricas por proveedor.
+
+        Returns:
+            Diccionario proveedor -> contadores, latencias y lotes
+        """
+        with self._lock:
+            stats = {}
+            for provider, metrics in self._providers.items():
+                stats[provider] = {
+                    "calls": metrics.calls,
+                    "texts": metrics.texts,
+                    "tokens": metrics.tokens,
+                    "cost_usd": round(metrics.cost_usd, 6),
+                    "retries": metrics.retries,
+                    "failures": metrics.failures,
+                    "throttled_seconds": round(metrics.throttled_seconds, 3),
+                    "rejected": metrics.rejected,
+                    "fallback_texts": metrics.fallback_texts,
+                    "avg_batch_size": round(metrics.texts / metrics.calls, 2) if metrics.calls else 0.0,
+                    "latency_seconds": {
+                        "avg": round(metrics.latency_sum / metrics.calls, 4) if metrics.calls else None,
+                        **metrics.percentiles()
+                    },
+                    "batch_size_buckets": {
+                        **{f"le_{bound}": count for bound, count in zip(BATCH_SIZE_BUCKETS, metrics.batch_sizes)},
+                        "gt_max": metrics.batch_sizes[-1]
+                    }
+                }
+            return stats
+
+    def render_prometheus(self) -> str:
+        """
+        Exporta las métricas en el formato de texto de Prometheus.
+
+        Returns:
+            Texto listo para servir en un endpoint /metrics
+        """
+        lines: List[str] = []
+
+        def metric(name: str, kind: str, help_text: str, samples: List[str]) -> None:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+
+        with self._lock:
+            providers = list(self._providers.items())
+            counters = [
+                ("embedding_requests_total", "calls", "Llamadas exitosas al proveedor"),
+                ("embedding_texts_total", "texts", "Textos embebidos"),
+                ("embedding_tokens_total", "tokens", "Tokens procesados"),
+                ("embedding_cost_usd_total", "cost_usd", "Costo estimado en USD"),
+                ("embedding_retries_total", "retries", "Reintentos tras un fallo"),
+                ("embedding_failures_total", "failures", "Llamadas fallidas al proveedor"),
+                ("embedding_throttled_seconds_total", "throttled_seconds", "Espera por límite de tasa"),
+                ("embedding_rejected_total", "rejected", "Llamadas rechazadas por el circuit breaker"),
+                ("embedding_fallback_texts_total", "fallback_texts", "Textos resueltos como respaldo"),
+            ]
+            for name, attr, help_text in counters:
+                metric(name, "counter", help_text, [
+                    f'{name}{{provider="{p}"}} {getattr(m, attr)}' for p, m in providers
+                ])
+
+            latency_samples = []
+            for provider, metrics in providers:
+                for label, value in metrics.percentiles().items():
+                    if value is not None:
+                        quantile = int(label[1:]) / 100
+                        latency_samples.append(
+                            f'embedding_request_latency_seconds{{provider="{provider}",quantile="{quantile}"}} {value}'
+                        )
+                latency_samples.append(
+                    f'embedding_request_latency_seconds_sum{{provider="{provider}"}} {metrics.latency_sum}'
+                )
+                latency_samples.append(
+                    f'embedding_request_latency_seconds_count{{provider="{provider}"}} {metrics.calls}'
+                )
+            metric("embedding_request_latency_seconds", "summary",
+                   "Latencia de las llamadas al proveedor", latency_samples)
+
+            batch_samples = []
+            for provider, metrics in providers:
+                cumulative = 0
+                for bound, count in zip(BATCH_SIZE_BUCKETS, metrics.batch_sizes):
+                    cumulative += count
+                    batch_samples.append(
+                        f'embedding_batch_size_bucket{{provider="{provider}",le="{bound}"}} {cumulative}'
+                    )
+                total = cumulative + metrics.batch_sizes[-1]
+                batch_samples.append(
+                    f'embedding_batch_size_bucket{{provider="{provider}",le="+Inf"}} {total}'
+                )
+                batch_samples.append(
+                    f'embedding_batch_size_sum{{provider="{provider}"}} {metrics.batch_size_sum}'
+                )
+                batch_samples.append(
+                    f'embedding_batch_size_count{{provider="{provider}"}} {total}'
+                )
+            metric("embedding_batch_size", "histogram",
+                   "Textos por llamada al proveedor", batch_samples)
+
+        return "\n".join(lines) + "\n"
+
+
+_embedding_metrics = EmbeddingMetrics()
+
+
+def get_embedding_metrics() -> EmbeddingMetrics:
+    """Obtiene el registro de métricas de embeddings del proceso."""
+    return _embedding_metrics
@@ -0,0 +1,193 @@
+"""
+Versiones de Embeddings
+=======================
+Versionado del modelo de embeddings con tablas sombra y cambio atómico
+
+Responsabilidades:
+- Resolver la tabla destino de cada entidad (activa o sombra)
+- Consultar la versión de modelo activa (con caché corta en memoria)
+- Crear la sombra, activarla (cutover) y volver atrás (rollback) mediante
+  las funciones SQL de database/embedding_versions.sql
+- Reportar el avance del backfill de la sombra
+
+Variables de entorno:
+- EMBEDDING_VERSION_CACHE_SECONDS: vigencia de la versión activa leída (default: 30)
+
+Autor: Sistema de Analizador Financiero
+Fecha: 17 octubre 2026
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import Dict, Any, Optional, Tuple
+
+from sqlalchemy import MetaData, Table, text
+from sqlalchemy.orm import Session
+
+from app.models.embeddings import GastoEmbedding, IngresoEmbedding
+
+logger = logging.getLogger(__name__)
+
+TARGETS = ("active", "shadow")
+
+# Tipo de entidad -> (tabla de embeddings activa, tabla de la entidad)
+_ENTITY_TABLES = {
+    "gasto": (GastoEmbedding.__table__, "gastos"),
+    "ingreso": (IngresoEmbedding.__table__, "ingresos"),
+}
+
+_shadow_metadata = MetaData()
+_shadow_tables: Dict[str, Table] = {}
+
+_active_version_cache: Tuple[float, Optional[str]] = (0.0, None)
+_active_version_lock = threading.Lock()
+
+
+def embedding_table(entity_type: str, target: str = "active") -> Table:
+    """
+    Retorna la tabla de embeddings de una entidad.
+
+    Args:
+        entity_type: "gasto" o "ingreso"
+        target: "active" (tablas *_embeddings) o "shadow" (*_embeddings_shadow)
+    """
+    table = _ENTITY_TABLES[entity_type][0]
+    if target == "active":
+        return table
+    if target != "shadow":
+        raise ValueError(f"Destino de embeddings no válido: {target}")
+
+    if entity_type not in _shadow_tables:
+        # Misma estructura que la activa; las dimensiones del vector solo
+        # importan para el DDL, que crea create_embedding_shadow()
+        _shadow_tables[entity_type] = table.to_metadata(
+            _shadow_metadata, name=f"{table.name}_shadow"
+        )
+    return _shadow_tables[entity_type]
+
+
+def get_active_model_version(db: Session, max_age: Optional[float] = None) -> Optional[str]:
+    """
+    Retorna la versión de modelo activa registrada en la base.
+
+    El valor se cachea unos segundos para no agregar una consulta a cada
+    búsqueda. None significa que no hay versiones registradas (instalación
+    previa al versionado) y la aplicación usa la configuración del entorno.
+    """
+    global _active_version_cache
+
+    if max_age is None:
+        max_age = float(os.getenv("EMBEDDING_VERSION_CACHE_SECONDS", "30"))
+
+    with _active_version_lock:
+        fetched_at, version = _active_version_cache
+        if time.monotonic() - fetched_at < max_age:
+            return version
+
+    try:
+        version = db.execute(text(
+            "SELECT model_version FROM embedding_model_versions WHERE status = 'active'"
+        )).scalar()
+    except Exception as e:
+        logger.warning(f"No se pudo leer la versión de embeddings activa: {str(e)}")
+        db.rollback()
+        version = None
+
+    with _active_version_lock:
+        _active_version_cache = (time.monotonic(), version)
+    return version
+
+
+def invalidate_active_version_cache() -> None:
+    """Descarta la versión activa cacheada (ej: después de un cutover)."""
+    global _active_version_cache
+    with _active_version_lock:
+        _active_version_cache = (0.0, None)
+
+
+def get_building_model_version(db: Session) -> Optional[str]:
+    """Retorna la versión de modelo cuya sombra está en construcción."""
+    return db.execute(text(
+        "SELECT model_version FROM embedding_model_versions WHERE status = 'building'"
+    )).scalar()
+
+
+def is_model_version_active(db: Session, model_version: str) -> bool:
+    """Indica si los embeddings de `model_version` son comparables con los activos."""
+    active = get_active_model_version(db)
+    return active is None or active == model_version
+
+
+def create_shadow(db: Session, model_version: str, dimensions: int) -> None:
+    """Crea (o recrea vacías) las tablas sombra para `model_version`."""
+    db.execute(
+        text("SELECT create_embedding_shadow(:model_version, :dimensions)"),
+        {"model_version": model_version, "dimensions": dimensions}
+    )
+    db.commit()
+    logger.info(f"Tablas sombra creadas para {model_version} ({dimensions} dimensiones)")
+
+
+def cutover(db: Session) -> str:
+    """
+    Activa la versión sombra intercambiando las tablas en una transacción.
+
+    Returns:
+        Versión de modelo activada
+    """
+    version = db.execute(text("SELECT cutover_embedding_shadow()")).scalar()
+    db.commit()
+    invalidate_active_version_cache()
+    logger.info(f"Versión de embeddings activada: {version}")
+    return version
+
+
+def rollback_cutover(db: Session) -> Optional[str]:
+    """
+    Vuelve a activar las tablas retiradas en el último cutover.
+
+    Returns:
+        Versión de modelo reactivada
+    """
+    version = db.execute(text("SELECT rollback_embedding_cutover()")).scalar()
+    db.commit()
+    invalidate_active_version_cache()
+    logger.info(f"Rollback de embeddings a la versión: {version}")
+    return version
+
+
+def get_versions_status(db: Session) -> Dict[str, Any]:
+    """
+    Retorna las versiones registradas y la cobertura de cada tabla.
+
+    Returns:
+        Diccionario con las versiones y, por entidad, la cantidad de
+        registros y de embeddings en la tabla activa y en la sombra
+    """
+    versions = [
+        dict(row._mapping)
+        for row in db.execute(text(
+            "SELECT model_version, dimensions, status, created_at, activated_at "
+            "FROM embedding_model_versions ORDER BY id"
+        ))
+    ]
+
+    coverage = {}
+    for entity_type, (table, entity_table) in _ENTITY_TABLES.items():
+        coverage[entity_type] = {
+            "total": db.execute(text(f"SELECT COUNT(*) FROM {entity_table}")).scalar(),
+            "active": db.execute(text(f"SELECT COUNT(*) FROM {table.name}")).scalar(),
+            "shadow": _count_if_exists(db, f"{table.name}_shadow")
+        }
+
+    return {"versions": versions, "coverage": coverage}
+
+
+def _count_if_exists(db: Session, table_name: str) -> Optional[int]:
+    """Cuenta las filas de una tabla, o None si la tabla no existe."""
+    exists = db.execute(text("SELECT to_regclass(:name)"), {"name": table_name}).scalar()
+    if exists is None:
+        return None
+    return db.execute(text(f"SELECT COUNT(*) FROM {table_name}")).scalar()
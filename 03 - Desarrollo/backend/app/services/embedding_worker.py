@@ -0,0 +1,438 @@
+"""
+Worker de Embeddings
+====================
+Worker en proceso que genera los embeddings de gastos e ingresos modificados
+
+Responsabilidades:
+- Acumular durante una ventana corta los IDs de gastos/ingresos a embeber
+- Deduplicar los IDs repetidos (altas y ediciones seguidas del mismo registro)
+- Omitir las entidades cuyo texto no cambió (hash del contenido)
+- Cargar todas las filas en una sola consulta con las categorías incluidas
+- Generar los embeddings en una única llamada batch al proveedor
+- Guardar todos los embeddings con un único INSERT ... ON CONFLICT
+- Re-embeber solo los gastos/ingresos afectados cuando se renombra una categoría
+
+Variables de entorno:
+- EMBEDDING_WORKER_WINDOW_SECONDS: ventana de acumulación (default: 0.5)
+- EMBEDDING_WORKER_MAX_BATCH: máximo de IDs por ciclo (default: 256)
+
+Autor: Sistema de Analizador Financiero
+Fecha: 17 octubre 2026
+"""
+
+import os
+import logging
+import threading
+from typing import List, Dict, Any, Iterable, Callable, Optional, Set, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session, joinedload
+
+from app.crud.session import SessionLocal
+from app.models.gasto import Gasto
+from app.models.ingreso import Ingreso
+from app.services.embeddings_service import get_embeddings_service
+from app.services.embedding_versions import embedding_table, is_model_version_active
+from app.services.vector_invalidation import mark_changed
+
+logger = logging.getLogger(__name__)
+
+# Campos de la categoría que forman parte del texto embebido (ver gasto_to_dict).
+# De la moneda solo se embebe el código, que es la clave y no se edita.
+CATEGORY_TEXT_FIELDS = ("nombre",)
+
+
+def gasto_to_dict(gasto: Gasto) -> Dict[str, Any]:
+    """Construye el diccionario de un gasto para texto y metadata del embedding."""
+    return {
+        "descripcion": gasto.descripcion,
+        "categoria": gasto.categoria.nombre if gasto.categoria else None,
+        "monto": gasto.monto,
+        "moneda": gasto.moneda,
+        "fecha": gasto.fecha,
+        "comercio": gasto.comercio,
+        "fuente": gasto.fuente
+    }
+
+
+def ingreso_to_dict(ingreso: Ingreso) -> Dict[str, Any]:
+    """Construye el diccionario de un ingreso para texto y metadata del embedding."""
+    return {
+        "descripcion": ingreso.descripcion,
+        "categoria": ingreso.categoria.nombre if ingreso.categoria else None,
+        "monto": ingreso.monto,
+        "moneda": ingreso.moneda,
+        "fecha": ingreso.fecha,
+        "fuente": ingreso.fuente
+    }
+
+
+def upsert_embeddings(db: Session, table: Any, id_column: str, values: List[Dict[str, Any]]) -> None:
+    """Inserta o actualiza todos los embeddings en una sola sentencia."""
+    stmt = insert(table).values(values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[id_column],
+        set_={
+            "embedding": stmt.excluded.embedding,
+            "texto_original": stmt.excluded.texto_original,
+            "content_hash": stmt.excluded.content_hash,
+            "model_version": stmt.excluded.model_version,
+            "metadata": stmt.excluded["metadata"],
+            "updated_at": func.now()
+        }
+    )
+    db.execute(stmt)
+
+
+def embed_and_store(
+    db: Session,
+    entity_type: str,
+    rows: List[Any],
+    embeddings_service: Any,
+    force: bool = False,
+    target: str = "active",
+    writer: Optional[Callable[..., None]] = None
+) -> Tuple[int, int]:
+    """
+    Genera y guarda (sin commit) los embeddings de gastos o ingresos ya cargados.
+
+    Las entidades cuyo texto no cambió se omiten salvo que `force` sea True.
+    Es el núcleo compartido por el worker y los scripts de backfill.
+
+    Args:
+        db: Sesión de base de datos
+        entity_type: "gasto" o "ingreso"
+        rows: Entidades ORM con la categoría cargada
+        embeddings_service: Servicio de embeddings a usar
+        force: Regenera aunque el texto no haya cambiado
+        target: Tabla destino: "active" o "shadow" (backfill de un modelo nuevo)
+        writer: Función de escritura con la interfaz de `upsert_embeddings`
+                (ej: la carga con COPY de embedding_bulk_loader)
+
+    Returns:
+        Tupla (guardadas, sin cambios)
+    """
+    table = embedding_table(entity_type, target)
+    if entity_type == "gasto":
+        id_column = "gasto_id"
+        entities = [(row.id_gasto, gasto_to_dict(row)) for row in rows]
+        texts = [embeddings_service.build_gasto_text(data) for _, data in entities]
+    else:
+        id_column = "ingreso_id"
+        entities = [(row.id_ingreso, ingreso_to_dict(row)) for row in rows]
+        texts = [embeddings_service.build_ingreso_text(data) for _, data in entities]
+
+    if force:
+        pending = [(entity_id, data, texto) for (entity_id, data), texto in zip(entities, texts)]
+    else:
+        # Descartar las entidades cuyo texto no cambió (ej: cambios de estado)
+        fk_column = table.c[id_column]
+        stored = {
+            row[0]: (row[1], row[2])
+            for row in db.query(fk_column, table.c.content_hash, table.c.texto_original).filter(
+                fk_column.in_([entity_id for entity_id, _ in entities])
+            )
+        }
+        pending = [
+            (entity_id, data, texto)
+            for (entity_id, data), texto in zip(entities, texts)
+            if not embeddings_service.is_embedding_current(
+                *stored.get(entity_id, (None, None)), texto
+            )
+        ]
+    unchanged = len(entities) - len(pending)
+
+    # Cada vector viene con el modelo que lo generó; los textos que solo un
+    # respaldo de otro modelo podría resolver quedan pendientes (None)
+    embeddings, versions = embeddings_service.generate_embeddings_batch_versioned(
+        [texto for _, _, texto in pending]
+    )
+
+    values = [
+        {
+            id_column: entity_id,
+            "embedding": embedding,
+            "texto_original": texto,
+            "content_hash": embeddings_service.content_hash(texto, model_version),
+            "model_version": model_version,
+            "metadata": embeddings_service.build_metadata(data, entity_type)
+        }
+        for (entity_id, data, texto), embedding, model_version in zip(pending, embeddings, versions)
+        if embedding is not None
+    ]
+
+    if values:
+        (writer or upsert_embeddings)(db, table, id_column, values)
+        if target == "active":
+            # Las cachés de búsqueda de estos usuarios se invalidan al confirmar
+            mark_changed(db, entity_type, {row.id_usuario for row in rows})
+
+    return len(values), unchanged
+
+
+class EmbeddingWorker:
+    """
+    Worker de un solo hilo que procesa en lote los embeddings pendientes.
+
+    Los endpoints llaman a `enqueue` y retornan de inmediato; el hilo espera
+    la ventana de acumulación (o a juntar `max_batch` IDs) y procesa todo lo
+    pendiente de cada tipo de entidad de una vez.
+    """
+
+    ENTITY_TYPES = ("gasto", "ingreso")
+
+    def __init__(
+        self,
+        window_seconds: float = 0.5,
+        max_batch: int = 256,
+        session_factory: Callable[[], Session] = SessionLocal
+    ):
+        """
+        Args:
+            window_seconds: Segundos que se acumulan IDs antes de procesar
+            max_batch: Máximo de IDs por ciclo (procesa antes si se alcanza)
+            session_factory: Fábrica de sesiones de base de datos
+        """
+        self.window_seconds = window_seconds
+        self.max_batch = max_batch
+        self.session_factory = session_factory
+
+        self._pending: Dict[str, Set[int]] = {entity: set() for entity in self.ENTITY_TYPES}
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+
+        self.stats = {
+            "enqueued": 0,
+            "processed": 0,
+            "unchanged": 0,
+            "failed": 0,
+            "cycles": 0
+        }
+
+    # ==================== API PÚBLICA ====================
+
+    def enqueue(self, entity_type: str, entity_ids: Iterable[int]) -> None:
+        """
+        Marca gastos o ingresos para (re)generar su embedding.
+
+        Args:
+            entity_type: "gasto" o "ingreso"
+            entity_ids: IDs de las entidades creadas o modificadas
+        """
+        if entity_type not in self._pending:
+            raise ValueError(f"Tipo de entidad no válido: {entity_type}")
+
+        with self._condition:
+            before = len(self._pending[entity_type])
+            self._pending[entity_type].update(entity_ids)
+            self.stats["enqueued"] += len(self._pending[entity_type]) - before
+
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping = False
+                self._thread = threading.Thread(
+                    target=self._run, name="embedding-worker", daemon=True
+                )
+                self._thread.start()
+
+            self._condition.notify()
+
+    def flush(self) -> None:
+        """Procesa de inmediato todo lo pendiente en el hilo que llama."""
+        for entity_type, ids in self._take_pending().items():
+            self._process(entity_type, ids)
+
+    def stop(self, timeout: float = 30.0) -> None:
+        """Detiene el hilo después de procesar lo pendiente."""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+        self.flush()
+
+    # ==================== CICLO DEL WORKER ====================
+
+    def _pending_count(self) -> int:
+        return sum(len(ids) for ids in self._pending.values())
+
+    def _take_pending(self) -> Dict[str, List[int]]:
+        """Retira los IDs pendientes de todos los tipos."""
+        with self._condition:
+            taken = {
+                entity_type: sorted(ids)
+                for entity_type, ids in self._pending.items() if ids
+            }
+            for ids in self._pending.values():
+                ids.clear()
+        return taken
+
+    def _run(self) -> None:
+        """Bucle principal: espera trabajo, acumula durante la ventana y procesa."""
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending_count() or self._stopping)
+                if self._stopping:
+                    return
+
+                # Acumular hasta cerrar la ventana o juntar un lote completo
+                self._condition.wait_for(
+                    lambda: self._pending_count() >= self.max_batch or self._stopping,
+                    timeout=self.window_seconds
+                )
+
+            self.flush()
+
+    def _process(self, entity_type: str, ids: List[int]) -> None:
+        """Procesa los IDs de un tipo en bloques de `max_batch`."""
+        for start in range(0, len(ids), self.max_batch):
+            chunk = ids[start:start + self.max_batch]
+            try:
+                saved = self._process_chunk(entity_type, chunk)
+                self.stats["processed"] += saved
+                self.stats["failed"] += len(chunk) - saved
+            except Exception as e:
+                logger.error(f"Error procesando embeddings de {entity_type}: {str(e)}")
+                self.stats["failed"] += len(chunk)
+            finally:
+                self.stats["cycles"] += 1
+
+    def _process_chunk(self, entity_type: str, ids: List[int]) -> int:
+        """
+        Carga, embebe y guarda un bloque de entidades.
+
+        Returns:
+            Cantidad de entidades resueltas (guardadas o sin cambios)
+        """
+        embeddings_service = get_embeddings_service()
+        db = self.session_factory()
+
+        try:
+            # Tras un cutover de modelo no escribir vectores del modelo anterior
+            if not is_model_version_active(db, embeddings_service.model_version):
+                logger.warning(
+                    f"Worker de embeddings: {embeddings_service.model_version} ya no es la "
+                    f"versión activa, se omiten {len(ids)} {entity_type}s"
+                )
+                return 0
+
+            if entity_type == "gasto":
+                rows = db.query(Gasto).options(joinedload(Gasto.categoria)).filter(
+                    Gasto.id_gasto.in_(ids)
+                ).all()
+            else:
+                rows = db.query(Ingreso).options(joinedload(Ingreso.categoria)).filter(
+                    Ingreso.id_ingreso.in_(ids)
+                ).all()
+
+            if len(rows) < len(ids):
+                logger.info(
+                    f"{len(ids) - len(rows)} {entity_type}s ya no existen, se omiten"
+                )
+
+            saved, unchanged = embed_and_store(db, entity_type, rows, embeddings_service)
+            self.stats["unchanged"] += unchanged
+            db.commit()
+
+            logger.info(
+                f"Worker de embeddings: {saved}/{len(ids)} {entity_type}s actualizados, "
+                f"{unchanged} sin cambios"
+            )
+            return saved + unchanged
+
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+_embedding_worker: Optional[EmbeddingWorker] = None
+_embedding_worker_lock = threading.Lock()
+
+
+def get_embedding_worker() -> EmbeddingWorker:
+    """Obtiene el worker de embeddings del proceso (singleton)."""
+    global _embedding_worker
+
+    with _embedding_worker_lock:
+        if _embedding_worker is None:
+            _embedding_worker = EmbeddingWorker(
+                window_seconds=float(os.getenv("EMBEDDING_WORKER_WINDOW_SECONDS", "0.5")),
+                max_batch=int(os.getenv("EMBEDDING_WORKER_MAX_BATCH", "256"))
+            )
+        return _embedding_worker
+
+
+def category_text_changed(categoria: Any, update_data: Dict[str, Any]) -> bool:
+    """Indica si una actualización de categoría cambia el texto de sus embeddings."""
+    return any(
+        field in update_data and update_data[field] != getattr(categoria, field)
+        for field in CATEGORY_TEXT_FIELDS
+    )
+
+
+def category_dependents(db: Session, categoria_id: int) -> Dict[str, List[int]]:
+    """
+    Retorna los gastos e ingresos de una categoría que ya tienen embedding.
+
+    Los que no tienen embedding no quedan desactualizados: los genera el
+    worker al crearlos o el backfill.
+
+    Returns:
+        Diccionario tipo de entidad -> IDs afectados
+    """
+    dependents = {}
+    for entity_type, model, id_column, fk_name in (
+        ("gasto", Gasto, Gasto.id_gasto, "gasto_id"),
+        ("ingreso", Ingreso, Ingreso.id_ingreso, "ingreso_id"),
+    ):
+        table = embedding_table(entity_type)
+        dependents[entity_type] = list(db.execute(
+            select(id_column)
+            .join(table, table.c[fk_name] == id_column)
+            .where(model.id_categoria == categoria_id)
+            .order_by(id_column)
+        ).scalars())
+    return dependents
+
+
+def reembed_category(
+    db: Session,
+    categoria_id: int,
+    dry_run: bool = False,
+    worker: Optional[EmbeddingWorker] = None
+) -> Dict[str, int]:
+    """
+    Encola el re-embedding de los gastos e ingresos de una categoría.
+
+    El worker los procesa en bloques de `max_batch` y descarta por hash los
+    que no cambiaron, así que alcanza con encolar los afectados en lugar de
+    regenerar todo con force_regenerate.
+
+    Args:
+        db: Sesión de base de datos
+        categoria_id: ID de la categoría modificada
+        dry_run: Solo cuenta los afectados, sin encolar
+        worker: Worker a usar (default: el del proceso)
+
+    Returns:
+        Cantidad de gastos e ingresos afectados por tipo
+    """
+    dependents = category_dependents(db, categoria_id)
+
+    if not dry_run:
+        worker = worker or get_embedding_worker()
+        for entity_type, ids in dependents.items():
+            if ids:
+                worker.enqueue(entity_type, ids)
+        logger.info(
+            f"Categoría {categoria_id}: re-embedding encolado para "
+            f"{len(dependents['gasto'])} gastos y {len(dependents['ingreso'])} ingresos"
+        )
+
+    return {entity_type: len(ids) for entity_type, ids in dependents.items()}
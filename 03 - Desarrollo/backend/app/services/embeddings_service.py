@@ -1,12 +1,14 @@
 """
 Servicio de Embeddings
 ======================
-Genera embeddings vectoriales usando Azure OpenAI o Google Gemini
+Genera embeddings vectoriales usando Azure OpenAI, Google Gemini o un modelo local
 
 Responsabilidades:
-- Generar embeddings de texto usando Azure OpenAI o Gemini
+- Generar embeddings de texto usando Azure OpenAI, Gemini o el modelo local
 - Procesar texto para optimizar la calidad de embeddings
 - Manejar errores y reintentos en llamadas a la API
+- Cortar las llamadas a un proveedor caído (circuit breaker) y usar un
+  proveedor de respaldo compatible
 - Calcular costos de embeddings
 
 Autor: Sistema de Analizador Financiero
@@ -14,12 +16,33 @@ Fecha: 12 noviembre 2025
 """
 
 import os
+import asyncio
 import logging
-from typing import List, Optional, Dict, Any
+import threading
+import weakref
+from typing import List, Optional, Dict, Any, Tuple
 import time
 
+from app.services.embedding_cache import EmbeddingCache, get_embedding_cache
+from app.services.embedding_metrics import get_embedding_metrics
+from app.services.local_embeddings import LocalHashingEmbedder
+from app.services.query_embedding_cache import get_query_embedding_cache
+from app.utils.circuit_breaker import CircuitBreaker
+from app.utils.rate_limiter import RateLimiter
+
 logger = logging.getLogger(__name__)
 
+# Recursos async por event loop: {loop: {namespace: (semáforo, cliente async)}}
+_async_resources: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+# Limitadores de tasa por proveedor, compartidos por todo el proceso
+_rate_limiters: Dict[str, RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+# Circuit breakers por proveedor, compartidos por todo el proceso
+_circuit_breakers: Dict[str, CircuitBreaker] = {}
+_circuit_breakers_lock = threading.Lock()
+
 
 class EmbeddingsService:
     """
@@ -28,14 +51,22 @@ class EmbeddingsService:
     Soporta múltiples proveedores:
     - Azure OpenAI: text-embedding-3-small (1536 dimensiones)
     - Google Gemini: text-embedding-004 (768 dimensiones)
+    - Local: feature hashing offline (EMBEDDING_DIMENSIONS dimensiones)
     """
     
-    def __init__(self):
+    def __init__(self, provider: Optional[str] = None, is_fallback: bool = False):
         """
         Inicializa el cliente según el proveedor configurado.
         
+        Args:
+            provider: Proveedor a usar; pisa EMBEDDING_PROVIDER (ej: para
+                      backfillear la versión sombra con otro modelo)
+            is_fallback: True para la instancia de respaldo de otro servicio
+                         (no tiene respaldo propio y usa las credenciales
+                         AZURE_OPENAI_FALLBACK_* si están definidas)
+        
         Variables de entorno:
-        - EMBEDDING_PROVIDER: "azure" o "gemini" (default: azure)
+        - EMBEDDING_PROVIDER: "azure", "gemini" o "local" (default: azure)
         
         Para Azure OpenAI:
         - AZURE_OPENAI_API_KEY
@@ -44,23 +75,80 @@ class EmbeddingsService:
         
         Para Gemini:
         - GEMINI_API_KEY
+        
+        Para el modelo local (no requiere credenciales):
+        - EMBEDDING_DIMENSIONS (default: 768)
+        
+        Límites de concurrencia y tasa (opcionales, con defaults por proveedor):
+        - EMBEDDING_MAX_CONCURRENCY: requests simultáneos en el cliente async
+        - EMBEDDING_REQUESTS_PER_MINUTE
+        - EMBEDDING_TOKENS_PER_MINUTE
+        
+        Circuit breaker y respaldo (opcionales):
+        - EMBEDDING_FALLBACK_PROVIDER: "azure", "gemini" o "local" (default: sin respaldo)
+        - AZURE_OPENAI_FALLBACK_API_KEY / _ENDPOINT / _EMBEDDING_DEPLOYMENT:
+          deployment secundario cuando el respaldo también es Azure
+        - EMBEDDING_BREAKER_FAILURE_RATE: proporción de fallos que abre el circuito (default: 0.5)
+        - EMBEDDING_BREAKER_WINDOW_SECONDS: ventana de la proporción (default: 60)
+        - EMBEDDING_BREAKER_MIN_CALLS: llamadas mínimas en la ventana (default: 5)
+        - EMBEDDING_BREAKER_OPEN_SECONDS: tiempo abierto antes de probar (default: 30)
+        
+        Caché persistente: ver app.services.embedding_cache
         """
-        self.provider = os.getenv("EMBEDDING_PROVIDER", "azure").lower()
+        self.provider = (provider or os.getenv("EMBEDDING_PROVIDER", "azure")).lower()
+        self.is_fallback = is_fallback
         
         if self.provider == "gemini":
             self._init_gemini()
+        elif self.provider == "local":
+            self._init_local()
         else:
             self._init_azure()
         
+        # Límites de tasa y concurrencia (la variable de entorno pisa el default)
+        self.max_concurrency = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "8"))
+        self.requests_per_minute = int(
+            os.getenv("EMBEDDING_REQUESTS_PER_MINUTE", self.requests_per_minute)
+        )
+        self.tokens_per_minute = int(
+            os.getenv("EMBEDDING_TOKENS_PER_MINUTE", self.tokens_per_minute)
+        )
+        # Limitador externo (ej: compartido entre procesos); None = el del proceso
+        self.rate_limiter: Optional[RateLimiter] = None
+        
+        # Métricas y cachés compartidas por todas las instancias del proceso
+        self.metrics = get_embedding_metrics()
+        # (el modelo local recalcula más rápido de lo que tarda en leer el disco)
+        self.cache = get_embedding_cache() if self.provider != "local" else None
+        self.query_cache = get_query_embedding_cache() if self.provider != "local" else None
+        self.cache_namespace = (
+            f"{self.provider}:{getattr(self, 'deployment', self.model_name)}:"
+            f"{self.embedding_dimensions}"
+        )
+        
+        # El respaldo se crea recién cuando hace falta
+        self.fallback_provider = None if is_fallback else self._resolve_fallback_provider()
+        self._fallback: Optional[EmbeddingsService] = None
+        
         logger.info(f"EmbeddingsService inicializado con proveedor: {self.provider}")
     
+    @property
+    def model_version(self) -> str:
+        """Versión del modelo (proveedor:modelo:dimensiones) guardada en cada embedding."""
+        return self.cache_namespace
+    
     def _init_azure(self):
         """Inicializa cliente de Azure OpenAI"""
         from openai import AzureOpenAI
         
-        self.api_key = os.getenv("AZURE_OPENAI_API_KEY")
-        self.endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
-        self.deployment = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT", "text-embedding-3-small")
+        # El respaldo puede apuntar a un deployment secundario (otra región)
+        prefix = "AZURE_OPENAI_FALLBACK_" if self.is_fallback else "AZURE_OPENAI_"
+        self.api_key = os.getenv(f"{prefix}API_KEY") or os.getenv("AZURE_OPENAI_API_KEY")
+        self.endpoint = os.getenv(f"{prefix}ENDPOINT") or os.getenv("AZURE_OPENAI_ENDPOINT")
+        self.deployment = (
+            os.getenv(f"{prefix}EMBEDDING_DEPLOYMENT")
+            or os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT", "text-embedding-3-small")
+        )
         
         if not self.api_key or not self.endpoint:
             raise ValueError(
@@ -77,6 +165,14 @@ class EmbeddingsService:
         self.embedding_dimensions = 1536
         self.max_tokens = 8191
         self.cost_per_1m_tokens = 0.02
+        
+        # Límites por request de la API de embeddings
+        self.max_batch_items = 2048
+        self.max_batch_tokens = 300_000
+        
+        # Cuota estándar de un deployment de text-embedding-3-small
+        self.requests_per_minute = 2100
+        self.tokens_per_minute = 350_000
     
     def _init_gemini(self):
         """Inicializa cliente de Google Gemini"""
@@ -93,6 +189,30 @@ class EmbeddingsService:
         self.embedding_dimensions = 768
         self.max_tokens = 2048
         self.cost_per_1m_tokens = 0.0  # Gemini es gratis (con límites)
+        
+        # batch_embed_contents acepta hasta 100 textos por request
+        self.max_batch_items = 100
+        self.max_batch_tokens = 100 * self.max_tokens
+        
+        # Cuota de text-embedding-004 (sin límite de tokens por minuto)
+        self.requests_per_minute = 1500
+        self.tokens_per_minute = 0
+    
+    def _init_local(self):
+        """Inicializa el modelo local de feature hashing"""
+        self.model_name = LocalHashingEmbedder.MODEL_NAME
+        self.embedding_dimensions = int(os.getenv("EMBEDDING_DIMENSIONS", "768"))
+        self.max_tokens = 8191
+        self.cost_per_1m_tokens = 0.0
+        
+        self.local_embedder = LocalHashingEmbedder(self.embedding_dimensions)
+        
+        self.max_batch_items = 1024
+        self.max_batch_tokens = 1024 * self.max_tokens
+        
+        # Sin cuotas: el cálculo es en proceso
+        self.requests_per_minute = 0
+        self.tokens_per_minute = 0
     
     def generate_embedding(
         self, 
@@ -108,6 +228,11 @@ class EmbeddingsService:
             retry_count: Número de reintentos en caso de error
             retry_delay: Delay entre reintentos en segundos
         
+        Si el circuito del proveedor está abierto no se lo llama; en ese caso,
+        o si fallan todos los reintentos, se usa el proveedor de respaldo
+        cuando genera vectores intercambiables (mismo modelo y dimensiones).
+        Una respuesta con dimensiones incorrectas también pasa al respaldo.
+        
         Returns:
             Lista de floats representando el vector,
             o None si hay un error irrecuperable
@@ -119,20 +244,56 @@ class EmbeddingsService:
         # Limpiar y preparar el texto
         cleaned_text = self._preprocess_text(text)
         
+        # Buscar en la caché antes de llamar al proveedor
+        cache_key = EmbeddingCache.make_key(self.cache_namespace, cleaned_text)
+        if self.cache:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                logger.debug("Embedding obtenido de la caché")
+                return cached
+        
+        estimated_tokens = self._estimate_tokens(cleaned_text)
+        breaker = self._get_circuit_breaker()
+        
         for attempt in range(retry_count):
+            if not breaker.allow_request():
+                logger.warning(f"Circuito de {self.provider} abierto: no se llama al proveedor")
+                self.metrics.record_rejected(self.provider)
+                break
+            
             try:
+                self.metrics.record_throttle(
+                    self.provider, self._get_rate_limiter().acquire_sync(estimated_tokens)
+                )
+                started = time.perf_counter()
+                
                 if self.provider == "gemini":
                     embedding = self._generate_gemini_embedding(cleaned_text)
+                elif self.provider == "local":
+                    embedding = self._generate_local_batch([cleaned_text])[0][0]
                 else:
                     embedding = self._generate_azure_embedding(cleaned_text)
                 
-                # Validar dimensiones
+                breaker.record_success()
+                self.metrics.record_call(
+                    self.provider,
+                    1,
+                    time.perf_counter() - started,
+                    estimated_tokens,
+                    self._calculate_cost(estimated_tokens)
+                )
+                
+                # Validar dimensiones: reintentar no cambia la respuesta, pero
+                # el respaldo puede generarlo (igual que en el batch)
                 if len(embedding) != self.embedding_dimensions:
                     logger.error(
                         f"Embedding con dimensiones incorrectas: "
                         f"{len(embedding)} (esperado: {self.embedding_dimensions})"
                     )
-                    return None
+                    break
+                
+                if self.cache:
+                    self.cache.put(cache_key, embedding)
                 
                 logger.debug(f"Embedding generado exitosamente ({len(embedding)} dimensiones)")
                 return embedding
@@ -141,12 +302,47 @@ class EmbeddingsService:
                 logger.warning(
                     f"Intento {attempt + 1}/{retry_count} falló: {type(e).__name__}: {str(e)}"
                 )
+                breaker.record_failure()
+                self.metrics.record_failure(self.provider, 1)
                 
-                if attempt < retry_count - 1:
+                if attempt < retry_count - 1 and breaker.state != CircuitBreaker.OPEN:
+                    self.metrics.record_retry(self.provider)
                     time.sleep(retry_delay * (attempt + 1))  # Backoff exponencial
-                else:
+                elif attempt == retry_count - 1:
                     logger.error(f"Error generando embedding después de {retry_count} intentos")
-                    return None
+        
+        fallback = self._get_interchangeable_fallback()
+        if fallback is None:
+            return None
+        
+        embedding = fallback.generate_embedding(text)
+        if embedding is not None:
+            self.metrics.record_fallback(fallback.provider, 1)
+        return embedding
+    
+    def generate_query_embedding(self, text: str) -> Optional[List[float]]:
+        """
+        Genera el embedding de una consulta de búsqueda o del chat.
+        
+        Pasa primero por la caché en memoria de consultas, que evita el round
+        trip al proveedor para preguntas repetidas.
+        
+        Args:
+            text: Texto de la consulta
+        
+        Returns:
+            Lista de floats representando el vector, o None si hay un error
+        """
+        if self.query_cache:
+            cached = self.query_cache.get(self.cache_namespace, text)
+            if cached is not None:
+                return cached
+        
+        embedding = self.generate_embedding(text)
+        
+        if embedding is not None and self.query_cache:
+            self.query_cache.put(self.cache_namespace, text, embedding)
+        return embedding
     
     def _generate_azure_embedding(self, text: str) -> List[float]:
         """Genera embedding usando Azure OpenAI"""
@@ -172,57 +368,698 @@ class EmbeddingsService:
     def generate_embeddings_batch(
         self,
         texts: List[str],
-        batch_size: int = 100
+        batch_size: Optional[int] = None,
+        retry_count: int = 3,
+        retry_delay: float = 1.0
     ) -> List[Optional[List[float]]]:
         """
-        Genera embeddings para múltiples textos en lotes.
+        Genera embeddings para múltiples textos en lotes, con cualquier proveedor.
+        
+        Los lotes se arman de forma adaptativa: se cierran al alcanzar el máximo de
+        textos por request del proveedor (o `batch_size`) o el presupuesto de tokens
+        estimados. Si un lote falla después de los reintentos se divide a la mitad
+        para aislar el texto problemático, de modo que un solo texto inválido no
+        invalida al resto. Los textos presentes en la caché persistente, o repetidos
+        dentro de la misma llamada, no se envían al proveedor. Los que quedan sin
+        embedding se piden al respaldo si genera vectores intercambiables.
         
         Args:
             texts: Lista de textos para generar embeddings
-            batch_size: Tamaño del lote (Azure OpenAI soporta hasta 2048)
+            batch_size: Máximo de textos por lote (default: límite del proveedor)
+            retry_count: Número de reintentos por lote
+            retry_delay: Delay base entre reintentos en segundos
         
         Returns:
-            Lista de embeddings (o None para textos que fallaron)
+            Lista de embeddings en el mismo orden que `texts`
+            (None para textos vacíos o que fallaron)
         """
-        results = []
-        total_batches = (len(texts) + batch_size - 1) // batch_size
+        results, positions, keys, pending = self._prepare_batch(texts)
+        
+        if not pending:
+            return results
+        
+        generated: List[Optional[List[float]]] = [None] * len(pending)
+        batches = self._build_batches(pending, batch_size)
+        logger.info(f"Generando embeddings para {len(pending)} textos en {len(batches)} lotes")
+        
+        for batch_num, batch in enumerate(batches, 1):
+            logger.info(f"Procesando lote {batch_num}/{len(batches)} ({len(batch)} textos)")
+            self._process_batch(batch, generated, retry_count, retry_delay)
         
-        logger.info(f"Generando embeddings para {len(texts)} textos en {total_batches} lotes")
+        self._collect_batch(results, positions, keys, generated)
+        
+        missing = self._missing_positions(texts, results)
+        fallback = self._get_interchangeable_fallback() if missing else None
+        if fallback is not None:
+            filled = fallback.generate_embeddings_batch([texts[i] for i in missing], batch_size)
+            self._merge_fallback(fallback, missing, filled, results)
+        return results
+    
+    def generate_embeddings_batch_versioned(
+        self,
+        texts: List[str]
+    ) -> Tuple[List[Optional[List[float]]], List[Optional[str]]]:
+        """
+        Igual que `generate_embeddings_batch`, indicando el modelo de cada vector.
+        
+        Es la variante para guardar embeddings. Solo usa el respaldo si genera
+        vectores intercambiables: los de otro modelo, aunque tengan las mismas
+        dimensiones, no se comparan con los del principal, y las búsquedas no
+        filtran por versión. Esos textos quedan en None (pendientes) y el
+        worker o el backfill los generan cuando el proveedor principal vuelve.
+        
+        Returns:
+            Tupla con (embeddings, versión de modelo de cada embedding)
+        """
+        results = self.generate_embeddings_batch(texts)
+        versions = [self.model_version if e is not None else None for e in results]
+        return results, versions
+    
+    def _prepare_batch(
+        self,
+        texts: List[str]
+    ) -> Tuple[List[Optional[List[float]]], Dict[str, List[int]], List[str], List[Tuple[int, str]]]:
+        """
+        Limpia los textos de un lote y resuelve lo que ya está en caché.
         
-        for i in range(0, len(texts), batch_size):
-            batch = texts[i:i + batch_size]
-            batch_num = i // batch_size + 1
+        Args:
+            texts: Textos originales
+        
+        Returns:
+            Tupla con (resultados parciales, posiciones por clave,
+            claves pendientes, textos pendientes como (índice, texto limpio))
+        """
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        
+        # Limpiar textos, descartando los vacíos y agrupando los repetidos
+        positions: Dict[str, List[int]] = {}
+        cleaned_by_key: Dict[str, str] = {}
+        for index, text in enumerate(texts):
+            if text and text.strip():
+                cleaned = self._preprocess_text(text)
+                key = EmbeddingCache.make_key(self.cache_namespace, cleaned)
+                positions.setdefault(key, []).append(index)
+                cleaned_by_key[key] = cleaned
+        
+        # Resolver desde la caché lo que ya fue embebido
+        cached = self.cache.get_many(positions.keys()) if self.cache and positions else {}
+        for key, embedding in cached.items():
+            for index in positions[key]:
+                results[index] = embedding
+        
+        if cached:
+            logger.info(f"{len(cached)}/{len(positions)} textos resueltos desde la caché")
+        
+        # Un único request por texto distinto que no está en caché
+        keys = [key for key in positions if key not in cached]
+        pending = [(i, cleaned_by_key[key]) for i, key in enumerate(keys)]
+        
+        return results, positions, keys, pending
+    
+    def _collect_batch(
+        self,
+        results: List[Optional[List[float]]],
+        positions: Dict[str, List[int]],
+        keys: List[str],
+        generated: List[Optional[List[float]]]
+    ) -> None:
+        """Copia los embeddings generados a sus posiciones y los guarda en caché."""
+        new_entries = {}
+        for key, embedding in zip(keys, generated):
+            if embedding is None:
+                continue
+            new_entries[key] = embedding
+            for index in positions[key]:
+                results[index] = embedding
+        
+        if self.cache:
+            self.cache.put_many(new_entries)
+        
+        failed = len(keys) - len(new_entries)
+        if failed:
+            logger.warning(f"{failed}/{len(keys)} textos sin embedding tras procesar los lotes")
+    
+    def _build_batches(
+        self,
+        items: List[Tuple[int, str]],
+        batch_size: Optional[int] = None
+    ) -> List[List[Tuple[int, str]]]:
+        """
+        Agrupa los textos en lotes respetando cantidad de textos y tokens estimados.
+        
+        Args:
+            items: Lista de tuplas (índice original, texto limpio)
+            batch_size: Máximo de textos por lote
+        
+        Returns:
+            Lista de lotes
+        """
+        max_items = min(batch_size or self.max_batch_items, self.max_batch_items)
+        batches = []
+        current = []
+        current_tokens = 0
+        
+        for item in items:
+            tokens = self._estimate_tokens(item[1])
+            if current and (
+                len(current) >= max_items
+                or current_tokens + tokens > self.max_batch_tokens
+            ):
+                batches.append(current)
+                current = []
+                current_tokens = 0
             
-            logger.info(f"Procesando lote {batch_num}/{total_batches}")
+            current.append(item)
+            current_tokens += tokens
+        
+        if current:
+            batches.append(current)
+        
+        return batches
+    
+    def _process_batch(
+        self,
+        batch: List[Tuple[int, str]],
+        results: List[Optional[List[float]]],
+        retry_count: int,
+        retry_delay: float
+    ) -> None:
+        """
+        Genera los embeddings de un lote y los escribe en `results`.
+        
+        Si el lote falla en todos los reintentos se divide en dos mitades que se
+        procesan por separado, hasta llegar a textos individuales. Con el
+        circuito abierto el lote se omite sin llamar al proveedor.
+        """
+        texts = [text for _, text in batch]
+        estimated_tokens = sum(self._estimate_tokens(text) for text in texts)
+        breaker = self._get_circuit_breaker()
+        
+        for attempt in range(retry_count):
+            if not self._allow_batch(breaker, batch):
+                return
             
             try:
-                # Limpiar textos
-                cleaned_batch = [self._preprocess_text(text) for text in batch]
+                self.metrics.record_throttle(
+                    self.provider, self._get_rate_limiter().acquire_sync(estimated_tokens)
+                )
+                started = time.perf_counter()
+                embeddings, tokens_used = self._generate_provider_batch(texts)
+                self._assign_batch(batch, embeddings, tokens_used, results)
+                breaker.record_success()
+                self._record_batch_call(len(batch), time.perf_counter() - started, tokens_used)
+                return
                 
-                # Llamada a la API con el lote completo
-                response = self.client.embeddings.create(
-                    model=self.deployment,
-                    input=cleaned_batch
+            except Exception as e:
+                logger.warning(
+                    f"Intento {attempt + 1}/{retry_count} del lote falló: "
+                    f"{type(e).__name__}: {str(e)}"
                 )
+                breaker.record_failure()
+                self.metrics.record_failure(self.provider, len(batch))
                 
-                # Extraer embeddings
-                batch_embeddings = [data.embedding for data in response.data]
-                results.extend(batch_embeddings)
+                if attempt < retry_count - 1 and breaker.state != CircuitBreaker.OPEN:
+                    self.metrics.record_retry(self.provider)
+                    time.sleep(retry_delay * (attempt + 1))
+        
+        if breaker.state == CircuitBreaker.OPEN:
+            logger.error(f"Circuito de {self.provider} abierto: no se divide el lote")
+            return
+        
+        if len(batch) == 1:
+            logger.error(f"Error generando embedding para el texto en la posición {batch[0][0]}")
+            return
+        
+        # Aislar el fallo: reprocesar cada mitad por separado
+        middle = len(batch) // 2
+        logger.info(f"Dividiendo lote de {len(batch)} textos para aislar el error")
+        self._process_batch(batch[:middle], results, retry_count, retry_delay)
+        self._process_batch(batch[middle:], results, retry_count, retry_delay)
+    
+    def _allow_batch(self, breaker: CircuitBreaker, batch: List[Tuple[int, str]]) -> bool:
+        """Consulta el circuit breaker antes de enviar un lote."""
+        if breaker.allow_request():
+            return True
+        logger.warning(
+            f"Circuito de {self.provider} abierto: se omite el lote de {len(batch)} textos"
+        )
+        self.metrics.record_rejected(self.provider)
+        return False
+    
+    def _assign_batch(
+        self,
+        batch: List[Tuple[int, str]],
+        embeddings: List[List[float]],
+        tokens_used: int,
+        results: List[Optional[List[float]]]
+    ) -> None:
+        """
+        Valida la respuesta de un lote y escribe cada embedding en su posición.
+        
+        Raises:
+            ValueError: Si la cantidad de embeddings no coincide con el lote
+        """
+        if len(embeddings) != len(batch):
+            raise ValueError(
+                f"Se recibieron {len(embeddings)} embeddings para {len(batch)} textos"
+            )
+        
+        for (index, _), embedding in zip(batch, embeddings):
+            if len(embedding) != self.embedding_dimensions:
+                logger.error(
+                    f"Embedding con dimensiones incorrectas: "
+                    f"{len(embedding)} (esperado: {self.embedding_dimensions})"
+                )
+                continue
+            results[index] = embedding
+        
+        logger.info(
+            f"Lote completado: {tokens_used} tokens, "
+            f"costo: ${self._calculate_cost(tokens_used):.6f}"
+        )
+    
+    def _record_batch_call(self, batch_size: int, latency: float, tokens_used: int) -> None:
+        """Registra en las métricas una llamada batch exitosa."""
+        self.metrics.record_call(
+            self.provider,
+            batch_size,
+            latency,
+            tokens_used,
+            self._calculate_cost(tokens_used)
+        )
+    
+    def _generate_provider_batch(self, texts: List[str]) -> Tuple[List[List[float]], int]:
+        """
+        Genera embeddings para un lote de textos ya limpios con el proveedor activo.
+        
+        Returns:
+            Tupla con (embeddings en el orden de entrada, tokens usados)
+        """
+        if self.provider == "gemini":
+            return self._generate_gemini_batch(texts)
+        if self.provider == "local":
+            return self._generate_local_batch(texts)
+        return self._generate_azure_batch(texts)
+    
+    def _generate_azure_batch(self, texts: List[str]) -> Tuple[List[List[float]], int]:
+        """Genera un lote de embeddings usando Azure OpenAI"""
+        response = self.client.embeddings.create(
+            model=self.deployment,
+            input=texts
+        )
+        
+        # La API no garantiza el orden: reordenar por índice
+        data = sorted(response.data, key=lambda item: item.index)
+        return [item.embedding for item in data], response.usage.total_tokens
+    
+    def _generate_local_batch(self, texts: List[str]) -> Tuple[List[List[float]], int]:
+        """Genera un lote de embeddings con el modelo local de feature hashing"""
+        matrix = self.local_embedder.embed(texts)
+        tokens = sum(self._estimate_tokens(text) for text in texts)
+        return matrix.tolist(), tokens
+    
+    def _generate_gemini_batch(self, texts: List[str]) -> Tuple[List[List[float]], int]:
+        """Genera un lote de embeddings usando Google Gemini (batch_embed_contents)"""
+        import google.generativeai as genai
+        
+        result = genai.embed_content(
+            model=self.model_name,
+            content=texts,
+            task_type="retrieval_document",
+            title="Financial data"
+        )
+        
+        # Gemini no reporta tokens: usar la estimación
+        tokens_used = sum(self._estimate_tokens(text) for text in texts)
+        return result['embedding'], tokens_used
+    
+    def _estimate_tokens(self, text: str) -> int:
+        """Estima la cantidad de tokens de un texto (~4 caracteres por token)."""
+        return max(1, len(text) // 4)
+    
+    # ==================== API ASYNC ====================
+    
+    async def agenerate_embedding(
+        self,
+        text: str,
+        retry_count: int = 3,
+        retry_delay: float = 1.0
+    ) -> Optional[List[float]]:
+        """
+        Versión async de `generate_embedding`, para usar dentro de endpoints async.
+        
+        No bloquea el event loop: usa el cliente async del proveedor, esperas con
+        asyncio.sleep y los límites de concurrencia y tasa compartidos.
+        
+        Args:
+            text: Texto para generar el embedding
+            retry_count: Número de reintentos en caso de error
+            retry_delay: Delay base entre reintentos en segundos
+        
+        Returns:
+            Lista de floats representando el vector,
+            o None si hay un error irrecuperable
+        """
+        if not text or not text.strip():
+            logger.warning("Texto vacío proporcionado para embedding")
+            return None
+        
+        results = await self.agenerate_embeddings_batch(
+            [text],
+            retry_count=retry_count,
+            retry_delay=retry_delay
+        )
+        return results[0]
+    
+    async def agenerate_query_embedding(self, text: str) -> Optional[List[float]]:
+        """Versión async de `generate_query_embedding`."""
+        if self.query_cache:
+            cached = self.query_cache.get(self.cache_namespace, text)
+            if cached is not None:
+                return cached
+        
+        embedding = await self.agenerate_embedding(text)
+        
+        if embedding is not None and self.query_cache:
+            self.query_cache.put(self.cache_namespace, text, embedding)
+        return embedding
+    
+    async def agenerate_embeddings_batch(
+        self,
+        texts: List[str],
+        batch_size: Optional[int] = None,
+        retry_count: int = 3,
+        retry_delay: float = 1.0
+    ) -> List[Optional[List[float]]]:
+        """
+        Versión async de `generate_embeddings_batch`.
+        
+        Los lotes se envían en paralelo, acotados por EMBEDDING_MAX_CONCURRENCY y
+        por el limitador de requests/tokens por minuto del proveedor. La caché
+        persistente (SQLite, con commit y fsync) se consulta y actualiza en un
+        hilo para no bloquear el event loop.
+        
+        Returns:
+            Lista de embeddings en el mismo orden que `texts`
+            (None para textos vacíos o que fallaron)
+        """
+        results, positions, keys, pending = await asyncio.to_thread(self._prepare_batch, texts)
+        
+        if not pending:
+            return results
+        
+        generated: List[Optional[List[float]]] = [None] * len(pending)
+        batches = self._build_batches(pending, batch_size)
+        
+        await asyncio.gather(*(
+            self._aprocess_batch(batch, generated, retry_count, retry_delay)
+            for batch in batches
+        ))
+        
+        await asyncio.to_thread(self._collect_batch, results, positions, keys, generated)
+        
+        missing = self._missing_positions(texts, results)
+        fallback = self._get_interchangeable_fallback() if missing else None
+        if fallback is not None:
+            filled = await fallback.agenerate_embeddings_batch(
+                [texts[i] for i in missing], batch_size
+            )
+            self._merge_fallback(fallback, missing, filled, results)
+        return results
+    
+    async def _aprocess_batch(
+        self,
+        batch: List[Tuple[int, str]],
+        results: List[Optional[List[float]]],
+        retry_count: int,
+        retry_delay: float
+    ) -> None:
+        """Versión async de `_process_batch` (reintentos y división del lote)."""
+        semaphore, client = self._get_async_resources()
+        texts = [text for _, text in batch]
+        estimated_tokens = sum(self._estimate_tokens(text) for text in texts)
+        breaker = self._get_circuit_breaker()
+        
+        for attempt in range(retry_count):
+            if not self._allow_batch(breaker, batch):
+                return
+            
+            try:
+                self.metrics.record_throttle(
+                    self.provider, await self._get_rate_limiter().acquire(estimated_tokens)
+                )
+                async with semaphore:
+                    started = time.perf_counter()
+                    embeddings, tokens_used = await self._agenerate_provider_batch(texts, client)
+                    latency = time.perf_counter() - started
+                self._assign_batch(batch, embeddings, tokens_used, results)
+                breaker.record_success()
+                self._record_batch_call(len(batch), latency, tokens_used)
+                return
                 
-                # Log de uso
-                tokens_used = response.usage.total_tokens
-                cost = self._calculate_cost(tokens_used)
-                logger.info(
-                    f"Lote {batch_num} completado: {tokens_used} tokens, "
-                    f"costo: ${cost:.6f}"
+            except Exception as e:
+                logger.warning(
+                    f"Intento {attempt + 1}/{retry_count} del lote falló: "
+                    f"{type(e).__name__}: {str(e)}"
                 )
+                breaker.record_failure()
+                self.metrics.record_failure(self.provider, len(batch))
                 
+                if attempt < retry_count - 1 and breaker.state != CircuitBreaker.OPEN:
+                    self.metrics.record_retry(self.provider)
+                    await asyncio.sleep(retry_delay * (attempt + 1))
+            
+            except BaseException:
+                # CancelledError (ej: se canceló la request del chat): no es
+                # un fallo del proveedor, pero la llamada no debe retener el
+                # lugar de la prueba half-open
+                breaker.release()
+                raise
+        
+        if breaker.state == CircuitBreaker.OPEN:
+            logger.error(f"Circuito de {self.provider} abierto: no se divide el lote")
+            return
+        
+        if len(batch) == 1:
+            logger.error(f"Error generando embedding para el texto en la posición {batch[0][0]}")
+            return
+        
+        middle = len(batch) // 2
+        await asyncio.gather(
+            self._aprocess_batch(batch[:middle], results, retry_count, retry_delay),
+            self._aprocess_batch(batch[middle:], results, retry_count, retry_delay)
+        )
+    
+    async def _agenerate_provider_batch(
+        self,
+        texts: List[str],
+        client: Any
+    ) -> Tuple[List[List[float]], int]:
+        """Genera un lote de embeddings con el cliente async del proveedor."""
+        if self.provider == "gemini":
+            # google-generativeai no tiene cliente async: usar un hilo del pool
+            return await asyncio.to_thread(self._generate_gemini_batch, texts)
+        if self.provider == "local":
+            return self._generate_local_batch(texts)
+        
+        response = await client.embeddings.create(
+            model=self.deployment,
+            input=texts
+        )
+        data = sorted(response.data, key=lambda item: item.index)
+        return [item.embedding for item in data], response.usage.total_tokens
+    
+    def _get_async_resources(self) -> Tuple[asyncio.Semaphore, Any]:
+        """
+        Retorna el semáforo y el cliente async compartidos del event loop actual.
+        
+        Se crean una sola vez por loop y proveedor, de modo que todas las
+        instancias del servicio reutilizan el mismo pool de conexiones.
+        """
+        loop = asyncio.get_running_loop()
+        per_loop = _async_resources.setdefault(loop, {})
+        
+        if self._client_key not in per_loop:
+            client = None
+            if self.provider not in ("gemini", "local"):
+                from openai import AsyncAzureOpenAI
+                
+                client = AsyncAzureOpenAI(
+                    api_key=self.api_key,
+                    api_version="2024-02-01",
+                    azure_endpoint=self.endpoint,
+                    max_retries=0  # Los reintentos los maneja el servicio
+                )
+            per_loop[self._client_key] = (asyncio.Semaphore(self.max_concurrency), client)
+        
+        return per_loop[self._client_key]
+    
+    def _get_rate_limiter(self) -> RateLimiter:
+        """Retorna el limitador de tasa del proveedor, compartido por el proceso."""
+        if self.rate_limiter is not None:
+            return self.rate_limiter
+        
+        with _rate_limiters_lock:
+            if self._client_key not in _rate_limiters:
+                _rate_limiters[self._client_key] = RateLimiter(
+                    requests_per_minute=self.requests_per_minute,
+                    tokens_per_minute=self.tokens_per_minute
+                )
+            return _rate_limiters[self._client_key]
+    
+    def _get_circuit_breaker(self) -> CircuitBreaker:
+        """Retorna el circuit breaker del proveedor, compartido por el proceso."""
+        with _circuit_breakers_lock:
+            if self._client_key not in _circuit_breakers:
+                _circuit_breakers[self._client_key] = CircuitBreaker(
+                    name=self._client_key,
+                    failure_rate_threshold=float(os.getenv("EMBEDDING_BREAKER_FAILURE_RATE", "0.5")),
+                    window_seconds=float(os.getenv("EMBEDDING_BREAKER_WINDOW_SECONDS", "60")),
+                    min_calls=int(os.getenv("EMBEDDING_BREAKER_MIN_CALLS", "5")),
+                    open_seconds=float(os.getenv("EMBEDDING_BREAKER_OPEN_SECONDS", "30"))
+                )
+            return _circuit_breakers[self._client_key]
+    
+    @property
+    def _client_key(self) -> str:
+        """Clave del limitador, el breaker y el cliente async compartidos."""
+        # Un deployment secundario de Azure comparte namespace (mismos vectores)
+        # pero tiene su propia cuota y su propio estado de salud
+        return f"{self.cache_namespace}:fallback" if self.is_fallback else self.cache_namespace
+    
+    # ==================== RESPALDO ====================
+    
+    def _resolve_fallback_provider(self) -> Optional[str]:
+        """Lee EMBEDDING_FALLBACK_PROVIDER descartando configuraciones sin efecto."""
+        provider = os.getenv("EMBEDDING_FALLBACK_PROVIDER", "").lower()
+        if not provider:
+            return None
+        
+        if provider == self.provider and not (
+            provider == "azure" and os.getenv("AZURE_OPENAI_FALLBACK_ENDPOINT")
+        ):
+            logger.warning(
+                f"EMBEDDING_FALLBACK_PROVIDER={provider} es el proveedor principal "
+                f"sin un deployment secundario: se ignora"
+            )
+            return None
+        return provider
+    
+    def _get_fallback(self) -> Optional["EmbeddingsService"]:
+        """Retorna el servicio de respaldo, creándolo la primera vez."""
+        if self.fallback_provider is None:
+            return None
+        
+        if self._fallback is None:
+            try:
+                self._fallback = EmbeddingsService(self.fallback_provider, is_fallback=True)
             except Exception as e:
-                logger.error(f"Error procesando lote {batch_num}: {str(e)}")
-                # Agregar None para cada texto que falló
-                results.extend([None] * len(batch))
+                logger.error(
+                    f"No se pudo inicializar el proveedor de respaldo "
+                    f"{self.fallback_provider}: {str(e)}"
+                )
+                self.fallback_provider = None
+                return None
+            
+            if self._fallback.embedding_dimensions != self.embedding_dimensions:
+                logger.warning(
+                    f"El respaldo {self._fallback.model_version} tiene "
+                    f"{self._fallback.embedding_dimensions} dimensiones y el índice "
+                    f"{self.embedding_dimensions}: no se usará"
+                )
+        return self._fallback
+    
+    def _is_interchangeable(self, fallback: "EmbeddingsService") -> bool:
+        """Indica si los vectores del respaldo son comparables con los propios."""
+        return (
+            fallback.model_name == self.model_name
+            and fallback.embedding_dimensions == self.embedding_dimensions
+        )
+    
+    def _get_interchangeable_fallback(self) -> Optional["EmbeddingsService"]:
+        """
+        Retorna el respaldo solo si genera vectores del mismo modelo.
         
-        return results
+        Es el único respaldo válido para consultas y para las rutas que guardan
+        con la versión del proveedor principal.
+        """
+        fallback = self._get_fallback()
+        if fallback is None or not self._is_interchangeable(fallback):
+            return None
+        return fallback
+    
+    def _missing_positions(
+        self,
+        texts: List[str],
+        results: List[Optional[List[float]]]
+    ) -> List[int]:
+        """Posiciones de textos no vacíos que quedaron sin embedding."""
+        return [
+            i for i, (text, embedding) in enumerate(zip(texts, results))
+            if embedding is None and text and text.strip()
+        ]
+    
+    def _merge_fallback(
+        self,
+        fallback: "EmbeddingsService",
+        positions: List[int],
+        filled: List[Optional[List[float]]],
+        results: List[Optional[List[float]]]
+    ) -> None:
+        """Copia a `results` los embeddings obtenidos del respaldo."""
+        count = 0
+        for index, embedding in zip(positions, filled):
+            if embedding is not None:
+                results[index] = embedding
+                count += 1
+        
+        if count:
+            self.metrics.record_fallback(fallback.provider, count)
+            logger.warning(
+                f"{count}/{len(positions)} textos resueltos con el respaldo {fallback.model_version}"
+            )
+    
+    def content_hash(self, text: str, model_version: Optional[str] = None) -> str:
+        """
+        Calcula el hash del contenido a embeber.
+        
+        Combina proveedor, modelo y dimensiones con el texto preprocesado, de
+        modo que cambia tanto si cambia el texto como si cambia el modelo.
+        
+        Args:
+            text: Texto usado para generar el embedding
+            model_version: Modelo que generó el embedding (default: el propio;
+                           ej: el del respaldo)
+        
+        Returns:
+            Hash SHA-256 en hexadecimal
+        """
+        return EmbeddingCache.make_key(
+            model_version or self.cache_namespace, self._preprocess_text(text)
+        )
+    
+    def is_embedding_current(
+        self,
+        content_hash: Optional[str],
+        texto_original: Optional[str],
+        text: str
+    ) -> bool:
+        """
+        Indica si un embedding guardado ya corresponde al texto actual.
+        
+        Args:
+            content_hash: Hash guardado junto al embedding (None en filas antiguas)
+            texto_original: Texto guardado junto al embedding
+            text: Texto actual de la entidad
+        
+        Returns:
+            True si no hace falta regenerar el embedding
+        """
+        if content_hash:
+            return content_hash == self.content_hash(text)
+        
+        # Filas anteriores al hash: comparar el texto guardado
+        return texto_original is not None and texto_original == text
     
     def _preprocess_text(self, text: str) -> str:
         """
@@ -255,7 +1092,7 @@ class EmbeddingsService:
         Returns:
             Costo en USD
         """
-        return (tokens / 1_000_000) * self.COST_PER_1M_TOKENS
+        return (tokens / 1_000_000) * self.cost_per_1m_tokens
     
     def build_gasto_text(self, gasto: Dict[str, Any]) -> str:
         """
@@ -366,16 +1203,46 @@ class EmbeddingsService:
     
     def get_stats(self) -> Dict[str, Any]:
         """
-        Retorna estadísticas del servicio de embeddings.
+        Retorna configuración, métricas de uso y estado de las cachés.
         
         Returns:
-            Diccionario con información de configuración y costos
+            Diccionario con modelo, límites, métricas por proveedor y cachés
         """
         return {
-            "model": self.MODEL_NAME,
-            "dimensions": self.EMBEDDING_DIMENSIONS,
+            "provider": self.provider,
+            "model": self.model_name,
+            "deployment": getattr(self, "deployment", None),
+            "endpoint": getattr(self, "endpoint", None),
+            "dimensions": self.embedding_dimensions,
             "max_tokens": self.max_tokens,
-            "cost_per_1m_tokens": self.COST_PER_1M_TOKENS,
-            "deployment": self.deployment,
-            "endpoint": self.endpoint.replace(self.api_key, "***") if self.endpoint else None
+            "cost_per_1m_tokens": self.cost_per_1m_tokens,
+            "limits": {
+                "max_concurrency": self.max_concurrency,
+                "requests_per_minute": self.requests_per_minute,
+                "tokens_per_minute": self.tokens_per_minute,
+                "max_batch_items": self.max_batch_items,
+                "max_batch_tokens": self.max_batch_tokens
+            },
+            "circuit_breaker": self._get_circuit_breaker().get_stats(),
+            "fallback": {
+                "provider": self.fallback_provider,
+                "model_version": self._fallback.model_version if self._fallback else None,
+                "circuit_breaker": (
+                    self._fallback._get_circuit_breaker().get_stats() if self._fallback else None
+                )
+            } if self.fallback_provider else None,
+            "metrics": self.metrics.get_stats(),
+            "cache": self.cache.get_stats() if self.cache else None,
+            "query_cache": self.query_cache.get_stats() if self.query_cache else None
         }
+
+
+_embeddings_service: Optional[EmbeddingsService] = None
+
+
+def get_embeddings_service() -> EmbeddingsService:
+    """Obtiene la instancia del servicio de embeddings (singleton)"""
+    global _embeddings_service
+    if _embeddings_service is None:
+        _embeddings_service = EmbeddingsService()
+    return _embeddings_service
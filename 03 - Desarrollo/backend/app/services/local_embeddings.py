@@ -0,0 +1,118 @@
+"""
+Embeddings Locales por Feature Hashing
+======================================
+Proveedor de embeddings offline, determinístico y sin dependencias externas
+
+Responsabilidades:
+- Generar vectores de cualquier dimensión sin red ni credenciales
+- Combinar n-gramas de palabras y de caracteres para tolerar errores de tipeo
+- Normalizar acentos del español ("café" y "cafe" producen el mismo vector)
+- Procesar lotes completos con operaciones vectorizadas de NumPy
+
+Se usa con EMBEDDING_PROVIDER=local para entornos sin acceso a internet,
+benchmarks y CI, y como respaldo de latencia cero cuando el proveedor falla.
+
+Autor: Sistema de Analizador Financiero
+Fecha: 17 octubre 2026
+"""
+
+import re
+import zlib
+import unicodedata
+from typing import List, Tuple
+
+import numpy as np
+
+_WORD_RE = re.compile(r"\w+")
+
+
+class LocalHashingEmbedder:
+    """
+    Embedder basado en el "hashing trick".
+
+    Cada feature (palabra, par de palabras o n-grama de caracteres) se
+    proyecta con CRC32 a una posición del vector y a un signo, y los vectores
+    resultantes se normalizan a norma 1 para que la similitud coseno de
+    pgvector sea comparable con la de los proveedores remotos.
+    """
+
+    MODEL_NAME = "local-hashing-v1"
+
+    # Pesos relativos de cada tipo de feature
+    WORD_WEIGHT = 1.0
+    BIGRAM_WEIGHT = 0.7
+    CHAR_WEIGHT = 0.35
+
+    def __init__(self, dimensions: int, char_ngrams: Tuple[int, ...] = (3, 4, 5)):
+        """
+        Args:
+            dimensions: Dimensiones de los vectores generados
+            char_ngrams: Longitudes de los n-gramas de caracteres
+        """
+        if dimensions <= 0:
+            raise ValueError("Las dimensiones deben ser mayores a 0")
+
+        self.dimensions = dimensions
+        self.char_ngrams = char_ngrams
+
+    @staticmethod
+    def fold_text(text: str) -> str:
+        """Pasa a minúsculas y elimina acentos y diacríticos."""
+        decomposed = unicodedata.normalize("NFKD", text.lower())
+        return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+    def _features(self, text: str) -> List[Tuple[str, float]]:
+        """Extrae las features con su peso para un texto."""
+        words = _WORD_RE.findall(self.fold_text(text))
+        features = [(f"w:{word}", self.WORD_WEIGHT) for word in words]
+        features.extend(
+            (f"b:{first} {second}", self.BIGRAM_WEIGHT)
+            for first, second in zip(words, words[1:])
+        )
+
+        for word in words:
+            padded = f"<{word}>"
+            for n in self.char_ngrams:
+                features.extend(
+                    (f"c:{padded[i:i + n]}", self.CHAR_WEIGHT)
+                    for i in range(len(padded) - n + 1)
+                )
+
+        return features
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        Genera los embeddings de un lote de textos.
+
+        Args:
+            texts: Lista de textos
+
+        Returns:
+            Matriz float32 de (len(texts), dimensions) con filas de norma 1
+            (las filas de textos sin features quedan en cero)
+        """
+        rows, hashes, weights = [], [], []
+        for row, text in enumerate(texts):
+            for feature, weight in self._features(text):
+                rows.append(row)
+                hashes.append(zlib.crc32(feature.encode("utf-8")))
+                weights.append(weight)
+
+        matrix = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        if not rows:
+            return matrix
+
+        hashes = np.asarray(hashes, dtype=np.uint32)
+        columns = (hashes % self.dimensions).astype(np.int64)
+        # El bit alto del hash decide el signo, para que las colisiones se compensen
+        signs = np.where(hashes >> 31, -1.0, 1.0).astype(np.float32)
+
+        np.add.at(
+            matrix,
+            (np.asarray(rows, dtype=np.int64), columns),
+            signs * np.asarray(weights, dtype=np.float32)
+        )
+
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix
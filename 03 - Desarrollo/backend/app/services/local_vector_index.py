@@ -0,0 +1,357 @@
+"""
+Índice Vectorial Local
+======================
+Búsqueda vectorial en memoria con NumPy, por usuario
+
+Responsabilidades:
+- Cargar los embeddings de un usuario en una matriz float32 contigua,
+  normalizada una sola vez
+- Buscar con un único producto matriz-vector y top-k con argpartition,
+  aplicando en memoria los filtros de categoría, fecha y monto
+- Mantener las matrices en una caché LRU acotada por memoria, opcionalmente
+  mapeadas desde archivos locales (np.memmap)
+- Descartar la matriz de un usuario cuando cambian sus gastos, ingresos o
+  embeddings (ver vector_invalidation.py)
+
+La mayoría de los usuarios tiene pocos miles de registros: una búsqueda
+exacta en memoria evita el round trip a pgvector y la hidratación de filas.
+Solo usa SQLAlchemy genérico, por lo que funciona también sobre SQLite.
+
+Variables de entorno:
+- VECTOR_LOCAL_CACHE_MB: memoria máxima de las matrices en caché (default: 256)
+- VECTOR_LOCAL_MMAP_DIR: directorio para mapear las matrices desde archivos
+  (default: sin mapear, en memoria del proceso)
+- VECTOR_LOCAL_TTL_SECONDS: vigencia máxima de una matriz, para ver las
+  escrituras de otros procesos (default: 300)
+
+Autor: Sistema de Analizador Financiero
+Fecha: 17 octubre 2026
+"""
+
+import os
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.models.categoria import Categoria
+from app.models.gasto import Gasto
+from app.models.ingreso import Ingreso
+from app.services.embedding_versions import embedding_table
+from app.services.vector_invalidation import GenerationRegistry, get_generations
+
+logger = logging.getLogger(__name__)
+
+# Tipo de entidad -> (modelo, columna ID, clave del resultado)
+_ENTITIES = {
+    "gasto": (Gasto, Gasto.id_gasto, "gasto_id"),
+    "ingreso": (Ingreso, Ingreso.id_ingreso, "ingreso_id"),
+}
+
+# Bytes estimados por fila para los datos de los resultados (sin el texto)
+_ROW_OVERHEAD = 200
+
+
+@dataclass
+class UserMatrix:
+    """Vectores normalizados y datos de resultado de un usuario para una entidad."""
+    ids: np.ndarray
+    matrix: np.ndarray
+    fechas: np.ndarray
+    montos: np.ndarray
+    categorias: np.ndarray
+    rows: List[Tuple[Any, ...]]
+    generation: int
+    loaded_at: float
+    nbytes: int
+    path: Optional[str] = None
+
+    def unlink(self) -> None:
+        """Borra el archivo mapeado, si tiene."""
+        if self.path:
+            # El mapeo sigue siendo válido para quien lo esté usando
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+class LocalVectorIndex:
+    """Caché LRU de matrices de embeddings por (usuario, entidad)."""
+
+    def __init__(
+        self,
+        max_bytes: Optional[int] = None,
+        mmap_dir: Optional[str] = None,
+        ttl_seconds: Optional[float] = None,
+        generations: Optional[GenerationRegistry] = None
+    ):
+        """
+        Args:
+            max_bytes: Memoria máxima (default: VECTOR_LOCAL_CACHE_MB)
+            mmap_dir: Directorio de las matrices mapeadas (default: VECTOR_LOCAL_MMAP_DIR)
+            ttl_seconds: Vigencia de una matriz (default: VECTOR_LOCAL_TTL_SECONDS)
+            generations: Registro de generaciones (default: el del proceso)
+        """
+        self.max_bytes = max_bytes if max_bytes is not None else (
+            int(os.getenv("VECTOR_LOCAL_CACHE_MB", "256")) * 1024 * 1024
+        )
+        self.mmap_dir = mmap_dir if mmap_dir is not None else os.getenv("VECTOR_LOCAL_MMAP_DIR")
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else (
+            float(os.getenv("VECTOR_LOCAL_TTL_SECONDS", "300"))
+        )
+        self.generations = generations or get_generations()
+
+        self._entries: "OrderedDict[Tuple[str, int], UserMatrix]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+        if self.mmap_dir:
+            os.makedirs(self.mmap_dir, exist_ok=True)
+        self.generations.add_listener(self.invalidate)
+
+    # ==================== BÚSQUEDA ====================
+
+    def search(
+        self,
+        db: Session,
+        entity_type: str,
+        user_id: int,
+        query_embedding: List[float],
+        limit: int,
+        similarity_threshold: float,
+        categoria: Optional[str] = None,
+        fecha_desde: Optional[date] = None,
+        fecha_hasta: Optional[date] = None,
+        monto_min: Optional[Decimal] = None,
+        monto_max: Optional[Decimal] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Busca los registros del usuario más similares a la consulta.
+
+        Args:
+            db: Sesión de base de datos (solo si hay que cargar la matriz)
+            entity_type: "gasto" o "ingreso"
+            user_id: Dueño de los registros
+            query_embedding: Vector de consulta
+            limit: Número máximo de resultados
+            similarity_threshold: Umbral mínimo de similitud (0-1)
+            categoria, fecha_desde, fecha_hasta, monto_min, monto_max: Filtros opcionales
+
+        Returns:
+            Resultados con las mismas claves que VectorSearchService.search_gastos/ingresos
+        """
+        entry = self.get_matrix(db, entity_type, user_id)
+        if not len(entry.ids) or limit <= 0:
+            return []
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+        scores = entry.matrix @ (query / norm)
+
+        # Los descartados por filtro o umbral quedan fuera del top-k
+        mask = scores >= similarity_threshold
+        if categoria is not None:
+            mask &= entry.categorias == categoria
+        if fecha_desde is not None:
+            mask &= entry.fechas >= np.datetime64(fecha_desde, "D")
+        if fecha_hasta is not None:
+            mask &= entry.fechas <= np.datetime64(fecha_hasta, "D")
+        if monto_min is not None:
+            mask &= entry.montos >= float(monto_min)
+        if monto_max is not None:
+            mask &= entry.montos <= float(monto_max)
+
+        candidates = np.flatnonzero(mask)
+        if len(candidates) > limit:
+            top = np.argpartition(-scores[candidates], limit - 1)[:limit]
+            candidates = candidates[top]
+        order = candidates[np.argsort(-scores[candidates], kind="stable")]
+
+        id_key = _ENTITIES[entity_type][2]
+        results = []
+        for position in order:
+            descripcion, monto, fecha, nombre_categoria, moneda, texto = entry.rows[position]
+            results.append({
+                id_key: int(entry.ids[position]),
+                "descripcion": descripcion,
+                "monto": float(monto),
+                "fecha": fecha,
+                "categoria": nombre_categoria,
+                "moneda": moneda,
+                "similarity": float(scores[position]),
+                "texto_embedding": texto
+            })
+        return results
+
+    # ==================== CACHÉ ====================
+
+    def get_matrix(self, db: Session, entity_type: str, user_id: int) -> UserMatrix:
+        """Retorna la matriz vigente del usuario, cargándola si hace falta."""
+        key = (entity_type, user_id)
+        generation = self.generations.get(user_id, entity_type)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if (
+                entry is not None
+                and entry.generation == generation
+                and time.monotonic() - entry.loaded_at < self.ttl_seconds
+            ):
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry
+            self.stats["misses"] += 1
+
+        # La generación se leyó antes de consultar: si hay una escritura
+        # mientras tanto, la entrada nace vencida y se recarga en la próxima
+        entry = self._load(db, entity_type, user_id, generation)
+
+        with self._lock:
+            self._remove(key)
+            if entry.nbytes <= self.max_bytes:
+                self._entries[key] = entry
+                self._bytes += entry.nbytes
+                while self._bytes > self.max_bytes:
+                    self._remove(next(iter(self._entries)))
+                    self.stats["evictions"] += 1
+            else:
+                # No entra en la caché: se usa solo para esta búsqueda
+                entry.unlink()
+        return entry
+
+    def invalidate(self, user_id: Optional[int], entity_type: Optional[str] = None) -> None:
+        """Descarta las matrices de un usuario (None = todos), de una entidad o de todas."""
+        entity_types = [entity_type] if entity_type else list(_ENTITIES)
+        with self._lock:
+            keys = [
+                key for key in self._entries
+                if key[0] in entity_types and (user_id is None or key[1] == user_id)
+            ]
+            for key in keys:
+                self._remove(key)
+                self.stats["invalidations"] += 1
+
+    def clear(self) -> None:
+        """Descarta todas las matrices."""
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Retorna aciertos, fallos, desalojos y memoria usada."""
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_ratio": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "mmap": bool(self.mmap_dir)
+            }
+
+    def _remove(self, key: Tuple[str, int]) -> bool:
+        """Quita una entrada (con el lock tomado) y borra su archivo mapeado."""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+
+        self._bytes -= entry.nbytes
+        entry.unlink()
+        return True
+
+    # ==================== CARGA ====================
+
+    def _load(self, db: Session, entity_type: str, user_id: int, generation: int) -> UserMatrix:
+        """Lee los embeddings del usuario y arma la matriz normalizada."""
+        model, id_column, _ = _ENTITIES[entity_type]
+        table = embedding_table(entity_type)
+        fk_column = table.c[_ENTITIES[entity_type][2]]
+
+        rows = db.execute(
+            select(
+                fk_column,
+                table.c.embedding,
+                model.descripcion,
+                model.monto,
+                model.fecha,
+                Categoria.nombre,
+                model.moneda,
+                table.c.texto_original
+            )
+            .join(model, id_column == fk_column)
+            .outerjoin(Categoria, Categoria.id_categoria == model.id_categoria)
+            .where(model.id_usuario == user_id)
+            .order_by(fk_column)
+        ).all()
+
+        ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        if rows:
+            matrix = np.vstack([np.asarray(row[1], dtype=np.float32) for row in rows])
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            matrix = np.ascontiguousarray(matrix / norms, dtype=np.float32)
+        else:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+
+        data = [tuple(row[2:]) for row in rows]
+        fechas = np.array([row[4] for row in rows], dtype="datetime64[D]")
+        montos = np.array([float(row[3]) for row in rows], dtype=np.float64)
+        categorias = np.array([row[5] for row in rows], dtype=object)
+
+        nbytes = (
+            matrix.nbytes + ids.nbytes + fechas.nbytes + montos.nbytes + categorias.nbytes
+            + sum(_ROW_OVERHEAD + len(row[-1] or "") for row in data)
+        )
+
+        # Solo se mapea lo que va a quedar en la caché
+        path = None
+        if self.mmap_dir and len(rows) and nbytes <= self.max_bytes:
+            path = os.path.join(self.mmap_dir, f"{entity_type}_{user_id}_{uuid.uuid4().hex}.npy")
+            np.save(path, matrix)
+            matrix = np.load(path, mmap_mode="r")
+
+        logger.debug(
+            f"Índice local: {len(rows)} {entity_type}s del usuario {user_id} ({nbytes} bytes)"
+        )
+        return UserMatrix(
+            ids=ids,
+            matrix=matrix,
+            fechas=fechas,
+            montos=montos,
+            categorias=categorias,
+            rows=data,
+            generation=generation,
+            loaded_at=time.monotonic(),
+            nbytes=nbytes,
+            path=path
+        )
+
+
+# ==================== SINGLETON ====================
+
+_local_index: Optional[LocalVectorIndex] = None
+_local_index_lock = threading.Lock()
+
+
+def get_local_vector_index() -> LocalVectorIndex:
+    """Retorna el índice local del proceso."""
+    global _local_index
+    if _local_index is None:
+        with _local_index_lock:
+            if _local_index is None:
+                _local_index = LocalVectorIndex()
+    return _local_index
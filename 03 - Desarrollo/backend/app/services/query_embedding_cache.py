@@ -0,0 +1,172 @@
+"""
+Caché en Memoria de Embeddings de Consultas
+===========================================
+Caché LRU con expiración para los embeddings de las preguntas del usuario
+
+Responsabilidades:
+- Evitar un round trip al proveedor para consultas repetidas (prompts sugeridos)
+- Normalizar el texto de la consulta para que variantes triviales compartan entrada
+- Guardar los vectores como arrays float32 compactos con un tope en bytes
+- Llevar métricas de aciertos, fallos, expiraciones y desalojos
+
+Variables de entorno:
+- QUERY_EMBEDDING_CACHE_ENABLED: "true" o "false" (default: true)
+- QUERY_EMBEDDING_CACHE_MAX_MB: tamaño máximo de los vectores (default: 32)
+- QUERY_EMBEDDING_CACHE_TTL_SECONDS: vida de cada entrada (default: 3600)
+
+Autor: Sistema de Analizador Financiero
+Fecha: 17 octubre 2026
+"""
+
+import os
+import re
+import time
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import List, Optional, Dict, Any, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+class QueryEmbeddingCache:
+    """
+    Caché LRU + TTL de embeddings de consultas, en memoria del proceso.
+
+    Las entradas se ordenan por último acceso; al superar `max_bytes` se
+    desalojan las menos usadas y las vencidas se descartan al leerlas.
+    """
+
+    def __init__(self, max_bytes: int, ttl_seconds: float):
+        """
+        Args:
+            max_bytes: Tamaño máximo de los vectores almacenados en bytes
+            ttl_seconds: Segundos de vida de cada entrada
+        """
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[np.ndarray, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Normaliza la consulta: Unicode NFC, minúsculas y espacios colapsados."""
+        text = unicodedata.normalize("NFC", text).casefold()
+        return _WHITESPACE_RE.sub(" ", text).strip()
+
+    def get(self, namespace: str, text: str) -> Optional[List[float]]:
+        """
+        Busca el embedding de una consulta.
+
+        Args:
+            namespace: Identificador de proveedor, modelo y dimensiones
+            text: Texto de la consulta (sin normalizar)
+
+        Returns:
+            El vector, o None si no está o venció
+        """
+        key = (namespace, self.normalize(text))
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            vector, expires_at = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+        return vector.tolist()
+
+    def put(self, namespace: str, text: str, vector: List[float]) -> None:
+        """Guarda el embedding de una consulta y desaloja si hace falta."""
+        key = (namespace, self.normalize(text))
+        array = np.asarray(vector, dtype=np.float32)
+
+        if array.nbytes > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = (array, time.monotonic() + self.ttl_seconds)
+            self.size_bytes += array.nbytes
+
+            while self.size_bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key: Tuple[str, str]) -> None:
+        """Elimina una entrada (requiere tener el lock)."""
+        vector, _ = self._entries.pop(key)
+        self.size_bytes -= vector.nbytes
+
+    def clear(self) -> None:
+        """Elimina todas las entradas."""
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Retorna métricas de uso de la caché.
+
+        Returns:
+            Diccionario con entradas, tamaño, aciertos, fallos y desalojos
+        """
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "size_bytes": self.size_bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "expirations": self.expirations,
+            "evictions": self.evictions
+        }
+
+
+_query_embedding_cache: Optional[QueryEmbeddingCache] = None
+_query_embedding_cache_lock = threading.Lock()
+
+
+def get_query_embedding_cache() -> Optional[QueryEmbeddingCache]:
+    """
+    Obtiene la caché de embeddings de consultas del proceso (singleton).
+
+    Returns:
+        La instancia compartida, o None si la caché está deshabilitada
+    """
+    global _query_embedding_cache
+
+    if os.getenv("QUERY_EMBEDDING_CACHE_ENABLED", "true").lower() != "true":
+        return None
+
+    with _query_embedding_cache_lock:
+        if _query_embedding_cache is None:
+            max_bytes = int(float(os.getenv("QUERY_EMBEDDING_CACHE_MAX_MB", "32")) * 1024 * 1024)
+            ttl_seconds = float(os.getenv("QUERY_EMBEDDING_CACHE_TTL_SECONDS", "3600"))
+            _query_embedding_cache = QueryEmbeddingCache(max_bytes, ttl_seconds)
+
+        return _query_embedding_cache
@@ -0,0 +1,148 @@
+"""
+Índices Vectoriales
+===================
+Administración de los índices ANN y de sus parámetros de búsqueda
+
+Responsabilidades:
+- Reconstruir el índice sobre embedding como HNSW (m, ef_construction) o
+  IVFFlat (lists) mediante database/vector_indexes.sql
+- Listar los índices ANN existentes
+- Resolver los parámetros de búsqueda (hnsw.ef_search, ivfflat.probes) a
+  partir de un preset de velocidad/recall o de valores explícitos
+  (las funciones SQL de búsqueda los reciben como parámetros y los fijan
+  solo mientras recorren el índice, ver begin_vector_scan en
+  database/embedding_user_scope.sql)
+
+Variables de entorno:
+- VECTOR_INDEX_METHOD: "hnsw" o "ivfflat" (default: hnsw)
+- VECTOR_HNSW_M: conexiones por nodo de HNSW (default: 16)
+- VECTOR_HNSW_EF_CONSTRUCTION: candidatos al construir HNSW (default: 64)
+- VECTOR_IVFFLAT_LISTS: listas de IVFFlat (default: raíz de la cantidad de filas)
+- VECTOR_SEARCH_PRESET: preset por defecto de las búsquedas (default: balanced)
+
+Autor: Sistema de Analizador Financiero
+Fecha: 17 octubre 2026
+"""
+
+import os
+import logging
+from typing import Dict, Any, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.services.embedding_versions import embedding_table
+
+logger = logging.getLogger(__name__)
+
+INDEX_METHODS = ("hnsw", "ivfflat")
+
+# hnsw.ef_search: candidatos explorados por consulta (más = mejor recall, más lento)
+# ivfflat.probes: listas recorridas por consulta
+SEARCH_PRESETS: Dict[str, Dict[str, int]] = {
+    "fast": {"ef_search": 40, "probes": 1},
+    "balanced": {"ef_search": 100, "probes": 10},
+    "accurate": {"ef_search": 400, "probes": 40},
+}
+
+
+def resolve_search_params(
+    preset: Optional[str] = None,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+    min_candidates: int = 0
+) -> Dict[str, int]:
+    """
+    Combina un preset con los valores explícitos de la llamada.
+
+    HNSW nunca retorna más filas que ef_search, así que se eleva al menos a
+    la cantidad de filas que pide la consulta.
+
+    Args:
+        preset: "fast", "balanced" o "accurate" (None = VECTOR_SEARCH_PRESET)
+        ef_search: Pisa el ef_search del preset
+        probes: Pisa el probes del preset
+        min_candidates: Filas que pide la consulta al índice
+
+    Returns:
+        Diccionario con ef_search y probes
+
+    Raises:
+        ValueError: Si el preset no existe
+    """
+    preset = preset or os.getenv("VECTOR_SEARCH_PRESET", "balanced")
+    if preset not in SEARCH_PRESETS:
+        raise ValueError(f"Preset de búsqueda no válido: {preset}")
+
+    params = dict(SEARCH_PRESETS[preset])
+    if ef_search is not None:
+        params["ef_search"] = ef_search
+    if probes is not None:
+        params["probes"] = probes
+    params["ef_search"] = max(params["ef_search"], min_candidates)
+    return params
+
+
+def rebuild_vector_index(
+    db: Session,
+    entity_type: str,
+    method: Optional[str] = None,
+    m: Optional[int] = None,
+    ef_construction: Optional[int] = None,
+    lists: Optional[int] = None,
+    target: str = "active"
+) -> str:
+    """
+    Reemplaza el índice ANN sobre embedding de una tabla (con commit).
+
+    Args:
+        db: Sesión de base de datos
+        entity_type: "gasto" o "ingreso"
+        method: "hnsw" o "ivfflat" (default: VECTOR_INDEX_METHOD)
+        m: Conexiones por nodo de HNSW (default: VECTOR_HNSW_M)
+        ef_construction: Candidatos al construir HNSW (default: VECTOR_HNSW_EF_CONSTRUCTION)
+        lists: Listas de IVFFlat (default: VECTOR_IVFFLAT_LISTS o raíz de las filas)
+        target: Tabla "active" o "shadow"
+
+    Returns:
+        Nombre del índice creado
+
+    Raises:
+        ValueError: Si el método no es válido
+    """
+    method = method or os.getenv("VECTOR_INDEX_METHOD", "hnsw")
+    if method not in INDEX_METHODS:
+        raise ValueError(f"Método de índice no válido: {method}")
+
+    if lists is None and os.getenv("VECTOR_IVFFLAT_LISTS"):
+        lists = int(os.getenv("VECTOR_IVFFLAT_LISTS"))
+
+    table = embedding_table(entity_type, target)
+    name = db.execute(
+        text("SELECT rebuild_embedding_vector_index(:table, :method, :m, :ef_construction, :lists)"),
+        {
+            "table": table.name,
+            "method": method,
+            "m": m or int(os.getenv("VECTOR_HNSW_M", "16")),
+            "ef_construction": ef_construction or int(os.getenv("VECTOR_HNSW_EF_CONSTRUCTION", "64")),
+            "lists": lists
+        }
+    ).scalar()
+    db.commit()
+
+    logger.info(f"Índice {method} {name} creado sobre {table.name}")
+    return name
+
+
+def get_vector_indexes(db: Session) -> List[Dict[str, Any]]:
+    """Lista los índices ANN de las tablas de embeddings."""
+    return [
+        {
+            "tabla": row[0],
+            "indice": row[1],
+            "metodo": row[2],
+            "definicion": row[3],
+            "tamano": row[4]
+        }
+        for row in db.execute(text("SELECT * FROM get_embedding_vector_indexes()"))
+    ]
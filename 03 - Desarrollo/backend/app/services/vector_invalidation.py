@@ -0,0 +1,174 @@
+"""
+Invalidación de Búsquedas Vectoriales
+=====================================
+Contadores de generación por usuario para las cachés de búsqueda vectorial
+
+Responsabilidades:
+- Detectar los usuarios cuyos gastos o ingresos (o sus embeddings)
+  cambiaron en una transacción (eventos de la sesión de SQLAlchemy: altas,
+  ediciones y bajas por ORM)
+- Registrar los cambios de embeddings escritos sin ORM (upsert o COPY)
+- Al confirmar la transacción, incrementar la generación de cada
+  (usuario, entidad) afectado y avisar a las cachés registradas
+- Descartar los cambios pendientes si la transacción se revierte
+- Invalidar también al renombrar o borrar una categoría (los resultados
+  incluyen su nombre); una categoría global invalida a todos los usuarios
+
+Una entrada de caché guarda la generación leída antes de consultar la base
+y solo es válida mientras esa generación no cambie. La invalidación es por
+proceso: cada worker de la API ve sus propias escrituras.
+
+Autor: Sistema de Analizador Financiero
+Fecha: 17 octubre 2026
+"""
+
+import logging
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.models.categoria import Categoria
+from app.models.embeddings import GastoEmbedding, IngresoEmbedding
+from app.models.gasto import Gasto
+from app.models.ingreso import Ingreso
+
+logger = logging.getLogger(__name__)
+
+ENTITY_TYPES = ("gasto", "ingreso")
+
+_ENTITY_CLASSES = {Gasto: "gasto", Ingreso: "ingreso"}
+
+# Embedding -> (entidad dueña, columna que la referencia)
+_EMBEDDING_CLASSES = {GastoEmbedding: (Gasto, "gasto_id"), IngresoEmbedding: (Ingreso, "ingreso_id")}
+
+# Clave en Session.info con los (entidad, usuario) modificados sin confirmar
+_PENDING_KEY = "vector_search_changes"
+
+
+class GenerationRegistry:
+    """Generación por (usuario, entidad), segura entre hilos."""
+
+    def __init__(self):
+        self._generations: Dict[Tuple[int, str], int] = {}
+        # Cambios que afectan a todos los usuarios (ej: categoría global)
+        self._epochs: Dict[str, int] = {}
+        self._listeners: List[Callable[[Optional[int], str], None]] = []
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int, entity_type: str) -> int:
+        """
+        Retorna la generación actual de los datos de un usuario.
+
+        Suma la del usuario y la global: ambas solo crecen, así que cualquier
+        cambio de una de ellas cambia el resultado.
+        """
+        with self._lock:
+            return self._generations.get((user_id, entity_type), 0) + self._epochs.get(entity_type, 0)
+
+    def bump(self, user_id: int, entity_type: str) -> None:
+        """Marca como modificados los datos de un usuario y avisa a las cachés."""
+        with self._lock:
+            key = (user_id, entity_type)
+            self._generations[key] = self._generations.get(key, 0) + 1
+        self._notify(user_id, entity_type)
+
+    def bump_all(self, entity_type: str) -> None:
+        """Marca como modificados los datos de todos los usuarios de una entidad."""
+        with self._lock:
+            self._epochs[entity_type] = self._epochs.get(entity_type, 0) + 1
+        self._notify(None, entity_type)
+
+    def add_listener(self, listener: Callable[[Optional[int], str], None]) -> None:
+        """
+        Registra una función a llamar con (usuario, entidad) en cada cambio.
+
+        El usuario es None cuando el cambio afecta a todos.
+        """
+        with self._lock:
+            self._listeners.append(listener)
+
+    def _notify(self, user_id: Optional[int], entity_type: str) -> None:
+        with self._lock:
+            listeners = list(self._listeners)
+
+        for listener in listeners:
+            try:
+                listener(user_id, entity_type)
+            except Exception as e:
+                logger.error(f"Error invalidando caché vectorial: {str(e)}")
+
+
+_registry = GenerationRegistry()
+
+
+def get_generations() -> GenerationRegistry:
+    """Retorna el registro de generaciones del proceso."""
+    return _registry
+
+
+def mark_changed(db: Session, entity_type: str, user_ids: Iterable[int]) -> None:
+    """
+    Registra cambios hechos sin ORM (ej: upsert de embeddings).
+
+    Se aplican al confirmar la transacción de `db`.
+
+    Args:
+        db: Sesión en la que se hizo la escritura
+        entity_type: "gasto" o "ingreso"
+        user_ids: Usuarios dueños de las filas escritas
+    """
+    pending: Set[Tuple[str, Optional[int]]] = db.info.setdefault(_PENDING_KEY, set())
+    pending.update((entity_type, user_id) for user_id in user_ids if user_id is not None)
+
+
+def _embedding_owner(session: Session, obj) -> Tuple[str, Optional[int]]:
+    """
+    Entidad y dueño de un embedding.
+
+    Al insertarlo por ORM id_usuario lo completa un trigger y el objeto
+    todavía no lo tiene: se toma del gasto/ingreso referenciado.
+    """
+    parent_class, column = _EMBEDDING_CLASSES[type(obj)]
+    user_id = obj.id_usuario
+    if user_id is None:
+        parent = session.get(parent_class, getattr(obj, column))
+        user_id = parent.id_usuario if parent is not None else None
+    return _ENTITY_CLASSES[parent_class], user_id
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_orm_changes(session: Session, flush_context) -> None:
+    """Registra los dueños de los gastos/ingresos y embeddings insertados, editados o borrados."""
+    changed = []
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        entity_type = _ENTITY_CLASSES.get(type(obj))
+        if entity_type is not None:
+            changed.append((entity_type, obj.id_usuario))
+        elif type(obj) in _EMBEDDING_CLASSES:
+            entity_type, user_id = _embedding_owner(session, obj)
+            if user_id is not None:
+                changed.append((entity_type, user_id))
+        elif isinstance(obj, Categoria) and obj not in session.new:
+            # Usuario None: categoría global, afecta a todos
+            changed.extend((entity, obj.id_usuario) for entity in ENTITY_TYPES)
+
+    if changed:
+        session.info.setdefault(_PENDING_KEY, set()).update(changed)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_changes(session: Session) -> None:
+    """Incrementa las generaciones afectadas por la transacción confirmada."""
+    for entity_type, user_id in session.info.pop(_PENDING_KEY, ()):
+        if user_id is None:
+            _registry.bump_all(entity_type)
+        else:
+            _registry.bump(user_id, entity_type)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changes(session: Session) -> None:
+    """Una transacción revertida no modificó nada."""
+    session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,278 @@
+"""
+Caché de Resultados de Búsqueda Vectorial
+=========================================
+Resultados de VectorSearchService reutilizados hasta la próxima escritura
+
+Responsabilidades:
+- Guardar resultados por (usuario, método, huella del vector de consulta,
+  filtros, límite y umbral)
+- Invalidar con los contadores de generación por usuario de
+  vector_invalidation.py: cualquier alta, edición o baja de gastos, ingresos
+  o embeddings confirmada en el proceso descarta los resultados del usuario
+- Acotar la memoria con un LRU por bytes
+- Exportar aciertos, fallos y tasa de aciertos (JSON y Prometheus)
+
+La generación se lee antes de consultar la base y se guarda con el
+resultado: si una escritura se confirma durante la búsqueda, el resultado
+nace vencido. Las escrituras de otros procesos (backfill, otros workers de
+la API) no se ven; VECTOR_RESULT_CACHE_TTL_SECONDS acota ese caso.
+
+Variables de entorno:
+- VECTOR_RESULT_CACHE_ENABLED: "true" para activar la caché (default: true)
+- VECTOR_RESULT_CACHE_MB: memoria máxima de los resultados (default: 64)
+- VECTOR_RESULT_CACHE_TTL_SECONDS: vigencia máxima de un resultado (default: 300)
+
+Autor: Sistema de Analizador Financiero
+Fecha: 17 octubre 2026
+"""
+
+import os
+import copy
+import time
+import pickle
+import hashlib
+import inspect
+import logging
+import threading
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from app.services.vector_invalidation import GenerationRegistry, get_generations
+
+logger = logging.getLogger(__name__)
+
+
+def vector_fingerprint(values: Sequence[float]) -> str:
+    """Huella del vector de consulta (bytes float32, como se compara en la base)."""
+    data = np.ascontiguousarray(values, dtype=np.float32).tobytes()
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def _freeze(value: Any) -> Hashable:
+    """Convierte un argumento de búsqueda en parte de la clave."""
+    if isinstance(value, np.ndarray):
+        return vector_fingerprint(value)
+    if isinstance(value, (list, tuple)):
+        if value and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in value):
+            return vector_fingerprint(value)
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    return value
+
+
+def _is_empty(value: Any) -> bool:
+    # Los métodos de búsqueda devuelven vacío también ante errores: no se guarda
+    if isinstance(value, tuple):
+        return all(_is_empty(v) for v in value)
+    if isinstance(value, list) and value and isinstance(value[0], dict) and "gastos" in value[0]:
+        return all(not g["gastos"] and not g["ingresos"] for g in value)
+    return not value
+
+
+class VectorResultCache:
+    """LRU de resultados por usuario, invalidado por generación."""
+
+    def __init__(
+        self,
+        max_bytes: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+        generations: Optional[GenerationRegistry] = None
+    ):
+        """
+        Args:
+            max_bytes: Memoria máxima (default: VECTOR_RESULT_CACHE_MB)
+            ttl_seconds: Vigencia de un resultado (default: VECTOR_RESULT_CACHE_TTL_SECONDS)
+            generations: Registro de generaciones (default: el del proceso)
+        """
+        self.max_bytes = max_bytes if max_bytes is not None else (
+            int(os.getenv("VECTOR_RESULT_CACHE_MB", "64")) * 1024 * 1024
+        )
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else (
+            float(os.getenv("VECTOR_RESULT_CACHE_TTL_SECONDS", "300"))
+        )
+        self.generations = generations or get_generations()
+
+        # clave -> (generaciones, guardado, bytes, resultado)
+        self._entries: "OrderedDict[Tuple, Tuple[Tuple[int, ...], float, int, Any]]" = OrderedDict()
+        self._by_user: Dict[int, Set[Tuple]] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+        self.generations.add_listener(self.invalidate)
+
+    def snapshot(self, user_id: int, entity_types: Sequence[str]) -> Tuple[int, ...]:
+        """Generaciones actuales del usuario; leerlas antes de consultar la base."""
+        return tuple(self.generations.get(user_id, entity) for entity in entity_types)
+
+    def get(self, key: Tuple, user_id: int, entity_types: Sequence[str]) -> Tuple[bool, Any]:
+        """
+        Busca un resultado vigente.
+
+        Returns:
+            (encontrado, copia del resultado)
+        """
+        generation = self.snapshot(user_id, entity_types)
+        with self._lock:
+            entry = self._entries.get(key)
+            if (
+                entry is not None
+                and entry[0] == generation
+                and time.monotonic() - entry[1] < self.ttl_seconds
+            ):
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                value = entry[3]
+            else:
+                self.stats["misses"] += 1
+                return False, None
+        # Copia: quien llama puede modificar los diccionarios
+        return True, copy.deepcopy(value)
+
+    def put(self, key: Tuple, user_id: int, generation: Tuple[int, ...], value: Any) -> None:
+        """Guarda un resultado calculado con las generaciones `generation`."""
+        value = copy.deepcopy(value)
+        nbytes = len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)) + 200
+        if nbytes > self.max_bytes:
+            return
+
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (generation, time.monotonic(), nbytes, value)
+            self._by_user.setdefault(user_id, set()).add(key)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.stats["evictions"] += 1
+
+    def invalidate(self, user_id: Optional[int], entity_type: Optional[str] = None) -> None:
+        """
+        Descarta los resultados de un usuario (None = todos).
+
+        Los resultados de cualquier método del usuario se descartan juntos:
+        una búsqueda combinada depende de ambas entidades.
+        """
+        with self._lock:
+            if user_id is None:
+                keys = list(self._entries)
+            else:
+                keys = list(self._by_user.get(user_id, ()))
+            for key in keys:
+                if self._remove(key):
+                    self.stats["invalidations"] += 1
+
+    def clear(self) -> None:
+        """Descarta todos los resultados y reinicia las métricas."""
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
+            self.stats = dict.fromkeys(self.stats, 0)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Retorna aciertos, fallos, tasa de aciertos, desalojos y memoria usada."""
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_ratio": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes
+            }
+
+    def render_prometheus(self) -> str:
+        """Exporta las métricas en el formato de texto de Prometheus."""
+        stats = self.get_stats()
+        lines: List[str] = []
+        metrics = [
+            ("vector_search_cache_hits_total", "counter", "Búsquedas resueltas desde la caché", stats["hits"]),
+            ("vector_search_cache_misses_total", "counter", "Búsquedas que consultaron la base", stats["misses"]),
+            ("vector_search_cache_evictions_total", "counter", "Resultados desalojados por memoria", stats["evictions"]),
+            ("vector_search_cache_invalidations_total", "counter", "Resultados descartados por escrituras", stats["invalidations"]),
+            ("vector_search_cache_hit_ratio", "gauge", "Aciertos sobre búsquedas", stats["hit_ratio"]),
+            ("vector_search_cache_entries", "gauge", "Resultados en caché", stats["entries"]),
+            ("vector_search_cache_bytes", "gauge", "Memoria estimada de los resultados", stats["bytes"]),
+        ]
+        for name, kind, help_text, value in metrics:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def _remove(self, key: Tuple) -> bool:
+        """Quita una entrada (con el lock tomado)."""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        self._bytes -= entry[2]
+        user_keys = self._by_user.get(key[0])
+        if user_keys is not None:
+            user_keys.discard(key)
+            if not user_keys:
+                del self._by_user[key[0]]
+        return True
+
+
+def cached_search(entity_types: Sequence[str]) -> Callable:
+    """
+    Decorador para métodos de búsqueda de VectorSearchService.
+
+    La clave es (usuario, método, resto de los argumentos con los vectores
+    reducidos a su huella). Se desactiva con el atributo RESULT_CACHE del
+    servicio; los resultados vacíos no se guardan.
+
+    Args:
+        entity_types: Entidades de las que depende el resultado
+    """
+    def decorator(func: Callable) -> Callable:
+        signature = inspect.signature(func)
+
+        @wraps(func)
+        def wrapper(self, *args, **kwargs):
+            if not self.RESULT_CACHE:
+                return func(self, *args, **kwargs)
+
+            bound = signature.bind(self, *args, **kwargs)
+            bound.apply_defaults()
+            arguments = dict(bound.arguments)
+            arguments.pop("self")
+            user_id = arguments.pop("user_id")
+            try:
+                key = (user_id, func.__name__, self.BACKEND, _freeze(arguments))
+                hash(key)
+            except TypeError:
+                return func(self, *args, **kwargs)
+
+            cache = get_vector_result_cache()
+            found, value = cache.get(key, user_id, entity_types)
+            if found:
+                return value
+
+            generation = cache.snapshot(user_id, entity_types)
+            value = func(self, *args, **kwargs)
+            if not _is_empty(value):
+                cache.put(key, user_id, generation, value)
+            return value
+
+        return wrapper
+    return decorator
+
+
+# ==================== SINGLETON ====================
+
+_result_cache: Optional[VectorResultCache] = None
+_result_cache_lock = threading.Lock()
+
+
+def get_vector_result_cache() -> VectorResultCache:
+    """Retorna la caché de resultados del proceso."""
+    global _result_cache
+    if _result_cache is None:
+        with _result_cache_lock:
+            if _result_cache is None:
+                _result_cache = VectorResultCache()
+    return _result_cache
@@ -4,15 +4,28 @@ Servicio de Búsqueda Vectorial
 Realiza búsquedas de similitud vectorial en la base de datos usando pgvector
 
 Responsabilidades:
-- Ejecutar búsquedas vectoriales en gastos y/o ingresos
-- Aplicar filtros adicionales (fecha, categoría, monto)
+- Ejecutar búsquedas vectoriales en gastos y/o ingresos de un usuario
+  (las funciones SQL solo recorren los embeddings de ese usuario)
+- Aplicar filtros adicionales (fecha, categoría, monto) eligiendo, según la
+  selectividad estimada, pre-filtro exacto o iterative index scan
 - Combinar resultados de múltiples fuentes
 - Manejar umbrales de similitud
+- No comparar consultas de un modelo con embeddings de otra versión
+- Fijar por consulta el recall del índice ANN (hnsw.ef_search /
+  ivfflat.probes) mediante presets de velocidad/recall
+- Resolver varias consultas (vectores y filtros) en un solo round trip
+- Búsqueda híbrida: coincidencias léxicas (comercio, palabras clave) y
+  vectoriales fusionadas por reciprocal rank fusion
+- Reutilizar resultados hasta la próxima escritura del usuario
+- Opcionalmente, buscar en memoria con NumPy sobre la matriz del usuario
+  (VECTOR_SEARCH_BACKEND=local, ver local_vector_index.py)
 
 Autor: Sistema de Analizador Financiero
 Fecha: 11 noviembre 2025
 """
 
+import os
+import asyncio
 import logging
 from typing import List, Optional, Dict, Any, Tuple
 from datetime import date, datetime
@@ -20,8 +33,34 @@ from decimal import Decimal
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 
+from app.crud.vector_codec import VectorParam
+from app.services.vector_index import resolve_search_params
+from app.services.vector_result_cache import cached_search
+
 logger = logging.getLogger(__name__)
 
+# Tipos de entidad de cada consulta de search_many
+MANY_ENTITY_TYPES = ("gasto", "ingreso", "all")
+
+# Estrategias de la búsqueda con filtros (ver database/filtered_vector_search.sql)
+FILTER_STRATEGIES = ("auto", "exact", "iterative")
+
+# Umbral que no descarta nada (la similitud coseno está en [-1, 1])
+NO_THRESHOLD = -1.0
+
+
+def threshold_cascade(initial: float, step: float, minimum: float) -> List[float]:
+    """
+    Umbrales a probar, de mayor a menor: initial, initial - step, ... >= minimum.
+
+    Redondeados para que la resta en punto flotante no saltee el mínimo
+    (0.7 - 4 x 0.05 = 0.4999...).
+    """
+    if step <= 0:
+        return [initial]
+    count = int(round((initial - minimum) / step, 6)) + 1
+    return [round(initial - i * step, 6) for i in range(max(count, 1))]
+
 
 class VectorSearchService:
     """
@@ -35,6 +74,29 @@ class VectorSearchService:
     DEFAULT_SIMILARITY_THRESHOLD = 0.7  # 70% de similitud mínima
     MAX_LIMIT = 100
     
+    # Almacenamiento del índice ANN: "full" (vector float32) o "half" (halfvec
+    # con re-ranking exacto, ver database/compact_embeddings.sql)
+    STORAGE_MODE = os.getenv("VECTOR_STORAGE_MODE", "full").lower()
+    RESCORE_FACTOR = int(os.getenv("VECTOR_RESCORE_FACTOR", "4"))
+    
+    # Motor de búsqueda: "pgvector" (funciones SQL) o "local" (matriz en memoria
+    # por usuario; los presets del índice ANN no aplican)
+    BACKEND = os.getenv("VECTOR_SEARCH_BACKEND", "pgvector").lower()
+    
+    # Búsqueda híbrida (léxica + vectorial con RRF, ver database/hybrid_search.sql)
+    HYBRID_SEARCH = os.getenv("VECTOR_HYBRID_SEARCH", "false").lower() == "true"
+    HYBRID_RRF_K = int(os.getenv("VECTOR_HYBRID_RRF_K", "60"))
+    HYBRID_CANDIDATE_FACTOR = int(os.getenv("VECTOR_HYBRID_CANDIDATE_FACTOR", "5"))
+    
+    # Búsqueda con filtros: "auto" elige por la selectividad estimada entre
+    # "exact" (pre-filtro) e "iterative" (iterative index scan, pgvector >= 0.8)
+    FILTER_STRATEGY = os.getenv("VECTOR_FILTER_STRATEGY", "auto").lower()
+    FILTER_EXACT_MAX_ROWS = int(os.getenv("VECTOR_FILTER_EXACT_MAX_ROWS", "20000"))
+    FILTER_MIN_SELECTIVITY = float(os.getenv("VECTOR_FILTER_MIN_SELECTIVITY", "0.05"))
+    
+    # Caché de resultados invalidada por escrituras (ver vector_result_cache.py)
+    RESULT_CACHE = os.getenv("VECTOR_RESULT_CACHE_ENABLED", "true").lower() == "true"
+    
     def __init__(self, db: Session):
         """
         Inicializa el servicio con una sesión de base de datos.
@@ -45,8 +107,35 @@ class VectorSearchService:
         self.db = db
         logger.debug("VectorSearchService inicializado")
     
+    def check_model_version(self, model_version: str) -> bool:
+        """
+        Verifica que las tablas activas sean del modelo que generó la consulta.
+        
+        Después de un cutover (ver database/embedding_versions.sql) y hasta
+        reiniciar la API con el proveedor nuevo, las consultas se generarían
+        con el modelo anterior; comparar esos vectores no tiene sentido.
+        
+        Args:
+            model_version: Versión (proveedor:modelo:dimensiones) de la consulta
+        
+        Returns:
+            True si se puede buscar
+        """
+        from app.services.embedding_versions import get_active_model_version
+        
+        active = get_active_model_version(self.db)
+        if active is not None and active != model_version:
+            logger.warning(
+                f"Embeddings activos de {active} y consulta de {model_version}: "
+                f"se omite la búsqueda semántica"
+            )
+            return False
+        return True
+    
+    @cached_search(("gasto",))
     def search_gastos(
         self,
+        user_id: int,
         query_embedding: List[float],
         limit: int = DEFAULT_LIMIT,
         similarity_threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
@@ -54,12 +143,17 @@ class VectorSearchService:
         fecha_desde: Optional[date] = None,
         fecha_hasta: Optional[date] = None,
         monto_min: Optional[Decimal] = None,
-        monto_max: Optional[Decimal] = None
+        monto_max: Optional[Decimal] = None,
+        preset: Optional[str] = None,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        filter_strategy: Optional[str] = None
     ) -> List[Dict[str, Any]]:
         """
-        Busca gastos similares usando búsqueda vectorial.
+        Busca gastos similares del usuario usando búsqueda vectorial.
         
         Args:
+            user_id: ID del usuario dueño de los gastos (obligatorio)
             query_embedding: Vector de consulta (1536 dimensiones)
             limit: Número máximo de resultados
             similarity_threshold: Umbral mínimo de similitud (0-1)
@@ -68,62 +162,120 @@ class VectorSearchService:
             fecha_hasta: Filtro opcional de fecha final
             monto_min: Filtro opcional de monto mínimo
             monto_max: Filtro opcional de monto máximo
+            preset: Preset de velocidad/recall: "fast", "balanced" o "accurate"
+                    (default: VECTOR_SEARCH_PRESET)
+            ef_search: Pisa hnsw.ef_search del preset
+            probes: Pisa ivfflat.probes del preset
+            filter_strategy: Estrategia con filtros: "auto", "exact" o "iterative"
+                             (default: VECTOR_FILTER_STRATEGY, ver `plan_search`)
         
         Returns:
             Lista de gastos con su similitud
+        
+        Raises:
+            ValueError: Si el preset o la estrategia de filtrado no existen
         """
         limit = min(limit, self.MAX_LIMIT)
+        if self.BACKEND == "local":
+            return self._search_local(
+                "gasto", user_id, query_embedding, limit, similarity_threshold,
+                categoria=categoria,
+                fecha_desde=fecha_desde,
+                fecha_hasta=fecha_hasta,
+                monto_min=monto_min,
+                monto_max=monto_max
+            )
+        search_params = self._search_params(preset, ef_search, probes, limit)
+        filter_strategy = self._filter_strategy(filter_strategy)
         
         try:
-            # Convertir el embedding a formato PostgreSQL array
-            embedding_str = self._format_vector(query_embedding)
+            # VectorParam lo envía como '[...]'::vector (float32)
+            embedding = VectorParam(query_embedding)
             
             # Construir y ejecutar la consulta
             if any([categoria, fecha_desde, fecha_hasta, monto_min, monto_max]):
-                # Usar función con filtros
+                # Pre-filtro exacto o iterative scan según la selectividad estimada
                 query = text("""
                     SELECT * FROM search_gastos_with_filters(
-                        :embedding::vector,
+                        :user_id,
+                        :embedding,
                         :limit,
                         :threshold,
                         :categoria,
                         :fecha_desde,
                         :fecha_hasta,
                         :monto_min,
-                        :monto_max
+                        :monto_max,
+                        :ef_search,
+                        :probes,
+                        :strategy,
+                        :exact_max_rows,
+                        :min_selectivity
                     )
                 """)
                 
                 result = self.db.execute(query, {
-                    "embedding": embedding_str,
+                    "user_id": user_id,
+                    "embedding": embedding,
                     "limit": limit,
                     "threshold": similarity_threshold,
                     "categoria": categoria,
                     "fecha_desde": fecha_desde,
                     "fecha_hasta": fecha_hasta,
                     "monto_min": float(monto_min) if monto_min else None,
-                    "monto_max": float(monto_max) if monto_max else None
+                    "monto_max": float(monto_max) if monto_max else None,
+                    "strategy": filter_strategy,
+                    "exact_max_rows": self.FILTER_EXACT_MAX_ROWS,
+                    "min_selectivity": self.FILTER_MIN_SELECTIVITY,
+                    **search_params
+                })
+            elif self.STORAGE_MODE == "half":
+                # Candidatos desde el índice halfvec, re-ordenados con float32
+                query = text("""
+                    SELECT * FROM search_gastos_compact(
+                        :user_id,
+                        :embedding,
+                        :limit,
+                        :threshold,
+                        :candidates,
+                        :ef_search,
+                        :probes
+                    )
+                """)
+                
+                result = self.db.execute(query, {
+                    "user_id": user_id,
+                    "embedding": embedding,
+                    "limit": limit,
+                    "threshold": similarity_threshold,
+                    "candidates": limit * self.RESCORE_FACTOR,
+                    **search_params
                 })
             else:
                 # Usar función básica sin filtros
                 query = text("""
                     SELECT * FROM search_gastos_by_vector(
-                        :embedding::vector,
+                        :user_id,
+                        :embedding,
                         :limit,
-                        :threshold
+                        :threshold,
+                        :ef_search,
+                        :probes
                     )
                 """)
                 
                 result = self.db.execute(query, {
-                    "embedding": embedding_str,
+                    "user_id": user_id,
+                    "embedding": embedding,
                     "limit": limit,
-                    "threshold": similarity_threshold
+                    "threshold": similarity_threshold,
+                    **search_params
                 })
             
             # Convertir resultados a diccionarios
             gastos = []
             for row in result:
-                gastos.append({
+                gasto = {
                     "gasto_id": row[0],
                     "descripcion": row[1],
                     "monto": float(row[2]),
@@ -132,7 +284,8 @@ class VectorSearchService:
                     "moneda": row[5],
                     "similarity": float(row[6]),
                     "texto_embedding": row[7] if len(row) > 7 else None
-                })
+                }
+                gastos.append(gasto)
             
             logger.info(
                 f"Búsqueda de gastos: {len(gastos)} resultados "
@@ -145,8 +298,10 @@ class VectorSearchService:
             logger.error(f"Error en búsqueda vectorial de gastos: {str(e)}")
             return []
     
+    @cached_search(("ingreso",))
     def search_ingresos(
         self,
+        user_id: int,
         query_embedding: List[float],
         limit: int = DEFAULT_LIMIT,
         similarity_threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
@@ -154,12 +309,17 @@ class VectorSearchService:
         fecha_desde: Optional[date] = None,
         fecha_hasta: Optional[date] = None,
         monto_min: Optional[Decimal] = None,
-        monto_max: Optional[Decimal] = None
+        monto_max: Optional[Decimal] = None,
+        preset: Optional[str] = None,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        filter_strategy: Optional[str] = None
     ) -> List[Dict[str, Any]]:
         """
-        Busca ingresos similares usando búsqueda vectorial.
+        Busca ingresos similares del usuario usando búsqueda vectorial.
         
         Args:
+            user_id: ID del usuario dueño de los ingresos (obligatorio)
             query_embedding: Vector de consulta (1536 dimensiones)
             limit: Número máximo de resultados
             similarity_threshold: Umbral mínimo de similitud (0-1)
@@ -168,62 +328,119 @@ class VectorSearchService:
             fecha_hasta: Filtro opcional de fecha final
             monto_min: Filtro opcional de monto mínimo
             monto_max: Filtro opcional de monto máximo
+            preset: Preset de velocidad/recall: "fast", "balanced" o "accurate"
+                    (default: VECTOR_SEARCH_PRESET)
+            ef_search: Pisa hnsw.ef_search del preset
+            probes: Pisa ivfflat.probes del preset
+            filter_strategy: Estrategia con filtros (ver `plan_search`)
         
         Returns:
             Lista de ingresos con su similitud
+        
+        Raises:
+            ValueError: Si el preset o la estrategia de filtrado no existen
         """
         limit = min(limit, self.MAX_LIMIT)
+        if self.BACKEND == "local":
+            return self._search_local(
+                "ingreso", user_id, query_embedding, limit, similarity_threshold,
+                categoria=categoria,
+                fecha_desde=fecha_desde,
+                fecha_hasta=fecha_hasta,
+                monto_min=monto_min,
+                monto_max=monto_max
+            )
+        search_params = self._search_params(preset, ef_search, probes, limit)
+        filter_strategy = self._filter_strategy(filter_strategy)
         
         try:
-            # Convertir el embedding a formato PostgreSQL array
-            embedding_str = self._format_vector(query_embedding)
+            # VectorParam lo envía como '[...]'::vector (float32)
+            embedding = VectorParam(query_embedding)
             
             # Construir y ejecutar la consulta
             if any([categoria, fecha_desde, fecha_hasta, monto_min, monto_max]):
-                # Usar función con filtros
+                # Pre-filtro exacto o iterative scan según la selectividad estimada
                 query = text("""
                     SELECT * FROM search_ingresos_with_filters(
-                        :embedding::vector,
+                        :user_id,
+                        :embedding,
                         :limit,
                         :threshold,
                         :categoria,
                         :fecha_desde,
                         :fecha_hasta,
                         :monto_min,
-                        :monto_max
+                        :monto_max,
+                        :ef_search,
+                        :probes,
+                        :strategy,
+                        :exact_max_rows,
+                        :min_selectivity
                     )
                 """)
                 
                 result = self.db.execute(query, {
-                    "embedding": embedding_str,
+                    "user_id": user_id,
+                    "embedding": embedding,
                     "limit": limit,
                     "threshold": similarity_threshold,
                     "categoria": categoria,
                     "fecha_desde": fecha_desde,
                     "fecha_hasta": fecha_hasta,
                     "monto_min": float(monto_min) if monto_min else None,
-                    "monto_max": float(monto_max) if monto_max else None
+                    "monto_max": float(monto_max) if monto_max else None,
+                    "strategy": filter_strategy,
+                    "exact_max_rows": self.FILTER_EXACT_MAX_ROWS,
+                    "min_selectivity": self.FILTER_MIN_SELECTIVITY,
+                    **search_params
+                })
+            elif self.STORAGE_MODE == "half":
+                # Candidatos desde el índice halfvec, re-ordenados con float32
+                query = text("""
+                    SELECT * FROM search_ingresos_compact(
+                        :user_id,
+                        :embedding,
+                        :limit,
+                        :threshold,
+                        :candidates,
+                        :ef_search,
+                        :probes
+                    )
+                """)
+                
+                result = self.db.execute(query, {
+                    "user_id": user_id,
+                    "embedding": embedding,
+                    "limit": limit,
+                    "threshold": similarity_threshold,
+                    "candidates": limit * self.RESCORE_FACTOR,
+                    **search_params
                 })
             else:
                 # Usar función básica sin filtros
                 query = text("""
                     SELECT * FROM search_ingresos_by_vector(
-                        :embedding::vector,
+                        :user_id,
+                        :embedding,
                         :limit,
-                        :threshold
+                        :threshold,
+                        :ef_search,
+                        :probes
                     )
                 """)
                 
                 result = self.db.execute(query, {
-                    "embedding": embedding_str,
+                    "user_id": user_id,
+                    "embedding": embedding,
                     "limit": limit,
-                    "threshold": similarity_threshold
+                    "threshold": similarity_threshold,
+                    **search_params
                 })
             
             # Convertir resultados a diccionarios
             ingresos = []
             for row in result:
-                ingresos.append({
+                ingreso = {
                     "ingreso_id": row[0],
                     "descripcion": row[1],
                     "monto": float(row[2]),
@@ -232,7 +449,8 @@ class VectorSearchService:
                     "moneda": row[5],
                     "similarity": float(row[6]),
                     "texto_embedding": row[7] if len(row) > 7 else None
-                })
+                }
+                ingresos.append(ingreso)
             
             logger.info(
                 f"Búsqueda de ingresos: {len(ingresos)} resultados "
@@ -244,43 +462,147 @@ class VectorSearchService:
         except Exception as e:
             logger.error(f"Error en búsqueda vectorial de ingresos: {str(e)}")
             return []
-    
+
+    def plan_search(
+        self,
+        entity_type: str,
+        user_id: int,
+        categoria: Optional[str] = None,
+        fecha_desde: Optional[date] = None,
+        fecha_hasta: Optional[date] = None,
+        monto_min: Optional[Decimal] = None,
+        monto_max: Optional[Decimal] = None,
+        filter_strategy: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Estrategia que usaría una búsqueda con filtros, sin ejecutarla.
+
+        Usa plan_vector_search (database/filtered_vector_search.sql): "exact"
+        recorre los candidatos filtrados del usuario con distancia exacta e
+        "iterative" recorre el índice ANN evaluando los filtros hasta
+        completar el límite (pgvector >= 0.8; sin él se usa "exact"). Pasar
+        la estrategia resuelta a `search_gastos` / `search_ingresos` evita
+        estimar dos veces.
+
+        Args:
+            entity_type: "gasto" o "ingreso"
+            user_id: ID del usuario dueño de los registros (obligatorio)
+            categoria, fecha_desde, fecha_hasta, monto_min, monto_max: Filtros
+            filter_strategy: "auto", "exact" o "iterative"
+                             (default: VECTOR_FILTER_STRATEGY)
+
+        Returns:
+            Diccionario con search_strategy, estimated_rows (filas candidatas
+            según el planner) y table_rows; vacío si falla la estimación
+
+        Raises:
+            ValueError: Si el tipo de entidad o la estrategia no existen
+        """
+        if entity_type not in ("gasto", "ingreso"):
+            raise ValueError(f"Tipo de entidad no válido: {entity_type}")
+        filter_strategy = self._filter_strategy(filter_strategy)
+        if self.BACKEND == "local":
+            # La matriz en memoria siempre es un recorrido exacto
+            return {"search_strategy": "exact", "estimated_rows": None, "table_rows": None}
+
+        try:
+            query = text("""
+                SELECT * FROM plan_vector_search(
+                    :entity_type,
+                    :user_id,
+                    :categoria,
+                    :fecha_desde,
+                    :fecha_hasta,
+                    :monto_min,
+                    :monto_max,
+                    :strategy,
+                    :exact_max_rows,
+                    :min_selectivity
+                )
+            """)
+
+            row = self.db.execute(query, {
+                "entity_type": entity_type,
+                "user_id": user_id,
+                "categoria": categoria,
+                "fecha_desde": fecha_desde,
+                "fecha_hasta": fecha_hasta,
+                "monto_min": float(monto_min) if monto_min else None,
+                "monto_max": float(monto_max) if monto_max else None,
+                "strategy": filter_strategy,
+                "exact_max_rows": self.FILTER_EXACT_MAX_ROWS,
+                "min_selectivity": self.FILTER_MIN_SELECTIVITY
+            }).fetchone()
+
+            return {
+                "search_strategy": row[0],
+                "estimated_rows": row[1],
+                "table_rows": row[2]
+            }
+
+        except Exception as e:
+            logger.error(f"Error estimando la búsqueda de {entity_type}s: {str(e)}")
+            return {}
+
+    @cached_search(("gasto", "ingreso"))
     def search_combined(
         self,
+        user_id: int,
         query_embedding: List[float],
         limit: int = DEFAULT_LIMIT,
-        similarity_threshold: float = DEFAULT_SIMILARITY_THRESHOLD
+        similarity_threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+        preset: Optional[str] = None,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None
     ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
         """
-        Busca tanto en gastos como en ingresos y retorna ambos resultados.
+        Busca tanto en gastos como en ingresos del usuario y retorna ambos resultados.
         
         Args:
+            user_id: ID del usuario dueño de los registros (obligatorio)
             query_embedding: Vector de consulta (1536 dimensiones)
             limit: Número máximo de resultados por tipo
             similarity_threshold: Umbral mínimo de similitud (0-1)
+            preset: Preset de velocidad/recall (ver `search_gastos`)
+            ef_search: Pisa hnsw.ef_search del preset
+            probes: Pisa ivfflat.probes del preset
         
         Returns:
             Tupla con (gastos, ingresos)
         """
         limit = min(limit, self.MAX_LIMIT)
+        if self.BACKEND == "local":
+            gastos = self._search_local("gasto", user_id, query_embedding, limit, similarity_threshold)
+            ingresos = self._search_local("ingreso", user_id, query_embedding, limit, similarity_threshold)
+            for data in gastos:
+                data["id"] = data.pop("gasto_id")
+            for data in ingresos:
+                data["id"] = data.pop("ingreso_id")
+            return gastos, ingresos
+        search_params = resolve_search_params(preset, ef_search, probes, limit)
         
         try:
-            # Convertir el embedding a formato PostgreSQL array
-            embedding_str = self._format_vector(query_embedding)
+            # VectorParam lo envía como '[...]'::vector (float32)
+            embedding = VectorParam(query_embedding)
             
             # Ejecutar búsqueda combinada
             query = text("""
                 SELECT * FROM search_combined_by_vector(
-                    :embedding::vector,
+                    :user_id,
+                    :embedding,
                     :limit,
-                    :threshold
+                    :threshold,
+                    :ef_search,
+                    :probes
                 )
             """)
             
             result = self.db.execute(query, {
-                "embedding": embedding_str,
+                "user_id": user_id,
+                "embedding": embedding,
                 "limit": limit,
-                "threshold": similarity_threshold
+                "threshold": similarity_threshold,
+                **search_params
             })
             
             # Separar resultados por tipo
@@ -316,6 +638,402 @@ class VectorSearchService:
         except Exception as e:
             logger.error(f"Error en búsqueda vectorial combinada: {str(e)}")
             return [], []
+
+    @cached_search(("gasto", "ingreso"))
+    def search_many(
+        self,
+        user_id: int,
+        queries: List[Dict[str, Any]],
+        preset: Optional[str] = None,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None
+    ) -> List[Dict[str, List[Dict[str, Any]]]]:
+        """
+        Ejecuta varias búsquedas del usuario en un solo round trip.
+
+        Usa search_many_by_vector (database/vector_search_many.sql): un
+        LATERAL por consulta sobre search_*_with_filters, con la misma
+        estrategia por usuario que las búsquedas individuales.
+
+        Args:
+            user_id: ID del usuario dueño de los registros (obligatorio)
+            queries: Una entrada por consulta con "embedding" (obligatorio) y
+                     opcionalmente "entity_type" ("gasto", "ingreso" o "all",
+                     default: "all"), "limit" (por entidad),
+                     "similarity_threshold", "categoria", "fecha_desde",
+                     "fecha_hasta", "monto_min" y "monto_max"
+            preset: "fast", "balanced" o "accurate" (default: VECTOR_SEARCH_PRESET)
+            ef_search: Pisa el ef_search del preset (HNSW)
+            probes: Pisa el probes del preset (IVFFlat)
+
+        Returns:
+            Una entrada por consulta, en el mismo orden, con sus "gastos" e
+            "ingresos" (mismas claves que `search_gastos` / `search_ingresos`)
+
+        Raises:
+            ValueError: Si un tipo de entidad o el preset no existen
+        """
+        for query in queries:
+            if query.get("entity_type", "all") not in MANY_ENTITY_TYPES:
+                raise ValueError(f"Tipo de entidad no válido: {query.get('entity_type')}")
+
+        grouped = [{"gastos": [], "ingresos": []} for _ in queries]
+        if not queries:
+            return grouped
+
+        if self.BACKEND == "local":
+            for query, results in zip(queries, grouped):
+                self._search_many_local(user_id, query, results)
+            return grouped
+
+        def column(key, default=None, convert=None):
+            values = [query.get(key, default) for query in queries]
+            return [convert(v) if convert and v is not None else v for v in values]
+
+        limits = [min(q.get("limit", self.DEFAULT_LIMIT), self.MAX_LIMIT) for q in queries]
+        search_params = resolve_search_params(preset, ef_search, probes, max(limits))
+
+        try:
+            # Arrays paralelos: los CAST fijan el tipo aunque solo haya NULLs
+            query = text("""
+                SELECT * FROM search_many_by_vector(
+                    :user_id,
+                    :embeddings,
+                    CAST(:entity_types AS VARCHAR[]),
+                    CAST(:limits AS INTEGER[]),
+                    CAST(:thresholds AS FLOAT[]),
+                    CAST(:categorias AS VARCHAR[]),
+                    CAST(:fechas_desde AS DATE[]),
+                    CAST(:fechas_hasta AS DATE[]),
+                    CAST(:montos_min AS DECIMAL[]),
+                    CAST(:montos_max AS DECIMAL[]),
+                    :ef_search,
+                    :probes
+                )
+            """)
+
+            result = self.db.execute(query, {
+                "user_id": user_id,
+                "embeddings": [VectorParam(q["embedding"]) for q in queries],
+                "entity_types": column("entity_type", "all"),
+                "limits": limits,
+                "thresholds": column("similarity_threshold", self.DEFAULT_SIMILARITY_THRESHOLD),
+                "categorias": column("categoria"),
+                "fechas_desde": column("fecha_desde"),
+                "fechas_hasta": column("fecha_hasta"),
+                "montos_min": column("monto_min", convert=float),
+                "montos_max": column("monto_max", convert=float),
+                **search_params
+            })
+
+            for row in result:
+                transaction_type = row[1]
+                grouped[row[0] - 1][f"{transaction_type}s"].append({
+                    f"{transaction_type}_id": row[2],
+                    "descripcion": row[3],
+                    "monto": float(row[4]),
+                    "fecha": row[5],
+                    "categoria": row[6],
+                    "moneda": row[7],
+                    "similarity": float(row[8]),
+                    "texto_embedding": row[9]
+                })
+
+            logger.info(
+                f"Búsqueda múltiple: {len(queries)} consultas, "
+                f"{sum(len(g['gastos']) + len(g['ingresos']) for g in grouped)} resultados"
+            )
+
+            return grouped
+
+        except Exception as e:
+            logger.error(f"Error en búsqueda vectorial múltiple: {str(e)}")
+            return [{"gastos": [], "ingresos": []} for _ in queries]
+
+    @cached_search(("gasto", "ingreso"))
+    def search_hybrid(
+        self,
+        user_id: int,
+        query_text: str,
+        query_embedding: List[float],
+        entity_type: str = "gasto",
+        limit: int = DEFAULT_LIMIT,
+        similarity_threshold: float = 0.0,
+        candidates: Optional[int] = None,
+        rrf_k: Optional[int] = None,
+        preset: Optional[str] = None,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Búsqueda híbrida: top-k léxico y top-k vectorial fusionados por RRF.
+
+        Usa search_{gastos,ingresos}_hybrid (database/hybrid_search.sql): texto
+        completo en español sin acentos y trigramas sobre descripción,
+        comercio/fuente y categoría. Encuentra coincidencias exactas de
+        comercio o palabra clave ("Rappi", "YPF") que la similitud coseno
+        deja debajo de vecinos vagos. Siempre se resuelve en PostgreSQL.
+
+        Args:
+            user_id: ID del usuario dueño de los registros (obligatorio)
+            query_text: Texto de la consulta (parte léxica)
+            query_embedding: Embedding de la consulta (parte vectorial)
+            entity_type: "gasto" o "ingreso"
+            limit: Número máximo de resultados
+            similarity_threshold: Similitud mínima de los candidatos vectoriales
+                                  (los léxicos entran igual)
+            candidates: Candidatos de cada lista antes de fusionar
+                        (default: limit x HYBRID_CANDIDATE_FACTOR)
+            rrf_k: Constante de RRF (default: HYBRID_RRF_K)
+            preset: Preset de velocidad/recall de la parte vectorial
+            ef_search: Pisa hnsw.ef_search del preset
+            probes: Pisa ivfflat.probes del preset
+
+        Returns:
+            Resultados ordenados por "score" (RRF), con "similarity" coseno y
+            "vector_rank" / "lexical_rank" (None si no apareció en esa lista)
+        """
+        if entity_type not in ("gasto", "ingreso"):
+            raise ValueError(f"Tipo de entidad no válido: {entity_type}")
+
+        limit = min(limit, self.MAX_LIMIT)
+        candidates = candidates or limit * self.HYBRID_CANDIDATE_FACTOR
+        # La parte vectorial pide `candidates` filas a search_*_by_vector
+        search_params = resolve_search_params(preset, ef_search, probes, candidates)
+
+        try:
+            query = text(f"""
+                SELECT * FROM search_{entity_type}s_hybrid(
+                    :user_id,
+                    :embedding,
+                    :query_text,
+                    :limit,
+                    :candidates,
+                    :rrf_k,
+                    :threshold,
+                    :ef_search,
+                    :probes
+                )
+            """)
+
+            result = self.db.execute(query, {
+                "user_id": user_id,
+                "embedding": VectorParam(query_embedding),
+                "query_text": query_text,
+                "limit": limit,
+                "candidates": candidates,
+                "rrf_k": rrf_k or self.HYBRID_RRF_K,
+                "threshold": similarity_threshold,
+                **search_params
+            })
+
+            results = []
+            for row in result:
+                results.append({
+                    f"{entity_type}_id": row[0],
+                    "descripcion": row[1],
+                    "monto": float(row[2]),
+                    "fecha": row[3],
+                    "categoria": row[4],
+                    "moneda": row[5],
+                    "similarity": float(row[6]) if row[6] is not None else None,
+                    "texto_embedding": row[7],
+                    "score": float(row[8]),
+                    "vector_rank": row[9],
+                    "lexical_rank": row[10]
+                })
+
+            logger.info(
+                f"Búsqueda híbrida de {entity_type}s: {len(results)} resultados "
+                f"({sum(1 for r in results if r['lexical_rank'] is not None)} con coincidencia léxica)"
+            )
+
+            return results
+
+        except Exception as e:
+            logger.error(f"Error en búsqueda híbrida de {entity_type}s: {str(e)}")
+            return []
+
+    def _search_many_local(
+        self,
+        user_id: int,
+        query: Dict[str, Any],
+        results: Dict[str, List[Dict[str, Any]]]
+    ) -> None:
+        """Resuelve una consulta de `search_many` con el backend local."""
+        entity_type = query.get("entity_type", "all")
+        filters = {
+            key: query.get(key)
+            for key in ("categoria", "fecha_desde", "fecha_hasta", "monto_min", "monto_max")
+        }
+        for entity in ("gasto", "ingreso"):
+            if entity_type in (entity, "all"):
+                results[f"{entity}s"] = self._search_local(
+                    entity, user_id, query["embedding"],
+                    min(query.get("limit", self.DEFAULT_LIMIT), self.MAX_LIMIT),
+                    query.get("similarity_threshold", self.DEFAULT_SIMILARITY_THRESHOLD),
+                    **filters
+                )
+
+    async def buscar_gastos_similares(
+        self,
+        user_id: int,
+        query_text: str,
+        limite: int = DEFAULT_LIMIT,
+        similarity_threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+        preset: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Busca los gastos del usuario más similares a un texto.
+        
+        Genera el embedding de la consulta con el cliente async y ejecuta la
+        búsqueda en un hilo, para no bloquear el event loop del chat.
+        
+        Args:
+            user_id: ID del usuario dueño de los gastos
+            query_text: Texto de la consulta
+            limite: Número máximo de resultados
+            similarity_threshold: Umbral mínimo de similitud (0-1)
+            preset: Preset de velocidad/recall del índice (default: VECTOR_SEARCH_PRESET)
+        
+        Returns:
+            Lista de gastos con su similitud
+        """
+        return await self._buscar_similares(
+            "gastos", user_id, query_text, limite, similarity_threshold, preset
+        )
+    
+    async def buscar_ingresos_similares(
+        self,
+        user_id: int,
+        query_text: str,
+        limite: int = DEFAULT_LIMIT,
+        similarity_threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+        preset: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Busca los ingresos del usuario más similares a un texto.
+        
+        Ver `buscar_gastos_similares`.
+        """
+        return await self._buscar_similares(
+            "ingresos", user_id, query_text, limite, similarity_threshold, preset
+        )
+    
+    async def buscar_gastos_e_ingresos_similares(
+        self,
+        user_id: int,
+        query_text: str,
+        limite_gastos: int = DEFAULT_LIMIT,
+        limite_ingresos: int = DEFAULT_LIMIT,
+        similarity_threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+        hybrid: Optional[bool] = None
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        Busca gastos e ingresos similares a un texto con un solo embedding
+        y un solo round trip (ver `search_many`).
+
+        Con `hybrid` (default: VECTOR_HYBRID_SEARCH) usa `search_hybrid`, que
+        prioriza las coincidencias exactas de comercio o palabra clave.
+
+        Returns:
+            Tupla con (gastos, ingresos)
+        """
+        from app.services.embeddings_service import get_embeddings_service
+
+        embeddings_service = get_embeddings_service()
+        if not await asyncio.to_thread(self.check_model_version, embeddings_service.model_version):
+            return [], []
+
+        query_embedding = await embeddings_service.agenerate_query_embedding(query_text)
+        if query_embedding is None:
+            logger.warning("No se pudo generar el embedding de la consulta")
+            return [], []
+
+        if hybrid is None:
+            hybrid = self.HYBRID_SEARCH
+        if hybrid:
+            return await asyncio.to_thread(
+                self._search_hybrid_both, user_id, query_text, query_embedding,
+                limite_gastos, limite_ingresos, similarity_threshold
+            )
+
+        queries = [
+            {
+                "embedding": query_embedding,
+                "entity_type": entity_type,
+                "limit": limite,
+                "similarity_threshold": similarity_threshold
+            }
+            for entity_type, limite in (("gasto", limite_gastos), ("ingreso", limite_ingresos))
+        ]
+        gastos, ingresos = await asyncio.to_thread(self.search_many, user_id, queries)
+        return gastos["gastos"], ingresos["ingresos"]
+
+    def _search_hybrid_both(
+        self,
+        user_id: int,
+        query_text: str,
+        query_embedding: List[float],
+        limite_gastos: int,
+        limite_ingresos: int,
+        similarity_threshold: float
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Búsqueda híbrida en gastos e ingresos (mismo hilo, misma sesión)."""
+        gastos = self.search_hybrid(
+            user_id, query_text, query_embedding, "gasto", limite_gastos, similarity_threshold
+        )
+        ingresos = self.search_hybrid(
+            user_id, query_text, query_embedding, "ingreso", limite_ingresos, similarity_threshold
+        )
+        return gastos, ingresos
+
+    async def _buscar_similares(
+        self,
+        entity_type: str,
+        user_id: int,
+        query_text: str,
+        limite: int,
+        similarity_threshold: float,
+        preset: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Genera el embedding de la consulta y busca en la entidad indicada."""
+        from app.services.embeddings_service import get_embeddings_service
+        
+        embeddings_service = get_embeddings_service()
+        if not await asyncio.to_thread(self.check_model_version, embeddings_service.model_version):
+            return []
+        
+        query_embedding = await embeddings_service.agenerate_query_embedding(query_text)
+        if query_embedding is None:
+            logger.warning("No se pudo generar el embedding de la consulta")
+            return []
+        
+        return await asyncio.to_thread(
+            self._search_for_user,
+            entity_type,
+            user_id,
+            query_embedding,
+            limite,
+            similarity_threshold,
+            preset
+        )
+    
+    def _search_for_user(
+        self,
+        entity_type: str,
+        user_id: int,
+        query_embedding: List[float],
+        limit: int,
+        similarity_threshold: float,
+        preset: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Busca en la entidad indicada entre los registros del usuario."""
+        search = self.search_gastos if entity_type == "gastos" else self.search_ingresos
+        return search(
+            user_id, query_embedding, limit=limit,
+            similarity_threshold=similarity_threshold, preset=preset
+        )
     
     def get_embedding_stats(self) -> Dict[str, Any]:
         """
@@ -347,77 +1065,121 @@ class VectorSearchService:
             logger.error(f"Error obteniendo estadísticas de embeddings: {str(e)}")
             return {}
     
-    def _format_vector(self, embedding: List[float]) -> str:
+    def _search_params(
+        self,
+        preset: Optional[str],
+        ef_search: Optional[int],
+        probes: Optional[int],
+        limit: int
+    ) -> Dict[str, int]:
         """
-        Convierte una lista de floats a formato de array de PostgreSQL.
+        Resuelve ef_search/probes para una búsqueda en una entidad.
         
-        Args:
-            embedding: Lista de floats
-        
-        Returns:
-            String en formato '[1.0, 2.0, 3.0, ...]'
+        En modo half el índice debe entregar los candidatos a re-ordenar,
+        no solo `limit` filas.
         """
-        return "[" + ",".join(str(x) for x in embedding) + "]"
-    
+        candidates = limit * self.RESCORE_FACTOR if self.STORAGE_MODE == "half" else limit
+        return resolve_search_params(preset, ef_search, probes, candidates)
+
+    def _filter_strategy(self, filter_strategy: Optional[str]) -> str:
+        """Valida la estrategia de la búsqueda con filtros (None = FILTER_STRATEGY)."""
+        filter_strategy = (filter_strategy or self.FILTER_STRATEGY).lower()
+        if filter_strategy not in FILTER_STRATEGIES:
+            raise ValueError(f"Estrategia de filtrado no válida: {filter_strategy}")
+        return filter_strategy
+
+    def _search_local(
+        self,
+        entity_type: str,
+        user_id: int,
+        query_embedding: List[float],
+        limit: int,
+        similarity_threshold: float,
+        **filters
+    ) -> List[Dict[str, Any]]:
+        """
+        Busca en la matriz en memoria del usuario (backend "local").
+
+        Búsqueda exacta: equivale a la de pgvector con recall completo.
+        """
+        from app.services.local_vector_index import get_local_vector_index
+
+        try:
+            results = get_local_vector_index().search(
+                self.db, entity_type, user_id, query_embedding, limit,
+                similarity_threshold, **filters
+            )
+            logger.info(
+                f"Búsqueda local de {entity_type}s: {len(results)} resultados "
+                f"(umbral: {similarity_threshold})"
+            )
+            return results
+        except Exception as e:
+            logger.error(f"Error en búsqueda vectorial local de {entity_type}s: {str(e)}")
+            return []
+
     def adjust_threshold_dynamically(
         self,
+        user_id: int,
         query_embedding: List[float],
         entity_type: str,
         min_results: int = 5,
         initial_threshold: float = 0.7,
         threshold_step: float = 0.05,
-        min_threshold: float = 0.5
+        min_threshold: float = 0.5,
+        limit: int = DEFAULT_LIMIT
     ) -> Tuple[List[Dict[str, Any]], float]:
         """
         Ajusta dinámicamente el umbral de similitud para obtener un mínimo de resultados.
         
-        Si la búsqueda inicial no retorna suficientes resultados, reduce el umbral
-        gradualmente hasta alcanzar el mínimo deseado o el umbral mínimo.
+        Hace una sola búsqueda de los max(limit, min_results) más cercanos,
+        sin umbral, y aplica la cascada de umbrales (initial_threshold,
+        initial_threshold - threshold_step, ... hasta min_threshold) sobre
+        las similitudes devueltas: el primer umbral que deja min_results
+        resultados es el efectivo. El resultado es el mismo que repetir la
+        búsqueda bajando el umbral, con un solo recorrido del índice.
         
         Args:
+            user_id: ID del usuario dueño de los registros
             query_embedding: Vector de consulta
             entity_type: "gastos" o "ingresos"
             min_results: Número mínimo de resultados deseados
             initial_threshold: Umbral inicial
             threshold_step: Paso de reducción del umbral
             min_threshold: Umbral mínimo permitido
+            limit: Número máximo de resultados
         
         Returns:
             Tupla con (resultados, umbral_usado)
         """
-        current_threshold = initial_threshold
-        results = []
-        
-        while current_threshold >= min_threshold:
-            if entity_type == "gastos":
-                results = self.search_gastos(
-                    query_embedding,
-                    limit=self.DEFAULT_LIMIT,
-                    similarity_threshold=current_threshold
-                )
-            elif entity_type == "ingresos":
-                results = self.search_ingresos(
-                    query_embedding,
-                    limit=self.DEFAULT_LIMIT,
-                    similarity_threshold=current_threshold
-                )
-            else:
-                logger.error(f"Tipo de entidad no válido: {entity_type}")
-                return [], current_threshold
-            
+        if entity_type == "gastos":
+            search = self.search_gastos
+        elif entity_type == "ingresos":
+            search = self.search_ingresos
+        else:
+            logger.error(f"Tipo de entidad no válido: {entity_type}")
+            return [], initial_threshold
+        
+        # Ordenados por similitud descendente; sin predicado de umbral
+        candidates = search(
+            user_id,
+            query_embedding,
+            limit=max(limit, min_results),
+            similarity_threshold=NO_THRESHOLD
+        )
+        
+        thresholds = threshold_cascade(initial_threshold, threshold_step, min_threshold)
+        for threshold in thresholds:
+            results = [r for r in candidates if r["similarity"] >= threshold]
             if len(results) >= min_results:
-                logger.info(
-                    f"Umbral ajustado a {current_threshold} "
-                    f"({len(results)} resultados)"
-                )
-                return results, current_threshold
-            
-            # Reducir umbral
-            current_threshold -= threshold_step
+                logger.info(f"Umbral ajustado a {threshold} ({len(results)} resultados)")
+                return results[:limit], threshold
         
+        threshold = thresholds[-1]
+        results = [r for r in candidates if r["similarity"] >= threshold][:limit]
         logger.warning(
             f"No se alcanzó el mínimo de {min_results} resultados. "
-            f"Retornando {len(results)} con umbral {current_threshold + threshold_step}"
+            f"Retornando {len(results)} con umbral {threshold}"
         )
         
-        return results, current_threshold + threshold_step
+        return results, threshold
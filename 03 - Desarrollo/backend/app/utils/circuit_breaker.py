@@ -0,0 +1,174 @@
+# ============================================================================
+# CIRCUIT BREAKER PARA PROVEEDORES DE IA
+# ============================================================================
+"""
+Circuit breaker por tasa de errores en una ventana de tiempo.
+
+Estados:
+- closed: las llamadas pasan y se registra su resultado
+- open: las llamadas se rechazan de inmediato durante `open_seconds`
+- half_open: pasado ese tiempo se deja pasar una llamada de prueba; si
+  funciona el circuito se cierra, si falla vuelve a abrirse. Si la prueba
+  no informa su resultado (ej: se canceló) el lugar vuelve a quedar libre
+  tras otros `open_seconds`, o antes con `release`
+
+El circuito se abre cuando, con al menos `min_calls` llamadas en los
+últimos `window_seconds`, la proporción de fallos alcanza
+`failure_rate_threshold`.
+"""
+
+import time
+import threading
+from collections import deque
+from typing import Dict, Any, Callable
+
+
+class CircuitOpenError(Exception):
+    """El circuito está abierto y la llamada se rechazó sin intentarla."""
+
+
+class CircuitBreaker:
+    """Circuit breaker seguro entre hilos."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        failure_rate_threshold: float = 0.5,
+        window_seconds: float = 60.0,
+        min_calls: int = 5,
+        open_seconds: float = 30.0,
+        half_open_max_calls: int = 1,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+        self._clock = clock
+
+        self._state = self.CLOSED
+        self._outcomes = deque()  # (timestamp, éxito)
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self._half_open_since = 0.0
+        self._lock = threading.Lock()
+
+        self.times_opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        now = self._clock()
+        if self._state == self.OPEN and now - self._opened_at >= self.open_seconds:
+            self._state = self.HALF_OPEN
+            self._half_open_calls = 0
+            self._half_open_since = now
+        elif (
+            self._state == self.HALF_OPEN
+            and self._half_open_calls >= self.half_open_max_calls
+            and now - self._half_open_since >= self.open_seconds
+        ):
+            # Pruebas que nunca informaron su resultado: liberar sus lugares
+            self._half_open_calls = 0
+            self._half_open_since = now
+        return self._state
+
+    def allow_request(self) -> bool:
+        """
+        Indica si se puede intentar una llamada.
+
+        Cada llamada permitida debe informar su resultado con
+        `record_success` o `record_failure`.
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and self._half_open_calls < self.half_open_max_calls:
+                self._half_open_calls += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def check(self) -> None:
+        """
+        Igual que `allow_request`, pero lanza CircuitOpenError si está abierto.
+
+        Raises:
+            CircuitOpenError: Si la llamada se rechaza
+        """
+        if not self.allow_request():
+            raise CircuitOpenError(f"Circuito '{self.name}' abierto")
+
+    def release(self) -> None:
+        """
+        Libera una llamada permitida que terminó sin resultado (ej: cancelada).
+
+        En half_open devuelve el lugar de la prueba; en los demás estados no
+        hace nada.
+        """
+        with self._lock:
+            if self._current_state() == self.HALF_OPEN and self._half_open_calls > 0:
+                self._half_open_calls -= 1
+
+    def record_success(self) -> None:
+        """Registra una llamada exitosa."""
+        with self._lock:
+            if self._current_state() == self.HALF_OPEN:
+                self._state = self.CLOSED
+                self._outcomes.clear()
+                return
+            self._record(True)
+
+    def record_failure(self) -> None:
+        """Registra una llamada fallida y abre el circuito si corresponde."""
+        with self._lock:
+            state = self._current_state()
+            if state == self.HALF_OPEN:
+                self._open()
+                return
+            if state == self.OPEN:
+                return
+
+            self._record(False)
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            if (
+                len(self._outcomes) >= self.min_calls
+                and failures / len(self._outcomes) >= self.failure_rate_threshold
+            ):
+                self._open()
+
+    def _record(self, ok: bool) -> None:
+        now = self._clock()
+        self._outcomes.append((now, ok))
+        while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+            self._outcomes.popleft()
+
+    def _open(self) -> None:
+        self._state = self.OPEN
+        self._opened_at = self._clock()
+        self._outcomes.clear()
+        self.times_opened += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Retorna el estado y los contadores del circuito."""
+        with self._lock:
+            state = self._current_state()
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            return {
+                "state": state,
+                "window_calls": len(self._outcomes),
+                "window_failures": failures,
+                "times_opened": self.times_opened,
+                "rejected": self.rejected
+            }
@@ -0,0 +1,145 @@
+# ============================================================================
+# LIMITADOR DE TASA (TOKEN BUCKET) PARA PROVEEDORES DE IA
+# ============================================================================
+"""
+Limitador de requests y tokens por minuto basado en token buckets.
+
+Cada bucket permite saldo negativo: una llamada reserva su costo de inmediato
+y recibe cuánto tiempo debe esperar antes de ejecutarse. Así el limitador no
+depende de un event loop en particular y sirve tanto para código async
+(`acquire`) como sync (`acquire_sync`).
+
+`SharedRateLimiter` guarda el saldo en memoria compartida para que varios
+procesos (ej: el backfill en paralelo) respeten un único límite global.
+"""
+
+import time
+import asyncio
+import threading
+import multiprocessing
+from typing import Optional, Any
+
+
+class TokenBucket:
+    """Bucket que se recarga a `rate_per_minute` unidades por minuto."""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        """
+        Reserva `amount` unidades y retorna los segundos a esperar.
+
+        Un pedido mayor que la capacidad se recorta a la capacidad, para que
+        nunca quede bloqueado indefinidamente.
+        """
+        amount = min(amount, self.capacity)
+
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self.updated_at
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate_per_second)
+            self.updated_at = now
+
+            self.tokens -= amount
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate_per_second
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    Token bucket cuyo saldo vive en memoria compartida entre procesos.
+
+    Se puede pasar como argumento a procesos hijos (fork o spawn);
+    `time.monotonic` usa el mismo reloj en todos los procesos del equipo.
+    """
+
+    def __init__(
+        self,
+        rate_per_minute: float,
+        capacity: Optional[float] = None,
+        context: Optional[Any] = None
+    ):
+        ctx = context or multiprocessing.get_context()
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        # [saldo, última recarga]
+        self._state = ctx.RawArray("d", [self.capacity, time.monotonic()])
+        self._lock = ctx.Lock()
+
+    @property
+    def tokens(self) -> float:
+        return self._state[0]
+
+    @tokens.setter
+    def tokens(self, value: float) -> None:
+        self._state[0] = value
+
+    @property
+    def updated_at(self) -> float:
+        return self._state[1]
+
+    @updated_at.setter
+    def updated_at(self, value: float) -> None:
+        self._state[1] = value
+
+
+class RateLimiter:
+    """
+    Limita requests por minuto y tokens por minuto en simultáneo.
+
+    Un límite en 0 (o None) queda deshabilitado.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None
+    ):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+    def reserve(self, tokens: int = 0) -> float:
+        """Reserva un request y `tokens` tokens; retorna los segundos a esperar."""
+        wait = 0.0
+        if self.requests:
+            wait = max(wait, self.requests.reserve(1))
+        if self.tokens and tokens:
+            wait = max(wait, self.tokens.reserve(tokens))
+        return wait
+
+    async def acquire(self, tokens: int = 0) -> float:
+        """Espera sin bloquear el event loop hasta poder ejecutar el request."""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def acquire_sync(self, tokens: int = 0) -> float:
+        """Versión bloqueante de `acquire` para workers y scripts."""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class SharedRateLimiter(RateLimiter):
+    """RateLimiter con buckets compartidos entre procesos."""
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        context: Optional[Any] = None
+    ):
+        self.requests = (
+            SharedTokenBucket(requests_per_minute, context=context) if requests_per_minute else None
+        )
+        self.tokens = (
+            SharedTokenBucket(tokens_per_minute, context=context) if tokens_per_minute else None
+        )
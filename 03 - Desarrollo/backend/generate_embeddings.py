@@ -115,7 +115,7 @@ def migrate_gastos(
     logger.info("=" * 60)
     
     # Obtener gastos
-    query = db.query(Gasto)
+    query = db.query(Gasto).order_by(Gasto.id_gasto)
     if usuario_ids:
         query = query.filter(Gasto.id_usuario.in_(usuario_ids))
     
@@ -135,32 +135,38 @@ def migrate_gastos(
         gastos_batch = query.offset(offset).limit(batch_size).all()
         logger.info(f"\nProcesando lote {offset // batch_size + 1}: registros {offset + 1} a {offset + len(gastos_batch)}")
         
+        pendientes = []
         for gasto in gastos_batch:
+            # Verificar si ya existe embedding
+            existing = db.query(GastoEmbedding).filter(
+                GastoEmbedding.gasto_id == gasto.id_gasto
+            ).first()
+            
+            if existing and not force:
+                skipped += 1
+                continue
+            
+            # Construir texto
+            gasto_dict = {
+                "descripcion": gasto.descripcion,
+                "categoria": gasto.categoria.nombre if gasto.categoria else None,
+                "monto": gasto.monto,
+                "moneda": gasto.moneda,
+                "fecha": gasto.fecha,
+                "comercio": gasto.comercio
+            }
+            
+            texto = embeddings_service.build_gasto_text(gasto_dict)
+            pendientes.append((gasto, existing, gasto_dict, texto))
+        
+        # Generar los embeddings del lote en una sola llamada por lote del proveedor
+        embeddings = embeddings_service.generate_embeddings_batch(
+            [texto for _, _, _, texto in pendientes],
+            batch_size=batch_size
+        )
+        
+        for (gasto, existing, gasto_dict, texto), embedding in zip(pendientes, embeddings):
             try:
-                # Verificar si ya existe embedding
-                existing = db.query(GastoEmbedding).filter(
-                    GastoEmbedding.gasto_id == gasto.id_gasto
-                ).first()
-                
-                if existing and not force:
-                    skipped += 1
-                    continue
-                
-                # Construir texto
-                gasto_dict = {
-                    "descripcion": gasto.descripcion,
-                    "categoria": gasto.categoria.nombre if gasto.categoria else None,
-                    "monto": gasto.monto,
-                    "moneda": gasto.moneda,
-                    "fecha": gasto.fecha,
-                    "comercio": gasto.comercio
-                }
-                
-                texto = embeddings_service.build_gasto_text(gasto_dict)
-                
-                # Generar embedding
-                embedding = embeddings_service.generate_embedding(texto)
-                
                 if not embedding:
                     logger.error(f"Error generando embedding para gasto {gasto.id_gasto}")
                     errors += 1
@@ -169,11 +175,11 @@ def migrate_gastos(
                 # Guardar o actualizar
                 metadata = embeddings_service.build_metadata(gasto_dict, "gasto")
                 
-                if existing and force:
+                if existing:
                     # Actualizar
                     existing.embedding = embedding
                     existing.texto_original = texto
-                    existing.metadata = metadata
+                    existing.metadata_ = metadata
                     logger.debug(f"Actualizado embedding para gasto {gasto.id_gasto}")
                 else:
                     # Crear nuevo
@@ -181,23 +187,20 @@ def migrate_gastos(
                         gasto_id=gasto.id_gasto,
                         embedding=embedding,
                         texto_original=texto,
-                        metadata=metadata
+                        metadata_=metadata
                     )
                     db.add(gasto_embedding)
                     logger.debug(f"Creado embedding para gasto {gasto.id_gasto}")
                 
                 processed += 1
-                
-                # Commit cada 10 registros
-                if processed % 10 == 0:
-                    db.commit()
-                    logger.info(f"Progreso: {processed} procesados, {skipped} omitidos, {errors} errores")
             
             except Exception as e:
                 logger.error(f"Error procesando gasto {gasto.id_gasto}: {str(e)}")
                 errors += 1
                 db.rollback()
         
+        logger.info(f"Progreso: {processed} procesados, {skipped} omitidos, {errors} errores")
+        
         # Commit final del lote
         db.commit()
     
@@ -232,7 +235,7 @@ def migrate_ingresos(
     logger.info("=" * 60)
     
     # Obtener ingresos
-    query = db.query(Ingreso)
+    query = db.query(Ingreso).order_by(Ingreso.id_ingreso)
     if usuario_ids:
         query = query.filter(Ingreso.id_usuario.in_(usuario_ids))
     
@@ -252,31 +255,37 @@ def migrate_ingresos(
         ingresos_batch = query.offset(offset).limit(batch_size).all()
         logger.info(f"\nProcesando lote {offset // batch_size + 1}: registros {offset + 1} a {offset + len(ingresos_batch)}")
         
+        pendientes = []
         for ingreso in ingresos_batch:
+            # Verificar si ya existe embedding
+            existing = db.query(IngresoEmbedding).filter(
+                IngresoEmbedding.ingreso_id == ingreso.id_ingreso
+            ).first()
+            
+            if existing and not force:
+                skipped += 1
+                continue
+            
+            # Construir texto
+            ingreso_dict = {
+                "descripcion": ingreso.descripcion,
+                "categoria": ingreso.categoria.nombre if ingreso.categoria else None,
+                "monto": ingreso.monto,
+                "moneda": ingreso.moneda,
+                "fecha": ingreso.fecha
+            }
+            
+            texto = embeddings_service.build_ingreso_text(ingreso_dict)
+            pendientes.append((ingreso, existing, ingreso_dict, texto))
+        
+        # Generar los embeddings del lote en una sola llamada por lote del proveedor
+        embeddings = embeddings_service.generate_embeddings_batch(
+            [texto for _, _, _, texto in pendientes],
+            batch_size=batch_size
+        )
+        
+        for (ingreso, existing, ingreso_dict, texto), embedding in zip(pendientes, embeddings):
             try:
-                # Verificar si ya existe embedding
-                existing = db.query(IngresoEmbedding).filter(
-                    IngresoEmbedding.ingreso_id == ingreso.id_ingreso
-                ).first()
-                
-                if existing and not force:
-                    skipped += 1
-                    continue
-                
-                # Construir texto
-                ingreso_dict = {
-                    "descripcion": ingreso.descripcion,
-                    "categoria": ingreso.categoria.nombre if ingreso.categoria else None,
-                    "monto": ingreso.monto,
-                    "moneda": ingreso.moneda,
-                    "fecha": ingreso.fecha
-                }
-                
-                texto = embeddings_service.build_ingreso_text(ingreso_dict)
-                
-                # Generar embedding
-                embedding = embeddings_service.generate_embedding(texto)
-                
                 if not embedding:
                     logger.error(f"Error generando embedding para ingreso {ingreso.id_ingreso}")
                     errors += 1
@@ -285,11 +294,11 @@ def migrate_ingresos(
                 # Guardar o actualizar
                 metadata = embeddings_service.build_metadata(ingreso_dict, "ingreso")
                 
-                if existing and force:
+                if existing:
                     # Actualizar
                     existing.embedding = embedding
                     existing.texto_original = texto
-                    existing.metadata = metadata
+                    existing.metadata_ = metadata
                     logger.debug(f"Actualizado embedding para ingreso {ingreso.id_ingreso}")
                 else:
                     # Crear nuevo
@@ -297,23 +306,20 @@ def migrate_ingresos(
                         ingreso_id=ingreso.id_ingreso,
                         embedding=embedding,
                         texto_original=texto,
-                        metadata=metadata
+                        metadata_=metadata
                     )
                     db.add(ingreso_embedding)
                     logger.debug(f"Creado embedding para ingreso {ingreso.id_ingreso}")
                 
                 processed += 1
-                
-                # Commit cada 10 registros
-                if processed % 10 == 0:
-                    db.commit()
-                    logger.info(f"Progreso: {processed} procesados, {skipped} omitidos, {errors} errores")
             
             except Exception as e:
                 logger.error(f"Error procesando ingreso {ingreso.id_ingreso}: {str(e)}")
                 errors += 1
                 db.rollback()
         
+        logger.info(f"Progreso: {processed} procesados, {skipped} omitidos, {errors} errores")
+        
         # Commit final del lote
         db.commit()
     
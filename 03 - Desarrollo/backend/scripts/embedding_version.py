@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Script: embedding_version.py
+Descripción: Administra las versiones del modelo de embeddings (sombra y cutover)
+Autor: Sistema de Analizador Financiero
+Fecha: 17 octubre 2026
+
+Uso:
+    python scripts/embedding_version.py status
+    python scripts/embedding_version.py create-shadow [--provider gemini]
+    python scripts/embedding_version.py cutover [--force]
+    python scripts/embedding_version.py rollback
+
+Flujo para cambiar de modelo sin dejar la búsqueda vacía:
+    1. create-shadow --provider NUEVO   crea las tablas sombra del modelo nuevo
+    2. populate_embeddings.py --target shadow --provider NUEVO [--workers N]
+    3. populate_embeddings.py --target shadow --provider NUEVO   (puesta al día)
+    4. cutover                          intercambio atómico de tablas
+    5. reiniciar la API con EMBEDDING_PROVIDER=NUEVO
+
+Mientras tanto la API sigue buscando en las tablas activas con el modelo
+actual. Entre el cutover y el reinicio, VectorSearchService detecta que su
+modelo ya no es el activo y omite la búsqueda semántica en vez de comparar
+vectores de modelos distintos.
+"""
+
+import sys
+import os
+import argparse
+import logging
+
+# Agregar directorio raíz al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.crud.session import SessionLocal
+from app.services.embeddings_service import EmbeddingsService
+from app.services.embedding_backfill import ENTITY_MODELS, count_pending
+from app.services.embedding_versions import (
+    create_shadow, cutover, rollback_cutover, get_versions_status
+)
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def cmd_status(db, args):
+    """Muestra las versiones registradas y la cobertura de cada tabla."""
+    status = get_versions_status(db)
+
+    print("📦 Versiones:")
+    for version in status["versions"]:
+        print(f"   [{version['status']}] {version['model_version']} ({version['dimensions']} dims)")
+    if not status["versions"]:
+        print("   (sin versiones registradas)")
+    print()
+
+    print("📊 Cobertura:")
+    for entity_type, coverage in status["coverage"].items():
+        shadow = coverage["shadow"] if coverage["shadow"] is not None else "-"
+        print(
+            f"   {entity_type}s: {coverage['total']} registros, "
+            f"{coverage['active']} activos, {shadow} en sombra"
+        )
+
+
+def cmd_create_shadow(db, args):
+    """Crea las tablas sombra para el modelo del proveedor indicado."""
+    service = EmbeddingsService(args.provider)
+    create_shadow(db, service.model_version, service.embedding_dimensions)
+    print(f"✅ Sombra creada para {service.model_version}")
+    print(
+        f"   Siguiente paso: python scripts/populate_embeddings.py --target shadow "
+        f"--provider {service.provider}"
+    )
+
+
+def cmd_cutover(db, args):
+    """Activa la versión sombra si está completa."""
+    pending = {
+        entity_type: count_pending(db, entity_type, target="shadow")
+        for entity_type in ENTITY_MODELS
+    }
+    if any(pending.values()) and not args.force:
+        print(f"❌ La sombra no está completa, faltan: {pending}")
+        print("   Ejecutar el backfill con --target shadow o usar --force")
+        sys.exit(1)
+
+    version = cutover(db)
+    print(f"✅ Versión activa: {version}")
+    print(f"   Reiniciar la API con el proveedor de {version}")
+
+
+def cmd_rollback(db, args):
+    """Vuelve a la versión anterior."""
+    version = rollback_cutover(db)
+    print(f"✅ Versión reactivada: {version or 'sin registrar'}")
+
+
+def main():
+    """Función principal."""
+    parser = argparse.ArgumentParser(
+        description="Administra las versiones del modelo de embeddings"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("status", help="Versiones registradas y cobertura")
+
+    create_parser = subparsers.add_parser("create-shadow", help="Crea las tablas sombra")
+    create_parser.add_argument(
+        "--provider",
+        choices=["azure", "gemini", "local"],
+        help="Proveedor del modelo nuevo; pisa EMBEDDING_PROVIDER"
+    )
+
+    cutover_parser = subparsers.add_parser("cutover", help="Activa la versión sombra")
+    cutover_parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Activa aunque haya registros sin embedding en la sombra"
+    )
+
+    subparsers.add_parser("rollback", help="Vuelve a la versión anterior")
+
+    args = parser.parse_args()
+    commands = {
+        "status": cmd_status,
+        "create-shadow": cmd_create_shadow,
+        "cutover": cmd_cutover,
+        "rollback": cmd_rollback,
+    }
+
+    db = SessionLocal()
+    try:
+        commands[args.command](db, args)
+    except Exception as e:
+        logger.error(f"❌ Error: {str(e)}")
+        db.rollback()
+        sys.exit(1)
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
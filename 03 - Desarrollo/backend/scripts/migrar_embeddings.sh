@@ -5,12 +5,15 @@
 # Wrapper para ejecutar la migración de embeddings dentro del contenedor Docker
 #
 # Uso:
-#   ./scripts/migrar_embeddings.sh [gasto|ingreso|all] [limite]
+#   ./scripts/migrar_embeddings.sh [gasto|ingreso|all] [limite] [binary|text]
 #
 # Ejemplos:
 #   ./scripts/migrar_embeddings.sh                  # Migra todo
 #   ./scripts/migrar_embeddings.sh gasto            # Solo gastos
 #   ./scripts/migrar_embeddings.sh ingreso 10       # Solo 10 ingresos
+#   ./scripts/migrar_embeddings.sh all "" text      # COPY en formato texto
+#
+# Los embeddings se escriben con COPY (binario por defecto) y un upsert por lote.
 #
 # Autor: Sistema de Analizador Financiero
 # Fecha: 12 noviembre 2025
@@ -32,6 +35,7 @@ SCRIPT_PATH="scripts/migrar_embeddings_existentes.py"
 # Parámetros
 TIPO="${1:-all}"
 LIMITE="${2:-}"
+FORMATO="${3:-}"
 
 echo -e "${BLUE}╔════════════════════════════════════════════════════════════╗${NC}"
 echo -e "${BLUE}║     🚀 MIGRACIÓN DE EMBEDDINGS - DOCKER                    ║${NC}"
@@ -53,10 +57,14 @@ CMD="python $SCRIPT_PATH --tipo $TIPO"
 if [ -n "$LIMITE" ]; then
     CMD="$CMD --limite $LIMITE"
 fi
+if [ -n "$FORMATO" ]; then
+    CMD="$CMD --copy-format $FORMATO"
+fi
 
 echo -e "${BLUE}📋 Configuración:${NC}"
 echo -e "   Tipo: ${YELLOW}$TIPO${NC}"
 echo -e "   Límite: ${YELLOW}${LIMITE:-Sin límite}${NC}"
+echo -e "   COPY: ${YELLOW}${FORMATO:-binary}${NC}"
 echo ""
 
 # Preguntar confirmación
@@ -6,6 +6,10 @@ Genera embeddings para todos los gastos e ingresos existentes que no los tienen.
 
 Uso:
     python scripts/migrar_embeddings_existentes.py [--tipo gasto|ingreso|all]
+        [--copy-format binary|text]
+
+Cada lote se escribe con COPY a una tabla temporal y un único
+INSERT ... ON CONFLICT (ver app/services/embedding_bulk_loader.py).
 
 Autor: Sistema de Analizador Financiero
 Fecha: 12 noviembre 2025
@@ -27,13 +31,16 @@ from app.models.gasto import Gasto
 from app.models.ingreso import Ingreso
 from app.models.embeddings import GastoEmbedding, IngresoEmbedding
 from app.services.embeddings_service import EmbeddingsService
+from app.services.embedding_bulk_loader import copy_upsert_embeddings
 
 
 class EmbeddingsMigrator:
     """Migrador de embeddings para datos existentes"""
     
-    def __init__(self):
+    def __init__(self, batch_size: int = 100, copy_format: str = None):
         self.embeddings_service = EmbeddingsService()
+        self.batch_size = batch_size
+        self.copy_format = copy_format
         self.stats = {
             'gastos_procesados': 0,
             'gastos_creados': 0,
@@ -165,39 +172,44 @@ class EmbeddingsMigrator:
         
         print("\n🚀 Iniciando procesamiento...\n")
         
-        for i, gasto in enumerate(gastos, 1):
+        for inicio in range(0, total, self.batch_size):
+            lote = gastos[inicio:inicio + self.batch_size]
+            self.stats['gastos_procesados'] += len(lote)
+            
+            # Generar textos y embeddings del lote completo
+            textos = [self._generar_texto_gasto(gasto) for gasto in lote]
+            print(f"[{inicio + 1}-{inicio + len(lote)}/{total}] Procesando lote de gastos...", end=" ")
+            embeddings, versiones = self.embeddings_service.generate_embeddings_batch_versioned(textos)
+            
             try:
-                self.stats['gastos_procesados'] += 1
-                
-                # Generar texto
-                texto = self._generar_texto_gasto(gasto)
-                
-                # Generar embedding
-                print(f"[{i}/{total}] Procesando gasto #{gasto.id_gasto}...", end=" ")
-                embedding = self.embeddings_service.generate_embedding(texto)
+                filas = []
+                for gasto, texto, embedding, version in zip(lote, textos, embeddings, versiones):
+                    if not embedding:
+                        self.stats['gastos_errores'] += 1
+                        continue
+                    
+                    filas.append({
+                        'gasto_id': gasto.id_gasto,
+                        'embedding': embedding,
+                        'texto_original': texto,
+                        'content_hash': self.embeddings_service.content_hash(texto, version),
+                        'model_version': version,
+                        'metadata': self._generar_metadata_gasto(gasto)
+                    })
+                creados = len(filas)
                 
-                if not embedding:
-                    print("❌ Error generando embedding")
-                    self.stats['gastos_errores'] += 1
-                    continue
-                
-                # Crear registro de embedding
-                gasto_embedding = GastoEmbedding(
-                    gasto_id=gasto.id_gasto,
-                    embedding=embedding,
-                    texto_original=texto,
-                    metadata_=self._generar_metadata_gasto(gasto)
+                # Un COPY y un upsert por lote en lugar de un INSERT por fila
+                copy_upsert_embeddings(
+                    db, GastoEmbedding.__table__, 'gasto_id', filas, copy_format=self.copy_format
                 )
-                
-                db.add(gasto_embedding)
                 db.commit()
                 
-                print("✅")
-                self.stats['gastos_creados'] += 1
+                print(f"✅ {creados}/{len(lote)}")
+                self.stats['gastos_creados'] += creados
                 
             except Exception as e:
                 print(f"❌ Error: {str(e)}")
-                self.stats['gastos_errores'] += 1
+                self.stats['gastos_errores'] += creados
                 db.rollback()
                 continue
         
@@ -241,39 +253,44 @@ class EmbeddingsMigrator:
         
         print("\n🚀 Iniciando procesamiento...\n")
         
-        for i, ingreso in enumerate(ingresos, 1):
+        for inicio in range(0, total, self.batch_size):
+            lote = ingresos[inicio:inicio + self.batch_size]
+            self.stats['ingresos_procesados'] += len(lote)
+            
+            # Generar textos y embeddings del lote completo
+            textos = [self._generar_texto_ingreso(ingreso) for ingreso in lote]
+            print(f"[{inicio + 1}-{inicio + len(lote)}/{total}] Procesando lote de ingresos...", end=" ")
+            embeddings, versiones = self.embeddings_service.generate_embeddings_batch_versioned(textos)
+            
             try:
-                self.stats['ingresos_procesados'] += 1
-                
-                # Generar texto
-                texto = self._generar_texto_ingreso(ingreso)
+                filas = []
+                for ingreso, texto, embedding, version in zip(lote, textos, embeddings, versiones):
+                    if not embedding:
+                        self.stats['ingresos_errores'] += 1
+                        continue
+                    
+                    filas.append({
+                        'ingreso_id': ingreso.id_ingreso,
+                        'embedding': embedding,
+                        'texto_original': texto,
+                        'content_hash': self.embeddings_service.content_hash(texto, version),
+                        'model_version': version,
+                        'metadata': self._generar_metadata_ingreso(ingreso)
+                    })
+                creados = len(filas)
                 
-                # Generar embedding
-                print(f"[{i}/{total}] Procesando ingreso #{ingreso.id_ingreso}...", end=" ")
-                embedding = self.embeddings_service.generate_embedding(texto)
-                
-                if not embedding:
-                    print("❌ Error generando embedding")
-                    self.stats['ingresos_errores'] += 1
-                    continue
-                
-                # Crear registro de embedding
-                ingreso_embedding = IngresoEmbedding(
-                    ingreso_id=ingreso.id_ingreso,
-                    embedding=embedding,
-                    texto_original=texto,
-                    metadata_=self._generar_metadata_ingreso(ingreso)
+                # Un COPY y un upsert por lote en lugar de un INSERT por fila
+                copy_upsert_embeddings(
+                    db, IngresoEmbedding.__table__, 'ingreso_id', filas, copy_format=self.copy_format
                 )
-                
-                db.add(ingreso_embedding)
                 db.commit()
                 
-                print("✅")
-                self.stats['ingresos_creados'] += 1
+                print(f"✅ {creados}/{len(lote)}")
+                self.stats['ingresos_creados'] += creados
                 
             except Exception as e:
                 print(f"❌ Error: {str(e)}")
-                self.stats['ingresos_errores'] += 1
+                self.stats['ingresos_errores'] += creados
                 db.rollback()
                 continue
         
@@ -324,12 +341,24 @@ def main():
         default='all',
         help='Tipo de datos a migrar (default: all)'
     )
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=100,
+        help='Cantidad de registros por lote de embeddings (default: 100)'
+    )
     parser.add_argument(
         '--limite',
         type=int,
         default=None,
         help='Límite de registros a procesar por tipo (default: todos)'
     )
+    parser.add_argument(
+        '--copy-format',
+        choices=['binary', 'text'],
+        default=None,
+        help='Formato del COPY (default: EMBEDDING_COPY_FORMAT o binary)'
+    )
     
     args = parser.parse_args()
     
@@ -338,10 +367,12 @@ def main():
     print("="*60)
     print(f"Tipo: {args.tipo}")
     print(f"Límite: {args.limite if args.limite else 'Sin límite'}")
+    print(f"Batch size: {args.batch_size}")
+    print(f"COPY: {args.copy_format or os.getenv('EMBEDDING_COPY_FORMAT', 'binary')}")
     print("="*60)
     
     # Crear migrador
-    migrator = EmbeddingsMigrator()
+    migrator = EmbeddingsMigrator(batch_size=args.batch_size, copy_format=args.copy_format)
     
     # Obtener sesión de base de datos
     db = SessionLocal()
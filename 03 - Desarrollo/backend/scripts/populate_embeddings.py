@@ -16,6 +16,33 @@ Opciones:
     --ingresos-only         Solo procesa ingresos
     --dry-run               Muestra qué se haría sin ejecutar
     --verbose               Muestra información detallada
+    --checkpoint-file PATH  Archivo de checkpoint para reanudar
+                            (default: populate_embeddings.checkpoint.json)
+    --reset-checkpoint      Ignora el checkpoint y empieza desde el principio
+    --workers N             Procesos en paralelo, cada uno con un shard (default: 1)
+    --shard-by id|usuario   Partición por id del registro o por id_usuario (default: id)
+    --target active|shadow  Tabla destino: la activa o la sombra de un modelo nuevo
+                            (default: active)
+    --provider NOMBRE       Proveedor de embeddings; pisa EMBEDDING_PROVIDER
+    --copy-format binary|text|off
+                            Escritura con COPY binario, COPY de texto o con
+                            INSERT ... VALUES (default: EMBEDDING_COPY_FORMAT
+                            o binary)
+
+Los registros se leen en streaming (anti-join + paginación por ID) y después
+de cada lote confirmado se guarda el último ID procesado. Si la corrida se
+interrumpe, al volver a ejecutarla con los mismos filtros continúa desde ahí.
+
+Con --workers N cada proceso recorre su shard con su propia conexión, su propio
+cliente de embeddings y su propio checkpoint, y todos comparten el límite de
+requests/tokens por minuto del proveedor (EMBEDDING_REQUESTS_PER_MINUTE y
+EMBEDDING_TOKENS_PER_MINUTE), de modo que sumar workers no excede la cuota.
+
+Con --target shadow se llena la versión sombra creada con
+scripts/embedding_version.py mientras la API sigue usando las tablas activas.
+Además de los registros sin embedding en la sombra, procesa los editados en
+la tabla activa después de copiarse, así que una última corrida justo antes
+del cutover deja la sombra al día.
 """
 
 import sys
@@ -23,18 +50,23 @@ import os
 import argparse
 import logging
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import Optional
 
 # Agregar directorio raíz al path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from sqlalchemy import create_engine, text, select, func
 from sqlalchemy.orm import Session
 from app.crud.session import SessionLocal
-from app.models.gasto import Gasto
-from app.models.ingreso import Ingreso
-from app.models.embeddings import GastoEmbedding, IngresoEmbedding
 from app.services.embeddings_service import EmbeddingsService
+from app.services.embedding_versions import (
+    get_active_model_version, get_building_model_version, is_model_version_active
+)
+from app.services.embedding_worker import embed_and_store
+from app.services.embedding_bulk_loader import get_copy_writer
+from app.services.embedding_backfill import (
+    BackfillCheckpoint, BackfillSupervisor, ENTITY_MODELS,
+    count_pending, iter_pending_chunks, shard_checkpoint_path
+)
 
 # Configuración de logging
 logging.basicConfig(
@@ -47,6 +79,8 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+DEFAULT_CHECKPOINT_FILE = 'populate_embeddings.checkpoint.json'
+
 
 class PopulateEmbeddingsScript:
     """Script para poblar embeddings de gastos e ingresos."""
@@ -59,7 +93,14 @@ class PopulateEmbeddingsScript:
         gastos_only: bool = False,
         ingresos_only: bool = False,
         dry_run: bool = False,
-        verbose: bool = False
+        verbose: bool = False,
+        checkpoint_file: Optional[str] = DEFAULT_CHECKPOINT_FILE,
+        reset_checkpoint: bool = False,
+        workers: int = 1,
+        shard_by: str = "id",
+        target: str = "active",
+        provider: Optional[str] = None,
+        copy_format: Optional[str] = None
     ):
         self.batch_size = batch_size
         self.force_regenerate = force_regenerate
@@ -68,8 +109,30 @@ class PopulateEmbeddingsScript:
         self.ingresos_only = ingresos_only
         self.dry_run = dry_run
         self.verbose = verbose
-        
-        self.embeddings_service = EmbeddingsService()
+        self.checkpoint_file = checkpoint_file
+        self.workers = workers
+        self.shard_by = shard_by
+        self.target = target
+        self.provider = provider
+        self.copy_format = copy_format
+        self.writer = get_copy_writer(copy_format)
+        
+        self.embeddings_service = EmbeddingsService(provider)
+        
+        # El checkpoint solo es válido para la misma combinación de filtros
+        self.checkpoint = BackfillCheckpoint(
+            None if dry_run else checkpoint_file,
+            params={
+                "user_id": user_id,
+                "force_regenerate": force_regenerate,
+                "target": target,
+                "model_version": self.embeddings_service.model_version
+            }
+        )
+        if reset_checkpoint:
+            self.checkpoint.reset()
+            for index in range(workers):
+                BackfillCheckpoint(shard_checkpoint_path(checkpoint_file, index, workers)).reset()
         self.stats = {
             'gastos_processed': 0,
             'gastos_skipped': 0,
@@ -104,201 +167,81 @@ class PopulateEmbeddingsScript:
         print(title)
         print("=" * 70 + "\n")
     
-    def get_existing_embeddings(self, db: Session, tipo: str) -> set:
-        """Obtiene IDs de registros que ya tienen embeddings."""
-        if tipo == 'gastos':
-            result = db.execute(
-                select(GastoEmbedding.gasto_id)
-            ).scalars().all()
-        else:
-            result = db.execute(
-                select(IngresoEmbedding.ingreso_id)
-            ).scalars().all()
-        
-        return set(result)
-    
-    def get_gastos_to_process(self, db: Session) -> List[Gasto]:
-        """Obtiene lista de gastos a procesar."""
-        query = select(Gasto)
-        
-        # Filtrar por usuario si se especificó
-        if self.user_id:
-            query = query.where(Gasto.id_usuario == self.user_id)
-        
-        # Si no forzamos regeneración, excluir los que ya tienen embeddings
-        if not self.force_regenerate:
-            existing_ids = self.get_existing_embeddings(db, 'gastos')
-            if existing_ids:
-                query = query.where(Gasto.id_gasto.not_in(existing_ids))
-        
-        query = query.order_by(Gasto.id_gasto)
-        
-        return db.execute(query).scalars().all()
-    
-    def get_ingresos_to_process(self, db: Session) -> List[Ingreso]:
-        """Obtiene lista de ingresos a procesar."""
-        query = select(Ingreso)
-        
-        # Filtrar por usuario si se especificó
-        if self.user_id:
-            query = query.where(Ingreso.id_usuario == self.user_id)
-        
-        # Si no forzamos regeneración, excluir los que ya tienen embeddings
-        if not self.force_regenerate:
-            existing_ids = self.get_existing_embeddings(db, 'ingresos')
-            if existing_ids:
-                query = query.where(Ingreso.id_ingreso.not_in(existing_ids))
-        
-        query = query.order_by(Ingreso.id_ingreso)
-        
-        return db.execute(query).scalars().all()
-    
-    def process_gastos_batch(self, db: Session, gastos: List[Gasto]) -> int:
-        """Procesa un lote de gastos."""
-        if self.dry_run:
-            self.log_info(f"DRY RUN: Se procesarían {len(gastos)} gastos")
-            return len(gastos)
-        
-        processed = 0
-        
-        for gasto in gastos:
-            try:
-                # Generar embedding
-                embedding_data = self.embeddings_service.generate_embedding_for_gasto(
-                    gasto=gasto,
-                    db=db
-                )
-                
-                if not embedding_data:
-                    self.log_warning(f"No se pudo generar embedding para gasto {gasto.id_gasto}")
-                    self.stats['gastos_skipped'] += 1
-                    continue
-                
-                # Verificar si ya existe
-                existing = db.query(GastoEmbedding).filter(
-                    GastoEmbedding.gasto_id == gasto.id
-                ).first()
-                
-                if existing and self.force_regenerate:
-                    # Actualizar embedding existente
-                    existing.embedding = embedding_data['embedding']
-                    existing.texto = embedding_data['texto']
-                    existing.metadata = embedding_data.get('metadata', {})
-                    existing.fecha_actualizacion = datetime.now()
-                    
-                    if self.verbose:
-                        self.log_info(f"Actualizado embedding para gasto {gasto.id_gasto}")
-                elif not existing:
-                    # Crear nuevo embedding
-                    nuevo_embedding = GastoEmbedding(
-                        id_gasto=gasto.id_gasto,
-                        id_usuario=gasto.id_usuario,
-                        embedding=embedding_data['embedding'],
-                        texto=embedding_data['texto'],
-                        metadata=embedding_data.get('metadata', {})
-                    )
-                    db.add(nuevo_embedding)
-                    
-                    if self.verbose:
-                        self.log_info(f"Creado embedding para gasto {gasto.id_gasto}")
-                else:
-                    self.stats['gastos_skipped'] += 1
-                    continue
-                
-                processed += 1
-                
-                # Commit cada N registros
-                if processed % 10 == 0:
-                    db.commit()
-                    
-            except Exception as e:
-                self.log_error(f"Error procesando gasto {gasto.id_gasto}: {str(e)}")
-                self.stats['gastos_errors'] += 1
-                db.rollback()
-        
-        # Commit final
-        try:
-            db.commit()
-            self.stats['gastos_processed'] += processed
-        except Exception as e:
-            self.log_error(f"Error en commit final de gastos: {str(e)}")
-            db.rollback()
-        
-        return processed
-    
-    def process_ingresos_batch(self, db: Session, ingresos: List[Ingreso]) -> int:
-        """Procesa un lote de ingresos."""
-        if self.dry_run:
-            self.log_info(f"DRY RUN: Se procesarían {len(ingresos)} ingresos")
-            return len(ingresos)
-        
-        processed = 0
-        
-        for ingreso in ingresos:
-            try:
-                # Generar embedding
-                embedding_data = self.embeddings_service.generate_embedding_for_ingreso(
-                    ingreso=ingreso,
-                    db=db
-                )
-                
-                if not embedding_data:
-                    self.log_warning(f"No se pudo generar embedding para ingreso {ingreso.id_ingreso}")
-                    self.stats['ingresos_skipped'] += 1
-                    continue
-                
-                # Verificar si ya existe
-                existing = db.query(IngresoEmbedding).filter(
-                    IngresoEmbedding.ingreso_id == ingreso.id
-                ).first()
-                
-                if existing and self.force_regenerate:
-                    # Actualizar embedding existente
-                    existing.embedding = embedding_data['embedding']
-                    existing.texto = embedding_data['texto']
-                    existing.metadata = embedding_data.get('metadata', {})
-                    existing.fecha_actualizacion = datetime.now()
-                    
-                    if self.verbose:
-                        self.log_info(f"Actualizado embedding para ingreso {ingreso.id_ingreso}")
-                elif not existing:
-                    # Crear nuevo embedding
-                    nuevo_embedding = IngresoEmbedding(
-                        id_ingreso=ingreso.id_ingreso,
-                        id_usuario=ingreso.id_usuario,
-                        embedding=embedding_data['embedding'],
-                        texto=embedding_data['texto'],
-                        metadata=embedding_data.get('metadata', {})
+    def process_entity(self, db: Session, entity_type: str):
+        """
+        Procesa en streaming todos los gastos o ingresos pendientes.
+
+        Los candidatos se leen en bloques de `batch_size` con paginación por
+        clave y, después de confirmar cada bloque, se guarda el último ID en
+        el checkpoint para poder reanudar.
+        """
+        plural = f"{entity_type}s"
+        after_id = self.checkpoint.get(entity_type)
+        include_existing = self.force_regenerate
+
+        if after_id:
+            self.log_info(f"Reanudando {plural} desde el ID {after_id} (checkpoint)")
+
+        total = count_pending(
+            db, entity_type, self.user_id, include_existing, after_id,
+            target=self.target, model_version=self.embeddings_service.model_version
+        )
+        if total == 0:
+            self.log_info(f"No hay {plural} para procesar")
+            return
+
+        self.log_info(f"Total de {plural} a procesar: {total}")
+
+        done = 0
+        chunks = iter_pending_chunks(
+            db, entity_type, self.batch_size,
+            after_id=after_id,
+            user_id=self.user_id,
+            include_existing=include_existing,
+            target=self.target,
+            model_version=self.embeddings_service.model_version
+        )
+        for batch_num, chunk in enumerate(chunks, start=1):
+            total_batches = (total + self.batch_size - 1) // self.batch_size
+            last_id = getattr(chunk[-1], ENTITY_MODELS[entity_type][1].key)
+            self.log_info(f"Procesando lote {batch_num}/{total_batches} ({len(chunk)} {plural})...")
+
+            if self.dry_run:
+                self.log_info(f"DRY RUN: Se procesarían {len(chunk)} {plural}")
+                self.stats[f'{plural}_processed'] += len(chunk)
+            else:
+                try:
+                    saved, unchanged = embed_and_store(
+                        db, entity_type, chunk, self.embeddings_service,
+                        force=self.force_regenerate,
+                        target=self.target,
+                        writer=self.writer
                     )
-                    db.add(nuevo_embedding)
-                    
-                    if self.verbose:
-                        self.log_info(f"Creado embedding para ingreso {ingreso.id_ingreso}")
-                else:
-                    self.stats['ingresos_skipped'] += 1
-                    continue
-                
-                processed += 1
-                
-                # Commit cada N registros
-                if processed % 10 == 0:
                     db.commit()
-                    
-            except Exception as e:
-                self.log_error(f"Error procesando ingreso {ingreso.id_ingreso}: {str(e)}")
-                self.stats['ingresos_errors'] += 1
-                db.rollback()
-        
-        # Commit final
-        try:
-            db.commit()
-            self.stats['ingresos_processed'] += processed
-        except Exception as e:
-            self.log_error(f"Error en commit final de ingresos: {str(e)}")
-            db.rollback()
-        
-        return processed
-    
+                except Exception as e:
+                    self.log_error(f"Error en el lote de {plural} hasta el ID {last_id}: {str(e)}")
+                    db.rollback()
+                    self.stats[f'{plural}_errors'] += len(chunk)
+                    raise
+
+                self.stats[f'{plural}_processed'] += saved
+                self.stats[f'{plural}_skipped'] += unchanged
+                self.stats[f'{plural}_errors'] += len(chunk) - saved - unchanged
+                self.checkpoint.update(entity_type, last_id)
+
+                if self.verbose:
+                    self.log_info(f"Guardados {saved} embeddings de {plural} (último ID: {last_id})")
+
+            done += len(chunk)
+            progress = min(done / total, 1.0) * 100
+            self.log_info(f"Progreso: {progress:.1f}% ({done}/{total})")
+
+        self.log_success(f"{plural.capitalize()} procesados: {self.stats[f'{plural}_processed']}")
+        if self.stats[f'{plural}_skipped'] > 0:
+            self.log_warning(f"{plural.capitalize()} omitidos: {self.stats[f'{plural}_skipped']}")
+        if self.stats[f'{plural}_errors'] > 0:
+            self.log_error(f"Errores en {plural}: {self.stats[f'{plural}_errors']}")
+
     def process_gastos(self, db: Session):
         """Procesa todos los gastos."""
         if self.ingresos_only:
@@ -306,34 +249,7 @@ class PopulateEmbeddingsScript:
             return
         
         self.print_header("PROCESANDO GASTOS")
-        
-        gastos = self.get_gastos_to_process(db)
-        total = len(gastos)
-        
-        if total == 0:
-            self.log_info("No hay gastos para procesar")
-            return
-        
-        self.log_info(f"Total de gastos a procesar: {total}")
-        
-        # Procesar en lotes
-        for i in range(0, total, self.batch_size):
-            batch = gastos[i:i + self.batch_size]
-            batch_num = (i // self.batch_size) + 1
-            total_batches = (total + self.batch_size - 1) // self.batch_size
-            
-            self.log_info(f"Procesando lote {batch_num}/{total_batches} ({len(batch)} gastos)...")
-            
-            processed = self.process_gastos_batch(db, batch)
-            
-            progress = ((i + len(batch)) / total) * 100
-            self.log_info(f"Progreso: {progress:.1f}% ({i + len(batch)}/{total})")
-        
-        self.log_success(f"Gastos procesados: {self.stats['gastos_processed']}")
-        if self.stats['gastos_skipped'] > 0:
-            self.log_warning(f"Gastos omitidos: {self.stats['gastos_skipped']}")
-        if self.stats['gastos_errors'] > 0:
-            self.log_error(f"Errores en gastos: {self.stats['gastos_errors']}")
+        self.process_entity(db, "gasto")
     
     def process_ingresos(self, db: Session):
         """Procesa todos los ingresos."""
@@ -342,34 +258,71 @@ class PopulateEmbeddingsScript:
             return
         
         self.print_header("PROCESANDO INGRESOS")
-        
-        ingresos = self.get_ingresos_to_process(db)
-        total = len(ingresos)
-        
-        if total == 0:
-            self.log_info("No hay ingresos para procesar")
-            return
-        
-        self.log_info(f"Total de ingresos a procesar: {total}")
-        
-        # Procesar en lotes
-        for i in range(0, total, self.batch_size):
-            batch = ingresos[i:i + self.batch_size]
-            batch_num = (i // self.batch_size) + 1
-            total_batches = (total + self.batch_size - 1) // self.batch_size
-            
-            self.log_info(f"Procesando lote {batch_num}/{total_batches} ({len(batch)} ingresos)...")
-            
-            processed = self.process_ingresos_batch(db, batch)
-            
-            progress = ((i + len(batch)) / total) * 100
-            self.log_info(f"Progreso: {progress:.1f}% ({i + len(batch)}/{total})")
-        
-        self.log_success(f"Ingresos procesados: {self.stats['ingresos_processed']}")
-        if self.stats['ingresos_skipped'] > 0:
-            self.log_warning(f"Ingresos omitidos: {self.stats['ingresos_skipped']}")
-        if self.stats['ingresos_errors'] > 0:
-            self.log_error(f"Errores en ingresos: {self.stats['ingresos_errors']}")
+        self.process_entity(db, "ingreso")
+    
+    def check_model_version(self):
+        """Verifica que la tabla destino corresponda al modelo configurado."""
+        model_version = self.embeddings_service.model_version
+        db = SessionLocal()
+        try:
+            if self.target == "shadow":
+                building = get_building_model_version(db)
+                if building != model_version:
+                    raise RuntimeError(
+                        f"La sombra en construcción es {building or 'ninguna'} y el modelo "
+                        f"configurado es {model_version}; crearla con "
+                        f"scripts/embedding_version.py create-shadow"
+                    )
+            elif not is_model_version_active(db, model_version):
+                raise RuntimeError(
+                    f"Las tablas activas son de {get_active_model_version(db)} y el modelo "
+                    f"configurado es {model_version}; usar --target shadow para cambiar de modelo"
+                )
+        finally:
+            db.close()
+    
+    def run_parallel(self):
+        """Reparte el backfill entre `workers` procesos con un límite de tasa global."""
+        self.print_header(f"PROCESANDO EN PARALELO ({self.workers} WORKERS)")
+        
+        entity_types = []
+        if not self.ingresos_only:
+            entity_types.append("gasto")
+        if not self.gastos_only:
+            entity_types.append("ingreso")
+        
+        supervisor = BackfillSupervisor(
+            workers=self.workers,
+            options={
+                "entity_types": entity_types,
+                "batch_size": self.batch_size,
+                "user_id": self.user_id,
+                "force_regenerate": self.force_regenerate,
+                "dry_run": self.dry_run,
+                "shard_by": self.shard_by,
+                "checkpoint_file": self.checkpoint_file,
+                "target": self.target,
+                "provider": self.provider,
+                "copy_format": self.copy_format
+            },
+            requests_per_minute=self.embeddings_service.requests_per_minute,
+            tokens_per_minute=self.embeddings_service.tokens_per_minute
+        )
+        result = supervisor.run()
+        
+        for entity_type, totals in result["totals"].items():
+            for key, value in totals.items():
+                self.stats[f"{entity_type}s_{key}"] += value
+        
+        self.log_info(f"Throughput: {result['throughput_per_second']} registros/s")
+        failed = [index for index, shard in result["shards"].items() if shard["status"] == "failed"]
+        for index in failed:
+            self.log_error(f"Shard {index} falló: {result['shards'][index]['error']}")
+        if failed:
+            raise RuntimeError(
+                f"{len(failed)} shard(s) fallaron; volver a ejecutar con --workers "
+                f"{self.workers} para reanudar"
+            )
     
     def print_final_stats(self):
         """Imprime estadísticas finales."""
@@ -432,8 +385,22 @@ class PopulateEmbeddingsScript:
             print(f"   User ID filter: {self.user_id or 'Todos'}")
             print(f"   Gastos only: {self.gastos_only}")
             print(f"   Ingresos only: {self.ingresos_only}")
+            print(f"   Checkpoint: {self.checkpoint.path or 'Desactivado'}")
+            print(f"   Workers: {self.workers} (shard por {self.shard_by})")
+            print(f"   Modelo: {self.embeddings_service.model_version}")
+            print(f"   Destino: {self.target}")
+            print(f"   Escritura: {self.copy_format or os.getenv('EMBEDDING_COPY_FORMAT', 'binary')}")
             print()
             
+            if not self.dry_run:
+                self.check_model_version()
+            
+            if self.workers > 1:
+                self.run_parallel()
+                self.print_final_stats()
+                self.log_success("🎉 Población completada exitosamente!")
+                return
+            
             # Crear sesión de base de datos
             db = SessionLocal()
             
@@ -450,6 +417,8 @@ class PopulateEmbeddingsScript:
                 self.print_final_stats()
                 
                 if not self.dry_run:
+                    # Corrida completa: el próximo run empieza de cero
+                    self.checkpoint.reset()
                     self.log_success("🎉 Población completada exitosamente!")
                 else:
                     self.log_info("DRY RUN completado")
@@ -459,6 +428,8 @@ class PopulateEmbeddingsScript:
                 
         except KeyboardInterrupt:
             self.log_warning("\n⚠️  Proceso interrumpido por el usuario")
+            if self.checkpoint.path:
+                self.log_info(f"Se puede reanudar con el checkpoint {self.checkpoint.path}")
             sys.exit(1)
         except Exception as e:
             self.log_error(f"Error fatal: {str(e)}")
@@ -516,6 +487,52 @@ def main():
         help='Muestra información detallada'
     )
     
+    parser.add_argument(
+        '--checkpoint-file',
+        default=DEFAULT_CHECKPOINT_FILE,
+        help=f'Archivo de checkpoint para reanudar (default: {DEFAULT_CHECKPOINT_FILE})'
+    )
+    
+    parser.add_argument(
+        '--reset-checkpoint',
+        action='store_true',
+        help='Ignora el checkpoint y empieza desde el principio'
+    )
+    
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='Procesos en paralelo, cada uno con un shard (default: 1)'
+    )
+    
+    parser.add_argument(
+        '--shard-by',
+        choices=['id', 'usuario'],
+        default='id',
+        help='Partición por id del registro o por id_usuario (default: id)'
+    )
+    
+    parser.add_argument(
+        '--target',
+        choices=['active', 'shadow'],
+        default='active',
+        help='Tabla destino: la activa o la sombra de un modelo nuevo (default: active)'
+    )
+    
+    parser.add_argument(
+        '--provider',
+        choices=['azure', 'gemini', 'local'],
+        help='Proveedor de embeddings; pisa EMBEDDING_PROVIDER'
+    )
+    
+    parser.add_argument(
+        '--copy-format',
+        choices=['binary', 'text', 'off'],
+        help='Escritura con COPY binario, COPY de texto o INSERT ... VALUES '
+             '(default: EMBEDDING_COPY_FORMAT o binary)'
+    )
+    
     args = parser.parse_args()
     
     # Validar argumentos
@@ -523,6 +540,10 @@ def main():
         print("❌ Error: No se pueden usar --gastos-only e --ingresos-only simultáneamente")
         sys.exit(1)
     
+    if args.workers < 1:
+        print("❌ Error: --workers debe ser al menos 1")
+        sys.exit(1)
+    
     # Crear y ejecutar script
     script = PopulateEmbeddingsScript(
         batch_size=args.batch_size,
@@ -531,7 +552,14 @@ def main():
         gastos_only=args.gastos_only,
         ingresos_only=args.ingresos_only,
         dry_run=args.dry_run,
-        verbose=args.verbose
+        verbose=args.verbose,
+        checkpoint_file=args.checkpoint_file,
+        reset_checkpoint=args.reset_checkpoint,
+        workers=args.workers,
+        shard_by=args.shard_by,
+        target=args.target,
+        provider=args.provider,
+        copy_format=args.copy_format
     )
     
     script.run()
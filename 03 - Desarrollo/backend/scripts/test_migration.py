@@ -240,38 +240,38 @@ class MigrationTester:
                     SELECT indexname, indexdef
                     FROM pg_indexes
                     WHERE tablename = 'gastos_embeddings'
-                    AND indexdef LIKE '%ivfflat%';
+                    AND (indexdef LIKE '%hnsw%' OR indexdef LIKE '%ivfflat%');
                 """))
                 
                 gastos_indexes = result.fetchall()
                 
                 if gastos_indexes:
-                    self.print_success(f"Índices IVFFlat en gastos_embeddings: {len(gastos_indexes)}")
+                    self.print_success(f"Índices HNSW/IVFFlat en gastos_embeddings: {len(gastos_indexes)}")
                     
                     if self.verbose:
                         for idx in gastos_indexes:
                             self.print_info(f"   - {idx[0]}")
                 else:
-                    self.print_warning("No se encontraron índices IVFFlat en gastos_embeddings")
+                    self.print_warning("No se encontraron índices vectoriales en gastos_embeddings")
                 
                 # Verificar índices en ingresos_embeddings
                 result = conn.execute(text("""
                     SELECT indexname, indexdef
                     FROM pg_indexes
                     WHERE tablename = 'ingresos_embeddings'
-                    AND indexdef LIKE '%ivfflat%';
+                    AND (indexdef LIKE '%hnsw%' OR indexdef LIKE '%ivfflat%');
                 """))
                 
                 ingresos_indexes = result.fetchall()
                 
                 if ingresos_indexes:
-                    self.print_success(f"Índices IVFFlat en ingresos_embeddings: {len(ingresos_indexes)}")
+                    self.print_success(f"Índices HNSW/IVFFlat en ingresos_embeddings: {len(ingresos_indexes)}")
                     
                     if self.verbose:
                         for idx in ingresos_indexes:
                             self.print_info(f"   - {idx[0]}")
                 else:
-                    self.print_warning("No se encontraron índices IVFFlat en ingresos_embeddings")
+                    self.print_warning("No se encontraron índices vectoriales en ingresos_embeddings")
                 
                 return True
                 
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Script: vector_index.py
+Descripción: Administra los índices ANN (HNSW / IVFFlat) de las tablas de embeddings
+Autor: Sistema de Analizador Financiero
+Fecha: 17 octubre 2026
+
+Uso:
+    python scripts/vector_index.py status
+    python scripts/vector_index.py rebuild [--method hnsw|ivfflat] [--m 16]
+        [--ef-construction 64] [--lists N] [--entity gasto|ingreso|all]
+        [--target active|shadow]
+
+HNSW (default) da mejor recall/latencia y puede construirse con la tabla
+vacía; m y ef_construction más altos mejoran el recall a costa de memoria y
+tiempo de construcción. IVFFlat construye más rápido y ocupa menos, pero
+debe reconstruirse cuando la tabla crece (lists ~ raíz de las filas).
+
+El recall de cada búsqueda se ajusta en la API con los presets
+fast/balanced/accurate (VECTOR_SEARCH_PRESET), que fijan hnsw.ef_search e
+ivfflat.probes solo para la transacción de la consulta.
+"""
+
+import sys
+import os
+import argparse
+import logging
+
+# Agregar directorio raíz al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.crud.session import SessionLocal
+from app.services.vector_index import INDEX_METHODS, get_vector_indexes, rebuild_vector_index
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def cmd_status(db, args):
+    """Muestra los índices ANN de las tablas de embeddings."""
+    indexes = get_vector_indexes(db)
+
+    print("📇 Índices vectoriales:")
+    for index in indexes:
+        print(f"   {index['tabla']}.{index['indice']} [{index['metodo']}] {index['tamano']}")
+        print(f"      {index['definicion']}")
+    if not indexes:
+        print("   (sin índices: cada búsqueda recorre la tabla completa)")
+
+
+def cmd_rebuild(db, args):
+    """Reemplaza el índice ANN sobre embedding."""
+    entity_types = ["gasto", "ingreso"] if args.entity == "all" else [args.entity]
+    for entity_type in entity_types:
+        name = rebuild_vector_index(
+            db, entity_type,
+            method=args.method,
+            m=args.m,
+            ef_construction=args.ef_construction,
+            lists=args.lists,
+            target=args.target
+        )
+        print(f"✅ {entity_type}s: índice {name} creado")
+
+
+def main():
+    """Función principal."""
+    parser = argparse.ArgumentParser(
+        description="Administra los índices vectoriales de las tablas de embeddings"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("status", help="Índices ANN existentes")
+
+    rebuild_parser = subparsers.add_parser("rebuild", help="Reemplaza el índice ANN")
+    rebuild_parser.add_argument(
+        "--method",
+        choices=list(INDEX_METHODS),
+        help="Tipo de índice (default: VECTOR_INDEX_METHOD o hnsw)"
+    )
+    rebuild_parser.add_argument(
+        "--m",
+        type=int,
+        help="HNSW: conexiones por nodo (default: VECTOR_HNSW_M o 16)"
+    )
+    rebuild_parser.add_argument(
+        "--ef-construction",
+        type=int,
+        help="HNSW: candidatos al construir (default: VECTOR_HNSW_EF_CONSTRUCTION o 64)"
+    )
+    rebuild_parser.add_argument(
+        "--lists",
+        type=int,
+        help="IVFFlat: cantidad de listas (default: raíz de la cantidad de filas)"
+    )
+    rebuild_parser.add_argument(
+        "--entity",
+        choices=["gasto", "ingreso", "all"],
+        default="all",
+        help="Tabla a reindexar (default: all)"
+    )
+    rebuild_parser.add_argument(
+        "--target",
+        choices=["active", "shadow"],
+        default="active",
+        help="Tabla activa o sombra (default: active)"
+    )
+
+    args = parser.parse_args()
+    commands = {
+        "status": cmd_status,
+        "rebuild": cmd_rebuild,
+    }
+
+    db = SessionLocal()
+    try:
+        commands[args.command](db, args)
+    except Exception as e:
+        logger.error(f"❌ Error: {str(e)}")
+        db.rollback()
+        sys.exit(1)
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Tests unitarios para el circuit breaker
+Autor: Sistema de Analizador Financiero
+Fecha: 17 octubre 2026
+"""
+
+import pytest
+
+from app.utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+
+class FakeClock:
+    """Reloj manual para avanzar el tiempo sin esperas."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestCircuitBreaker:
+    """Tests para los estados del circuit breaker."""
+
+    @pytest.fixture
+    def clock(self):
+        return FakeClock()
+
+    @pytest.fixture
+    def breaker(self, clock):
+        return CircuitBreaker(
+            "test", failure_rate_threshold=0.5, window_seconds=60,
+            min_calls=4, open_seconds=30, clock=clock
+        )
+
+    def test_opens_on_failure_rate(self, breaker):
+        """Test: El circuito se abre al superar la proporción de fallos."""
+        breaker.record_success()
+        breaker.record_failure()
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+
+        breaker.record_failure()
+
+        assert breaker.state == CircuitBreaker.OPEN
+        assert breaker.allow_request() is False
+        with pytest.raises(CircuitOpenError):
+            breaker.check()
+        assert breaker.get_stats()["rejected"] == 2
+
+    def test_needs_min_calls(self, breaker):
+        """Test: Pocos fallos no alcanzan para abrir el circuito."""
+        for _ in range(3):
+            breaker.record_failure()
+
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    def test_old_outcomes_leave_window(self, breaker, clock):
+        """Test: Los fallos fuera de la ventana no cuentan."""
+        for _ in range(3):
+            breaker.record_failure()
+        clock.now = 120
+        breaker.record_success()
+        breaker.record_failure()
+
+        assert breaker.state == CircuitBreaker.CLOSED
+        assert breaker.get_stats()["window_calls"] == 2
+
+    def test_half_open_probe(self, breaker, clock):
+        """Test: Pasado el tiempo abierto se permite una sola llamada de prueba."""
+        for _ in range(4):
+            breaker.record_failure()
+        clock.now = 31
+
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        assert breaker.allow_request() is True
+        assert breaker.allow_request() is False
+
+        breaker.record_success()
+
+        assert breaker.state == CircuitBreaker.CLOSED
+        assert breaker.allow_request() is True
+
+    def test_half_open_failure_reopens(self, breaker, clock):
+        """Test: Si la prueba falla el circuito vuelve a abrirse."""
+        for _ in range(4):
+            breaker.record_failure()
+        clock.now = 31
+        assert breaker.allow_request() is True
+
+        breaker.record_failure()
+
+        assert breaker.state == CircuitBreaker.OPEN
+        assert breaker.get_stats()["times_opened"] == 2
+        clock.now = 50
+        assert breaker.allow_request() is False
+
+    def test_abandoned_probe_expires(self, breaker, clock):
+        """Test: Una prueba que nunca informa su resultado no bloquea el circuito."""
+        for _ in range(4):
+            breaker.record_failure()
+        clock.now = 31
+        assert breaker.allow_request() is True  # prueba cancelada, sin resultado
+
+        clock.now = 50
+        assert breaker.allow_request() is False
+        clock.now = 62
+        assert breaker.allow_request() is True
+
+    def test_release_frees_probe(self, breaker, clock):
+        """Test: `release` devuelve el lugar de la prueba half-open."""
+        for _ in range(4):
+            breaker.record_failure()
+        clock.now = 31
+        assert breaker.allow_request() is True
+
+        breaker.release()
+
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        assert breaker.allow_request() is True
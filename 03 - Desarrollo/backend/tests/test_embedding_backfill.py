@@ -0,0 +1,187 @@
+"""
+Tests unitarios para el backfill de embeddings
+Autor: Sistema de Analizador Financiero
+Fecha: 17 octubre 2026
+"""
+
+import json
+import multiprocessing
+from unittest.mock import Mock, patch
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from app.services.embedding_backfill import (
+    BackfillCheckpoint, BackfillSupervisor, iter_pending_chunks, process_shard
+)
+from app.utils.rate_limiter import SharedRateLimiter
+
+
+def _fake_shard(options, rate_limiter, events):
+    """Shard de prueba: reporta un bloque por tipo y falla el shard 1."""
+    index = options["shard_index"]
+    rate_limiter.acquire_sync(tokens=10)
+    if index == 1:
+        events.put({"shard": index, "error": "RuntimeError: proveedor caído"})
+        raise SystemExit(1)
+    for entity_type in options["entity_types"]:
+        events.put({
+            "shard": index, "entity_type": entity_type,
+            "processed": 3, "skipped": 1, "errors": 0, "last_id": 100 + index
+        })
+    events.put({"shard": index, "done": True})
+
+
+def _reserve_in_child(rate_limiter):
+    rate_limiter.reserve(tokens=600)
+
+
+class TestBackfillCheckpoint:
+    """Tests para el checkpoint persistente del backfill."""
+
+    def test_update_persists_and_resumes(self, tmp_path):
+        """Test: El último ID se guarda y se recupera en una nueva corrida."""
+        path = str(tmp_path / "checkpoint.json")
+        checkpoint = BackfillCheckpoint(path, params={"user_id": None})
+        checkpoint.update("gasto", 500)
+
+        resumed = BackfillCheckpoint(path, params={"user_id": None})
+
+        assert resumed.get("gasto") == 500
+        assert resumed.get("ingreso") == 0
+
+    def test_different_params_start_over(self, tmp_path):
+        """Test: Un checkpoint con otros filtros se descarta."""
+        path = str(tmp_path / "checkpoint.json")
+        BackfillCheckpoint(path, params={"user_id": 1}).update("gasto", 500)
+
+        assert BackfillCheckpoint(path, params={"user_id": 2}).get("gasto") == 0
+
+    def test_reset_and_corrupt_file(self, tmp_path):
+        """Test: reset borra el archivo y un archivo corrupto se ignora."""
+        path = tmp_path / "checkpoint.json"
+        checkpoint = BackfillCheckpoint(str(path))
+        checkpoint.update("ingreso", 10)
+        assert json.loads(path.read_text())["last_ids"] == {"ingreso": 10}
+
+        checkpoint.reset()
+        assert not path.exists()
+
+        path.write_text("{no es json")
+        assert BackfillCheckpoint(str(path)).get("ingreso") == 0
+
+
+class TestIterPendingChunks:
+    """Tests para el recorrido por clave de las entidades pendientes."""
+
+    @staticmethod
+    def _db_with_chunks(*chunks):
+        db = Mock()
+        db.execute.side_effect = [
+            Mock(**{"scalars.return_value.unique.return_value.all.return_value": chunk})
+            for chunk in chunks
+        ]
+        return db
+
+    def test_keyset_pagination(self):
+        """Test: Cada bloque continúa desde el último ID del anterior."""
+        db = self._db_with_chunks(
+            [Mock(id_gasto=3), Mock(id_gasto=7)],
+            [Mock(id_gasto=9)],
+            []
+        )
+
+        chunks = list(iter_pending_chunks(db, "gasto", chunk_size=2, after_id=1))
+
+        assert [[g.id_gasto for g in chunk] for chunk in chunks] == [[3, 7], [9]]
+        params = [
+            call.args[0].compile(dialect=postgresql.dialect()).params
+            for call in db.execute.call_args_list
+        ]
+        assert [p["id_gasto_1"] for p in params] == [1, 7, 9]
+        assert db.expunge_all.call_count == 2
+
+    def test_uses_anti_join(self):
+        """Test: Los existentes se excluyen con LEFT JOIN, no con NOT IN."""
+        db = self._db_with_chunks([])
+
+        list(iter_pending_chunks(db, "ingreso", chunk_size=100, user_id=4))
+
+        sql = str(db.execute.call_args.args[0].compile(dialect=postgresql.dialect()))
+        assert "LEFT OUTER JOIN ingresos_embeddings" in sql
+        assert "ingresos_embeddings.id IS NULL" in sql
+        assert "NOT IN" not in sql
+        assert "ORDER BY ingresos.id_ingreso" in sql
+
+
+class TestShardedBackfill:
+    """Tests para el backfill en paralelo por shards."""
+
+    def test_shard_filter(self):
+        """Test: Cada shard filtra por el módulo de la columna elegida."""
+        db = Mock()
+        db.execute.return_value.scalars.return_value.unique.return_value.all.return_value = []
+
+        list(iter_pending_chunks(db, "gasto", 10, shard=(2, 4), shard_by="usuario"))
+
+        compiled = db.execute.call_args.args[0].compile(
+            dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+        )
+        assert "gastos.id_usuario %% 4 = 2" in str(compiled)
+
+    def test_process_shard_updates_checkpoint_and_emits(self, tmp_path):
+        """Test: Cada bloque confirmado avanza el checkpoint y emite progreso."""
+        chunk = [Mock(id_gasto=4), Mock(id_gasto=8)]
+        checkpoint = BackfillCheckpoint(str(tmp_path / "shard.json"))
+        events = []
+        options = {
+            "entity_types": ["gasto"], "batch_size": 2,
+            "shard_index": 0, "shard_count": 2
+        }
+
+        with patch("app.services.embedding_backfill.iter_pending_chunks", return_value=[chunk]), \
+             patch("app.services.embedding_backfill.embed_and_store", return_value=(1, 0)):
+            process_shard(Mock(), Mock(), options, checkpoint, events.append)
+
+        assert checkpoint.get("gasto") == 8
+        assert events == [{
+            "shard": 0, "entity_type": "gasto",
+            "processed": 1, "skipped": 0, "errors": 1, "last_id": 8
+        }]
+
+    @pytest.mark.skipif(
+        "fork" not in multiprocessing.get_all_start_methods(), reason="requiere fork"
+    )
+    def test_supervisor_aggregates_and_detects_failures(self):
+        """Test: El supervisor suma el progreso y marca los shards fallidos."""
+        supervisor = BackfillSupervisor(
+            workers=3,
+            options={"entity_types": ["gasto", "ingreso"]},
+            requests_per_minute=6000,
+            start_method="fork",
+            target=_fake_shard
+        )
+
+        stats = supervisor.run()
+
+        assert stats["totals"]["gasto"] == {"processed": 6, "skipped": 2, "errors": 0}
+        assert stats["shards"][0]["status"] == "done"
+        assert stats["shards"][2]["last_ids"] == {"gasto": 102, "ingreso": 102}
+        assert stats["shards"][1]["status"] == "failed"
+        assert "proveedor caído" in stats["shards"][1]["error"]
+
+    @pytest.mark.skipif(
+        "fork" not in multiprocessing.get_all_start_methods(), reason="requiere fork"
+    )
+    def test_shared_rate_limiter_across_processes(self):
+        """Test: El consumo de un proceso hijo descuenta del bucket compartido."""
+        context = multiprocessing.get_context("fork")
+        limiter = SharedRateLimiter(requests_per_minute=60, tokens_per_minute=1000, context=context)
+
+        process = context.Process(target=_reserve_in_child, args=(limiter,))
+        process.start()
+        process.join()
+
+        assert limiter.requests.tokens == pytest.approx(59, abs=0.1)
+        assert limiter.tokens.tokens == pytest.approx(400, abs=1)
+        assert limiter.reserve(tokens=600) > 0
@@ -0,0 +1,115 @@
+"""
+Tests unitarios para la carga masiva de embeddings con COPY
+Autor: Sistema de Analizador Financiero
+Fecha: 17 octubre 2026
+"""
+
+import struct
+
+import pytest
+from unittest.mock import Mock
+
+from app.models.embeddings import GastoEmbedding
+from app.services.embedding_bulk_loader import (
+    copy_upsert_embeddings, encode_binary, encode_text, get_copy_writer
+)
+
+
+def _row(gasto_id=1, **values):
+    row = {
+        "gasto_id": gasto_id,
+        "embedding": [0.5, -1.0, 2.25],
+        "texto_original": "Gasto: café",
+        "content_hash": "abc",
+        "model_version": "local:test:3",
+        "metadata": {"monto": 10.0}
+    }
+    row.update(values)
+    return row
+
+
+def _session():
+    """Sesión simulada que expone el cursor de psycopg2."""
+    db = Mock()
+    cursor = db.connection.return_value.connection.cursor.return_value
+    return db, cursor
+
+
+class TestEncoding:
+    """Tests para la serialización de los formatos de COPY."""
+
+    def test_binary_header_and_vector(self):
+        """Test: El formato binario usa el encabezado PGCOPY y el formato de envío de pgvector."""
+        payload = encode_binary("gasto_id", [_row()])
+
+        assert payload.startswith(b"PGCOPY\n\xff\r\n\x00")
+        assert payload.endswith(struct.pack("!h", -1))
+        # 19 bytes de encabezado, cantidad de campos y la FK
+        assert struct.unpack("!h", payload[19:21])[0] == 6
+        assert struct.unpack("!ii", payload[21:29]) == (4, 1)
+        # Vector: longitud, dimensiones, reservado y float4 big-endian
+        length, dims, reserved = struct.unpack("!ihh", payload[29:37])
+        assert (length, dims, reserved) == (4 + 3 * 4, 3, 0)
+        assert struct.unpack("!3f", payload[37:49]) == (0.5, -1.0, 2.25)
+
+    def test_binary_null_fields(self):
+        """Test: Las columnas opcionales vacías se envían como NULL (-1)."""
+        payload = encode_binary("gasto_id", [_row(content_hash=None, model_version=None, metadata=None)])
+        null = struct.pack("!i", -1)
+
+        assert payload.endswith(null * 3 + struct.pack("!h", -1))
+
+    def test_text_escaping(self):
+        """Test: El formato texto escapa tabs, saltos de línea y barras."""
+        payload = encode_text("gasto_id", [_row(texto_original="a\tb\nc\\d", metadata=None)])
+        fields = payload.decode("utf-8").rstrip("\n").split("\t")
+
+        assert fields[0] == "1"
+        assert fields[1] == "[0.5,-1.0,2.25]"
+        assert fields[2] == "a\\tb\\nc\\\\d"
+        assert fields[5] == "\\N"
+
+
+class TestCopyUpsert:
+    """Tests para la escritura con tabla temporal y upsert."""
+
+    def test_copy_then_single_upsert(self):
+        """Test: Carga con COPY en la tabla temporal y la pasa con un único ON CONFLICT."""
+        db, cursor = _session()
+
+        copy_upsert_embeddings(
+            db, GastoEmbedding.__table__, "gasto_id",
+            [_row(1), _row(2), _row(1, texto_original="editado")],
+            copy_format="binary"
+        )
+
+        copy_sql, data = cursor.copy_expert.call_args.args
+        assert "COPY gastos_embeddings_staging" in copy_sql
+        assert "FORMAT binary" in copy_sql
+        # Filas repetidas por FK: gana la última
+        assert data.getvalue().count(b"editado") == 1
+        assert data.getvalue().count(b"Gasto: caf") == 1
+
+        statements = [call.args[0] for call in cursor.execute.call_args_list]
+        assert statements[0].startswith("CREATE TEMP TABLE gastos_embeddings_staging")
+        upserts = [sql for sql in statements if sql.startswith("INSERT INTO gastos_embeddings")]
+        assert len(upserts) == 1
+        assert "ON CONFLICT (gasto_id) DO UPDATE" in upserts[0]
+        cursor.close.assert_called_once()
+
+    def test_empty_values_skip_database(self):
+        """Test: Sin filas no se abre el cursor."""
+        db, cursor = _session()
+
+        copy_upsert_embeddings(db, GastoEmbedding.__table__, "gasto_id", [])
+
+        db.connection.assert_not_called()
+
+    def test_copy_writer_formats(self, monkeypatch):
+        """Test: "off" vuelve al upsert habitual y un formato inválido falla."""
+        monkeypatch.setenv("EMBEDDING_COPY_FORMAT", "text")
+
+        assert get_copy_writer("off") is None
+        assert get_copy_writer(None).keywords == {"copy_format": "text"}
+        with pytest.raises(ValueError):
+            get_copy_writer("csv")
@@ -0,0 +1,146 @@
+"""
+Tests unitarios para EmbeddingCache
+Autor: Sistema de Analizador Financiero
+Fecha: 17 octubre 2026
+"""
+
+import pytest
+from unittest.mock import Mock, patch
+
+from app.services.embedding_cache import EmbeddingCache
+from app.services.query_embedding_cache import QueryEmbeddingCache
+from app.services.embeddings_service import EmbeddingsService
+
+
+class TestEmbeddingCache:
+    """Tests para la caché persistente de embeddings."""
+    
+    @pytest.fixture
+    def cache(self, tmp_path):
+        """Caché en un archivo temporal."""
+        return EmbeddingCache(str(tmp_path / "cache.sqlite3"), max_bytes=10 * 1024 * 1024)
+    
+    def test_put_and_get(self, cache):
+        """Test: Guardar y recuperar un vector."""
+        key = EmbeddingCache.make_key("azure:model:4", "Gasto: Netflix")
+        cache.put(key, [0.5, 0.25, -1.0, 2.0])
+        
+        assert cache.get(key) == [0.5, 0.25, -1.0, 2.0]
+        assert cache.get_stats()["hits"] == 1
+    
+    def test_miss_counts(self, cache):
+        """Test: Una clave inexistente cuenta como fallo."""
+        assert cache.get("no-existe") is None
+        assert cache.get_stats()["misses"] == 1
+    
+    def test_key_depends_on_namespace(self):
+        """Test: El mismo texto con otro modelo tiene otra clave."""
+        assert EmbeddingCache.make_key("azure:a:1536", "texto") != \
+            EmbeddingCache.make_key("gemini:b:768", "texto")
+    
+    def test_persists_between_instances(self, tmp_path):
+        """Test: Las entradas sobreviven a reabrir el archivo."""
+        path = str(tmp_path / "cache.sqlite3")
+        EmbeddingCache(path, max_bytes=1024 * 1024).put("k", [1.0, 2.0])
+        
+        assert EmbeddingCache(path, max_bytes=1024 * 1024).get("k") == [1.0, 2.0]
+    
+    def test_lru_eviction(self, tmp_path):
+        """Test: Al superar el máximo se desalojan las entradas menos usadas."""
+        cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"), max_bytes=3 * 16)
+        cache.put("a", [1.0] * 4)
+        cache.put("b", [2.0] * 4)
+        cache.put("c", [3.0] * 4)
+        cache.get("a")  # "a" pasa a ser la más reciente
+        cache.put("d", [4.0] * 4)
+        
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+        assert cache.get_stats()["size_bytes"] <= 3 * 16
+
+
+class TestEmbeddingsServiceCache:
+    """Tests de integración de la caché con EmbeddingsService."""
+    
+    @pytest.fixture
+    def service(self, tmp_path):
+        """Servicio con caché temporal y cliente simulado."""
+        service = EmbeddingsService()
+        service.client = Mock()
+        service.cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"), max_bytes=10 * 1024 * 1024)
+        return service
+    
+    def test_generate_embedding_uses_cache(self, service):
+        """Test: El segundo pedido del mismo texto no llama al proveedor."""
+        service.client.embeddings.create.return_value = Mock(data=[Mock(embedding=[0.5] * 1536)])
+        
+        first = service.generate_embedding("Gasto: Netflix | Categoría: Suscripciones")
+        second = service.generate_embedding("Gasto:  Netflix | Categoría: Suscripciones")
+        
+        assert first == second
+        service.client.embeddings.create.assert_called_once()
+    
+    def test_batch_deduplicates_and_caches(self, service):
+        """Test: Los textos repetidos o en caché no se envían al proveedor."""
+        service.cache.put(
+            EmbeddingCache.make_key(service.cache_namespace, "sueldo"), [0.25] * 1536
+        )
+        service.client.embeddings.create.return_value = Mock(
+            data=[Mock(embedding=[0.5] * 1536, index=0)],
+            usage=Mock(total_tokens=5)
+        )
+        
+        result = service.generate_embeddings_batch(["netflix", "sueldo", "netflix"])
+        
+        assert result == [[0.5] * 1536, [0.25] * 1536, [0.5] * 1536]
+        _, kwargs = service.client.embeddings.create.call_args
+        assert kwargs["input"] == ["netflix"]
+
+
+class TestQueryEmbeddingCache:
+    """Tests para la caché en memoria de embeddings de consultas."""
+    
+    def test_normalized_queries_share_entry(self):
+        """Test: Mayúsculas y espacios no generan entradas distintas."""
+        cache = QueryEmbeddingCache(max_bytes=1024 * 1024, ttl_seconds=60)
+        cache.put("ns", "¿En qué gasté más  este mes?", [0.5] * 8)
+        
+        assert cache.get("ns", "¿en qué gasté más este mes? ") == [0.5] * 8
+        assert cache.get("otro-ns", "¿en qué gasté más este mes?") is None
+    
+    def test_expired_entries_are_dropped(self):
+        """Test: Las entradas vencidas no se devuelven."""
+        cache = QueryEmbeddingCache(max_bytes=1024 * 1024, ttl_seconds=60)
+        
+        with patch("app.services.query_embedding_cache.time.monotonic", return_value=0.0):
+            cache.put("ns", "hola", [1.0] * 8)
+        with patch("app.services.query_embedding_cache.time.monotonic", return_value=61.0):
+            assert cache.get("ns", "hola") is None
+        
+        stats = cache.get_stats()
+        assert stats["expirations"] == 1 and stats["entries"] == 0
+    
+    def test_lru_eviction_by_bytes(self):
+        """Test: Al superar el tope se desaloja la entrada menos usada."""
+        cache = QueryEmbeddingCache(max_bytes=2 * 8 * 4, ttl_seconds=60)  # dos vectores
+        cache.put("ns", "a", [1.0] * 8)
+        cache.put("ns", "b", [2.0] * 8)
+        cache.get("ns", "a")
+        cache.put("ns", "c", [3.0] * 8)
+        
+        assert cache.get("ns", "b") is None
+        assert cache.get("ns", "a") == [1.0] * 8
+        assert cache.get_stats()["evictions"] == 1
+    
+    def test_service_query_embedding_uses_cache(self):
+        """Test: Una consulta repetida no vuelve a llamar al proveedor."""
+        service = EmbeddingsService()
+        service.client = Mock()
+        service.client.embeddings.create.return_value = Mock(data=[Mock(embedding=[0.5] * 1536)])
+        service.query_cache = QueryEmbeddingCache(max_bytes=1024 * 1024, ttl_seconds=60)
+        
+        first = service.generate_query_embedding("¿En qué gasté más?")
+        second = service.generate_query_embedding("¿en qué gasté más?")
+        
+        assert first == second
+        service.client.embeddings.create.assert_called_once()
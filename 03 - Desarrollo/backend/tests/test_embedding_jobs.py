@@ -0,0 +1,119 @@
+"""
+Tests unitarios para los trabajos de generación de embeddings en lote
+Autor: Sistema de Analizador Financiero
+Fecha: 17 octubre 2026
+"""
+
+import pytest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import Mock, patch
+
+from app.models.embedding_job import EmbeddingJob
+from app.services.embedding_jobs import create_job, run_embedding_job
+
+
+def _job(**values):
+    defaults = dict(
+        id=7, id_usuario=3, entity_type="gasto", entity_ids=None, force_regenerate=False,
+        status=EmbeddingJob.QUEUED, total=None, last_id=0, started_at=None,
+        updated_at=datetime.now(timezone.utc)
+    )
+    defaults.update(values)
+    return Mock(**defaults)
+
+
+def _session(job):
+    """Sesión simulada que registra cada UPDATE del trabajo."""
+    db = Mock()
+    db.get.return_value = job
+    db.updates = []
+    db.query.return_value.filter.return_value.update.side_effect = (
+        lambda values, **kwargs: db.updates.append(values)
+    )
+    return db
+
+
+class TestRunEmbeddingJob:
+    """Tests para la ejecución de un trabajo."""
+
+    @pytest.fixture
+    def service(self):
+        return Mock(model_version="azure:text-embedding-3-small:1536")
+
+    def test_processes_chunks_with_own_session(self, service):
+        """Test: El trabajo abre y cierra su sesión y confirma avance por bloque."""
+        db = _session(_job())
+        chunks = [[Mock(id_gasto=1), Mock(id_gasto=2)], [Mock(id_gasto=5)]]
+
+        with patch("app.services.embedding_jobs.count_pending", return_value=3), \
+             patch("app.services.embedding_jobs.iter_pending_chunks", return_value=iter(chunks)) as pending, \
+             patch("app.services.embedding_jobs.embed_and_store", side_effect=[(2, 0), (0, 0)]) as store:
+            run_embedding_job(7, session_factory=lambda: db, embeddings_service=service)
+
+        # Anti-join acotado al usuario, sin cargar todo de una vez
+        kwargs = pending.call_args.kwargs
+        assert kwargs["user_id"] == 3 and kwargs["include_existing"] is False
+        assert store.call_count == 2
+
+        assert db.updates[0]["status"] == EmbeddingJob.RUNNING
+        assert db.updates[0]["total"] == 3
+        assert db.updates[1]["last_id"] == 2
+        assert db.updates[2]["last_id"] == 5
+        assert db.updates[-1]["status"] == EmbeddingJob.COMPLETED
+        assert db.commit.call_count == 4
+        db.close.assert_called_once()
+
+    def test_resumes_from_last_id(self, service):
+        """Test: Un trabajo reanudado continúa desde el último bloque confirmado."""
+        db = _session(_job(last_id=40, total=100, started_at=datetime.now(timezone.utc)))
+
+        with patch("app.services.embedding_jobs.count_pending") as count, \
+             patch("app.services.embedding_jobs.iter_pending_chunks", return_value=iter([])) as pending:
+            run_embedding_job(7, session_factory=lambda: db, embeddings_service=service)
+
+        count.assert_not_called()
+        assert pending.call_args.args[3] == 40
+        assert db.updates[-1]["status"] == EmbeddingJob.COMPLETED
+
+    def test_failure_marks_job(self, service):
+        """Test: Un error deja el trabajo como fallido con el mensaje."""
+        db = _session(_job())
+
+        with patch("app.services.embedding_jobs.count_pending", return_value=1), \
+             patch("app.services.embedding_jobs.iter_pending_chunks", return_value=iter([[Mock(id_gasto=1)]])), \
+             patch("app.services.embedding_jobs.embed_and_store", side_effect=RuntimeError("sin conexión")):
+            run_embedding_job(7, session_factory=lambda: db, embeddings_service=service)
+
+        assert db.updates[-1]["status"] == EmbeddingJob.FAILED
+        assert db.updates[-1]["error_message"] == "sin conexión"
+        db.rollback.assert_called()
+        db.close.assert_called_once()
+
+
+class TestCreateJob:
+    """Tests para el registro de trabajos."""
+
+    def test_returns_active_job(self):
+        """Test: Un segundo pedido retorna el trabajo en curso sin lanzar otro."""
+        active = _job(status=EmbeddingJob.RUNNING)
+        db = Mock()
+        db.query.return_value.filter.return_value.first.return_value = active
+
+        job, should_run = create_job(db, 3, "gasto")
+
+        assert job is active and should_run is False
+        db.add.assert_not_called()
+
+    def test_resumes_stale_job(self):
+        """Test: Un trabajo sin avance hace tiempo se vuelve a encolar."""
+        stale = _job(
+            status=EmbeddingJob.RUNNING,
+            updated_at=datetime.now(timezone.utc) - timedelta(hours=2)
+        )
+        db = Mock()
+        db.query.return_value.filter.return_value.first.return_value = stale
+
+        job, should_run = create_job(db, 3, "gasto")
+
+        assert job is stale and should_run is True
+        assert stale.status == EmbeddingJob.QUEUED
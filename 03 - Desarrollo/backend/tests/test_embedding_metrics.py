@@ -0,0 +1,85 @@
+"""
+Tests unitarios para EmbeddingMetrics
+Autor: Sistema de Analizador Financiero
+Fecha: 17 octubre 2026
+"""
+
+import pytest
+from unittest.mock import Mock, patch
+
+from app.services.embedding_metrics import EmbeddingMetrics
+from app.services.embeddings_service import EmbeddingsService
+
+
+class TestEmbeddingMetrics:
+    """Tests para el registro de métricas de embeddings."""
+
+    def test_counters_and_percentiles(self):
+        """Test: Se acumulan contadores y se calculan percentiles de latencia."""
+        metrics = EmbeddingMetrics()
+        for i in range(1, 101):
+            metrics.record_call("azure", batch_size=10, latency=i / 100, tokens=50, cost_usd=0.001)
+        metrics.record_failure("azure", batch_size=10)
+        metrics.record_retry("azure")
+
+        stats = metrics.get_stats()["azure"]
+
+        assert stats["calls"] == 100 and stats["texts"] == 1000
+        assert stats["tokens"] == 5000
+        assert stats["cost_usd"] == pytest.approx(0.1)
+        assert stats["failures"] == 1 and stats["retries"] == 1
+        assert stats["latency_seconds"]["p50"] == pytest.approx(0.505, abs=0.01)
+        assert stats["latency_seconds"]["p99"] == pytest.approx(0.99, abs=0.01)
+        assert stats["batch_size_buckets"]["le_16"] == 101
+
+    def test_prometheus_format(self):
+        """Test: La exportación incluye contadores, resumen e histograma."""
+        metrics = EmbeddingMetrics()
+        metrics.record_call("gemini", batch_size=3, latency=0.2, tokens=30, cost_usd=0.0)
+
+        text = metrics.render_prometheus()
+
+        assert 'embedding_requests_total{provider="gemini"} 1' in text
+        assert 'embedding_request_latency_seconds{provider="gemini",quantile="0.5"} 0.2' in text
+        assert 'embedding_batch_size_bucket{provider="gemini",le="4"} 1' in text
+        assert "# TYPE embedding_batch_size histogram" in text
+
+
+class TestEmbeddingsServiceMetrics:
+    """Tests de la instrumentación de EmbeddingsService."""
+
+    @pytest.fixture
+    def service(self):
+        """Servicio con métricas propias y sin límites de tasa."""
+        service = EmbeddingsService()
+        service.metrics = EmbeddingMetrics()
+        service.requests_per_minute = 0
+        service.tokens_per_minute = 0
+        service.cache_namespace = f"test-metrics:{id(service)}"
+        return service
+
+    def test_batch_records_calls_and_retries(self, service):
+        """Test: Un lote con un fallo transitorio registra reintento, fallo y llamada."""
+        fake_batch = Mock(side_effect=[
+            RuntimeError("429"),
+            ([[1.0] * 1536, [2.0] * 1536], 500_000)
+        ])
+
+        with patch.object(service, "_generate_provider_batch", fake_batch), \
+             patch("app.services.embeddings_service.time.sleep"):
+            service.generate_embeddings_batch(["uno", "dos"])
+
+        stats = service.metrics.get_stats()["azure"]
+        assert stats["calls"] == 1 and stats["texts"] == 2
+        assert stats["failures"] == 1 and stats["retries"] == 1
+        assert stats["tokens"] == 500_000
+        assert stats["cost_usd"] == pytest.approx(0.01)
+
+    def test_get_stats(self, service):
+        """Test: get_stats expone configuración y métricas."""
+        stats = service.get_stats()
+
+        assert stats["model"] == "text-embedding-3-small"
+        assert stats["dimensions"] == 1536
+        assert stats["cost_per_1m_tokens"] == 0.02
+        assert stats["metrics"] == {}
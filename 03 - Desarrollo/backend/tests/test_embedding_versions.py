@@ -0,0 +1,113 @@
+"""
+Tests unitarios para el versionado de embeddings
+Autor: Sistema de Analizador Financiero
+Fecha: 17 octubre 2026
+"""
+
+import pytest
+from unittest.mock import Mock, patch
+
+from sqlalchemy.dialects import postgresql
+
+from app.services.embedding_backfill import iter_pending_chunks
+from app.services.embedding_versions import (
+    embedding_table, get_active_model_version, invalidate_active_version_cache
+)
+from app.services.embedding_worker import embed_and_store
+from app.services.vector_search_service import VectorSearchService
+
+
+@pytest.fixture(autouse=True)
+def clear_version_cache():
+    """Cada test empieza sin versión activa cacheada."""
+    invalidate_active_version_cache()
+    yield
+    invalidate_active_version_cache()
+
+
+def _db_with_active_version(version):
+    db = Mock()
+    db.execute.return_value.scalar.return_value = version
+    return db
+
+
+class TestEmbeddingVersions:
+    """Tests para las tablas y la versión activa."""
+
+    def test_shadow_table(self):
+        """Test: La tabla sombra tiene la misma estructura que la activa."""
+        active = embedding_table("gasto")
+        shadow = embedding_table("gasto", "shadow")
+
+        assert shadow.name == "gastos_embeddings_shadow"
+        assert shadow.c.keys() == active.c.keys()
+        assert "model_version" in shadow.c
+        with pytest.raises(ValueError):
+            embedding_table("gasto", "retired")
+
+    def test_active_version_is_cached(self):
+        """Test: La versión activa se lee una vez dentro de la vigencia."""
+        db = _db_with_active_version("gemini:models/text-embedding-004:768")
+
+        first = get_active_model_version(db, max_age=60)
+        second = get_active_model_version(db, max_age=60)
+
+        assert first == second == "gemini:models/text-embedding-004:768"
+        assert db.execute.call_count == 1
+
+    def test_search_skipped_after_cutover(self):
+        """Test: No se busca con consultas de un modelo que ya no es el activo."""
+        service = VectorSearchService(_db_with_active_version("gemini:models/text-embedding-004:768"))
+
+        assert service.check_model_version("gemini:models/text-embedding-004:768") is True
+        invalidate_active_version_cache()
+        assert service.check_model_version("azure:text-embedding-3-small:1536") is False
+
+    def test_unregistered_versions_allow_search(self):
+        """Test: Sin versiones registradas se mantiene el comportamiento previo."""
+        service = VectorSearchService(_db_with_active_version(None))
+
+        assert service.check_model_version("azure:text-embedding-3-small:1536") is True
+
+
+class TestShadowBackfill:
+    """Tests para el llenado de la versión sombra."""
+
+    def test_pending_includes_rows_edited_after_copy(self):
+        """Test: Son pendientes las filas sin sombra y las editadas en la tabla activa."""
+        db = Mock()
+        db.execute.return_value.scalars.return_value.unique.return_value.all.return_value = []
+
+        list(iter_pending_chunks(db, "gasto", 10, target="shadow"))
+
+        sql = str(db.execute.call_args.args[0].compile(dialect=postgresql.dialect()))
+        assert "LEFT OUTER JOIN gastos_embeddings_shadow" in sql
+        assert "LEFT OUTER JOIN gastos_embeddings ON" in sql
+        assert (
+            "gastos_embeddings_shadow.id IS NULL OR "
+            "gastos_embeddings.updated_at > gastos_embeddings_shadow.updated_at"
+        ) in sql
+
+    def test_embed_and_store_writes_shadow_with_version(self):
+        """Test: Los embeddings se guardan en la sombra con su versión de modelo."""
+        service = Mock(model_version="local:local-hashing-v1:768")
+        service.build_ingreso_text.return_value = "Ingreso: Sueldo"
+        service.generate_embeddings_batch_versioned.return_value = (
+            [[0.1] * 768], ["local:local-hashing-v1:768"]
+        )
+        service.content_hash.return_value = "abc"
+        ingreso = Mock(
+            id_ingreso=5, categoria=None, descripcion="Sueldo", monto=100,
+            moneda="ARS", fecha=None, fuente=None
+        )
+
+        with patch("app.services.embedding_worker.upsert_embeddings") as upsert:
+            saved, unchanged = embed_and_store(
+                Mock(), "ingreso", [ingreso], service, force=True, target="shadow"
+            )
+
+        assert (saved, unchanged) == (1, 0)
+        table, id_column, values = upsert.call_args.args[1:]
+        assert table.name == "ingresos_embeddings_shadow"
+        assert id_column == "ingreso_id"
+        assert values[0]["model_version"] == "local:local-hashing-v1:768"
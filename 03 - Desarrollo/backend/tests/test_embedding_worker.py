@@ -0,0 +1,188 @@
+"""
+Tests unitarios para EmbeddingWorker
+Autor: Sistema de Analizador Financiero
+Fecha: 17 octubre 2026
+"""
+
+import time
+import pytest
+from unittest.mock import Mock, patch
+
+from fastapi import HTTPException
+from sqlalchemy.dialects import postgresql
+
+from app.api.api_v1.endpoints.categorias import reembed_categoria
+from app.services.embedding_worker import (
+    EmbeddingWorker, gasto_to_dict, category_text_changed, reembed_category
+)
+from app.services.embeddings_service import EmbeddingsService
+
+
+class TestEmbeddingWorker:
+    """Tests para el worker que agrupa la generación de embeddings."""
+
+    @pytest.fixture
+    def worker(self):
+        """Worker con ventana larga para controlar el procesamiento desde el test."""
+        worker = EmbeddingWorker(window_seconds=60, max_batch=3, session_factory=Mock())
+        yield worker
+        worker.stop(timeout=1)
+
+    def test_enqueue_deduplicates_ids(self, worker):
+        """Test: Los IDs repetidos se procesan una sola vez y en un solo ciclo."""
+        with patch.object(worker, "_process_chunk", side_effect=lambda t, ids: len(ids)) as process:
+            worker.enqueue("gasto", [1, 2])
+            worker.enqueue("gasto", [2, 1])
+            worker.enqueue("ingreso", [7])
+            worker.flush()
+
+        calls = [c.args for c in process.call_args_list]
+        assert ("gasto", [1, 2]) in calls
+        assert ("ingreso", [7]) in calls
+        assert len(calls) == 2
+        assert worker.stats["processed"] == 3
+
+    def test_chunks_respect_max_batch(self, worker):
+        """Test: Los IDs se procesan en bloques de max_batch."""
+        with patch.object(worker, "_process_chunk", side_effect=lambda t, ids: len(ids)) as process:
+            worker.enqueue("gasto", range(1, 8))
+            worker.flush()
+
+        assert [len(c.args[1]) for c in process.call_args_list] == [3, 3, 1]
+
+    def test_failed_chunk_is_counted(self, worker):
+        """Test: Un error en un bloque no detiene al worker."""
+        with patch.object(worker, "_process_chunk", side_effect=RuntimeError("db caída")):
+            worker.enqueue("ingreso", [1, 2])
+            worker.flush()
+
+        assert worker.stats["failed"] == 2
+
+    def test_invalid_entity_type(self, worker):
+        """Test: Un tipo de entidad desconocido es rechazado."""
+        with pytest.raises(ValueError):
+            worker.enqueue("factura", [1])
+
+    def test_background_thread_processes_after_window(self):
+        """Test: El hilo procesa lo pendiente al cerrar la ventana."""
+        worker = EmbeddingWorker(window_seconds=0.05, max_batch=100, session_factory=Mock())
+
+        with patch.object(worker, "_process_chunk", side_effect=lambda t, ids: len(ids)) as process:
+            worker.enqueue("gasto", [10])
+            worker.enqueue("gasto", [11])
+
+            deadline = time.monotonic() + 2
+            while not process.called and time.monotonic() < deadline:
+                time.sleep(0.01)
+            worker.stop(timeout=1)
+
+        process.assert_called_once_with("gasto", [10, 11])
+
+    def test_unchanged_text_skips_provider_and_write(self, worker):
+        """Test: Si el texto no cambió no se llama al proveedor ni se escribe."""
+        service = EmbeddingsService()
+        service.generate_embeddings_batch = Mock(return_value=[])
+        gasto = Mock(
+            id_gasto=1, categoria=None, descripcion="Netflix", monto=10,
+            moneda="ARS", fecha=None, comercio=None, fuente=None
+        )
+        stored_hash = service.content_hash(service.build_gasto_text(gasto_to_dict(gasto)))
+
+        db = Mock()
+        gastos_query, stored_query = Mock(), Mock()
+        gastos_query.options.return_value.filter.return_value.all.return_value = [gasto]
+        stored_query.filter.return_value = [(1, stored_hash, None)]
+        db.query.side_effect = [gastos_query, stored_query]
+        worker.session_factory = Mock(return_value=db)
+
+        with patch("app.services.embedding_worker.get_embeddings_service", return_value=service), \
+             patch("app.services.embedding_worker.is_model_version_active", return_value=True):
+            resolved = worker._process_chunk("gasto", [1])
+
+        assert resolved == 1
+        assert worker.stats["unchanged"] == 1
+        service.generate_embeddings_batch.assert_called_once_with([])
+        db.execute.assert_not_called()
+
+    def test_inactive_model_version_skips_chunk(self, worker):
+        """Test: Tras un cutover a otro modelo el worker no escribe vectores viejos."""
+        service = EmbeddingsService()
+        service.generate_embeddings_batch = Mock()
+        db = Mock()
+        worker.session_factory = Mock(return_value=db)
+
+        with patch("app.services.embedding_worker.get_embeddings_service", return_value=service), \
+             patch("app.services.embedding_worker.is_model_version_active", return_value=False):
+            resolved = worker._process_chunk("gasto", [1, 2])
+
+        assert resolved == 0
+        service.generate_embeddings_batch.assert_not_called()
+        db.query.assert_not_called()
+
+
+class TestCategoryReembed:
+    """Tests para el re-embedding al renombrar una categoría."""
+
+    @staticmethod
+    def _db(gasto_ids, ingreso_ids):
+        db = Mock()
+        db.execute.return_value.scalars.side_effect = [iter(gasto_ids), iter(ingreso_ids)]
+        return db
+
+    def test_only_text_fields_trigger(self):
+        """Test: Solo los cambios de nombre afectan a los embeddings."""
+        categoria = Mock(nombre="Comida", icono="🍔", color="#fff")
+
+        assert category_text_changed(categoria, {"nombre": "Supermercado"})
+        assert not category_text_changed(categoria, {"nombre": "Comida", "color": "#000"})
+        assert not category_text_changed(categoria, {"icono": "🛒"})
+
+    def test_dry_run_only_counts(self):
+        """Test: El dry run cuenta los afectados sin encolar."""
+        worker = Mock()
+        db = self._db([1, 2, 3], [9])
+
+        counts = reembed_category(db, 4, dry_run=True, worker=worker)
+
+        assert counts == {"gasto": 3, "ingreso": 1}
+        worker.enqueue.assert_not_called()
+
+    def test_enqueues_only_embedded_rows_of_category(self):
+        """Test: Se encolan solo los registros de la categoría que tienen embedding."""
+        worker = Mock()
+        db = self._db([1, 2], [])
+
+        reembed_category(db, 4, worker=worker)
+
+        worker.enqueue.assert_called_once_with("gasto", [1, 2])
+        sql = str(db.execute.call_args_list[0].args[0].compile(
+            dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+        ))
+        assert "JOIN gastos_embeddings ON gastos_embeddings.gasto_id = gastos.id_gasto" in sql
+        assert "gastos.id_categoria = 4" in sql
+
+    @pytest.mark.parametrize("owner_id", [8, None])
+    def test_endpoint_requires_owner(self, owner_id):
+        """Test: Solo el dueño re-embebe su categoría; ni la ajena ni la global."""
+        db = Mock()
+        db.query.return_value.filter.return_value.first.return_value = Mock(id_usuario=owner_id)
+
+        with patch("app.api.api_v1.endpoints.categorias.reembed_category") as reembed:
+            with pytest.raises(HTTPException) as error:
+                reembed_categoria(4, dry_run=False, db=db, current_user=Mock(id_usuario=7))
+
+        assert error.value.status_code == 403
+        reembed.assert_not_called()
+
+    def test_endpoint_owner_allowed(self):
+        """Test: El dueño obtiene el conteo de afectados."""
+        db = Mock()
+        db.query.return_value.filter.return_value.first.return_value = Mock(id_usuario=7)
+
+        with patch(
+            "app.api.api_v1.endpoints.categorias.reembed_category",
+            return_value={"gasto": 2, "ingreso": 0}
+        ):
+            result = reembed_categoria(4, dry_run=True, db=db, current_user=Mock(id_usuario=7))
+
+        assert result["gastos"] == 2
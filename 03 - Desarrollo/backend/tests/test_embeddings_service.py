@@ -4,12 +4,16 @@ Autor: Sistema de Analizador Financiero
 Fecha: 12 noviembre 2025
 """
 
+import asyncio
+import threading
 import pytest
 import numpy as np
 from unittest.mock import Mock, patch, MagicMock
 from datetime import datetime, date
 
 from app.services.embeddings_service import EmbeddingsService
+from app.utils.circuit_breaker import CircuitBreaker
+from app.utils.rate_limiter import RateLimiter
 from app.models.gasto import Gasto
 from app.models.ingreso import Ingreso
 from app.models.embeddings import GastoEmbedding, IngresoEmbedding
@@ -261,6 +265,304 @@ class TestEmbeddingsService:
         assert embedding is None or len(embedding) == 0
 
 
+class TestEmbeddingsBatch:
+    """Tests para la generación de embeddings en lote."""
+    
+    @pytest.fixture
+    def service(self):
+        """Servicio con cliente de Azure simulado."""
+        service = EmbeddingsService()
+        service.client = Mock()
+        return service
+    
+    @staticmethod
+    def _azure_response(vectors):
+        """Arma una respuesta de Azure con los índices invertidos."""
+        data = [Mock(embedding=v, index=i) for i, v in enumerate(vectors)]
+        return Mock(data=list(reversed(data)), usage=Mock(total_tokens=10 * len(vectors)))
+    
+    def test_batch_preserves_order(self, service):
+        """Test: Los resultados respetan el orden de entrada."""
+        vectors = [[float(i)] * 1536 for i in range(3)]
+        service.client.embeddings.create.return_value = self._azure_response(vectors)
+        
+        result = service.generate_embeddings_batch(["a", "b", "c"])
+        
+        assert [r[0] for r in result] == [0.0, 1.0, 2.0]
+        service.client.embeddings.create.assert_called_once()
+    
+    def test_batch_skips_empty_texts(self, service):
+        """Test: Los textos vacíos devuelven None sin llamar a la API."""
+        service.client.embeddings.create.return_value = self._azure_response([[0.5] * 1536])
+        
+        result = service.generate_embeddings_batch(["", "texto", "   "])
+        
+        assert result[0] is None and result[2] is None
+        assert result[1] == [0.5] * 1536
+    
+    def test_batch_respects_item_limit(self, service):
+        """Test: Los lotes se cortan según batch_size."""
+        items = [(i, "texto") for i in range(5)]
+        
+        batches = service._build_batches(items, batch_size=2)
+        
+        assert [len(b) for b in batches] == [2, 2, 1]
+    
+    def test_batch_respects_token_budget(self, service):
+        """Test: Los lotes se cortan según el presupuesto de tokens."""
+        service.max_batch_tokens = 10
+        items = [(i, "x" * 24) for i in range(4)]  # ~6 tokens cada uno
+        
+        batches = service._build_batches(items)
+        
+        assert [len(b) for b in batches] == [1, 1, 1, 1]
+    
+    def test_batch_isolates_failing_item(self, service):
+        """Test: Un texto que falla no invalida al resto del lote."""
+        def fake_batch(texts):
+            if "malo" in texts:
+                raise ValueError("input inválido")
+            return [[1.0] * 1536 for _ in texts], len(texts)
+        
+        with patch.object(service, "_generate_provider_batch", side_effect=fake_batch):
+            result = service.generate_embeddings_batch(
+                ["uno", "malo", "tres", "cuatro"], retry_count=1
+            )
+        
+        assert result[1] is None
+        assert all(result[i] == [1.0] * 1536 for i in (0, 2, 3))
+
+
+class TestContentHash:
+    """Tests para el hash de contenido de los embeddings."""
+    
+    @pytest.fixture
+    def service(self):
+        return EmbeddingsService()
+    
+    def test_hash_ignores_whitespace(self, service):
+        """Test: El hash se calcula sobre el texto preprocesado."""
+        assert service.content_hash("Gasto:  Netflix") == service.content_hash("Gasto: Netflix")
+    
+    def test_hash_depends_on_model(self, service):
+        """Test: Cambiar de modelo cambia el hash."""
+        before = service.content_hash("Gasto: Netflix")
+        service.cache_namespace = "gemini:models/text-embedding-004:768"
+        
+        assert service.content_hash("Gasto: Netflix") != before
+    
+    def test_is_embedding_current(self, service):
+        """Test: Se compara por hash, o por texto en filas sin hash."""
+        stored = service.content_hash("Gasto: Netflix")
+        
+        assert service.is_embedding_current(stored, None, "Gasto: Netflix")
+        assert not service.is_embedding_current(stored, None, "Gasto: Spotify")
+        assert service.is_embedding_current(None, "Gasto: Netflix", "Gasto: Netflix")
+        assert not service.is_embedding_current(None, None, "Gasto: Netflix")
+
+
+class TestEmbeddingsAsync:
+    """Tests para la API async y los límites de tasa."""
+    
+    @pytest.fixture
+    def service(self):
+        """Servicio con límites de tasa deshabilitados."""
+        service = EmbeddingsService()
+        service.requests_per_minute = 0
+        service.tokens_per_minute = 0
+        service.cache_namespace = f"test-async:{id(service)}"
+        return service
+    
+    @pytest.mark.asyncio
+    async def test_async_batch_preserves_order(self, service):
+        """Test: El lote async respeta el orden de entrada."""
+        async def fake_batch(texts, client):
+            return [[float(len(t))] * 1536 for t in texts], len(texts)
+        
+        with patch.object(service, "_agenerate_provider_batch", side_effect=fake_batch):
+            result = await service.agenerate_embeddings_batch(["a", "bb", "", "ccc"], batch_size=1)
+        
+        assert result[2] is None
+        assert [result[i][0] for i in (0, 1, 3)] == [1.0, 2.0, 3.0]
+    
+    @pytest.mark.asyncio
+    async def test_async_respects_concurrency(self, service):
+        """Test: No se superan los requests simultáneos configurados."""
+        service.max_concurrency = 2
+        active = {"now": 0, "max": 0}
+        
+        async def fake_batch(texts, client):
+            active["now"] += 1
+            active["max"] = max(active["max"], active["now"])
+            await asyncio.sleep(0.01)
+            active["now"] -= 1
+            return [[1.0] * 1536 for _ in texts], len(texts)
+        
+        with patch.object(service, "_agenerate_provider_batch", side_effect=fake_batch):
+            result = await service.agenerate_embeddings_batch(
+                [f"texto {i}" for i in range(6)], batch_size=1
+            )
+        
+        assert all(r is not None for r in result)
+        assert active["max"] == 2
+    
+    @pytest.mark.asyncio
+    async def test_async_single_embedding(self, service):
+        """Test: agenerate_embedding retorna un único vector."""
+        async def fake_batch(texts, client):
+            return [[0.25] * 1536], 3
+        
+        with patch.object(service, "_agenerate_provider_batch", side_effect=fake_batch):
+            result = await service.agenerate_embedding("Compra en supermercado")
+        
+        assert result == [0.25] * 1536
+    
+    @pytest.mark.asyncio
+    async def test_async_disk_cache_off_event_loop(self, service):
+        """Test: La caché persistente se usa fuera del hilo del event loop."""
+        loop_thread = threading.get_ident()
+        threads = []
+        prepare, collect = service._prepare_batch, service._collect_batch
+        
+        def spy(method):
+            def wrapper(*args):
+                threads.append(threading.get_ident())
+                return method(*args)
+            return wrapper
+        
+        async def fake_batch(texts, client):
+            return [[1.0] * 1536 for _ in texts], len(texts)
+        
+        with patch.object(service, "_prepare_batch", spy(prepare)), \
+             patch.object(service, "_collect_batch", spy(collect)), \
+             patch.object(service, "_agenerate_provider_batch", side_effect=fake_batch):
+            result = await service.agenerate_embeddings_batch(["texto async"])
+        
+        assert result[0] is not None
+        assert len(threads) == 2 and loop_thread not in threads
+    
+    @pytest.mark.asyncio
+    async def test_cancelled_probe_releases_breaker(self, service):
+        """Test: Cancelar la llamada de prueba half-open no deja el circuito bloqueado."""
+        service.cache = None
+        breaker = service._get_circuit_breaker()
+        for _ in range(breaker.min_calls):
+            breaker.record_failure()
+        breaker.open_seconds = 0
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        breaker.open_seconds = 3600  # el lugar de la prueba no vence solo
+        started = asyncio.Event()
+        
+        async def hanging_batch(texts, client):
+            started.set()
+            await asyncio.sleep(3600)
+        
+        with patch.object(service, "_agenerate_provider_batch", side_effect=hanging_batch):
+            task = asyncio.create_task(service.agenerate_embeddings_batch(["Pago de luz"]))
+            await started.wait()
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+        
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        assert breaker.allow_request() is True
+    
+    def test_rate_limiter_waits_when_exhausted(self):
+        """Test: El bucket pide esperar cuando se agota el cupo."""
+        limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=600)
+        
+        assert limiter.reserve(tokens=600) == 0.0
+        wait = limiter.reserve(tokens=60)
+        
+        assert 5.0 < wait <= 6.1  # 60 tokens a 10 tokens/segundo
+
+
+class TestCircuitBreakerFallback:
+    """Tests para el circuit breaker y el proveedor de respaldo."""
+    
+    @pytest.fixture(autouse=True)
+    def breaker_env(self, monkeypatch):
+        """El circuito se abre con el primer fallo."""
+        monkeypatch.setenv("EMBEDDING_BREAKER_MIN_CALLS", "1")
+        monkeypatch.setenv("EMBEDDING_BREAKER_FAILURE_RATE", "0.5")
+    
+    @staticmethod
+    def _failing(texts):
+        raise RuntimeError("503")
+    
+    def test_open_circuit_fails_fast(self):
+        """Test: Con el circuito abierto no se llama al proveedor ni se espera."""
+        service = EmbeddingsService()
+        provider = Mock(side_effect=self._failing)
+        
+        with patch.object(service, "_generate_provider_batch", provider), \
+             patch("app.services.embeddings_service.time.sleep") as sleep:
+            first = service.generate_embeddings_batch(["uno", "dos"])
+            second = service.generate_embeddings_batch(["tres"])
+        
+        assert first == [None, None] and second == [None]
+        assert provider.call_count == 1  # ni reintentos ni división del lote
+        sleep.assert_not_called()
+        assert service.get_stats()["circuit_breaker"]["state"] == "open"
+    
+    def test_interchangeable_fallback(self, monkeypatch):
+        """Test: Un deployment secundario del mismo modelo responde si el principal falla."""
+        monkeypatch.setenv("EMBEDDING_FALLBACK_PROVIDER", "azure")
+        monkeypatch.setenv("AZURE_OPENAI_FALLBACK_ENDPOINT", "https://secundario.openai.azure.com/")
+        service = EmbeddingsService()
+        fallback = service._get_fallback()
+        
+        with patch.object(service, "_generate_provider_batch", side_effect=self._failing), \
+             patch.object(fallback, "_generate_provider_batch",
+                          return_value=([[0.5] * 1536], 3)):
+            result = service.generate_embeddings_batch(["uno"])
+        
+        assert fallback.endpoint == "https://secundario.openai.azure.com/"
+        assert result == [[0.5] * 1536]
+        assert service._get_circuit_breaker() is not fallback._get_circuit_breaker()
+    
+    def test_single_dimension_mismatch_uses_fallback(self, monkeypatch):
+        """Test: Si el principal responde otras dimensiones, generate_embedding pide al respaldo."""
+        monkeypatch.setenv("EMBEDDING_FALLBACK_PROVIDER", "azure")
+        monkeypatch.setenv("AZURE_OPENAI_FALLBACK_ENDPOINT", "https://secundario.openai.azure.com/")
+        service = EmbeddingsService()
+        service.cache = None
+        fallback = service._get_fallback()
+        fallback.cache = None
+        primary = Mock(return_value=[0.1] * 768)
+        
+        with patch.object(service, "_generate_azure_embedding", primary), \
+             patch.object(fallback, "_generate_azure_embedding", return_value=[0.5] * 1536):
+            result = service.generate_embedding("Pago de luz")
+        
+        assert result == [0.5] * 1536
+        assert primary.call_count == 1  # reintentar no cambia las dimensiones
+    
+    def test_other_model_never_written(self, monkeypatch):
+        """Test: Un respaldo de otro modelo con iguales dimensiones no se guarda en el índice."""
+        monkeypatch.setenv("EMBEDDING_FALLBACK_PROVIDER", "local")
+        monkeypatch.setenv("EMBEDDING_DIMENSIONS", "1536")
+        service = EmbeddingsService()
+        
+        with patch.object(service, "_generate_provider_batch", side_effect=self._failing):
+            plain = service.generate_embeddings_batch(["Pago de luz"])
+            vectors, versions = service.generate_embeddings_batch_versioned(["Pago de luz"])
+        
+        assert plain == [None]  # no es comparable para consultas
+        assert vectors == [None] and versions == [None]  # queda pendiente
+    
+    def test_dimension_mismatch_never_written(self, monkeypatch):
+        """Test: Un respaldo con otras dimensiones no produce vectores para el índice."""
+        monkeypatch.setenv("EMBEDDING_FALLBACK_PROVIDER", "local")
+        monkeypatch.setenv("EMBEDDING_DIMENSIONS", "768")
+        service = EmbeddingsService()
+        
+        with patch.object(service, "_generate_provider_batch", side_effect=self._failing):
+            vectors, versions = service.generate_embeddings_batch_versioned(["Pago de luz"])
+        
+        assert vectors == [None] and versions == [None]
+
+
 # ==================== Tests de integración con DB ====================
 
 @pytest.mark.integration
@@ -0,0 +1,81 @@
+"""
+Tests unitarios para el proveedor local de embeddings
+Autor: Sistema de Analizador Financiero
+Fecha: 17 octubre 2026
+"""
+
+import pytest
+import numpy as np
+
+from app.services.embeddings_service import EmbeddingsService
+from app.services.local_embeddings import LocalHashingEmbedder
+
+
+class TestLocalHashingEmbedder:
+    """Tests para el embedder de feature hashing."""
+
+    @pytest.fixture
+    def embedder(self):
+        """Embedder de 256 dimensiones."""
+        return LocalHashingEmbedder(256)
+
+    def test_vectors_are_normalized(self, embedder):
+        """Test: Los vectores tienen norma 1 y la dimensión pedida."""
+        matrix = embedder.embed(["Compra en supermercado", "Pago de alquiler"])
+
+        assert matrix.shape == (2, 256)
+        assert np.allclose(np.linalg.norm(matrix, axis=1), 1.0, atol=1e-5)
+
+    def test_deterministic(self, embedder):
+        """Test: El mismo texto produce siempre el mismo vector."""
+        first = embedder.embed(["Café en la esquina"])
+        second = LocalHashingEmbedder(256).embed(["Café en la esquina"])
+
+        assert np.array_equal(first, second)
+
+    def test_accent_folding(self, embedder):
+        """Test: Los acentos no cambian el vector."""
+        matrix = embedder.embed(["Cafetería Ñandú", "cafeteria nandu"])
+
+        assert np.allclose(matrix[0], matrix[1])
+
+    def test_related_texts_are_closer(self, embedder):
+        """Test: Un texto con un error de tipeo queda más cerca que uno no relacionado."""
+        matrix = embedder.embed(["supermercado carrefour", "supermercdo carrefur", "pago de alquiler"])
+
+        assert matrix[0] @ matrix[1] > matrix[0] @ matrix[2]
+
+    def test_empty_text_is_zero(self, embedder):
+        """Test: Un texto sin palabras produce un vector nulo."""
+        matrix = embedder.embed(["", "texto"])
+
+        assert not matrix[0].any()
+        assert matrix[1].any()
+
+
+class TestLocalProvider:
+    """Tests del proveedor local dentro de EmbeddingsService."""
+
+    @pytest.fixture
+    def service(self, monkeypatch):
+        """Servicio configurado con EMBEDDING_PROVIDER=local y sin credenciales."""
+        monkeypatch.setenv("EMBEDDING_PROVIDER", "local")
+        monkeypatch.setenv("EMBEDDING_DIMENSIONS", "128")
+        monkeypatch.delenv("AZURE_OPENAI_API_KEY", raising=False)
+        return EmbeddingsService()
+
+    def test_single_matches_batch(self, service):
+        """Test: Un embedding individual coincide con el del lote."""
+        single = service.generate_embedding("Compra en supermercado")
+        batch = service.generate_embeddings_batch(["Pago de luz", "Compra en supermercado"])
+
+        assert len(single) == 128
+        assert np.allclose(single, batch[1])
+
+    @pytest.mark.asyncio
+    async def test_async_batch(self, service):
+        """Test: La API async funciona con el proveedor local."""
+        result = await service.agenerate_embeddings_batch(["uno", "", "dos"])
+
+        assert result[1] is None
+        assert len(result[0]) == 128 and len(result[2]) == 128
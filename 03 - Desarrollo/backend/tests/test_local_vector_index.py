@@ -0,0 +1,215 @@
+"""
+Tests unitarios para el índice vectorial local (NumPy)
+Corren sobre SQLite en memoria, sin PostgreSQL
+Autor: Sistema de Analizador Financiero
+Fecha: 17 octubre 2026
+"""
+
+import os
+from datetime import date
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import app.models  # noqa: F401  (registra las tablas referenciadas por las FK)
+from app.models.categoria import Categoria
+from app.models.embeddings import GastoEmbedding, IngresoEmbedding
+from app.models.gasto import Gasto
+from app.models.ingreso import Ingreso
+from app.services.local_vector_index import LocalVectorIndex
+from app.services.vector_invalidation import GenerationRegistry, get_generations
+from app.services.vector_search_service import VectorSearchService
+
+DIMENSIONS = 768
+
+
+@compiles(JSONB, "sqlite")
+def _jsonb_sqlite(type_, compiler, **kw):
+    return "JSON"
+
+
+def _vector(*values):
+    """Vector de DIMENSIONS componentes con los primeros valores dados."""
+    return list(values) + [0.0] * (DIMENSIONS - len(values))
+
+
+@pytest.fixture
+def db():
+    """Sesión sobre SQLite en memoria con las tablas de gastos, ingresos y embeddings."""
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Gasto.metadata.create_all(engine, tables=[
+        Categoria.__table__, Gasto.__table__, Ingreso.__table__,
+        GastoEmbedding.__table__, IngresoEmbedding.__table__
+    ])
+    session = sessionmaker(bind=engine)()
+    session.add(Categoria(id_categoria=1, nombre="Comida"))
+    session.add(Categoria(id_categoria=2, nombre="Transporte"))
+    session.commit()
+    yield session
+    session.close()
+
+
+def _add_gasto(db, id_gasto, user_id, vector, categoria=1, fecha=date(2026, 1, 10), monto=100):
+    db.add(Gasto(
+        id_gasto=id_gasto, id_usuario=user_id, id_categoria=categoria,
+        fecha=fecha, monto=monto, descripcion=f"gasto {id_gasto}", moneda="ARS"
+    ))
+    db.add(GastoEmbedding(
+        gasto_id=id_gasto, id_usuario=user_id, embedding=vector,
+        texto_original=f"gasto {id_gasto}"
+    ))
+
+
+class TestLocalVectorSearch:
+    """Tests para la búsqueda exacta en memoria."""
+
+    def test_top_k_by_cosine_similarity(self, db):
+        """Test: Ordena por similitud coseno y respeta límite y umbral."""
+        _add_gasto(db, 1, 7, _vector(1.0, 0.0))
+        _add_gasto(db, 2, 7, _vector(3.0, 1.0))  # sin normalizar
+        _add_gasto(db, 3, 7, _vector(0.0, 1.0))
+        _add_gasto(db, 4, 7, _vector(1.0, 1.0))
+        db.commit()
+        index = LocalVectorIndex(max_bytes=10 ** 6, generations=GenerationRegistry())
+
+        results = index.search(db, "gasto", 7, _vector(2.0, 0.0), limit=2, similarity_threshold=0.5)
+
+        assert [r["gasto_id"] for r in results] == [1, 2]
+        assert results[0]["similarity"] == pytest.approx(1.0)
+        assert results[1]["similarity"] == pytest.approx(3 / np.sqrt(10))
+        assert results[0]["categoria"] == "Comida"
+        assert results[0]["texto_embedding"] == "gasto 1"
+
+    def test_only_user_rows(self, db):
+        """Test: Nunca se cargan filas de otro usuario."""
+        _add_gasto(db, 1, 7, _vector(1.0))
+        _add_gasto(db, 2, 8, _vector(1.0))
+        db.commit()
+        index = LocalVectorIndex(max_bytes=10 ** 6, generations=GenerationRegistry())
+
+        results = index.search(db, "gasto", 8, _vector(1.0), limit=10, similarity_threshold=0.0)
+
+        assert [r["gasto_id"] for r in results] == [2]
+
+    def test_filters(self, db):
+        """Test: Categoría, fechas y montos se aplican antes del top-k."""
+        _add_gasto(db, 1, 7, _vector(1.0), categoria=1, monto=50)
+        _add_gasto(db, 2, 7, _vector(1.0, 0.1), categoria=2, fecha=date(2026, 3, 1), monto=500)
+        _add_gasto(db, 3, 7, _vector(1.0, 0.2), categoria=2, fecha=date(2026, 1, 1), monto=500)
+        db.commit()
+        index = LocalVectorIndex(max_bytes=10 ** 6, generations=GenerationRegistry())
+
+        results = index.search(
+            db, "gasto", 7, _vector(1.0), limit=1, similarity_threshold=0.0,
+            categoria="Transporte", fecha_desde=date(2026, 2, 1), monto_min=100
+        )
+
+        assert [r["gasto_id"] for r in results] == [2]
+
+    def test_service_uses_local_backend(self, db):
+        """Test: Con VECTOR_SEARCH_BACKEND=local el servicio no usa funciones SQL."""
+        _add_gasto(db, 1, 7, _vector(1.0))
+        db.commit()
+        service = VectorSearchService(db)
+        service.BACKEND = "local"
+
+        gastos, ingresos = service.search_combined(7, _vector(1.0), similarity_threshold=0.5)
+
+        assert [g["id"] for g in gastos] == [1]
+        assert ingresos == []
+
+
+class TestLocalVectorCache:
+    """Tests para la caché de matrices."""
+
+    def test_invalidated_by_orm_commit(self, db):
+        """Test: Un gasto nuevo confirmado invalida la matriz del usuario."""
+        _add_gasto(db, 1, 7, _vector(1.0))
+        db.commit()
+        index = LocalVectorIndex(max_bytes=10 ** 6, generations=get_generations())
+        index.search(db, "gasto", 7, _vector(1.0), limit=10, similarity_threshold=0.0)
+
+        _add_gasto(db, 2, 7, _vector(1.0, 0.1))
+        db.commit()
+        results = index.search(db, "gasto", 7, _vector(1.0), limit=10, similarity_threshold=0.0)
+
+        assert [r["gasto_id"] for r in results] == [1, 2]
+        assert index.get_stats()["misses"] == 2
+
+    def test_invalidated_by_orm_reembed(self, db):
+        """Test: Regenerar solo el embedding (sin tocar el gasto) invalida la matriz."""
+        _add_gasto(db, 1, 7, _vector(1.0))
+        db.commit()
+        index = LocalVectorIndex(max_bytes=10 ** 6, generations=get_generations())
+        index.search(db, "gasto", 7, _vector(1.0), limit=10, similarity_threshold=0.0)
+
+        db.query(GastoEmbedding).filter_by(gasto_id=1).one().embedding = _vector(0.0, 1.0)
+        db.commit()
+        results = index.search(db, "gasto", 7, _vector(1.0), limit=10, similarity_threshold=0.0)
+
+        assert results[0]["similarity"] == pytest.approx(0.0)
+        assert index.get_stats()["misses"] == 2
+
+    def test_hit_without_writes(self, db):
+        """Test: Sin escrituras la segunda búsqueda no consulta la base."""
+        _add_gasto(db, 1, 7, _vector(1.0))
+        db.commit()
+        index = LocalVectorIndex(max_bytes=10 ** 6, generations=GenerationRegistry())
+        index.search(db, "gasto", 7, _vector(1.0), limit=10, similarity_threshold=0.0)
+
+        db.close()
+        index.search(None, "gasto", 7, _vector(1.0), limit=10, similarity_threshold=0.0)
+
+        assert index.get_stats()["hits"] == 1
+
+    def test_lru_eviction_by_bytes(self, db):
+        """Test: Al superar el presupuesto se desaloja la matriz menos usada."""
+        for user_id in (1, 2, 3):
+            _add_gasto(db, user_id, user_id, _vector(1.0))
+        db.commit()
+        index = LocalVectorIndex(max_bytes=10 ** 6, generations=GenerationRegistry())
+        entry_bytes = index.get_matrix(db, "gasto", 1).nbytes
+        index.max_bytes = 2 * entry_bytes
+
+        index.get_matrix(db, "gasto", 2)
+        index.get_matrix(db, "gasto", 1)
+        index.get_matrix(db, "gasto", 3)
+
+        stats = index.get_stats()
+        assert stats["entries"] == 2 and stats["evictions"] == 1
+        assert stats["bytes"] <= index.max_bytes
+        assert ("gasto", 2) not in index._entries
+
+    def test_memory_mapped(self, db, tmp_path):
+        """Test: Con directorio la matriz se mapea desde un archivo que se borra al desalojar."""
+        _add_gasto(db, 1, 7, _vector(1.0))
+        db.commit()
+        index = LocalVectorIndex(
+            max_bytes=10 ** 6, mmap_dir=str(tmp_path), generations=GenerationRegistry()
+        )
+
+        entry = index.get_matrix(db, "gasto", 7)
+
+        assert isinstance(entry.matrix, np.memmap)
+        assert os.path.exists(entry.path)
+        index.invalidate(7)
+        assert not os.path.exists(entry.path)
+
+    def test_oversized_entry_leaves_no_file(self, db, tmp_path):
+        """Test: Una matriz más grande que el presupuesto no deja archivos mapeados."""
+        _add_gasto(db, 1, 7, _vector(1.0))
+        db.commit()
+        index = LocalVectorIndex(max_bytes=10, mmap_dir=str(tmp_path), generations=GenerationRegistry())
+
+        results = index.search(db, "gasto", 7, _vector(1.0), limit=10, similarity_threshold=0.0)
+
+        assert [r["gasto_id"] for r in results] == [1]
+        assert index.get_stats()["entries"] == 0
+        assert os.listdir(tmp_path) == []
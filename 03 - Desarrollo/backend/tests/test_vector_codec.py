@@ -0,0 +1,79 @@
+"""
+Tests unitarios para la codificación de vectores pgvector
+Autor: Sistema de Analizador Financiero
+Fecha: 17 octubre 2026
+"""
+
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import psycopg2
+import pytest
+from psycopg2.extensions import adapt
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.crud.vector_codec import (
+    Vector, VectorParam, cast_vector, format_vector, register_vector_type
+)
+
+
+class TestVectorCodec:
+    """Tests para el adaptador de parámetros y el tipo Vector."""
+
+    def test_format_is_exact_float32(self):
+        """Test: El texto corto vuelve exactamente a los mismos float32."""
+        values = np.random.default_rng(0).standard_normal(768).astype(np.float32)
+
+        text = format_vector(values)
+
+        assert np.array_equal(np.array(text[1:-1].split(","), dtype=np.float32), values)
+        assert len(text) < len("[" + ",".join(str(float(v)) for v in values) + "]")
+
+    def test_param_adapted_as_vector(self):
+        """Test: psycopg2 envía VectorParam como literal vector, sin pasar por listas."""
+        quoted = adapt(VectorParam(np.array([0.5, -1.0, 2.0]))).getquoted()
+
+        assert quoted == b"'[0.5,-1.0,2.0]'::vector"
+
+    def test_param_list_adapted_as_vector_array(self):
+        """Test: Una lista de VectorParam viaja como ARRAY de vectores (search_many)."""
+        quoted = adapt([VectorParam([1.0]), VectorParam([2.0])]).getquoted()
+
+        assert quoted == b"ARRAY['[1.0]'::vector,'[2.0]'::vector]"
+
+    def test_bind_per_dialect(self):
+        """Test: En PostgreSQL se envía un VectorParam float32; en SQLite, el texto."""
+        column_type = Vector(3)
+
+        pg_value = column_type.bind_processor(postgresql.dialect())([1, 2, 3])
+        sqlite_value = column_type.bind_processor(sqlite.dialect())([1, 2, 3])
+
+        assert isinstance(pg_value, VectorParam) and pg_value.array.dtype == np.float32
+        assert sqlite_value == "[1.0,2.0,3.0]"
+
+    def test_bind_checks_dimensions(self):
+        """Test: Un embedding de otra dimensión falla antes de llegar a la base."""
+        with pytest.raises(ValueError):
+            Vector(3).bind_processor(postgresql.dialect())([1.0, 2.0])
+
+    def test_cast_reads_float32(self):
+        """Test: Las columnas vector se leen como arrays float32."""
+        value = cast_vector("[0.5,-1,2]", None)
+
+        assert value.dtype == np.float32 and value.tolist() == [0.5, -1.0, 2.0]
+        assert cast_vector(None, None) is None
+
+    def test_type_registered_per_connection(self):
+        """Test: El tipo vector se registra solo en la conexión, sin adaptador para ndarray."""
+        connection = MagicMock()
+        cursor = connection.cursor.return_value.__enter__.return_value
+        cursor.description = [("vector", 16385)]
+
+        with patch("app.crud.vector_codec.register_type") as register:
+            register_vector_type(connection)
+
+        caster, scope = register.call_args.args
+        assert scope is connection
+        assert caster.values == (16385,)
+        with pytest.raises(psycopg2.ProgrammingError):
+            adapt(np.array([1.0, 2.0]))  # ndarray sigue sin adaptador global
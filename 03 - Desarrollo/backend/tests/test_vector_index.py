@@ -0,0 +1,101 @@
+"""
+Tests unitarios para la administración de índices vectoriales
+Autor: Sistema de Analizador Financiero
+Fecha: 17 octubre 2026
+"""
+
+import pytest
+from unittest.mock import Mock
+
+from app.services.vector_index import (
+    SEARCH_PRESETS, rebuild_vector_index, resolve_search_params
+)
+from app.services.vector_search_service import VectorSearchService
+
+
+class TestSearchParams:
+    """Tests para los presets de velocidad/recall."""
+
+    def test_preset_with_overrides(self):
+        """Test: Los valores explícitos pisan los del preset."""
+        params = resolve_search_params("accurate", probes=5)
+
+        assert params == {"ef_search": SEARCH_PRESETS["accurate"]["ef_search"], "probes": 5}
+
+    def test_default_preset_from_env(self, monkeypatch):
+        """Test: Sin preset se usa VECTOR_SEARCH_PRESET."""
+        monkeypatch.setenv("VECTOR_SEARCH_PRESET", "fast")
+
+        assert resolve_search_params() == SEARCH_PRESETS["fast"]
+
+    def test_ef_search_covers_requested_rows(self):
+        """Test: ef_search nunca es menor que las filas pedidas al índice."""
+        assert resolve_search_params("fast", min_candidates=100)["ef_search"] == 100
+
+    def test_invalid_preset(self):
+        """Test: Un preset desconocido falla."""
+        with pytest.raises(ValueError):
+            resolve_search_params("turbo")
+
+
+class TestVectorSearchIndexParams:
+    """Tests para los parámetros del índice en las búsquedas."""
+
+    def test_search_passes_params_to_function(self):
+        """Test: ef_search y probes viajan en la misma llamada a la función SQL."""
+        db = Mock()
+        db.execute.return_value = []
+        service = VectorSearchService(db)
+        service.STORAGE_MODE = "half"
+        service.RESCORE_FACTOR = 4
+
+        service.search_gastos(1, [0.1] * 768, limit=30, preset="fast")
+
+        # Sin round trip previo de set_config
+        db.execute.assert_called_once()
+        query, params = db.execute.call_args.args
+        assert "search_gastos_compact" in str(query)
+        assert ":ef_search" in str(query) and ":probes" in str(query)
+        # 30 x 4 candidatos a re-ordenar
+        assert params["ef_search"] == 120
+        assert params["probes"] == SEARCH_PRESETS["fast"]["probes"]
+
+    def test_combined_passes_params(self):
+        """Test: La búsqueda combinada también envía los parámetros del índice."""
+        db = Mock()
+        db.execute.return_value = []
+        service = VectorSearchService(db)
+
+        service.search_combined(1, [0.1] * 768, limit=5, ef_search=200)
+
+        db.execute.assert_called_once()
+        assert db.execute.call_args.args[1]["ef_search"] == 200
+
+
+class TestRebuildVectorIndex:
+    """Tests para la reconstrucción del índice."""
+
+    def test_rebuild_hnsw_defaults(self, monkeypatch):
+        """Test: Por defecto HNSW con m y ef_construction de las variables de entorno."""
+        monkeypatch.setenv("VECTOR_HNSW_M", "24")
+        monkeypatch.delenv("VECTOR_INDEX_METHOD", raising=False)
+        db = Mock()
+        db.execute.return_value.scalar.return_value = "idx_gastos_embeddings_vector"
+
+        name = rebuild_vector_index(db, "gasto")
+
+        params = db.execute.call_args.args[1]
+        assert name == "idx_gastos_embeddings_vector"
+        assert params["table"] == "gastos_embeddings"
+        assert params["method"] == "hnsw"
+        assert params["m"] == 24 and params["ef_construction"] == 64
+        db.commit.assert_called_once()
+
+    def test_rebuild_invalid_method(self):
+        """Test: Un método desconocido falla sin tocar la base."""
+        db = Mock()
+
+        with pytest.raises(ValueError):
+            rebuild_vector_index(db, "ingreso", method="flat")
+
+        db.execute.assert_not_called()
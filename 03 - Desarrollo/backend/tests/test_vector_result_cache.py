@@ -0,0 +1,225 @@
+"""
+Tests unitarios para la caché de resultados de búsqueda vectorial
+Autor: Sistema de Analizador Financiero
+Fecha: 17 octubre 2026
+"""
+
+from datetime import date
+from unittest.mock import Mock
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import app.models  # noqa: F401  (registra las tablas referenciadas por las FK)
+from app.models.categoria import Categoria
+from app.models.embeddings import GastoEmbedding
+from app.models.gasto import Gasto
+from app.services.vector_invalidation import GenerationRegistry
+from app.services.vector_result_cache import VectorResultCache, get_vector_result_cache
+from app.services.vector_search_service import VectorSearchService
+
+ROW = (10, "Super", 100, date(2026, 1, 1), "Comida", "ARS", 0.9, "texto")
+
+# gastos_embeddings con el trigger que completa id_usuario, como en
+# database/embedding_user_scope.sql (el modelo lo declara NOT NULL)
+GASTOS_EMBEDDINGS_DDL = (
+    """
+    CREATE TABLE gastos_embeddings (
+        id INTEGER PRIMARY KEY,
+        gasto_id INTEGER NOT NULL UNIQUE,
+        id_usuario INTEGER,
+        embedding TEXT NOT NULL,
+        texto_original TEXT NOT NULL,
+        content_hash VARCHAR(64),
+        model_version VARCHAR(100),
+        metadata JSON,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL
+    )
+    """,
+    """
+    CREATE TRIGGER set_gastos_embeddings_usuario AFTER INSERT ON gastos_embeddings
+    WHEN NEW.id_usuario IS NULL
+    BEGIN
+        UPDATE gastos_embeddings
+        SET id_usuario = (SELECT id_usuario FROM gastos WHERE id_gasto = NEW.gasto_id)
+        WHERE id = NEW.id;
+    END
+    """,
+)
+
+
+@pytest.fixture
+def db():
+    """Sesión simulada que devuelve un gasto en cada búsqueda."""
+    db = Mock()
+    db.execute.side_effect = lambda *args, **kwargs: [ROW]
+    return db
+
+
+@pytest.fixture
+def service(db):
+    """Servicio con la caché de resultados activa."""
+    service = VectorSearchService(db)
+    service.RESULT_CACHE = True
+    service.BACKEND = "pgvector"
+    service.STORAGE_MODE = "full"
+    return service
+
+
+@pytest.fixture
+def sqlite_session():
+    """Sesión SQLite para confirmar escrituras reales por ORM."""
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Gasto.metadata.create_all(engine, tables=[Categoria.__table__, Gasto.__table__])
+    with engine.begin() as connection:
+        for statement in GASTOS_EMBEDDINGS_DDL:
+            connection.execute(text(statement))
+    session = sessionmaker(bind=engine)()
+    session.add(Categoria(id_categoria=1, nombre="Comida"))
+    session.commit()
+    yield session
+    session.close()
+
+
+class TestVectorResultCache:
+    """Tests para la caché de resultados en VectorSearchService."""
+
+    def test_repeated_search_hits_cache(self, service, db):
+        """Test: La misma búsqueda no vuelve a consultar la base."""
+        first = service.search_gastos(1, [0.1] * 768, limit=5)
+        calls = db.execute.call_count
+
+        second = service.search_gastos(1, [0.1] * 768, limit=5)
+
+        assert second == first
+        assert db.execute.call_count == calls
+        assert get_vector_result_cache().get_stats()["hits"] == 1
+
+    def test_key_includes_vector_and_filters(self, service, db):
+        """Test: Otro vector, filtro, límite o usuario es otra entrada."""
+        service.search_gastos(1, [0.1] * 768, limit=5)
+        calls = db.execute.call_count
+
+        service.search_gastos(1, [0.2] * 768, limit=5)
+        service.search_gastos(1, [0.1] * 768, limit=5, categoria="Comida")
+        service.search_gastos(1, [0.1] * 768, limit=6)
+        service.search_gastos(2, [0.1] * 768, limit=5)
+
+        assert db.execute.call_count >= calls + 4
+        assert get_vector_result_cache().get_stats()["hits"] == 0
+
+    def test_returns_copies(self, service):
+        """Test: Modificar un resultado no altera la caché."""
+        service.search_gastos(1, [0.1] * 768)[0]["descripcion"] = "otro"
+
+        assert service.search_gastos(1, [0.1] * 768)[0]["descripcion"] == "Super"
+
+    def test_invalidated_by_orm_create(self, service, db, sqlite_session):
+        """Test: Crear un gasto del usuario invalida sus resultados al confirmar."""
+        service.search_gastos(3, [0.1] * 768)
+        service.search_gastos(4, [0.1] * 768)
+        calls = db.execute.call_count
+
+        sqlite_session.add(Gasto(
+            id_usuario=3, id_categoria=1, fecha=date(2026, 1, 2), monto=5, moneda="ARS"
+        ))
+        service.search_gastos(3, [0.1] * 768)
+        assert db.execute.call_count == calls  # sin confirmar: sigue vigente
+
+        sqlite_session.commit()
+        service.search_gastos(3, [0.1] * 768)
+        service.search_gastos(4, [0.1] * 768)
+
+        assert db.execute.call_count > calls
+        stats = get_vector_result_cache().get_stats()
+        assert stats["hits"] == 2  # el de antes del commit y el del usuario 4
+
+    def test_invalidated_by_orm_embedding(self, service, db, sqlite_session):
+        """Test: Guardar un embedding por ORM (sin id_usuario, como el endpoint) invalida."""
+        sqlite_session.add(Gasto(
+            id_gasto=20, id_usuario=3, id_categoria=1, fecha=date(2026, 1, 2), monto=5, moneda="ARS"
+        ))
+        sqlite_session.commit()
+        service.search_gastos(3, [0.1] * 768)
+        service.search_gastos(4, [0.1] * 768)
+        calls = db.execute.call_count
+
+        sqlite_session.add(GastoEmbedding(
+            gasto_id=20, embedding=[0.1] * 768, texto_original="gasto 20"
+        ))
+        sqlite_session.commit()
+        service.search_gastos(3, [0.1] * 768)
+        service.search_gastos(4, [0.1] * 768)
+
+        assert db.execute.call_count > calls
+        assert get_vector_result_cache().get_stats()["hits"] == 1  # solo el usuario 4
+
+    def test_global_category_rename_invalidates_everyone(self, service, db, sqlite_session):
+        """Test: Renombrar una categoría global invalida a todos los usuarios."""
+        service.search_combined(3, [0.1] * 768)
+        calls = db.execute.call_count
+
+        categoria = sqlite_session.get(Categoria, 1)
+        categoria.nombre = "Alimentos"
+        sqlite_session.commit()
+        service.search_combined(3, [0.1] * 768)
+
+        assert db.execute.call_count > calls
+
+    def test_empty_results_not_cached(self, service, db):
+        """Test: Un resultado vacío (o un error) no se guarda."""
+        db.execute.side_effect = lambda *args, **kwargs: []
+
+        service.search_ingresos(1, [0.1] * 768)
+        service.search_ingresos(1, [0.1] * 768)
+
+        assert get_vector_result_cache().get_stats()["entries"] == 0
+
+    def test_disabled(self, service, db):
+        """Test: Con RESULT_CACHE desactivado siempre se consulta."""
+        service.RESULT_CACHE = False
+
+        service.search_gastos(1, [0.1] * 768)
+        service.search_gastos(1, [0.1] * 768)
+
+        assert get_vector_result_cache().get_stats()["misses"] == 0
+
+
+class TestVectorResultCacheLRU:
+    """Tests para el límite de memoria y las métricas."""
+
+    def test_lru_eviction_and_hit_ratio(self):
+        """Test: Se desaloja el menos usado y se exporta la tasa de aciertos."""
+        generations = GenerationRegistry()
+        cache = VectorResultCache(max_bytes=10 ** 6, ttl_seconds=300, generations=generations)
+        value = [{"descripcion": "x" * 1000}]
+        cache.put(("a",), 1, cache.snapshot(1, ["gasto"]), value)
+        entry_bytes = cache.get_stats()["bytes"]
+        cache.max_bytes = 2 * entry_bytes
+
+        cache.put(("b",), 1, cache.snapshot(1, ["gasto"]), value)
+        cache.get(("a",), 1, ["gasto"])
+        cache.put(("c",), 2, cache.snapshot(2, ["gasto"]), value)
+
+        stats = cache.get_stats()
+        assert stats["evictions"] == 1
+        assert cache.get(("b",), 1, ["gasto"])[0] is False
+        assert cache.get(("a",), 1, ["gasto"])[0] is True
+        assert cache.get_stats()["hit_ratio"] == pytest.approx(2 / 3, abs=1e-4)
+        assert "vector_search_cache_hit_ratio" in cache.render_prometheus()
+
+    def test_stale_on_arrival(self):
+        """Test: Un resultado calculado antes de una escritura nace vencido."""
+        generations = GenerationRegistry()
+        cache = VectorResultCache(max_bytes=10 ** 6, ttl_seconds=300, generations=generations)
+        generation = cache.snapshot(1, ["gasto"])
+
+        generations.bump(1, "gasto")  # escritura confirmada durante la búsqueda
+        cache.put(("a",), 1, generation, [{"gasto_id": 1}])
+
+        assert cache.get(("a",), 1, ["gasto"])[0] is False
@@ -4,11 +4,15 @@ Autor: Sistema de Analizador Financiero
 Fecha: 12 noviembre 2025
 """
 
+import asyncio
+
 import pytest
 import numpy as np
+from fastapi import HTTPException
 from unittest.mock import Mock, patch, MagicMock
 from datetime import datetime, date
 
+from app.api.api_v1.endpoints.embeddings import EmbeddingSearchRequest, search_by_vector
 from app.services.vector_search_service import VectorSearchService
 
 
@@ -384,6 +388,322 @@ class TestVectorSearchService:
         assert similarities == sorted(similarities, reverse=True)
 
 
+class TestVectorSearchStorageMode:
+    """Tests para el modo de almacenamiento compacto (halfvec)."""
+    
+    @pytest.fixture
+    def db(self):
+        """Sesión simulada sin resultados."""
+        db = Mock()
+        db.execute.return_value = []
+        return db
+    
+    def test_full_mode_uses_vector_function(self, db):
+        """Test: En modo full se usa la función sobre el vector float32."""
+        service = VectorSearchService(db)
+        service.STORAGE_MODE = "full"
+        
+        service.search_gastos(1, [0.1] * 768, limit=5)
+        
+        query, params = db.execute.call_args.args
+        assert "search_gastos_by_vector" in str(query)
+        assert "candidates" not in params
+    
+    def test_half_mode_rescores_candidates(self, db):
+        """Test: En modo half se piden limit x RESCORE_FACTOR candidatos."""
+        service = VectorSearchService(db)
+        service.STORAGE_MODE = "half"
+        service.RESCORE_FACTOR = 4
+        
+        service.search_ingresos(1, [0.1] * 768, limit=5)
+        
+        query, params = db.execute.call_args.args
+        assert "search_ingresos_compact" in str(query)
+        assert params["candidates"] == 20
+
+
+class TestVectorSearchUserScope:
+    """Tests para las búsquedas acotadas al usuario."""
+    
+    @pytest.fixture
+    def db(self):
+        """Sesión simulada sin resultados."""
+        db = Mock()
+        db.execute.return_value = []
+        return db
+    
+    @pytest.mark.parametrize("method,function", [
+        ("search_gastos", "search_gastos_by_vector"),
+        ("search_ingresos", "search_ingresos_by_vector"),
+        ("search_combined", "search_combined_by_vector"),
+    ])
+    def test_user_id_reaches_sql_function(self, db, method, function):
+        """Test: El usuario se pasa a la función SQL como primer argumento."""
+        service = VectorSearchService(db)
+        service.STORAGE_MODE = "full"
+        
+        getattr(service, method)(42, [0.1] * 768, limit=5)
+        
+        query, params = db.execute.call_args.args
+        assert function in str(query)
+        assert str(query).index(":user_id") < str(query).index(":embedding")
+        assert params["user_id"] == 42
+    
+    def test_filters_are_user_scoped(self, db):
+        """Test: La búsqueda con filtros también recibe el usuario."""
+        service = VectorSearchService(db)
+        
+        service.search_ingresos(7, [0.1] * 768, categoria="Sueldo")
+        
+        query, params = db.execute.call_args.args
+        assert "search_ingresos_with_filters" in str(query)
+        assert params["user_id"] == 7
+    
+    def test_search_for_user_limits_in_sql(self, db):
+        """Test: No se piden MAX_LIMIT candidatos globales para filtrar después."""
+        service = VectorSearchService(db)
+        service.STORAGE_MODE = "full"
+        
+        service._search_for_user("gastos", 3, [0.1] * 768, limit=5, similarity_threshold=0.6)
+        
+        params = db.execute.call_args.args[1]
+        assert params["user_id"] == 3
+        assert params["limit"] == 5
+        # Sin consulta aparte para filtrar los dueños de los candidatos
+        db.query.assert_not_called()
+
+
+class TestAdjustThresholdSingleQuery:
+    """Tests para la cascada de umbrales sobre una sola búsqueda top-k."""
+
+    @pytest.fixture
+    def service(self):
+        """Servicio con una búsqueda de gastos simulada."""
+        service = VectorSearchService(Mock())
+        service.search_gastos = Mock(return_value=[
+            {"gasto_id": i, "similarity": similarity}
+            for i, similarity in enumerate([0.9, 0.72, 0.66, 0.61, 0.52, 0.3])
+        ])
+        return service
+
+    def test_single_search_without_threshold(self, service):
+        """Test: Una sola búsqueda de max(limit, min_results) sin umbral."""
+        service.adjust_threshold_dynamically(1, [0.1] * 768, "gastos", min_results=12, limit=10)
+
+        service.search_gastos.assert_called_once()
+        kwargs = service.search_gastos.call_args.kwargs
+        assert kwargs["limit"] == 12
+        assert kwargs["similarity_threshold"] == -1.0
+
+    def test_effective_threshold(self, service):
+        """Test: Se reporta el primer umbral de la cascada que alcanza el mínimo."""
+        results, threshold = service.adjust_threshold_dynamically(
+            1, [0.1] * 768, "gastos", min_results=4
+        )
+
+        assert threshold == 0.6
+        assert [r["gasto_id"] for r in results] == [0, 1, 2, 3]
+
+    def test_minimum_threshold_reached(self, service):
+        """Test: Sin alcanzar el mínimo, se usa el umbral más bajo (sin saltearlo)."""
+        results, threshold = service.adjust_threshold_dynamically(
+            1, [0.1] * 768, "gastos", min_results=6
+        )
+
+        assert threshold == 0.5
+        assert len(results) == 5
+
+
+class TestVectorSearchMany:
+    """Tests para varias búsquedas en un solo round trip."""
+
+    def test_single_statement_with_parallel_arrays(self):
+        """Test: N consultas se envían como arrays paralelos en una sola sentencia."""
+        db = Mock()
+        db.execute.return_value = []
+        service = VectorSearchService(db)
+
+        service.search_many(5, [
+            {"embedding": [0.1] * 768, "entity_type": "gasto", "limit": 3},
+            {"embedding": [0.2] * 768, "categoria": "Comida", "monto_min": 10},
+        ])
+
+        db.execute.assert_called_once()
+        query, params = db.execute.call_args.args
+        assert "search_many_by_vector" in str(query)
+        assert params["user_id"] == 5
+        assert len(params["embeddings"]) == 2
+        assert params["entity_types"] == ["gasto", "all"]
+        assert params["limits"] == [3, service.DEFAULT_LIMIT]
+        assert params["categorias"] == [None, "Comida"]
+        assert params["montos_min"] == [None, 10.0]
+
+    def test_search_params_in_same_statement(self):
+        """Test: ef_search/probes viajan en la misma sentencia, según el mayor límite."""
+        db = Mock()
+        db.execute.return_value = []
+        service = VectorSearchService(db)
+
+        service.search_many(1, [
+            {"embedding": [0.1] * 768, "limit": 5},
+            {"embedding": [0.2] * 768, "limit": 50},
+        ], preset="fast", probes=7)
+
+        db.execute.assert_called_once()
+        query, params = db.execute.call_args.args
+        assert ":ef_search" in str(query)
+        assert params["ef_search"] == 50
+        assert params["probes"] == 7
+
+    def test_results_grouped_by_query(self):
+        """Test: Los resultados vuelven agrupados por consulta y entidad."""
+        db = Mock()
+        db.execute.return_value = [
+            (1, "gasto", 10, "Super", 100, date(2026, 1, 1), "Comida", "ARS", 0.9, "t1"),
+            (2, "gasto", 11, "Taxi", 50, date(2026, 1, 2), "Transporte", "ARS", 0.8, "t2"),
+            (2, "ingreso", 20, "Sueldo", 900, date(2026, 1, 3), None, "ARS", 0.75, "t3"),
+        ]
+        service = VectorSearchService(db)
+
+        grouped = service.search_many(1, [{"embedding": [0.1] * 768}, {"embedding": [0.2] * 768}])
+
+        assert [g["gasto_id"] for g in grouped[0]["gastos"]] == [10]
+        assert grouped[0]["ingresos"] == []
+        assert [g["gasto_id"] for g in grouped[1]["gastos"]] == [11]
+        assert grouped[1]["ingresos"][0]["ingreso_id"] == 20
+
+    def test_invalid_entity_type(self):
+        """Test: Un tipo de entidad desconocido falla sin consultar."""
+        db = Mock()
+        service = VectorSearchService(db)
+
+        with pytest.raises(ValueError):
+            service.search_many(1, [{"embedding": [0.1] * 768, "entity_type": "gastos"}])
+
+        db.execute.assert_not_called()
+
+
+class TestVectorSearchHybrid:
+    """Tests para la búsqueda híbrida léxica + vectorial."""
+
+    def test_hybrid_params(self):
+        """Test: Texto, vector, candidatos y k de RRF llegan a la función SQL."""
+        db = Mock()
+        db.execute.return_value = []
+        service = VectorSearchService(db)
+        service.HYBRID_CANDIDATE_FACTOR = 5
+        service.HYBRID_RRF_K = 60
+
+        service.search_hybrid(9, "YPF nafta", [0.1] * 768, "gasto", limit=4)
+
+        query, params = db.execute.call_args.args
+        assert "search_gastos_hybrid" in str(query)
+        assert params["user_id"] == 9
+        assert params["query_text"] == "YPF nafta"
+        assert params["candidates"] == 20
+        assert params["rrf_k"] == 60
+        assert ":ef_search" in str(query) and params["ef_search"] >= 20
+
+    def test_lexical_only_match(self):
+        """Test: Una coincidencia solo léxica se devuelve sin similitud ni rango vectorial."""
+        db = Mock()
+        db.execute.return_value = [
+            (5, "Rappi", 2500, date(2026, 2, 1), "Comida", "ARS", None, None, 1 / 61, None, 1),
+        ]
+        service = VectorSearchService(db)
+
+        results = service.search_hybrid(1, "rappi", [0.1] * 768, "ingreso")
+
+        assert results[0]["ingreso_id"] == 5
+        assert results[0]["similarity"] is None
+        assert results[0]["vector_rank"] is None and results[0]["lexical_rank"] == 1
+
+    def test_invalid_entity_type(self):
+        """Test: Solo se aceptan gasto o ingreso."""
+        service = VectorSearchService(Mock())
+
+        with pytest.raises(ValueError):
+            service.search_hybrid(1, "x", [0.1] * 768, "gastos")
+
+
+class TestVectorSearchFiltered:
+    """Tests para la búsqueda con filtros según la selectividad."""
+
+    @pytest.fixture
+    def db(self):
+        """Sesión simulada: un plan exacto y ningún resultado."""
+        db = Mock()
+        db.execute.return_value.fetchone.return_value = ("exact", 120, 50000)
+        return db
+
+    def test_strategy_params_reach_sql(self, db):
+        """Test: La estrategia, los umbrales y ef_search llegan a la misma sentencia."""
+        service = VectorSearchService(db)
+        service.FILTER_STRATEGY = "auto"
+        service.FILTER_EXACT_MAX_ROWS = 5000
+        service.FILTER_MIN_SELECTIVITY = 0.1
+
+        service.search_gastos(1, [0.1] * 768, fecha_desde=date(2026, 1, 1), ef_search=80)
+
+        db.execute.assert_called_once()
+        query, params = db.execute.call_args.args
+        assert "search_gastos_with_filters" in str(query)
+        assert params["strategy"] == "auto"
+        assert params["exact_max_rows"] == 5000
+        assert params["min_selectivity"] == 0.1
+        assert params["ef_search"] == 80
+
+    def test_plan_reported_without_rows(self, db):
+        """Test: El plan se informa aunque la búsqueda no devuelva filas."""
+        service = VectorSearchService(db)
+        service.FILTER_EXACT_MAX_ROWS = 5000
+
+        plan = service.plan_search("gasto", 1, categoria="Comida")
+
+        query, params = db.execute.call_args.args
+        assert "plan_vector_search" in str(query)
+        assert params["entity_type"] == "gasto"
+        assert params["categoria"] == "Comida"
+        assert params["exact_max_rows"] == 5000
+        assert plan == {"search_strategy": "exact", "estimated_rows": 120, "table_rows": 50000}
+
+    def test_plan_error_is_empty(self, db):
+        """Test: Si la estimación falla el plan queda vacío."""
+        db.execute.side_effect = Exception("sin plan_vector_search")
+        service = VectorSearchService(db)
+
+        assert service.plan_search("ingreso", 1, monto_min=10) == {}
+
+    def test_forced_strategy(self, db):
+        """Test: Se puede forzar la estrategia por llamada."""
+        service = VectorSearchService(db)
+
+        service.search_ingresos(1, [0.1] * 768, monto_min=10, filter_strategy="iterative")
+
+        assert db.execute.call_args.args[1]["strategy"] == "iterative"
+
+    def test_invalid_strategy(self, db):
+        """Test: Una estrategia desconocida (ej: el post-filtro "index") se rechaza antes de consultar."""
+        service = VectorSearchService(db)
+
+        with pytest.raises(ValueError):
+            service.search_gastos(1, [0.1] * 768, categoria="Comida", filter_strategy="index")
+        with pytest.raises(ValueError):
+            service.plan_search("gasto", 1, categoria="Comida", filter_strategy="seq")
+        db.execute.assert_not_called()
+
+    def test_hybrid_with_filters_rejected(self):
+        """Test: La búsqueda híbrida con filtros responde 422 en lugar de ignorarlos."""
+        request = EmbeddingSearchRequest(
+            query="super", entity_type="gastos", hybrid=True, categoria="Comida"
+        )
+
+        with pytest.raises(HTTPException) as error:
+            asyncio.run(search_by_vector(request, db=Mock(), current_user=Mock()))
+
+        assert error.value.status_code == 422
+
+
 # ==================== Tests de integración ====================
 
 @pytest.mark.integration
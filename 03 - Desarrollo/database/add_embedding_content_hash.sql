@@ -0,0 +1,21 @@
+-- ============================================================
+-- Script: add_embedding_content_hash.sql
+-- Descripción: Agrega el hash del contenido embebido a las tablas de embeddings
+-- Fecha: 17 octubre 2026
+-- Orden de ejecución: 07 (después de compact_embeddings.sql)
+-- ============================================================
+
+-- SHA-256 de (proveedor:modelo:dimensiones + texto preprocesado).
+-- Si el texto de un gasto/ingreso no cambió respecto del embedding guardado,
+-- la aplicación omite la llamada al proveedor y la escritura de la fila.
+-- Las filas previas quedan en NULL y se comparan por texto_original.
+ALTER TABLE gastos_embeddings
+    ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64);
+
+ALTER TABLE ingresos_embeddings
+    ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64);
+
+COMMENT ON COLUMN gastos_embeddings.content_hash IS 'SHA-256 de modelo + texto, para no regenerar si no cambió';
+COMMENT ON COLUMN ingresos_embeddings.content_hash IS 'SHA-256 de modelo + texto, para no regenerar si no cambió';
+
+\echo '✓ Columna content_hash agregada a las tablas de embeddings'
@@ -0,0 +1,150 @@
+-- ============================================================
+-- Script: compact_embeddings.sql
+-- Descripción: Almacenamiento compacto (halfvec) para el índice ANN
+--              con re-ranking exacto sobre los vectores float32
+-- Fecha: 17 octubre 2026
+-- Orden de ejecución: 06 (después de vector_search_functions.sql)
+-- DIMENSIONES: 768 (Google Gemini text-embedding-004)
+-- Requiere: pgvector >= 0.7.0 (tipo halfvec)
+-- ============================================================
+
+-- ============================================================
+-- COLUMNAS COMPACTAS
+-- Descripción: Copia en media precisión (2 bytes por dimensión) del embedding.
+-- Es una columna generada, por lo que se mantiene sincronizada sin cambios
+-- en la aplicación. El índice ANN se construye sobre esta columna y ocupa
+-- la mitad que uno sobre vector(768).
+-- ============================================================
+ALTER TABLE gastos_embeddings
+    ADD COLUMN IF NOT EXISTS embedding_half halfvec(768)
+    GENERATED ALWAYS AS (embedding::halfvec(768)) STORED;
+
+ALTER TABLE ingresos_embeddings
+    ADD COLUMN IF NOT EXISTS embedding_half halfvec(768)
+    GENERATED ALWAYS AS (embedding::halfvec(768)) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_gastos_embeddings_half
+ON gastos_embeddings
+USING hnsw (embedding_half halfvec_cosine_ops);
+
+CREATE INDEX IF NOT EXISTS idx_ingresos_embeddings_half
+ON ingresos_embeddings
+USING hnsw (embedding_half halfvec_cosine_ops);
+
+-- Con el modo compacto activo (VECTOR_STORAGE_MODE=half) los índices IVFFlat
+-- sobre la columna float32 ya no se usan y pueden eliminarse para liberar memoria:
+--   DROP INDEX IF EXISTS idx_gastos_embeddings_vector;
+--   DROP INDEX IF EXISTS idx_ingresos_embeddings_vector;
+
+-- ============================================================
+-- FUNCIÓN: search_gastos_compact
+-- Descripción: Busca candidatos con el índice halfvec y los re-ordena con
+--              la distancia exacta sobre el embedding float32
+-- Parámetros:
+--   - query_embedding: Vector de consulta (768 dimensiones)
+--   - limit_results: Cantidad máxima de resultados (default: 10)
+--   - similarity_threshold: Umbral mínimo de similitud 0-1 (default: 0.7)
+--   - candidate_count: Candidatos a re-ordenar (default: 4 x limit_results)
+-- Retorna: Misma tabla que search_gastos_by_vector
+-- ============================================================
+CREATE OR REPLACE FUNCTION search_gastos_compact(
+    query_embedding vector(768),
+    limit_results INTEGER DEFAULT 10,
+    similarity_threshold FLOAT DEFAULT 0.7,
+    candidate_count INTEGER DEFAULT NULL
+)
+RETURNS TABLE (
+    gasto_id INTEGER,
+    descripcion TEXT,
+    monto DECIMAL,
+    fecha DATE,
+    categoria VARCHAR(100),
+    moneda VARCHAR(10),
+    similarity FLOAT,
+    texto_embedding TEXT,
+    metadata JSONB
+) AS $$
+BEGIN
+    RETURN QUERY
+    WITH candidatos AS (
+        SELECT ge.gasto_id, ge.embedding, ge.texto_original, ge.metadata
+        FROM gastos_embeddings ge
+        ORDER BY ge.embedding_half <=> query_embedding::halfvec
+        LIMIT COALESCE(candidate_count, limit_results * 4)
+    )
+    SELECT
+        g.id_gasto AS gasto_id,
+        g.descripcion::TEXT,
+        g.monto,
+        g.fecha,
+        c.nombre AS categoria,
+        g.moneda::VARCHAR(10),
+        -- Re-ranking exacto con el vector de precisión completa
+        (1 - (ca.embedding <=> query_embedding))::FLOAT AS similarity,
+        ca.texto_original AS texto_embedding,
+        ca.metadata
+    FROM candidatos ca
+    INNER JOIN gastos g ON ca.gasto_id = g.id_gasto
+    LEFT JOIN categorias c ON g.id_categoria = c.id_categoria
+    WHERE (1 - (ca.embedding <=> query_embedding)) >= similarity_threshold
+    ORDER BY ca.embedding <=> query_embedding ASC
+    LIMIT limit_results;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================================
+-- FUNCIÓN: search_ingresos_compact
+-- Descripción: Igual que search_gastos_compact, para ingresos
+-- ============================================================
+CREATE OR REPLACE FUNCTION search_ingresos_compact(
+    query_embedding vector(768),
+    limit_results INTEGER DEFAULT 10,
+    similarity_threshold FLOAT DEFAULT 0.7,
+    candidate_count INTEGER DEFAULT NULL
+)
+RETURNS TABLE (
+    ingreso_id INTEGER,
+    descripcion TEXT,
+    monto DECIMAL,
+    fecha DATE,
+    categoria VARCHAR(100),
+    moneda VARCHAR(10),
+    similarity FLOAT,
+    texto_embedding TEXT,
+    metadata JSONB
+) AS $$
+BEGIN
+    RETURN QUERY
+    WITH candidatos AS (
+        SELECT ie.ingreso_id, ie.embedding, ie.texto_original, ie.metadata
+        FROM ingresos_embeddings ie
+        ORDER BY ie.embedding_half <=> query_embedding::halfvec
+        LIMIT COALESCE(candidate_count, limit_results * 4)
+    )
+    SELECT
+        i.id_ingreso AS ingreso_id,
+        i.descripcion::TEXT,
+        i.monto,
+        i.fecha,
+        c.nombre AS categoria,
+        i.moneda::VARCHAR(10),
+        (1 - (ca.embedding <=> query_embedding))::FLOAT AS similarity,
+        ca.texto_original AS texto_embedding,
+        ca.metadata
+    FROM candidatos ca
+    INNER JOIN ingresos i ON ca.ingreso_id = i.id_ingreso
+    LEFT JOIN categorias c ON i.id_categoria = c.id_categoria
+    WHERE (1 - (ca.embedding <=> query_embedding)) >= similarity_threshold
+    ORDER BY ca.embedding <=> query_embedding ASC
+    LIMIT limit_results;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON COLUMN gastos_embeddings.embedding_half IS 'Copia halfvec del embedding para el índice ANN compacto';
+COMMENT ON COLUMN ingresos_embeddings.embedding_half IS 'Copia halfvec del embedding para el índice ANN compacto';
+COMMENT ON FUNCTION search_gastos_compact IS 'Búsqueda ANN sobre halfvec con re-ranking exacto en gastos';
+COMMENT ON FUNCTION search_ingresos_compact IS 'Búsqueda ANN sobre halfvec con re-ranking exacto en ingresos';
+
+-- Mensajes informativos
+\echo '✓ Columnas halfvec e índices HNSW compactos creados'
+\echo '✓ Funciones search_gastos_compact y search_ingresos_compact creadas'
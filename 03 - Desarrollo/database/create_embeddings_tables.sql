@@ -24,6 +24,7 @@ CREATE TABLE IF NOT EXISTS gastos_embeddings (
 );
 
 -- Índice IVFFlat para búsqueda vectorial eficiente en gastos
+-- (vector_indexes.sql lo reemplaza por HNSW; ver scripts/vector_index.py)
 -- lists = sqrt(total_rows) es una buena regla general
 -- Para 10,000 gastos: lists = 100
 -- Para 100,000 gastos: lists = 316
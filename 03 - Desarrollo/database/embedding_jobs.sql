@@ -0,0 +1,46 @@
+-- ============================================================
+-- Script: embedding_jobs.sql
+-- Descripción: Registro de trabajos de generación de embeddings en lote
+--              (POST /api/v1/embeddings/generate-batch)
+-- Fecha: 17 octubre 2026
+-- Orden de ejecución: 09 (después de embedding_versions.sql)
+-- ============================================================
+
+-- ============================================================
+-- TABLA: embedding_jobs
+-- Descripción: Estado y avance de cada trabajo. El trabajo confirma cada
+--              bloque por separado y guarda el último ID procesado, así
+--              que se puede reanudar si el proceso se reinicia.
+-- ============================================================
+CREATE TABLE IF NOT EXISTS embedding_jobs (
+    id SERIAL PRIMARY KEY,
+    id_usuario INTEGER NOT NULL REFERENCES usuarios(id_usuario) ON DELETE CASCADE,
+    entity_type VARCHAR(20) NOT NULL CHECK (entity_type IN ('gasto', 'ingreso')),
+    entity_ids INTEGER[],
+    force_regenerate BOOLEAN NOT NULL DEFAULT FALSE,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued'
+        CHECK (status IN ('queued', 'running', 'completed', 'failed')),
+    total INTEGER,
+    processed INTEGER NOT NULL DEFAULT 0,
+    skipped INTEGER NOT NULL DEFAULT 0,
+    errors INTEGER NOT NULL DEFAULT 0,
+    last_id INTEGER NOT NULL DEFAULT 0,
+    error_message TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP WITH TIME ZONE,
+    finished_at TIMESTAMP WITH TIME ZONE,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_embedding_jobs_usuario
+ON embedding_jobs (id_usuario, created_at DESC);
+
+-- Un solo trabajo en curso por usuario y entidad: pedir de nuevo la
+-- generación (ej: reintentos del onboarding) retorna el trabajo existente
+CREATE UNIQUE INDEX IF NOT EXISTS idx_embedding_jobs_activo
+ON embedding_jobs (id_usuario, entity_type) WHERE status IN ('queued', 'running');
+
+COMMENT ON TABLE embedding_jobs IS 'Trabajos de generación de embeddings en lote con su avance';
+
+-- Mensajes informativos
+\echo '✓ Tabla embedding_jobs creada'
@@ -0,0 +1,978 @@
+-- ============================================================
+-- Script: embedding_user_scope.sql
+-- Descripción: Búsqueda vectorial acotada a los registros de un usuario
+-- Fecha: 17 octubre 2026
+-- Orden de ejecución: 11 (después de vector_indexes.sql)
+-- DIMENSIONES: 768 (Google Gemini text-embedding-004)
+-- ============================================================
+--
+-- Las funciones de vector_search_functions.sql y compact_embeddings.sql
+-- ordenaban los vectores de todos los usuarios y el filtro por dueño se
+-- hacía después en la aplicación. Este script:
+--   1. Desnormaliza id_usuario en las tablas de embeddings (mantenido por
+--      triggers, sin cambios en los escritores)
+--   2. Indexa (id_usuario) para leer solo las filas de un usuario
+--   3. Reemplaza las funciones de búsqueda por versiones con p_user_id
+--      obligatorio y elimina las que no filtraban por usuario
+--
+-- Todas las búsquedas por usuario eligen el recorrido con la misma regla
+-- (choose_vector_scan), a partir de las estimaciones del planner:
+--   - 'exact': las filas del usuario (idx_*_usuario) se leen en un CTE
+--     MATERIALIZED y se ordenan por distancia exacta. Se usa si el usuario
+--     tiene pocas filas o es una porción chica de la tabla: su costo
+--     depende del historial del usuario y no del tamaño de la tabla.
+--   - 'iterative': índice ANN (vector_indexes.sql, compact_embeddings.sql)
+--     con iterative index scan de pgvector >= 0.8, que sigue recorriendo
+--     el grafo hasta juntar el límite de filas del usuario. ef_search y
+--     probes llegan como parámetros y se restauran al terminar.
+-- Sin iterative scan se usa siempre 'exact': ordenar por el índice global
+-- y filtrar por usuario después devolvería menos filas que las pedidas.
+-- ============================================================
+
+-- ============================================================
+-- COLUMNA id_usuario
+-- ============================================================
+ALTER TABLE gastos_embeddings ADD COLUMN IF NOT EXISTS id_usuario INTEGER;
+ALTER TABLE ingresos_embeddings ADD COLUMN IF NOT EXISTS id_usuario INTEGER;
+
+UPDATE gastos_embeddings ge
+SET id_usuario = g.id_usuario
+FROM gastos g
+WHERE g.id_gasto = ge.gasto_id AND ge.id_usuario IS DISTINCT FROM g.id_usuario;
+
+UPDATE ingresos_embeddings ie
+SET id_usuario = i.id_usuario
+FROM ingresos i
+WHERE i.id_ingreso = ie.ingreso_id AND ie.id_usuario IS DISTINCT FROM i.id_usuario;
+
+ALTER TABLE gastos_embeddings ALTER COLUMN id_usuario SET NOT NULL;
+ALTER TABLE ingresos_embeddings ALTER COLUMN id_usuario SET NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_gastos_embeddings_usuario
+ON gastos_embeddings(id_usuario);
+
+CREATE INDEX IF NOT EXISTS idx_ingresos_embeddings_usuario
+ON ingresos_embeddings(id_usuario);
+
+-- ============================================================
+-- TRIGGERS: completan id_usuario al insertar (ORM, upsert o COPY) y lo
+-- mantienen si el gasto/ingreso cambia de dueño
+-- ============================================================
+CREATE OR REPLACE FUNCTION set_gastos_embeddings_usuario()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.id_usuario IS NULL OR TG_OP = 'UPDATE' THEN
+        SELECT g.id_usuario INTO NEW.id_usuario FROM gastos g WHERE g.id_gasto = NEW.gasto_id;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION set_ingresos_embeddings_usuario()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.id_usuario IS NULL OR TG_OP = 'UPDATE' THEN
+        SELECT i.id_usuario INTO NEW.id_usuario FROM ingresos i WHERE i.id_ingreso = NEW.ingreso_id;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_gastos_embeddings_usuario ON gastos_embeddings;
+CREATE TRIGGER trg_gastos_embeddings_usuario
+BEFORE INSERT OR UPDATE OF gasto_id ON gastos_embeddings
+FOR EACH ROW EXECUTE FUNCTION set_gastos_embeddings_usuario();
+
+DROP TRIGGER IF EXISTS trg_ingresos_embeddings_usuario ON ingresos_embeddings;
+CREATE TRIGGER trg_ingresos_embeddings_usuario
+BEFORE INSERT OR UPDATE OF ingreso_id ON ingresos_embeddings
+FOR EACH ROW EXECUTE FUNCTION set_ingresos_embeddings_usuario();
+
+CREATE OR REPLACE FUNCTION propagate_gasto_usuario()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE gastos_embeddings SET id_usuario = NEW.id_usuario WHERE gasto_id = NEW.id_gasto;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION propagate_ingreso_usuario()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE ingresos_embeddings SET id_usuario = NEW.id_usuario WHERE ingreso_id = NEW.id_ingreso;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_gastos_propagate_usuario ON gastos;
+CREATE TRIGGER trg_gastos_propagate_usuario
+AFTER UPDATE OF id_usuario ON gastos
+FOR EACH ROW WHEN (OLD.id_usuario IS DISTINCT FROM NEW.id_usuario)
+EXECUTE FUNCTION propagate_gasto_usuario();
+
+DROP TRIGGER IF EXISTS trg_ingresos_propagate_usuario ON ingresos;
+CREATE TRIGGER trg_ingresos_propagate_usuario
+AFTER UPDATE OF id_usuario ON ingresos
+FOR EACH ROW WHEN (OLD.id_usuario IS DISTINCT FROM NEW.id_usuario)
+EXECUTE FUNCTION propagate_ingreso_usuario();
+
+-- ============================================================
+-- Funciones sin filtro por usuario: se eliminan para que ningún camino
+-- pueda volver a rankear embeddings de otros usuarios
+-- ============================================================
+DROP FUNCTION IF EXISTS search_gastos_by_vector(vector, INTEGER, FLOAT);
+DROP FUNCTION IF EXISTS search_ingresos_by_vector(vector, INTEGER, FLOAT);
+DROP FUNCTION IF EXISTS search_combined_by_vector(vector, INTEGER, FLOAT);
+DROP FUNCTION IF EXISTS search_gastos_with_filters(vector, INTEGER, FLOAT, VARCHAR, DATE, DATE, DECIMAL, DECIMAL);
+DROP FUNCTION IF EXISTS search_ingresos_with_filters(vector, INTEGER, FLOAT, VARCHAR, DATE, DATE, DECIMAL, DECIMAL);
+DROP FUNCTION IF EXISTS search_gastos_compact(vector, INTEGER, FLOAT, INTEGER);
+DROP FUNCTION IF EXISTS search_ingresos_compact(vector, INTEGER, FLOAT, INTEGER);
+
+
+-- Versiones anteriores con p_user_id pero sin parámetros del índice ANN
+DROP FUNCTION IF EXISTS search_gastos_by_vector(INTEGER, vector, INTEGER, FLOAT);
+DROP FUNCTION IF EXISTS search_ingresos_by_vector(INTEGER, vector, INTEGER, FLOAT);
+DROP FUNCTION IF EXISTS search_combined_by_vector(INTEGER, vector, INTEGER, FLOAT);
+DROP FUNCTION IF EXISTS search_gastos_with_filters(INTEGER, vector, INTEGER, FLOAT, VARCHAR, DATE, DATE, DECIMAL, DECIMAL);
+DROP FUNCTION IF EXISTS search_ingresos_with_filters(INTEGER, vector, INTEGER, FLOAT, VARCHAR, DATE, DATE, DECIMAL, DECIMAL);
+DROP FUNCTION IF EXISTS search_gastos_compact(INTEGER, vector, INTEGER, FLOAT, INTEGER);
+DROP FUNCTION IF EXISTS search_ingresos_compact(INTEGER, vector, INTEGER, FLOAT, INTEGER);
+
+-- ============================================================
+-- FUNCIÓN: iterative_scan_available
+-- Descripción: true si pgvector soporta iterative index scans (>= 0.8)
+-- ============================================================
+CREATE OR REPLACE FUNCTION iterative_scan_available()
+RETURNS BOOLEAN AS $$
+    SELECT EXISTS (SELECT 1 FROM pg_settings WHERE name = 'hnsw.iterative_scan');
+$$ LANGUAGE sql STABLE;
+
+-- ============================================================
+-- FUNCIÓN: estimate_search_rows
+-- Descripción: Filas de la tabla de embeddings y filas candidatas (del
+--              usuario y que pasan los filtros), según el planner. No
+--              recorre la tabla: usa EXPLAIN y pg_class.
+-- ============================================================
+CREATE OR REPLACE FUNCTION estimate_search_rows(
+    p_entity_type VARCHAR,
+    p_user_id INTEGER,
+    categoria_filter VARCHAR(100) DEFAULT NULL,
+    fecha_desde DATE DEFAULT NULL,
+    fecha_hasta DATE DEFAULT NULL,
+    monto_min DECIMAL DEFAULT NULL,
+    monto_max DECIMAL DEFAULT NULL
+)
+RETURNS TABLE (
+    table_rows BIGINT,
+    candidate_rows BIGINT
+) AS $$
+DECLARE
+    v_tabla TEXT;
+    v_clave TEXT;
+    v_pk TEXT;
+    v_filtros TEXT := '';
+    v_plan JSON;
+BEGIN
+    IF p_entity_type = 'gasto' THEN
+        v_tabla := 'gastos'; v_clave := 'gasto_id'; v_pk := 'id_gasto';
+    ELSIF p_entity_type = 'ingreso' THEN
+        v_tabla := 'ingresos'; v_clave := 'ingreso_id'; v_pk := 'id_ingreso';
+    ELSE
+        RAISE EXCEPTION 'Tipo de entidad no válido: %', p_entity_type;
+    END IF;
+
+    -- Literales en lugar de parámetros: el planner estima con los valores reales
+    IF categoria_filter IS NOT NULL THEN
+        v_filtros := v_filtros || format(' AND c.nombre = %L', categoria_filter);
+    END IF;
+    IF fecha_desde IS NOT NULL THEN
+        v_filtros := v_filtros || format(' AND t.fecha >= %L::DATE', fecha_desde);
+    END IF;
+    IF fecha_hasta IS NOT NULL THEN
+        v_filtros := v_filtros || format(' AND t.fecha <= %L::DATE', fecha_hasta);
+    END IF;
+    IF monto_min IS NOT NULL THEN
+        v_filtros := v_filtros || format(' AND t.monto >= %L::DECIMAL', monto_min);
+    END IF;
+    IF monto_max IS NOT NULL THEN
+        v_filtros := v_filtros || format(' AND t.monto <= %L::DECIMAL', monto_max);
+    END IF;
+
+    IF v_filtros = '' THEN
+        EXECUTE format(
+            'EXPLAIN (FORMAT JSON) SELECT 1 FROM %I e WHERE e.id_usuario = %s',
+            v_tabla || '_embeddings', p_user_id
+        ) INTO v_plan;
+    ELSE
+        EXECUTE format(
+            'EXPLAIN (FORMAT JSON) SELECT 1 FROM %I e '
+            'INNER JOIN %I t ON t.%I = e.%I '
+            'LEFT JOIN categorias c ON t.id_categoria = c.id_categoria '
+            'WHERE e.id_usuario = %s%s',
+            v_tabla || '_embeddings', v_tabla, v_pk, v_clave, p_user_id, v_filtros
+        ) INTO v_plan;
+    END IF;
+    candidate_rows := (v_plan -> 0 -> 'Plan' ->> 'Plan Rows')::BIGINT;
+
+    -- reltuples es -1 si la tabla nunca se analizó
+    SELECT GREATEST(cl.reltuples::BIGINT, candidate_rows) INTO table_rows
+    FROM pg_class cl
+    WHERE cl.oid = to_regclass(v_tabla || '_embeddings');
+
+    RETURN NEXT;
+END;
+$$ LANGUAGE plpgsql;  -- VOLATILE: EXPLAIN no se admite en funciones STABLE
+
+-- ============================================================
+-- FUNCIÓN: choose_vector_scan
+-- Descripción: Resuelve 'auto' a 'exact' o 'iterative'
+--
+-- El recorrido exacto calcula una distancia por fila candidata; el índice
+-- visita del orden de limit / selectividad filas antes de juntar el límite.
+-- Se usa el exacto si hay pocos candidatos o si son una porción chica de
+-- la tabla.
+-- ============================================================
+CREATE OR REPLACE FUNCTION choose_vector_scan(
+    p_strategy VARCHAR,
+    table_rows BIGINT,
+    candidate_rows BIGINT,
+    exact_max_rows INTEGER DEFAULT 20000,
+    min_selectivity FLOAT DEFAULT 0.05
+)
+RETURNS VARCHAR AS $$
+BEGIN
+    IF p_strategy NOT IN ('auto', 'exact', 'iterative') THEN
+        RAISE EXCEPTION 'Estrategia de búsqueda no válida: %', p_strategy;
+    END IF;
+
+    IF p_strategy = 'auto' THEN
+        IF candidate_rows <= exact_max_rows
+            OR candidate_rows < table_rows * min_selectivity THEN
+            RETURN 'exact';
+        END IF;
+        p_strategy := 'iterative';
+    END IF;
+
+    -- Sin iterative scan el índice filtraría después y devolvería menos filas
+    IF p_strategy = 'iterative' AND NOT iterative_scan_available() THEN
+        RETURN 'exact';
+    END IF;
+    RETURN p_strategy;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- ============================================================
+-- FUNCIONES: begin_vector_scan / end_vector_scan
+-- Descripción: Fijan ef_search, probes e iterative scan para la consulta
+--              de una función de búsqueda y restauran los valores previos
+--              al terminar, para no afectar a las búsquedas siguientes de
+--              la misma transacción. Si la consulta falla, la transacción
+--              (o el savepoint) revierte también estos valores.
+-- ============================================================
+CREATE OR REPLACE FUNCTION begin_vector_scan(
+    p_ef_search INTEGER DEFAULT NULL,
+    p_probes INTEGER DEFAULT NULL
+)
+RETURNS TEXT[] AS $$
+DECLARE
+    v_previos TEXT[] := ARRAY[
+        current_setting('hnsw.ef_search', true),
+        current_setting('ivfflat.probes', true),
+        current_setting('hnsw.iterative_scan', true),
+        current_setting('ivfflat.iterative_scan', true)
+    ];
+BEGIN
+    IF p_ef_search IS NOT NULL THEN
+        PERFORM set_config('hnsw.ef_search', p_ef_search::TEXT, true);
+    END IF;
+    IF p_probes IS NOT NULL THEN
+        PERFORM set_config('ivfflat.probes', p_probes::TEXT, true);
+    END IF;
+    -- relaxed_order: el resultado se re-ordena por distancia exacta
+    PERFORM set_config('hnsw.iterative_scan', 'relaxed_order', true);
+    PERFORM set_config('ivfflat.iterative_scan', 'relaxed_order', true);
+    RETURN v_previos;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION end_vector_scan(p_previos TEXT[])
+RETURNS VOID AS $$
+DECLARE
+    v_nombres TEXT[] := ARRAY[
+        'hnsw.ef_search', 'ivfflat.probes', 'hnsw.iterative_scan', 'ivfflat.iterative_scan'
+    ];
+BEGIN
+    FOR i IN 1 .. array_length(v_nombres, 1) LOOP
+        IF p_previos[i] IS NOT NULL THEN
+            PERFORM set_config(v_nombres[i], p_previos[i], true);
+        END IF;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================================
+-- FUNCIÓN: search_gastos_by_vector
+-- Descripción: Busca entre los gastos de un usuario
+-- Parámetros:
+--   - p_user_id: Dueño de los gastos (obligatorio)
+--   - query_embedding: Vector de consulta (768 dimensiones)
+--   - limit_results: Cantidad máxima de resultados (default: 10)
+--   - similarity_threshold: Umbral mínimo de similitud 0-1 (default: 0.7)
+--   - p_ef_search, p_probes: Parámetros del índice ANN si se recorre
+--     (NULL = los de la sesión)
+-- Retorna: Tabla con gastos ordenados por similitud
+-- ============================================================
+CREATE OR REPLACE FUNCTION search_gastos_by_vector(
+    p_user_id INTEGER,
+    query_embedding vector(768),
+    limit_results INTEGER DEFAULT 10,
+    similarity_threshold FLOAT DEFAULT 0.7,
+    p_ef_search INTEGER DEFAULT NULL,
+    p_probes INTEGER DEFAULT NULL
+)
+RETURNS TABLE (
+    gasto_id INTEGER,
+    descripcion TEXT,
+    monto DECIMAL,
+    fecha DATE,
+    categoria VARCHAR(100),
+    moneda VARCHAR(10),
+    similarity FLOAT,
+    texto_embedding TEXT,
+    metadata JSONB
+) AS $$
+DECLARE
+    v_previos TEXT[];
+BEGIN
+    IF (SELECT choose_vector_scan('auto', e.table_rows, e.candidate_rows)
+        FROM estimate_search_rows('gasto', p_user_id) e) = 'exact' THEN
+        RETURN QUERY
+        -- MATERIALIZED: se leen las filas del usuario por idx_*_usuario y se
+        -- ordenan por distancia exacta, sin pasar por el índice ANN
+        WITH propios AS MATERIALIZED (
+            SELECT ge.gasto_id, ge.embedding <=> query_embedding AS distance,
+                   ge.texto_original, ge.metadata
+            FROM gastos_embeddings ge
+            WHERE ge.id_usuario = p_user_id
+        )
+        SELECT
+            g.id_gasto AS gasto_id,
+            g.descripcion::TEXT,
+            g.monto,
+            g.fecha,
+            c.nombre AS categoria,
+            g.moneda::VARCHAR(10),
+            (1 - p.distance)::FLOAT AS similarity,
+            p.texto_original AS texto_embedding,
+            p.metadata
+        FROM propios p
+        INNER JOIN gastos g ON p.gasto_id = g.id_gasto
+        LEFT JOIN categorias c ON g.id_categoria = c.id_categoria
+        WHERE (1 - p.distance) >= similarity_threshold
+        ORDER BY p.distance ASC
+        LIMIT limit_results;
+        RETURN;
+    END IF;
+
+    -- Iterative scan: el índice sigue hasta juntar limit_results filas del
+    -- usuario; el umbral se aplica sobre ese top-k
+    v_previos := begin_vector_scan(p_ef_search, p_probes);
+    RETURN QUERY
+    WITH vecinos AS MATERIALIZED (
+        SELECT ge.gasto_id, ge.embedding <=> query_embedding AS distance,
+               ge.texto_original, ge.metadata
+        FROM gastos_embeddings ge
+        WHERE ge.id_usuario = p_user_id
+        ORDER BY ge.embedding <=> query_embedding
+        LIMIT limit_results
+    )
+    SELECT
+        g.id_gasto AS gasto_id,
+        g.descripcion::TEXT,
+        g.monto,
+        g.fecha,
+        c.nombre AS categoria,
+        g.moneda::VARCHAR(10),
+        (1 - v.distance)::FLOAT AS similarity,
+        v.texto_original AS texto_embedding,
+        v.metadata
+    FROM vecinos v
+    INNER JOIN gastos g ON v.gasto_id = g.id_gasto
+    LEFT JOIN categorias c ON g.id_categoria = c.id_categoria
+    WHERE (1 - v.distance) >= similarity_threshold
+    ORDER BY v.distance ASC;
+    PERFORM end_vector_scan(v_previos);
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================================
+-- FUNCIÓN: search_ingresos_by_vector
+-- Descripción: Busca entre los ingresos de un usuario
+-- ============================================================
+CREATE OR REPLACE FUNCTION search_ingresos_by_vector(
+    p_user_id INTEGER,
+    query_embedding vector(768),
+    limit_results INTEGER DEFAULT 10,
+    similarity_threshold FLOAT DEFAULT 0.7,
+    p_ef_search INTEGER DEFAULT NULL,
+    p_probes INTEGER DEFAULT NULL
+)
+RETURNS TABLE (
+    ingreso_id INTEGER,
+    descripcion TEXT,
+    monto DECIMAL,
+    fecha DATE,
+    categoria VARCHAR(100),
+    moneda VARCHAR(10),
+    similarity FLOAT,
+    texto_embedding TEXT,
+    metadata JSONB
+) AS $$
+DECLARE
+    v_previos TEXT[];
+BEGIN
+    IF (SELECT choose_vector_scan('auto', e.table_rows, e.candidate_rows)
+        FROM estimate_search_rows('ingreso', p_user_id) e) = 'exact' THEN
+        RETURN QUERY
+        WITH propios AS MATERIALIZED (
+            SELECT ie.ingreso_id, ie.embedding <=> query_embedding AS distance,
+                   ie.texto_original, ie.metadata
+            FROM ingresos_embeddings ie
+            WHERE ie.id_usuario = p_user_id
+        )
+        SELECT
+            i.id_ingreso AS ingreso_id,
+            i.descripcion::TEXT,
+            i.monto,
+            i.fecha,
+            c.nombre AS categoria,
+            i.moneda::VARCHAR(10),
+            (1 - p.distance)::FLOAT AS similarity,
+            p.texto_original AS texto_embedding,
+            p.metadata
+        FROM propios p
+        INNER JOIN ingresos i ON p.ingreso_id = i.id_ingreso
+        LEFT JOIN categorias c ON i.id_categoria = c.id_categoria
+        WHERE (1 - p.distance) >= similarity_threshold
+        ORDER BY p.distance ASC
+        LIMIT limit_results;
+        RETURN;
+    END IF;
+
+    v_previos := begin_vector_scan(p_ef_search, p_probes);
+    RETURN QUERY
+    WITH vecinos AS MATERIALIZED (
+        SELECT ie.ingreso_id, ie.embedding <=> query_embedding AS distance,
+               ie.texto_original, ie.metadata
+        FROM ingresos_embeddings ie
+        WHERE ie.id_usuario = p_user_id
+        ORDER BY ie.embedding <=> query_embedding
+        LIMIT limit_results
+    )
+    SELECT
+        i.id_ingreso AS ingreso_id,
+        i.descripcion::TEXT,
+        i.monto,
+        i.fecha,
+        c.nombre AS categoria,
+        i.moneda::VARCHAR(10),
+        (1 - v.distance)::FLOAT AS similarity,
+        v.texto_original AS texto_embedding,
+        v.metadata
+    FROM vecinos v
+    INNER JOIN ingresos i ON v.ingreso_id = i.id_ingreso
+    LEFT JOIN categorias c ON i.id_categoria = c.id_categoria
+    WHERE (1 - v.distance) >= similarity_threshold
+    ORDER BY v.distance ASC;
+    PERFORM end_vector_scan(v_previos);
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================================
+-- FUNCIÓN: search_combined_by_vector
+-- Descripción: Busca entre los gastos e ingresos de un usuario
+-- Retorna: Tabla combinada con tipo de transacción, ordenada por similitud
+-- ============================================================
+CREATE OR REPLACE FUNCTION search_combined_by_vector(
+    p_user_id INTEGER,
+    query_embedding vector(768),
+    limit_results INTEGER DEFAULT 10,
+    similarity_threshold FLOAT DEFAULT 0.7,
+    p_ef_search INTEGER DEFAULT NULL,
+    p_probes INTEGER DEFAULT NULL
+)
+RETURNS TABLE (
+    transaction_type VARCHAR(10),  -- 'gasto' o 'ingreso'
+    transaction_id INTEGER,
+    descripcion TEXT,
+    monto DECIMAL,
+    fecha DATE,
+    categoria VARCHAR(100),
+    moneda VARCHAR(10),
+    similarity FLOAT,
+    texto_embedding TEXT,
+    metadata JSONB
+) AS $$
+BEGIN
+    RETURN QUERY
+    SELECT * FROM (
+        SELECT 'gasto'::VARCHAR(10), s.gasto_id, s.descripcion, s.monto, s.fecha,
+               s.categoria, s.moneda, s.similarity, s.texto_embedding, s.metadata
+        FROM search_gastos_by_vector(
+            p_user_id, query_embedding, limit_results, similarity_threshold, p_ef_search, p_probes
+        ) s
+
+        UNION ALL
+
+        SELECT 'ingreso'::VARCHAR(10), s.ingreso_id, s.descripcion, s.monto, s.fecha,
+               s.categoria, s.moneda, s.similarity, s.texto_embedding, s.metadata
+        FROM search_ingresos_by_vector(
+            p_user_id, query_embedding, limit_results, similarity_threshold, p_ef_search, p_probes
+        ) s
+    ) combined
+    ORDER BY 8 DESC
+    LIMIT limit_results * 2;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================================
+-- FUNCIÓN: search_gastos_with_filters
+-- Descripción: Búsqueda entre los gastos de un usuario con filtros
+--              por categoría (nombre), fecha y monto
+-- Parámetros adicionales:
+--   - p_ef_search, p_probes: Parámetros del índice ANN si se recorre
+--   - p_strategy: 'auto' (choose_vector_scan), 'exact' o 'iterative'
+--   - p_exact_max_rows, p_min_selectivity: Umbrales de 'auto'
+-- ============================================================
+CREATE OR REPLACE FUNCTION search_gastos_with_filters(
+    p_user_id INTEGER,
+    query_embedding vector(768),
+    limit_results INTEGER DEFAULT 10,
+    similarity_threshold FLOAT DEFAULT 0.7,
+    categoria_filter VARCHAR(100) DEFAULT NULL,
+    fecha_desde DATE DEFAULT NULL,
+    fecha_hasta DATE DEFAULT NULL,
+    monto_min DECIMAL DEFAULT NULL,
+    monto_max DECIMAL DEFAULT NULL,
+    p_ef_search INTEGER DEFAULT NULL,
+    p_probes INTEGER DEFAULT NULL,
+    p_strategy VARCHAR DEFAULT 'auto',
+    p_exact_max_rows INTEGER DEFAULT 20000,
+    p_min_selectivity FLOAT DEFAULT 0.05
+)
+RETURNS TABLE (
+    gasto_id INTEGER,
+    descripcion TEXT,
+    monto DECIMAL,
+    fecha DATE,
+    categoria VARCHAR(100),
+    moneda VARCHAR(10),
+    similarity FLOAT,
+    texto_embedding TEXT
+) AS $$
+DECLARE
+    v_previos TEXT[];
+BEGIN
+    IF p_strategy = 'auto' THEN
+        SELECT choose_vector_scan(
+            p_strategy, e.table_rows, e.candidate_rows, p_exact_max_rows, p_min_selectivity
+        ) INTO p_strategy
+        FROM estimate_search_rows(
+            'gasto', p_user_id, categoria_filter, fecha_desde, fecha_hasta, monto_min, monto_max
+        ) e;
+    ELSE
+        -- Ya resuelta (ej: plan_vector_search): valida y sin iterative scan usa 'exact'
+        p_strategy := choose_vector_scan(p_strategy, NULL, NULL);
+    END IF;
+
+    IF p_strategy = 'exact' THEN
+        -- MATERIALIZED: los filtros (índices B-tree) arman el conjunto y la
+        -- distancia exacta se calcula sobre él; el índice ANN no participa
+        RETURN QUERY
+        WITH candidatos AS MATERIALIZED (
+            SELECT g.id_gasto, g.descripcion, g.monto, g.fecha, c.nombre,
+                   g.moneda, ge.embedding <=> query_embedding AS distance,
+                   ge.texto_original
+            FROM gastos_embeddings ge
+            INNER JOIN gastos g ON ge.gasto_id = g.id_gasto
+            LEFT JOIN categorias c ON g.id_categoria = c.id_categoria
+            WHERE ge.id_usuario = p_user_id
+                AND (categoria_filter IS NULL OR c.nombre = categoria_filter)
+                AND (fecha_desde IS NULL OR g.fecha >= fecha_desde)
+                AND (fecha_hasta IS NULL OR g.fecha <= fecha_hasta)
+                AND (monto_min IS NULL OR g.monto >= monto_min)
+                AND (monto_max IS NULL OR g.monto <= monto_max)
+        )
+        SELECT
+            k.id_gasto,
+            k.descripcion::TEXT,
+            k.monto,
+            k.fecha,
+            k.nombre,
+            k.moneda::VARCHAR(10),
+            (1 - k.distance)::FLOAT,
+            k.texto_original
+        FROM candidatos k
+        WHERE (1 - k.distance) >= similarity_threshold
+        ORDER BY k.distance ASC
+        LIMIT limit_results;
+        RETURN;
+    END IF;
+
+    -- Iterative scan: los filtros se evalúan mientras se recorre el índice
+    v_previos := begin_vector_scan(p_ef_search, p_probes);
+    RETURN QUERY
+    WITH vecinos AS MATERIALIZED (
+        SELECT g.id_gasto, g.descripcion, g.monto, g.fecha, c.nombre,
+               g.moneda, ge.embedding <=> query_embedding AS distance,
+               ge.texto_original
+        FROM gastos_embeddings ge
+        INNER JOIN gastos g ON ge.gasto_id = g.id_gasto
+        LEFT JOIN categorias c ON g.id_categoria = c.id_categoria
+        WHERE ge.id_usuario = p_user_id
+            AND (categoria_filter IS NULL OR c.nombre = categoria_filter)
+            AND (fecha_desde IS NULL OR g.fecha >= fecha_desde)
+            AND (fecha_hasta IS NULL OR g.fecha <= fecha_hasta)
+            AND (monto_min IS NULL OR g.monto >= monto_min)
+            AND (monto_max IS NULL OR g.monto <= monto_max)
+        ORDER BY ge.embedding <=> query_embedding
+        LIMIT limit_results
+    )
+    SELECT
+        v.id_gasto,
+        v.descripcion::TEXT,
+        v.monto,
+        v.fecha,
+        v.nombre,
+        v.moneda::VARCHAR(10),
+        (1 - v.distance)::FLOAT,
+        v.texto_original
+    FROM vecinos v
+    WHERE (1 - v.distance) >= similarity_threshold
+    ORDER BY v.distance ASC;
+    PERFORM end_vector_scan(v_previos);
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================================
+-- FUNCIÓN: search_ingresos_with_filters
+-- Descripción: Búsqueda entre los ingresos de un usuario con filtros
+-- Parámetros adicionales:
+--   - p_ef_search, p_probes: Parámetros del índice ANN si se recorre
+--   - p_strategy: 'auto' (choose_vector_scan), 'exact' o 'iterative'
+--   - p_exact_max_rows, p_min_selectivity: Umbrales de 'auto'
+-- ============================================================
+CREATE OR REPLACE FUNCTION search_ingresos_with_filters(
+    p_user_id INTEGER,
+    query_embedding vector(768),
+    limit_results INTEGER DEFAULT 10,
+    similarity_threshold FLOAT DEFAULT 0.7,
+    categoria_filter VARCHAR(100) DEFAULT NULL,
+    fecha_desde DATE DEFAULT NULL,
+    fecha_hasta DATE DEFAULT NULL,
+    monto_min DECIMAL DEFAULT NULL,
+    monto_max DECIMAL DEFAULT NULL,
+    p_ef_search INTEGER DEFAULT NULL,
+    p_probes INTEGER DEFAULT NULL,
+    p_strategy VARCHAR DEFAULT 'auto',
+    p_exact_max_rows INTEGER DEFAULT 20000,
+    p_min_selectivity FLOAT DEFAULT 0.05
+)
+RETURNS TABLE (
+    ingreso_id INTEGER,
+    descripcion TEXT,
+    monto DECIMAL,
+    fecha DATE,
+    categoria VARCHAR(100),
+    moneda VARCHAR(10),
+    similarity FLOAT,
+    texto_embedding TEXT
+) AS $$
+DECLARE
+    v_previos TEXT[];
+BEGIN
+    IF p_strategy = 'auto' THEN
+        SELECT choose_vector_scan(
+            p_strategy, e.table_rows, e.candidate_rows, p_exact_max_rows, p_min_selectivity
+        ) INTO p_strategy
+        FROM estimate_search_rows(
+            'ingreso', p_user_id, categoria_filter, fecha_desde, fecha_hasta, monto_min, monto_max
+        ) e;
+    ELSE
+        -- Ya resuelta (ej: plan_vector_search): valida y sin iterative scan usa 'exact'
+        p_strategy := choose_vector_scan(p_strategy, NULL, NULL);
+    END IF;
+
+    IF p_strategy = 'exact' THEN
+        -- MATERIALIZED: los filtros (índices B-tree) arman el conjunto y la
+        -- distancia exacta se calcula sobre él; el índice ANN no participa
+        RETURN QUERY
+        WITH candidatos AS MATERIALIZED (
+            SELECT i.id_ingreso, i.descripcion, i.monto, i.fecha, c.nombre,
+                   i.moneda, ie.embedding <=> query_embedding AS distance,
+                   ie.texto_original
+            FROM ingresos_embeddings ie
+            INNER JOIN ingresos i ON ie.ingreso_id = i.id_ingreso
+            LEFT JOIN categorias c ON i.id_categoria = c.id_categoria
+            WHERE ie.id_usuario = p_user_id
+                AND (categoria_filter IS NULL OR c.nombre = categoria_filter)
+                AND (fecha_desde IS NULL OR i.fecha >= fecha_desde)
+                AND (fecha_hasta IS NULL OR i.fecha <= fecha_hasta)
+                AND (monto_min IS NULL OR i.monto >= monto_min)
+                AND (monto_max IS NULL OR i.monto <= monto_max)
+        )
+        SELECT
+            k.id_ingreso,
+            k.descripcion::TEXT,
+            k.monto,
+            k.fecha,
+            k.nombre,
+            k.moneda::VARCHAR(10),
+            (1 - k.distance)::FLOAT,
+            k.texto_original
+        FROM candidatos k
+        WHERE (1 - k.distance) >= similarity_threshold
+        ORDER BY k.distance ASC
+        LIMIT limit_results;
+        RETURN;
+    END IF;
+
+    -- Iterative scan: los filtros se evalúan mientras se recorre el índice
+    v_previos := begin_vector_scan(p_ef_search, p_probes);
+    RETURN QUERY
+    WITH vecinos AS MATERIALIZED (
+        SELECT i.id_ingreso, i.descripcion, i.monto, i.fecha, c.nombre,
+               i.moneda, ie.embedding <=> query_embedding AS distance,
+               ie.texto_original
+        FROM ingresos_embeddings ie
+        INNER JOIN ingresos i ON ie.ingreso_id = i.id_ingreso
+        LEFT JOIN categorias c ON i.id_categoria = c.id_categoria
+        WHERE ie.id_usuario = p_user_id
+            AND (categoria_filter IS NULL OR c.nombre = categoria_filter)
+            AND (fecha_desde IS NULL OR i.fecha >= fecha_desde)
+            AND (fecha_hasta IS NULL OR i.fecha <= fecha_hasta)
+            AND (monto_min IS NULL OR i.monto >= monto_min)
+            AND (monto_max IS NULL OR i.monto <= monto_max)
+        ORDER BY ie.embedding <=> query_embedding
+        LIMIT limit_results
+    )
+    SELECT
+        v.id_ingreso,
+        v.descripcion::TEXT,
+        v.monto,
+        v.fecha,
+        v.nombre,
+        v.moneda::VARCHAR(10),
+        (1 - v.distance)::FLOAT,
+        v.texto_original
+    FROM vecinos v
+    WHERE (1 - v.distance) >= similarity_threshold
+    ORDER BY v.distance ASC;
+    PERFORM end_vector_scan(v_previos);
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================================
+-- FUNCIÓN: search_gastos_compact
+-- Descripción: Candidatos del usuario por distancia halfvec, re-ordenados
+--              con la distancia exacta sobre el embedding float32
+-- ============================================================
+CREATE OR REPLACE FUNCTION search_gastos_compact(
+    p_user_id INTEGER,
+    query_embedding vector(768),
+    limit_results INTEGER DEFAULT 10,
+    similarity_threshold FLOAT DEFAULT 0.7,
+    candidate_count INTEGER DEFAULT NULL,
+    p_ef_search INTEGER DEFAULT NULL,
+    p_probes INTEGER DEFAULT NULL
+)
+RETURNS TABLE (
+    gasto_id INTEGER,
+    descripcion TEXT,
+    monto DECIMAL,
+    fecha DATE,
+    categoria VARCHAR(100),
+    moneda VARCHAR(10),
+    similarity FLOAT,
+    texto_embedding TEXT,
+    metadata JSONB
+) AS $$
+DECLARE
+    v_previos TEXT[];
+BEGIN
+    IF (SELECT choose_vector_scan('auto', e.table_rows, e.candidate_rows)
+        FROM estimate_search_rows('gasto', p_user_id) e) = 'exact' THEN
+        RETURN QUERY
+        -- Distancia halfvec sobre las filas del usuario, sin el índice ANN
+        WITH propios AS MATERIALIZED (
+            SELECT ge.id, ge.embedding_half <=> query_embedding::halfvec AS half_distance
+            FROM gastos_embeddings ge
+            WHERE ge.id_usuario = p_user_id
+        ),
+        candidatos AS (
+            SELECT ge.gasto_id, ge.embedding, ge.texto_original, ge.metadata
+            FROM propios p
+            INNER JOIN gastos_embeddings ge ON ge.id = p.id
+            ORDER BY p.half_distance
+            LIMIT COALESCE(candidate_count, limit_results * 4)
+        )
+        SELECT
+            g.id_gasto AS gasto_id,
+            g.descripcion::TEXT,
+            g.monto,
+            g.fecha,
+            c.nombre AS categoria,
+            g.moneda::VARCHAR(10),
+            (1 - (ca.embedding <=> query_embedding))::FLOAT AS similarity,
+            ca.texto_original AS texto_embedding,
+            ca.metadata
+        FROM candidatos ca
+        INNER JOIN gastos g ON ca.gasto_id = g.id_gasto
+        LEFT JOIN categorias c ON g.id_categoria = c.id_categoria
+        WHERE (1 - (ca.embedding <=> query_embedding)) >= similarity_threshold
+        ORDER BY ca.embedding <=> query_embedding ASC
+        LIMIT limit_results;
+        RETURN;
+    END IF;
+
+    -- Iterative scan sobre el índice halfvec (compact_embeddings.sql): los
+    -- candidatos del usuario se re-ordenan con la distancia float32
+    v_previos := begin_vector_scan(p_ef_search, p_probes);
+    RETURN QUERY
+    WITH candidatos AS MATERIALIZED (
+        SELECT ge.gasto_id, ge.embedding, ge.texto_original, ge.metadata
+        FROM gastos_embeddings ge
+        WHERE ge.id_usuario = p_user_id
+        ORDER BY ge.embedding_half <=> query_embedding::halfvec
+        LIMIT COALESCE(candidate_count, limit_results * 4)
+    )
+    SELECT
+        g.id_gasto AS gasto_id,
+        g.descripcion::TEXT,
+        g.monto,
+        g.fecha,
+        c.nombre AS categoria,
+        g.moneda::VARCHAR(10),
+        (1 - (ca.embedding <=> query_embedding))::FLOAT AS similarity,
+        ca.texto_original AS texto_embedding,
+        ca.metadata
+    FROM candidatos ca
+    INNER JOIN gastos g ON ca.gasto_id = g.id_gasto
+    LEFT JOIN categorias c ON g.id_categoria = c.id_categoria
+    WHERE (1 - (ca.embedding <=> query_embedding)) >= similarity_threshold
+    ORDER BY ca.embedding <=> query_embedding ASC
+    LIMIT limit_results;
+    PERFORM end_vector_scan(v_previos);
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================================
+-- FUNCIÓN: search_ingresos_compact
+-- Descripción: Igual que search_gastos_compact, para ingresos
+-- ============================================================
+CREATE OR REPLACE FUNCTION search_ingresos_compact(
+    p_user_id INTEGER,
+    query_embedding vector(768),
+    limit_results INTEGER DEFAULT 10,
+    similarity_threshold FLOAT DEFAULT 0.7,
+    candidate_count INTEGER DEFAULT NULL,
+    p_ef_search INTEGER DEFAULT NULL,
+    p_probes INTEGER DEFAULT NULL
+)
+RETURNS TABLE (
+    ingreso_id INTEGER,
+    descripcion TEXT,
+    monto DECIMAL,
+    fecha DATE,
+    categoria VARCHAR(100),
+    moneda VARCHAR(10),
+    similarity FLOAT,
+    texto_embedding TEXT,
+    metadata JSONB
+) AS $$
+DECLARE
+    v_previos TEXT[];
+BEGIN
+    IF (SELECT choose_vector_scan('auto', e.table_rows, e.candidate_rows)
+        FROM estimate_search_rows('ingreso', p_user_id) e) = 'exact' THEN
+        RETURN QUERY
+        -- Distancia halfvec sobre las filas del usuario, sin el índice ANN
+        WITH propios AS MATERIALIZED (
+            SELECT ie.id, ie.embedding_half <=> query_embedding::halfvec AS half_distance
+            FROM ingresos_embeddings ie
+            WHERE ie.id_usuario = p_user_id
+        ),
+        candidatos AS (
+            SELECT ie.ingreso_id, ie.embedding, ie.texto_original, ie.metadata
+            FROM propios p
+            INNER JOIN ingresos_embeddings ie ON ie.id = p.id
+            ORDER BY p.half_distance
+            LIMIT COALESCE(candidate_count, limit_results * 4)
+        )
+        SELECT
+            i.id_ingreso AS ingreso_id,
+            i.descripcion::TEXT,
+            i.monto,
+            i.fecha,
+            c.nombre AS categoria,
+            i.moneda::VARCHAR(10),
+            (1 - (ca.embedding <=> query_embedding))::FLOAT AS similarity,
+            ca.texto_original AS texto_embedding,
+            ca.metadata
+        FROM candidatos ca
+        INNER JOIN ingresos i ON ca.ingreso_id = i.id_ingreso
+        LEFT JOIN categorias c ON i.id_categoria = c.id_categoria
+        WHERE (1 - (ca.embedding <=> query_embedding)) >= similarity_threshold
+        ORDER BY ca.embedding <=> query_embedding ASC
+        LIMIT limit_results;
+        RETURN;
+    END IF;
+
+    -- Iterative scan sobre el índice halfvec (compact_embeddings.sql): los
+    -- candidatos del usuario se re-ordenan con la distancia float32
+    v_previos := begin_vector_scan(p_ef_search, p_probes);
+    RETURN QUERY
+    WITH candidatos AS MATERIALIZED (
+        SELECT ie.ingreso_id, ie.embedding, ie.texto_original, ie.metadata
+        FROM ingresos_embeddings ie
+        WHERE ie.id_usuario = p_user_id
+        ORDER BY ie.embedding_half <=> query_embedding::halfvec
+        LIMIT COALESCE(candidate_count, limit_results * 4)
+    )
+    SELECT
+        i.id_ingreso AS ingreso_id,
+        i.descripcion::TEXT,
+        i.monto,
+        i.fecha,
+        c.nombre AS categoria,
+        i.moneda::VARCHAR(10),
+        (1 - (ca.embedding <=> query_embedding))::FLOAT AS similarity,
+        ca.texto_original AS texto_embedding,
+        ca.metadata
+    FROM candidatos ca
+    INNER JOIN ingresos i ON ca.ingreso_id = i.id_ingreso
+    LEFT JOIN categorias c ON i.id_categoria = c.id_categoria
+    WHERE (1 - (ca.embedding <=> query_embedding)) >= similarity_threshold
+    ORDER BY ca.embedding <=> query_embedding ASC
+    LIMIT limit_results;
+    PERFORM end_vector_scan(v_previos);
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON COLUMN gastos_embeddings.id_usuario IS 'Dueño del gasto (desnormalizado por trigger para filtrar búsquedas)';
+COMMENT ON COLUMN ingresos_embeddings.id_usuario IS 'Dueño del ingreso (desnormalizado por trigger para filtrar búsquedas)';
+COMMENT ON FUNCTION search_gastos_by_vector IS 'Búsqueda vectorial entre los gastos de un usuario (recorrido exacto o iterative scan)';
+COMMENT ON FUNCTION search_ingresos_by_vector IS 'Búsqueda vectorial entre los ingresos de un usuario (recorrido exacto o iterative scan)';
+COMMENT ON FUNCTION search_combined_by_vector IS 'Búsqueda vectorial combinada entre los gastos e ingresos de un usuario';
+COMMENT ON FUNCTION search_gastos_with_filters IS 'Búsqueda vectorial de gastos de un usuario con filtros por categoría, fecha y monto';
+COMMENT ON FUNCTION search_ingresos_with_filters IS 'Búsqueda vectorial de ingresos de un usuario con filtros por categoría, fecha y monto';
+COMMENT ON FUNCTION estimate_search_rows IS 'Filas de la tabla de embeddings y candidatas del usuario (con filtros), según el planner';
+COMMENT ON FUNCTION choose_vector_scan IS 'Elige recorrido exacto por usuario o iterative index scan según la selectividad';
+COMMENT ON FUNCTION begin_vector_scan IS 'Fija ef_search, probes e iterative scan y retorna los valores previos';
+COMMENT ON FUNCTION end_vector_scan IS 'Restaura los valores guardados por begin_vector_scan';
+COMMENT ON FUNCTION search_gastos_compact IS 'Búsqueda halfvec (recorrido exacto o índice HNSW halfvec) con re-ranking float32 entre los gastos de un usuario';
+COMMENT ON FUNCTION search_ingresos_compact IS 'Búsqueda halfvec (recorrido exacto o índice HNSW halfvec) con re-ranking float32 entre los ingresos de un usuario';
+
+-- Mensajes informativos
+\echo '✓ Columna id_usuario e índices por usuario en las tablas de embeddings'
+\echo '✓ Funciones de búsqueda acotadas por usuario (p_user_id obligatorio)'
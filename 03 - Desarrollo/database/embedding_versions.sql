@@ -0,0 +1,252 @@
+-- ============================================================
+-- Script: embedding_versions.sql
+-- Descripción: Versionado del modelo de embeddings con tablas sombra
+--              y cambio de versión atómico (sin vaciar la búsqueda)
+-- Fecha: 17 octubre 2026
+-- Orden de ejecución: 08 (después de add_embedding_content_hash.sql)
+-- ============================================================
+--
+-- Flujo para evaluar o cambiar de modelo (ej: Azure 1536 -> Gemini 768):
+--   1. SELECT create_embedding_shadow('gemini:models/text-embedding-004:768', 768);
+--   2. Backfill de la sombra con el modelo nuevo (la API sigue usando las
+--      tablas activas):
+--        python scripts/populate_embeddings.py --target shadow --provider gemini
+--   3. SELECT cutover_embedding_shadow();   -- intercambio atómico
+--   4. Reiniciar la API con EMBEDDING_PROVIDER del modelo nuevo
+--   Si el modelo nuevo no convence: SELECT rollback_embedding_cutover();
+--
+-- Reemplaza al antiguo recreate_embeddings_768.sql, que borraba las tablas y dejaba
+-- la búsqueda semántica vacía hasta terminar el backfill.
+
+-- ============================================================
+-- VERSIÓN POR FILA
+-- Descripción: proveedor:modelo:dimensiones con el que se generó cada embedding
+-- ============================================================
+ALTER TABLE gastos_embeddings
+    ADD COLUMN IF NOT EXISTS model_version VARCHAR(100);
+
+ALTER TABLE ingresos_embeddings
+    ADD COLUMN IF NOT EXISTS model_version VARCHAR(100);
+
+COMMENT ON COLUMN gastos_embeddings.model_version IS 'proveedor:modelo:dimensiones que generó el embedding';
+COMMENT ON COLUMN ingresos_embeddings.model_version IS 'proveedor:modelo:dimensiones que generó el embedding';
+
+-- ============================================================
+-- TABLA: embedding_model_versions
+-- Descripción: Registro de versiones de modelo. Como máximo una 'active'
+--              (la de las tablas *_embeddings) y una 'building' (la sombra).
+-- ============================================================
+CREATE TABLE IF NOT EXISTS embedding_model_versions (
+    id SERIAL PRIMARY KEY,
+    model_version VARCHAR(100) NOT NULL UNIQUE,
+    dimensions INTEGER NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'building'
+        CHECK (status IN ('building', 'active', 'retired')),
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    activated_at TIMESTAMP WITH TIME ZONE
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_embedding_model_versions_active
+ON embedding_model_versions (status) WHERE status = 'active';
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_embedding_model_versions_building
+ON embedding_model_versions (status) WHERE status = 'building';
+
+-- ============================================================
+-- FUNCIÓN: create_embedding_shadow
+-- Descripción: (Re)crea las tablas sombra con las dimensiones del modelo
+--              nuevo y registra la versión como 'building'
+-- Parámetros:
+--   - p_model_version: Identificador proveedor:modelo:dimensiones
+--   - p_dimensions: Dimensiones del modelo nuevo
+-- ============================================================
+CREATE OR REPLACE FUNCTION create_embedding_shadow(
+    p_model_version VARCHAR,
+    p_dimensions INTEGER
+)
+RETURNS VOID AS $$
+DECLARE
+    v_version_id INTEGER;
+    v_entity RECORD;
+BEGIN
+    -- Solo puede haber una sombra en construcción
+    UPDATE embedding_model_versions SET status = 'retired'
+    WHERE status = 'building' AND model_version <> p_model_version;
+
+    INSERT INTO embedding_model_versions (model_version, dimensions, status)
+    VALUES (p_model_version, p_dimensions, 'building')
+    ON CONFLICT (model_version) DO UPDATE
+        SET dimensions = EXCLUDED.dimensions, status = 'building', activated_at = NULL
+    RETURNING id INTO v_version_id;
+
+    FOR v_entity IN
+        SELECT * FROM (VALUES
+            ('gastos_embeddings', 'gasto_id', 'gastos', 'id_gasto'),
+            ('ingresos_embeddings', 'ingreso_id', 'ingresos', 'id_ingreso')
+        ) AS t(tabla, fk, tabla_ref, id_ref)
+    LOOP
+        EXECUTE format('DROP TABLE IF EXISTS %I', v_entity.tabla || '_shadow');
+
+        -- Nombres implícitos para PK/UNIQUE: PostgreSQL los elige sin colisionar
+        -- con los de la tabla activa (que pudo ser sombra en una versión previa)
+        EXECUTE format(
+            'CREATE TABLE %I (
+                id SERIAL PRIMARY KEY,
+                %I INTEGER NOT NULL UNIQUE REFERENCES %I(%I) ON DELETE CASCADE,
+                id_usuario INTEGER NOT NULL,
+                embedding vector(%s) NOT NULL,
+                embedding_half halfvec(%s) GENERATED ALWAYS AS (embedding::halfvec(%s)) STORED,
+                texto_original TEXT NOT NULL,
+                content_hash VARCHAR(64),
+                model_version VARCHAR(100),
+                metadata JSONB,
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+            )',
+            v_entity.tabla || '_shadow', v_entity.fk, v_entity.tabla_ref, v_entity.id_ref,
+            p_dimensions, p_dimensions, p_dimensions
+        );
+
+        -- Índices con el id de versión en el nombre para que sobrevivan al rename
+        EXECUTE format(
+            'CREATE INDEX %I ON %I USING hnsw (embedding vector_cosine_ops)',
+            format('idx_%s_v%s_vector', v_entity.tabla, v_version_id), v_entity.tabla || '_shadow'
+        );
+        EXECUTE format(
+            'CREATE INDEX %I ON %I USING hnsw (embedding_half halfvec_cosine_ops)',
+            format('idx_%s_v%s_half', v_entity.tabla, v_version_id), v_entity.tabla || '_shadow'
+        );
+        EXECUTE format(
+            'CREATE INDEX %I ON %I USING gin (metadata)',
+            format('idx_%s_v%s_metadata', v_entity.tabla, v_version_id), v_entity.tabla || '_shadow'
+        );
+        EXECUTE format(
+            'CREATE INDEX %I ON %I (id_usuario)',
+            format('idx_%s_v%s_usuario', v_entity.tabla, v_version_id), v_entity.tabla || '_shadow'
+        );
+        -- id_usuario desnormalizado, igual que en la tabla activa (embedding_user_scope.sql)
+        EXECUTE format(
+            'CREATE TRIGGER %I BEFORE INSERT OR UPDATE OF %I ON %I
+             FOR EACH ROW EXECUTE FUNCTION %I()',
+            format('trg_%s_usuario', v_entity.tabla), v_entity.fk,
+            v_entity.tabla || '_shadow', format('set_%s_usuario', v_entity.tabla)
+        );
+        -- updated_at al día, igual que en create_embeddings_tables.sql: el
+        -- backfill de la próxima sombra compara contra él
+        EXECUTE format(
+            'CREATE TRIGGER %I BEFORE UPDATE ON %I
+             FOR EACH ROW EXECUTE FUNCTION update_embeddings_updated_at()',
+            format('trigger_update_%s_updated_at', v_entity.tabla), v_entity.tabla || '_shadow'
+        );
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Tablas activadas con un cutover anterior, cuya sombra se creó sin el
+-- trigger de updated_at
+DROP TRIGGER IF EXISTS trigger_update_gastos_embeddings_updated_at ON gastos_embeddings;
+CREATE TRIGGER trigger_update_gastos_embeddings_updated_at
+    BEFORE UPDATE ON gastos_embeddings
+    FOR EACH ROW
+    EXECUTE FUNCTION update_embeddings_updated_at();
+
+DROP TRIGGER IF EXISTS trigger_update_ingresos_embeddings_updated_at ON ingresos_embeddings;
+CREATE TRIGGER trigger_update_ingresos_embeddings_updated_at
+    BEFORE UPDATE ON ingresos_embeddings
+    FOR EACH ROW
+    EXECUTE FUNCTION update_embeddings_updated_at();
+
+-- ============================================================
+-- FUNCIÓN: cutover_embedding_shadow
+-- Descripción: Intercambia en una sola transacción las tablas sombra con
+--              las activas. Las activas quedan como *_retired para poder
+--              volver atrás. Las funciones de búsqueda referencian las
+--              tablas por nombre, así que pasan a usar la versión nueva.
+-- Retorna: model_version activada
+-- ============================================================
+CREATE OR REPLACE FUNCTION cutover_embedding_shadow()
+RETURNS VARCHAR AS $$
+DECLARE
+    v_model_version VARCHAR;
+BEGIN
+    SELECT model_version INTO v_model_version
+    FROM embedding_model_versions WHERE status = 'building';
+
+    IF v_model_version IS NULL OR to_regclass('gastos_embeddings_shadow') IS NULL
+       OR to_regclass('ingresos_embeddings_shadow') IS NULL THEN
+        RAISE EXCEPTION 'No hay una versión sombra en construcción';
+    END IF;
+
+    -- El bloqueo dura solo lo que tardan los renames
+    LOCK TABLE gastos_embeddings, ingresos_embeddings,
+               gastos_embeddings_shadow, ingresos_embeddings_shadow
+        IN ACCESS EXCLUSIVE MODE;
+
+    DROP TABLE IF EXISTS gastos_embeddings_retired;
+    DROP TABLE IF EXISTS ingresos_embeddings_retired;
+
+    ALTER TABLE gastos_embeddings RENAME TO gastos_embeddings_retired;
+    ALTER TABLE gastos_embeddings_shadow RENAME TO gastos_embeddings;
+    ALTER TABLE ingresos_embeddings RENAME TO ingresos_embeddings_retired;
+    ALTER TABLE ingresos_embeddings_shadow RENAME TO ingresos_embeddings;
+
+    UPDATE embedding_model_versions SET status = 'retired' WHERE status = 'active';
+    UPDATE embedding_model_versions
+    SET status = 'active', activated_at = CURRENT_TIMESTAMP
+    WHERE model_version = v_model_version;
+
+    RETURN v_model_version;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================================
+-- FUNCIÓN: rollback_embedding_cutover
+-- Descripción: Vuelve a activar las tablas *_retired; las activas pasan a
+--              ser la sombra (se pueden volver a activar con un cutover)
+-- Retorna: model_version reactivada (NULL si no estaba registrada)
+-- ============================================================
+CREATE OR REPLACE FUNCTION rollback_embedding_cutover()
+RETURNS VARCHAR AS $$
+DECLARE
+    v_model_version VARCHAR;
+BEGIN
+    IF to_regclass('gastos_embeddings_retired') IS NULL
+       OR to_regclass('ingresos_embeddings_retired') IS NULL THEN
+        RAISE EXCEPTION 'No hay tablas retiradas a las que volver';
+    END IF;
+
+    LOCK TABLE gastos_embeddings, ingresos_embeddings,
+               gastos_embeddings_retired, ingresos_embeddings_retired
+        IN ACCESS EXCLUSIVE MODE;
+
+    DROP TABLE IF EXISTS gastos_embeddings_shadow;
+    DROP TABLE IF EXISTS ingresos_embeddings_shadow;
+
+    ALTER TABLE gastos_embeddings RENAME TO gastos_embeddings_shadow;
+    ALTER TABLE gastos_embeddings_retired RENAME TO gastos_embeddings;
+    ALTER TABLE ingresos_embeddings RENAME TO ingresos_embeddings_shadow;
+    ALTER TABLE ingresos_embeddings_retired RENAME TO ingresos_embeddings;
+
+    -- La versión reactivada es la del contenido de las tablas
+    SELECT model_version INTO v_model_version
+    FROM gastos_embeddings WHERE model_version IS NOT NULL LIMIT 1;
+
+    UPDATE embedding_model_versions SET status = 'retired' WHERE status = 'building';
+    UPDATE embedding_model_versions SET status = 'building', activated_at = NULL
+    WHERE status = 'active';
+    UPDATE embedding_model_versions
+    SET status = 'active', activated_at = CURRENT_TIMESTAMP
+    WHERE model_version = v_model_version;
+
+    RETURN v_model_version;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON TABLE embedding_model_versions IS 'Versiones del modelo de embeddings (activa, en construcción, retiradas)';
+COMMENT ON FUNCTION create_embedding_shadow IS 'Crea las tablas sombra para backfillear un modelo nuevo';
+COMMENT ON FUNCTION cutover_embedding_shadow IS 'Activa la versión sombra con un intercambio atómico de tablas';
+COMMENT ON FUNCTION rollback_embedding_cutover IS 'Vuelve a la versión de embeddings anterior';
+
+-- Mensajes informativos
+\echo '✓ Columna model_version y tabla embedding_model_versions creadas'
+\echo '✓ Funciones create_embedding_shadow, cutover_embedding_shadow y rollback_embedding_cutover creadas'
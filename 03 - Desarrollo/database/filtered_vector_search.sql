@@ -0,0 +1,70 @@
+-- ============================================================
+-- Script: filtered_vector_search.sql
+-- Descripción: Búsqueda vectorial con filtros consciente de la selectividad
+-- Fecha: 17 octubre 2026
+-- Orden de ejecución: 14 (después de hybrid_search.sql)
+-- DIMENSIONES: 768 (Google Gemini text-embedding-004)
+-- ============================================================
+--
+-- search_{gastos,ingresos}_with_filters (embedding_user_scope.sql) eligen
+-- entre recorrido exacto por usuario e iterative index scan con
+-- choose_vector_scan. Este script agrega:
+--   1. plan_vector_search: la estrategia que usaría una búsqueda y las
+--      filas candidatas estimadas, sin ejecutarla ni cambiar la
+--      configuración de la sesión. La API la informa aunque la búsqueda
+--      no devuelva filas y la pasa a search_*_with_filters, que así no
+--      vuelve a estimar.
+--   2. Índices (id_usuario, fecha) para armar el conjunto pre-filtrado
+-- ============================================================
+
+CREATE INDEX IF NOT EXISTS idx_gastos_usuario_fecha ON gastos (id_usuario, fecha);
+CREATE INDEX IF NOT EXISTS idx_ingresos_usuario_fecha ON ingresos (id_usuario, fecha);
+
+-- Versión anterior: funciones de búsqueda propias con estrategia 'index'
+-- (post-filtro) que dejaban ef_search/iterative_scan fijados hasta el fin
+-- de la transacción
+DROP FUNCTION IF EXISTS search_gastos_filtered(INTEGER, vector, INTEGER, FLOAT, VARCHAR, DATE, DATE, DECIMAL, DECIMAL, VARCHAR, INTEGER, FLOAT);
+DROP FUNCTION IF EXISTS search_ingresos_filtered(INTEGER, vector, INTEGER, FLOAT, VARCHAR, DATE, DATE, DECIMAL, DECIMAL, VARCHAR, INTEGER, FLOAT);
+DROP FUNCTION IF EXISTS prepare_filtered_index_scan(VARCHAR, INTEGER, BIGINT, BIGINT);
+DROP FUNCTION IF EXISTS choose_filter_strategy(VARCHAR, BIGINT, BIGINT, INTEGER, FLOAT);
+DROP FUNCTION IF EXISTS estimate_filtered_rows(VARCHAR, INTEGER, VARCHAR, DATE, DATE, DECIMAL, DECIMAL);
+
+-- ============================================================
+-- FUNCIÓN: plan_vector_search
+-- Descripción: Estrategia ('exact' o 'iterative') y filas candidatas de
+--              una búsqueda con filtros, según las estimaciones del planner
+-- Parámetros:
+--   - p_entity_type: 'gasto' o 'ingreso'
+--   - p_user_id, filtros: Los mismos de search_*_with_filters
+--   - p_strategy: 'auto', 'exact' o 'iterative' (ver choose_vector_scan)
+--   - p_exact_max_rows, p_min_selectivity: Umbrales de 'auto'
+-- ============================================================
+CREATE OR REPLACE FUNCTION plan_vector_search(
+    p_entity_type VARCHAR,
+    p_user_id INTEGER,
+    categoria_filter VARCHAR(100) DEFAULT NULL,
+    fecha_desde DATE DEFAULT NULL,
+    fecha_hasta DATE DEFAULT NULL,
+    monto_min DECIMAL DEFAULT NULL,
+    monto_max DECIMAL DEFAULT NULL,
+    p_strategy VARCHAR DEFAULT 'auto',
+    p_exact_max_rows INTEGER DEFAULT 20000,
+    p_min_selectivity FLOAT DEFAULT 0.05
+)
+RETURNS TABLE (
+    search_strategy VARCHAR(20),
+    estimated_rows BIGINT,
+    table_rows BIGINT
+) AS $$
+    SELECT
+        choose_vector_scan(
+            p_strategy, e.table_rows, e.candidate_rows, p_exact_max_rows, p_min_selectivity
+        )::VARCHAR(20),
+        e.candidate_rows,
+        e.table_rows
+    FROM estimate_search_rows(
+        p_entity_type, p_user_id, categoria_filter, fecha_desde, fecha_hasta, monto_min, monto_max
+    ) e;
+$$ LANGUAGE sql;  -- VOLATILE: estimate_search_rows ejecuta EXPLAIN
+
+COMMENT ON FUNCTION plan_vector_search IS 'Estrategia (exacta o iterative scan) y filas candidatas estimadas de una búsqueda con filtros, sin ejecutarla';
@@ -0,0 +1,334 @@
+-- ============================================================
+-- Script: hybrid_search.sql
+-- Descripción: Búsqueda híbrida léxica + vectorial con reciprocal rank fusion
+-- Fecha: 17 octubre 2026
+-- Orden de ejecución: 13 (después de vector_search_many.sql)
+-- DIMENSIONES: 768 (Google Gemini text-embedding-004)
+-- ============================================================
+--
+-- La similitud coseno sola deja abajo coincidencias exactas de comercio o
+-- palabra clave ("Rappi", "YPF") frente a vecinos semánticamente vagos.
+-- Este script agrega:
+--   1. Configuración de texto 'es_unaccent' (stemming español sin acentos)
+--   2. Columnas busqueda_texto / busqueda_tsv mantenidas por triggers:
+--      en gastos e ingresos con descripción y comercio (gastos) o fuente
+--      (ingresos); en categorias con el nombre. Renombrar una categoría
+--      solo reescribe su fila y no la de todos sus gastos e ingresos.
+--   3. Índices GIN de texto completo y de trigramas sobre esas columnas
+--   4. search_{gastos,ingresos}_hybrid: top-k léxico (tsvector + trigramas)
+--      y top-k vectorial del usuario (search_*_by_vector, con la misma
+--      estrategia por usuario) fusionados por RRF en una sola función. La
+--      parte léxica une, por sus índices, los registros cuyo documento
+--      coincide y los de las categorías que coinciden.
+-- ============================================================
+
+CREATE EXTENSION IF NOT EXISTS unaccent;
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- unaccent() es STABLE (depende del diccionario); la envoltura IMMUTABLE
+-- con el diccionario explícito permite usarla en índices y triggers
+CREATE OR REPLACE FUNCTION immutable_unaccent(p_text TEXT)
+RETURNS TEXT AS $$
+    SELECT public.unaccent('public.unaccent'::regdictionary, p_text);
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'es_unaccent') THEN
+        CREATE TEXT SEARCH CONFIGURATION es_unaccent (COPY = spanish);
+        ALTER TEXT SEARCH CONFIGURATION es_unaccent
+            ALTER MAPPING FOR hword, hword_part, word WITH unaccent, spanish_stem;
+    END IF;
+END $$;
+
+-- ============================================================
+-- COLUMNAS DE BÚSQUEDA
+-- ============================================================
+ALTER TABLE gastos ADD COLUMN IF NOT EXISTS busqueda_texto TEXT;
+ALTER TABLE gastos ADD COLUMN IF NOT EXISTS busqueda_tsv tsvector;
+ALTER TABLE ingresos ADD COLUMN IF NOT EXISTS busqueda_texto TEXT;
+ALTER TABLE ingresos ADD COLUMN IF NOT EXISTS busqueda_tsv tsvector;
+ALTER TABLE categorias ADD COLUMN IF NOT EXISTS busqueda_texto TEXT;
+ALTER TABLE categorias ADD COLUMN IF NOT EXISTS busqueda_tsv tsvector;
+
+-- Descripción y comercio/fuente pesan más (A) que la categoría (B)
+CREATE OR REPLACE FUNCTION set_gastos_busqueda()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.busqueda_texto := immutable_unaccent(lower(concat_ws(' ', NEW.descripcion, NEW.comercio)));
+    NEW.busqueda_tsv := setweight(to_tsvector('es_unaccent', concat_ws(' ', NEW.descripcion, NEW.comercio)), 'A');
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION set_ingresos_busqueda()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.busqueda_texto := immutable_unaccent(lower(concat_ws(' ', NEW.descripcion, NEW.fuente)));
+    NEW.busqueda_tsv := setweight(to_tsvector('es_unaccent', concat_ws(' ', NEW.descripcion, NEW.fuente)), 'A');
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION set_categorias_busqueda()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.busqueda_texto := immutable_unaccent(lower(NEW.nombre));
+    NEW.busqueda_tsv := setweight(to_tsvector('es_unaccent', coalesce(NEW.nombre, '')), 'B');
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_gastos_busqueda ON gastos;
+CREATE TRIGGER trg_gastos_busqueda
+BEFORE INSERT OR UPDATE OF descripcion, comercio ON gastos
+FOR EACH ROW EXECUTE FUNCTION set_gastos_busqueda();
+
+DROP TRIGGER IF EXISTS trg_ingresos_busqueda ON ingresos;
+CREATE TRIGGER trg_ingresos_busqueda
+BEFORE INSERT OR UPDATE OF descripcion, fuente ON ingresos
+FOR EACH ROW EXECUTE FUNCTION set_ingresos_busqueda();
+
+-- Versión anterior: renombrar una categoría reescribía en la misma
+-- transacción todos sus gastos e ingresos
+DROP TRIGGER IF EXISTS trg_categorias_busqueda ON categorias;
+DROP FUNCTION IF EXISTS propagate_categoria_busqueda();
+
+CREATE TRIGGER trg_categorias_busqueda
+BEFORE INSERT OR UPDATE OF nombre ON categorias
+FOR EACH ROW EXECUTE FUNCTION set_categorias_busqueda();
+
+-- Completar las filas existentes (dispara los triggers de arriba); las que
+-- todavía incluyen el nombre de la categoría se recalculan sin él
+UPDATE gastos SET descripcion = descripcion
+WHERE busqueda_texto IS DISTINCT FROM immutable_unaccent(lower(concat_ws(' ', descripcion, comercio)));
+UPDATE ingresos SET descripcion = descripcion
+WHERE busqueda_texto IS DISTINCT FROM immutable_unaccent(lower(concat_ws(' ', descripcion, fuente)));
+UPDATE categorias SET nombre = nombre WHERE busqueda_tsv IS NULL;
+
+-- ============================================================
+-- ÍNDICES
+-- ============================================================
+CREATE INDEX IF NOT EXISTS idx_gastos_busqueda_tsv
+ON gastos USING gin (busqueda_tsv);
+
+CREATE INDEX IF NOT EXISTS idx_gastos_busqueda_trgm
+ON gastos USING gin (busqueda_texto gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_ingresos_busqueda_tsv
+ON ingresos USING gin (busqueda_tsv);
+
+CREATE INDEX IF NOT EXISTS idx_ingresos_busqueda_trgm
+ON ingresos USING gin (busqueda_texto gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_categorias_busqueda_tsv
+ON categorias USING gin (busqueda_tsv);
+
+CREATE INDEX IF NOT EXISTS idx_categorias_busqueda_trgm
+ON categorias USING gin (busqueda_texto gin_trgm_ops);
+
+-- Registros de una categoría que coincide con la consulta
+CREATE INDEX IF NOT EXISTS idx_gastos_usuario_categoria ON gastos (id_usuario, id_categoria);
+CREATE INDEX IF NOT EXISTS idx_ingresos_usuario_categoria ON ingresos (id_usuario, id_categoria);
+
+-- ============================================================
+-- FUNCIÓN: search_gastos_hybrid
+-- Descripción: Fusiona por RRF el top-k léxico y el top-k vectorial de los
+--              gastos de un usuario
+-- Parámetros:
+--   - p_user_id: Dueño de los gastos (obligatorio)
+--   - query_embedding: Vector de consulta (768 dimensiones)
+--   - query_text: Texto de la consulta (para la parte léxica)
+--   - limit_results: Cantidad máxima de resultados (default: 10)
+--   - candidate_count: Candidatos de cada lista antes de fusionar (default: 50)
+--   - rrf_k: Constante de RRF; mayor = menos peso a los primeros puestos (default: 60)
+--   - similarity_threshold: Similitud mínima de los candidatos vectoriales;
+--     los léxicos entran aunque su similitud sea menor (default: 0)
+--   - p_ef_search, p_probes: Parámetros del índice ANN si se recorre
+-- Retorna: Gastos ordenados por puntaje RRF, con su similitud coseno y su
+--          posición en cada lista (NULL si no apareció en ella)
+-- ============================================================
+DROP FUNCTION IF EXISTS search_gastos_hybrid(INTEGER, vector, TEXT, INTEGER, INTEGER, INTEGER, FLOAT);
+DROP FUNCTION IF EXISTS search_ingresos_hybrid(INTEGER, vector, TEXT, INTEGER, INTEGER, INTEGER, FLOAT);
+
+CREATE OR REPLACE FUNCTION search_gastos_hybrid(
+    p_user_id INTEGER,
+    query_embedding vector(768),
+    query_text TEXT,
+    limit_results INTEGER DEFAULT 10,
+    candidate_count INTEGER DEFAULT 50,
+    rrf_k INTEGER DEFAULT 60,
+    similarity_threshold FLOAT DEFAULT 0.0,
+    p_ef_search INTEGER DEFAULT NULL,
+    p_probes INTEGER DEFAULT NULL
+)
+RETURNS TABLE (
+    gasto_id INTEGER,
+    descripcion TEXT,
+    monto DECIMAL,
+    fecha DATE,
+    categoria VARCHAR(100),
+    moneda VARCHAR(10),
+    similarity FLOAT,
+    texto_embedding TEXT,
+    score FLOAT,
+    vector_rank INTEGER,
+    lexical_rank INTEGER
+) AS $$
+    WITH consulta AS (
+        SELECT websearch_to_tsquery('es_unaccent', query_text) AS tsq,
+               immutable_unaccent(lower(query_text)) AS plano
+    ),
+    vectorial AS MATERIALIZED (
+        SELECT r.gasto_id AS id,
+               row_number() OVER (ORDER BY r.similarity DESC) AS posicion
+        FROM search_gastos_by_vector(
+            p_user_id, query_embedding, candidate_count, similarity_threshold, p_ef_search, p_probes
+        ) r
+    ),
+    coincidencias AS (
+        -- Registros cuyo propio documento coincide (índices GIN de gastos)
+        SELECT g.id_gasto AS id,
+               greatest(ts_rank_cd(g.busqueda_tsv, q.tsq), word_similarity(q.plano, g.busqueda_texto)) AS relevancia
+        FROM gastos g, consulta q
+        WHERE g.id_usuario = p_user_id
+            AND (g.busqueda_tsv @@ q.tsq OR q.plano <% g.busqueda_texto)
+        UNION ALL
+        -- Registros de las categorías que coinciden (índices GIN de categorias)
+        SELECT g.id_gasto,
+               greatest(ts_rank_cd(c.busqueda_tsv, q.tsq), word_similarity(q.plano, c.busqueda_texto))
+        FROM categorias c
+        CROSS JOIN consulta q
+        INNER JOIN gastos g ON g.id_categoria = c.id_categoria AND g.id_usuario = p_user_id
+        WHERE c.busqueda_tsv @@ q.tsq OR q.plano <% c.busqueda_texto
+    ),
+    lexica AS MATERIALIZED (
+        SELECT d.id,
+               row_number() OVER (ORDER BY max(d.relevancia) DESC) AS posicion
+        FROM coincidencias d
+        GROUP BY d.id
+        ORDER BY max(d.relevancia) DESC
+        LIMIT candidate_count
+    ),
+    fusion AS (
+        SELECT coalesce(v.id, l.id) AS id,
+               coalesce(1.0 / (rrf_k + v.posicion), 0) + coalesce(1.0 / (rrf_k + l.posicion), 0) AS puntaje,
+               v.posicion AS posicion_vectorial,
+               l.posicion AS posicion_lexica
+        FROM vectorial v
+        FULL OUTER JOIN lexica l ON l.id = v.id
+    )
+    SELECT
+        g.id_gasto,
+        g.descripcion::TEXT,
+        g.monto,
+        g.fecha,
+        c.nombre,
+        g.moneda::VARCHAR(10),
+        (1 - (ge.embedding <=> query_embedding))::FLOAT,
+        ge.texto_original,
+        f.puntaje::FLOAT,
+        f.posicion_vectorial::INTEGER,
+        f.posicion_lexica::INTEGER
+    FROM fusion f
+    INNER JOIN gastos g ON g.id_gasto = f.id
+    LEFT JOIN gastos_embeddings ge ON ge.gasto_id = f.id
+    LEFT JOIN categorias c ON g.id_categoria = c.id_categoria
+    ORDER BY f.puntaje DESC, f.posicion_vectorial ASC NULLS LAST
+    LIMIT limit_results;
+$$ LANGUAGE sql;  -- VOLATILE: search_*_by_vector ajusta el índice ANN
+
+-- ============================================================
+-- FUNCIÓN: search_ingresos_hybrid
+-- Descripción: Fusiona por RRF el top-k léxico y el top-k vectorial de los
+--              ingresos de un usuario (ver search_gastos_hybrid)
+-- ============================================================
+CREATE OR REPLACE FUNCTION search_ingresos_hybrid(
+    p_user_id INTEGER,
+    query_embedding vector(768),
+    query_text TEXT,
+    limit_results INTEGER DEFAULT 10,
+    candidate_count INTEGER DEFAULT 50,
+    rrf_k INTEGER DEFAULT 60,
+    similarity_threshold FLOAT DEFAULT 0.0,
+    p_ef_search INTEGER DEFAULT NULL,
+    p_probes INTEGER DEFAULT NULL
+)
+RETURNS TABLE (
+    ingreso_id INTEGER,
+    descripcion TEXT,
+    monto DECIMAL,
+    fecha DATE,
+    categoria VARCHAR(100),
+    moneda VARCHAR(10),
+    similarity FLOAT,
+    texto_embedding TEXT,
+    score FLOAT,
+    vector_rank INTEGER,
+    lexical_rank INTEGER
+) AS $$
+    WITH consulta AS (
+        SELECT websearch_to_tsquery('es_unaccent', query_text) AS tsq,
+               immutable_unaccent(lower(query_text)) AS plano
+    ),
+    vectorial AS MATERIALIZED (
+        SELECT r.ingreso_id AS id,
+               row_number() OVER (ORDER BY r.similarity DESC) AS posicion
+        FROM search_ingresos_by_vector(
+            p_user_id, query_embedding, candidate_count, similarity_threshold, p_ef_search, p_probes
+        ) r
+    ),
+    coincidencias AS (
+        -- Registros cuyo propio documento coincide (índices GIN de ingresos)
+        SELECT i.id_ingreso AS id,
+               greatest(ts_rank_cd(i.busqueda_tsv, q.tsq), word_similarity(q.plano, i.busqueda_texto)) AS relevancia
+        FROM ingresos i, consulta q
+        WHERE i.id_usuario = p_user_id
+            AND (i.busqueda_tsv @@ q.tsq OR q.plano <% i.busqueda_texto)
+        UNION ALL
+        -- Registros de las categorías que coinciden (índices GIN de categorias)
+        SELECT i.id_ingreso,
+               greatest(ts_rank_cd(c.busqueda_tsv, q.tsq), word_similarity(q.plano, c.busqueda_texto))
+        FROM categorias c
+        CROSS JOIN consulta q
+        INNER JOIN ingresos i ON i.id_categoria = c.id_categoria AND i.id_usuario = p_user_id
+        WHERE c.busqueda_tsv @@ q.tsq OR q.plano <% c.busqueda_texto
+    ),
+    lexica AS MATERIALIZED (
+        SELECT d.id,
+               row_number() OVER (ORDER BY max(d.relevancia) DESC) AS posicion
+        FROM coincidencias d
+        GROUP BY d.id
+        ORDER BY max(d.relevancia) DESC
+        LIMIT candidate_count
+    ),
+    fusion AS (
+        SELECT coalesce(v.id, l.id) AS id,
+               coalesce(1.0 / (rrf_k + v.posicion), 0) + coalesce(1.0 / (rrf_k + l.posicion), 0) AS puntaje,
+               v.posicion AS posicion_vectorial,
+               l.posicion AS posicion_lexica
+        FROM vectorial v
+        FULL OUTER JOIN lexica l ON l.id = v.id
+    )
+    SELECT
+        i.id_ingreso,
+        i.descripcion::TEXT,
+        i.monto,
+        i.fecha,
+        c.nombre,
+        i.moneda::VARCHAR(10),
+        (1 - (ie.embedding <=> query_embedding))::FLOAT,
+        ie.texto_original,
+        f.puntaje::FLOAT,
+        f.posicion_vectorial::INTEGER,
+        f.posicion_lexica::INTEGER
+    FROM fusion f
+    INNER JOIN ingresos i ON i.id_ingreso = f.id
+    LEFT JOIN ingresos_embeddings ie ON ie.ingreso_id = f.id
+    LEFT JOIN categorias c ON i.id_categoria = c.id_categoria
+    ORDER BY f.puntaje DESC, f.posicion_vectorial ASC NULLS LAST
+    LIMIT limit_results;
+$$ LANGUAGE sql;  -- VOLATILE: search_*_by_vector ajusta el índice ANN
+
+COMMENT ON FUNCTION search_gastos_hybrid IS 'Búsqueda híbrida (texto completo + trigramas + vector) con reciprocal rank fusion en gastos';
+COMMENT ON FUNCTION search_ingresos_hybrid IS 'Búsqueda híbrida (texto completo + trigramas + vector) con reciprocal rank fusion en ingresos';
@@ -0,0 +1,125 @@
+-- ============================================================
+-- Script: vector_indexes.sql
+-- Descripción: Administración de los índices ANN sobre embedding (HNSW o IVFFlat)
+-- Fecha: 17 octubre 2026
+-- Orden de ejecución: 10 (después de embedding_jobs.sql)
+-- DIMENSIONES: las de la columna embedding de cada tabla
+-- Requiere: pgvector >= 0.5.0 (HNSW)
+-- ============================================================
+
+-- ============================================================
+-- FUNCIÓN: rebuild_embedding_vector_index
+-- Descripción: Reemplaza el índice ANN sobre la columna embedding (float32)
+--              de una tabla de embeddings. El índice sobre embedding_half
+--              (compact_embeddings.sql) no se toca.
+-- Parámetros:
+--   - p_table: Tabla (gastos_embeddings, ingresos_embeddings o su sombra)
+--   - p_method: 'hnsw' (default) o 'ivfflat'
+--   - p_m: Conexiones por nodo de HNSW (default: 16)
+--   - p_ef_construction: Lista de candidatos al construir HNSW (default: 64)
+--   - p_lists: Listas de IVFFlat (default: sqrt(filas), mínimo 1)
+-- Retorna: Nombre del índice creado
+--
+-- Se ejecuta en una transacción: bloquea las escrituras sobre la tabla
+-- mientras se construye (las lecturas siguen). IVFFlat debe construirse con
+-- la tabla ya poblada; HNSW puede crearse con la tabla vacía.
+-- ============================================================
+CREATE OR REPLACE FUNCTION rebuild_embedding_vector_index(
+    p_table TEXT,
+    p_method TEXT DEFAULT 'hnsw',
+    p_m INTEGER DEFAULT 16,
+    p_ef_construction INTEGER DEFAULT 64,
+    p_lists INTEGER DEFAULT NULL
+)
+RETURNS TEXT AS $$
+DECLARE
+    v_index RECORD;
+    v_name TEXT := format('idx_%s_vector', p_table);
+    v_rows BIGINT;
+BEGIN
+    IF p_method NOT IN ('hnsw', 'ivfflat') THEN
+        RAISE EXCEPTION 'Método de índice no válido: %', p_method;
+    END IF;
+
+    -- Índices ANN existentes sobre la columna float32 (cualquier nombre y método)
+    FOR v_index IN
+        SELECT indexname FROM pg_indexes
+        WHERE schemaname = current_schema()
+          AND tablename = p_table
+          AND indexdef LIKE '%(embedding vector_cosine_ops)%'
+    LOOP
+        EXECUTE format('DROP INDEX %I', v_index.indexname);
+    END LOOP;
+
+    -- Después de un cutover el nombre puede seguir en uso por la tabla retirada
+    IF to_regclass(v_name) IS NOT NULL THEN
+        v_name := format('%s_%s', v_name, extract(epoch FROM clock_timestamp())::BIGINT);
+    END IF;
+
+    IF p_method = 'hnsw' THEN
+        EXECUTE format(
+            'CREATE INDEX %I ON %I USING hnsw (embedding vector_cosine_ops) '
+            'WITH (m = %s, ef_construction = %s)',
+            v_name, p_table, p_m, p_ef_construction
+        );
+    ELSE
+        IF p_lists IS NULL THEN
+            EXECUTE format('SELECT COUNT(*) FROM %I', p_table) INTO v_rows;
+            p_lists := GREATEST(1, sqrt(v_rows)::INTEGER);
+        END IF;
+        EXECUTE format(
+            'CREATE INDEX %I ON %I USING ivfflat (embedding vector_cosine_ops) '
+            'WITH (lists = %s)',
+            v_name, p_table, p_lists
+        );
+    END IF;
+
+    EXECUTE format('ANALYZE %I', p_table);
+    RETURN v_name;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================================
+-- FUNCIÓN: get_embedding_vector_indexes
+-- Descripción: Lista los índices ANN de las tablas de embeddings
+-- Retorna: tabla, índice, método, definición y tamaño
+-- ============================================================
+CREATE OR REPLACE FUNCTION get_embedding_vector_indexes()
+RETURNS TABLE (
+    tabla TEXT,
+    indice TEXT,
+    metodo TEXT,
+    definicion TEXT,
+    tamano TEXT
+) AS $$
+BEGIN
+    RETURN QUERY
+    SELECT
+        i.tablename::TEXT,
+        i.indexname::TEXT,
+        am.amname::TEXT,
+        i.indexdef::TEXT,
+        pg_size_pretty(pg_relation_size(format('%I.%I', i.schemaname, i.indexname)::regclass))
+    FROM pg_indexes i
+    JOIN pg_class ic ON ic.relname = i.indexname
+    JOIN pg_namespace n ON n.oid = ic.relnamespace AND n.nspname = i.schemaname
+    JOIN pg_am am ON am.oid = ic.relam
+    WHERE i.schemaname = current_schema()
+      AND i.tablename LIKE '%embeddings%'
+      AND am.amname IN ('hnsw', 'ivfflat')
+    ORDER BY i.tablename, i.indexname;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Las tablas de create_embeddings_tables.sql traen IVFFlat con lists fijo,
+-- construido sobre tablas vacías (listas sin centroides útiles). Se reemplaza
+-- por HNSW, que no depende de los datos al construirse.
+SELECT rebuild_embedding_vector_index('gastos_embeddings');
+SELECT rebuild_embedding_vector_index('ingresos_embeddings');
+
+COMMENT ON FUNCTION rebuild_embedding_vector_index IS 'Reemplaza el índice ANN (HNSW o IVFFlat) sobre embedding';
+COMMENT ON FUNCTION get_embedding_vector_indexes IS 'Índices ANN de las tablas de embeddings';
+
+-- Mensajes informativos
+\echo '✓ Índices HNSW sobre embedding creados'
+\echo '✓ Funciones rebuild_embedding_vector_index y get_embedding_vector_indexes creadas'
@@ -0,0 +1,97 @@
+-- ============================================================
+-- Script: vector_search_many.sql
+-- Descripción: Varias búsquedas vectoriales de un usuario en una sola sentencia
+-- Fecha: 17 octubre 2026
+-- Orden de ejecución: 12 (después de embedding_user_scope.sql)
+-- DIMENSIONES: 768 (Google Gemini text-embedding-004)
+-- ============================================================
+--
+-- El chat buscaba gastos e ingresos con llamadas separadas y las preguntas
+-- con varias intenciones ("comparar estos tres temas de gasto") pagaban un
+-- round trip por consulta. search_many_by_vector recibe N vectores con sus
+-- filtros como arrays paralelos y resuelve cada uno con un LATERAL sobre
+-- search_*_with_filters, así cada consulta usa la misma estrategia por
+-- usuario (recorrido exacto o iterative index scan, ver
+-- embedding_user_scope.sql) y los mismos ef_search/probes.
+-- ============================================================
+
+-- ============================================================
+-- FUNCIÓN: search_many_by_vector
+-- Descripción: Ejecuta N búsquedas entre los gastos y/o ingresos de un usuario
+-- Parámetros (arrays paralelos, un elemento por consulta):
+--   - p_user_id: Dueño de los registros (obligatorio, común a todas)
+--   - p_queries: Vectores de consulta
+--   - p_entity_types: 'gasto', 'ingreso' o 'all' (ambos, cada uno con su límite)
+--   - p_limits: Cantidad máxima de resultados por entidad
+--   - p_thresholds: Umbral mínimo de similitud 0-1
+--   - p_categorias, p_fechas_desde, p_fechas_hasta, p_montos_min,
+--     p_montos_max: Filtros opcionales (NULL = sin filtro)
+--   - p_ef_search, p_probes: Parámetros del índice ANN, comunes a todas
+-- Retorna: Resultados con el número de consulta (desde 1), ordenados por
+--          consulta, tipo y similitud
+-- ============================================================
+DROP FUNCTION IF EXISTS search_many_by_vector(
+    INTEGER, vector[], VARCHAR[], INTEGER[], FLOAT[], VARCHAR[], DATE[], DATE[], DECIMAL[], DECIMAL[]
+);
+
+CREATE OR REPLACE FUNCTION search_many_by_vector(
+    p_user_id INTEGER,
+    p_queries vector(768)[],
+    p_entity_types VARCHAR[],
+    p_limits INTEGER[],
+    p_thresholds FLOAT[],
+    p_categorias VARCHAR[],
+    p_fechas_desde DATE[],
+    p_fechas_hasta DATE[],
+    p_montos_min DECIMAL[],
+    p_montos_max DECIMAL[],
+    p_ef_search INTEGER DEFAULT NULL,
+    p_probes INTEGER DEFAULT NULL
+)
+RETURNS TABLE (
+    query_index INTEGER,
+    transaction_type VARCHAR(10),  -- 'gasto' o 'ingreso'
+    transaction_id INTEGER,
+    descripcion TEXT,
+    monto DECIMAL,
+    fecha DATE,
+    categoria VARCHAR(100),
+    moneda VARCHAR(10),
+    similarity FLOAT,
+    texto_embedding TEXT
+) AS $$
+    WITH consultas AS MATERIALIZED (
+        SELECT *
+        FROM unnest(
+            p_queries, p_entity_types, p_limits, p_thresholds, p_categorias,
+            p_fechas_desde, p_fechas_hasta, p_montos_min, p_montos_max
+        ) WITH ORDINALITY AS q(
+            embedding, entity_type, limit_results, similarity_threshold, categoria_filter,
+            fecha_desde, fecha_hasta, monto_min, monto_max, query_index
+        )
+    )
+    SELECT * FROM (
+        SELECT q.query_index::INTEGER, 'gasto'::VARCHAR(10), r.*
+        FROM consultas q
+        CROSS JOIN LATERAL search_gastos_with_filters(
+            p_user_id, q.embedding, q.limit_results, q.similarity_threshold,
+            q.categoria_filter, q.fecha_desde, q.fecha_hasta, q.monto_min, q.monto_max,
+            p_ef_search, p_probes
+        ) r
+        WHERE q.entity_type IN ('gasto', 'all')
+
+        UNION ALL
+
+        SELECT q.query_index::INTEGER, 'ingreso'::VARCHAR(10), r.*
+        FROM consultas q
+        CROSS JOIN LATERAL search_ingresos_with_filters(
+            p_user_id, q.embedding, q.limit_results, q.similarity_threshold,
+            q.categoria_filter, q.fecha_desde, q.fecha_hasta, q.monto_min, q.monto_max,
+            p_ef_search, p_probes
+        ) r
+        WHERE q.entity_type IN ('ingreso', 'all')
+    ) resultados
+    ORDER BY 1, 2, 9 DESC;
+$$ LANGUAGE sql;  -- VOLATILE: search_*_with_filters ajusta el índice ANN
+
+COMMENT ON FUNCTION search_many_by_vector IS 'Ejecuta varias búsquedas vectoriales de un usuario (arrays paralelos de vectores y filtros) en un solo round trip';